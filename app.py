@@ -1,14 +1,17 @@
 
 import os
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory
-from tasks import create_video_task, celery_app, resume_video_workflow_task
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, send_from_directory, stream_with_context
+from tasks import celery_app, enqueue_resume, job_scheduler
 from celery.result import AsyncResult
 from src.suno_api import SunoApiClient
+from src.suno_auth import account_key
+from src.suno_rate_limiter import get_rate_limiter
 from src.youtube_uploader import get_auth_flow, exchange_code_for_credentials
-from src.config import (
-    LYRICS_DIR, SONGS_DIR, CLIPS_DIR, OUTPUT_DIR, METADATA_DIR, 
-    PUBLICATION_REPORTS_DIR, VIDEO_OUTPUT_PATH
-)
+from src.config import SUNO_COOKIE
+from src.workspace import Workspace, list_jobs
+from src.progress_events import event_stream, status_payload
+from src.redis_store import get_redis
+from src.telemetry import render_metrics
 import logging
 
 class HealthCheckFilter(logging.Filter):
@@ -23,9 +26,17 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'super-secret-key-change-it-later')
 app.config['SUNO_COOKIE'] = os.environ.get('SUNO_COOKIE', '')
 
-# Rutas a las carpetas de salida, consistentes con config.py
-OUTPUT_FOLDER = 'output'
-SONGS_FOLDER = 'songs'
+def job_workspace(job_id):
+    """
+    Espacio de trabajo del trabajo indicado; sin id, el del trabajo más reciente (o las
+    carpetas clásicas si aún no hay ninguno). Devuelve (id, Workspace).
+    """
+    if not job_id:
+        jobs = list_jobs()
+        if not jobs:
+            return None, Workspace(".")
+        job_id = jobs[0]
+    return job_id, Workspace.for_job(job_id)
 
 # --- Rutas de Autenticación de YouTube ---
 
@@ -80,20 +91,24 @@ def index():
             num_female_songs = int(request.form.get('num_female_songs', 0))
             num_male_songs = int(request.form.get('num_male_songs', 0))
 
-        task = create_video_task.delay(
-            user_prompt=user_prompt,
-            song_style=song_style,
-            is_instrumental=is_instrumental,
-            language=language,
-            with_subtitles=with_subtitles,
-            refine_lyrics=refine_lyrics,
-            num_female_songs=num_female_songs,
-            num_male_songs=num_male_songs,
-            num_instrumental_songs=num_instrumental_songs,
-            llm_model=llm_model,
-            suno_model=suno_model
-        )
-        return redirect(url_for('status', job_id=task.id))
+        # El formulario pasa por el planificador, igual que los envíos masivos
+        try:
+            job, = job_scheduler.submit([{
+                'user_prompt': user_prompt,
+                'song_style': song_style,
+                'is_instrumental': is_instrumental,
+                'language': language,
+                'with_subtitles': with_subtitles,
+                'refine_lyrics': refine_lyrics,
+                'num_female_songs': num_female_songs,
+                'num_male_songs': num_male_songs,
+                'num_instrumental_songs': num_instrumental_songs,
+                'llm_model': llm_model,
+                'suno_model': suno_model
+            }], user='web')
+        except ValueError as e:
+            return str(e), 400
+        return redirect(url_for('status', job_id=job['job_id']))
     return render_template('index.html')
 
 @app.route('/test')
@@ -105,20 +120,31 @@ def status(job_id):
     return render_template('status.html', job_id=job_id)
 
 
-@app.route('/resume', methods=['GET', 'POST'])
-def resume():
+@app.route('/resume', methods=['GET', 'POST'], defaults={'job_id': None})
+@app.route('/resume/<job_id>', methods=['GET', 'POST'])
+def resume(job_id):
+    try:
+        job_id, workspace = job_workspace(job_id)
+    except ValueError as e:
+        return str(e), 400
+
     if request.method == 'POST':
         is_instrumental = 'instrumental' in request.form
         with_subtitles = 'subtitles' in request.form
         suno_model = request.form.get('suno_model', 'chirp-auk-turbo')
         llm_model = request.form.get('llm_model', 'openai/gpt-4o-mini') # Añadido
-        task = resume_video_workflow_task.delay(
-            is_instrumental=is_instrumental,
-            with_subtitles=with_subtitles,
-            suno_model=suno_model,
-            llm_model=llm_model # Añadido
-        )
-        return redirect(url_for('status', job_id=task.id))
+        # Los trabajos del planificador vuelven a su cola con su prioridad
+        try:
+            task_id = enqueue_resume(
+                job_id=job_id,
+                is_instrumental=is_instrumental,
+                with_subtitles=with_subtitles,
+                suno_model=suno_model,
+                llm_model=llm_model # Añadido
+            )
+        except ValueError as e:
+            return str(e), 409
+        return redirect(url_for('status', job_id=task_id))
 
     # Lógica para GET
     def get_file_count(directory, extensions):
@@ -127,51 +153,65 @@ def resume():
         return len([f for f in os.listdir(directory) if not f.startswith('.') and any(f.endswith(ext) for ext in extensions)])
 
     status_data = {
-        'lyrics': {'count': get_file_count(LYRICS_DIR, ['.txt'])},
-        'songs': {'count': get_file_count(SONGS_DIR, ['.mp3'])},
-        'clips': {'count': get_file_count(CLIPS_DIR, ['.mp4', '.mov'])},
-        'metadata': {'count': get_file_count(METADATA_DIR, ['.txt'])},
-        'published': {'count': get_file_count(PUBLICATION_REPORTS_DIR, ['.json'])},
-        'final_video': {'exists': os.path.exists(VIDEO_OUTPUT_PATH)}
+        'lyrics': {'count': get_file_count(workspace.lyrics_dir, ['.txt'])},
+        'songs': {'count': get_file_count(workspace.songs_dir, ['.mp3'])},
+        'clips': {'count': get_file_count(workspace.clips_dir, ['.mp4', '.mov'])},
+        'metadata': {'count': get_file_count(workspace.metadata_dir, ['.txt'])},
+        'published': {'count': get_file_count(workspace.reports_dir, ['.json'])},
+        'final_video': {'exists': os.path.exists(workspace.video_output_path)}
     }
 
-    return render_template('resume.html', status=status_data)
+    return render_template('resume.html', status=status_data, job_id=job_id, clips_dir=workspace.clips_dir)
 
 
-@app.route('/review_lyrics', methods=['GET'])
-def review_lyrics():
+@app.route('/review_lyrics', methods=['GET'], defaults={'job_id': None})
+@app.route('/review_lyrics/<job_id>', methods=['GET'])
+def review_lyrics(job_id):
     """
-    Muestra una página para editar todas las letras generadas.
+    Muestra una página para editar todas las letras generadas del trabajo.
     """
+    try:
+        job_id, workspace = job_workspace(job_id)
+    except ValueError as e:
+        return str(e), 400
+
+    lyrics_dir = workspace.lyrics_dir
     lyrics_data = []
-    if os.path.exists(LYRICS_DIR):
-        for filename in sorted(os.listdir(LYRICS_DIR)):
+    if os.path.exists(lyrics_dir):
+        for filename in sorted(os.listdir(lyrics_dir)):
             if filename.endswith('.txt') and not filename.startswith('.'):
-                filepath = os.path.join(LYRICS_DIR, filename)
+                filepath = os.path.join(lyrics_dir, filename)
                 with open(filepath, 'r', encoding='utf-8') as f:
                     content = f.read()
                 lyrics_data.append({'filename': filename, 'content': content})
     
-    return render_template('review_lyrics.html', lyrics=lyrics_data)
+    return render_template('review_lyrics.html', lyrics=lyrics_data, job_id=job_id)
 
-@app.route('/save_lyrics', methods=['POST'])
-def save_lyrics():
+@app.route('/save_lyrics', methods=['POST'], defaults={'job_id': None})
+@app.route('/save_lyrics/<job_id>', methods=['POST'])
+def save_lyrics(job_id):
     """
     Guarda las letras editadas desde el formulario de revisión.
     """
+    try:
+        job_id, workspace = job_workspace(job_id)
+    except ValueError as e:
+        return str(e), 400
+
+    lyrics_dir = workspace.lyrics_dir
     for filename, content in request.form.items():
         # Asegurarse de que el archivo que se intenta escribir esté dentro del directorio de letras
         safe_filename = os.path.basename(filename)
-        filepath = os.path.join(LYRICS_DIR, safe_filename)
+        filepath = os.path.join(lyrics_dir, safe_filename)
         
         # Comprobación de seguridad para evitar Path Traversal
-        if os.path.abspath(os.path.dirname(filepath)) != os.path.abspath(LYRICS_DIR):
+        if os.path.abspath(os.path.dirname(filepath)) != os.path.abspath(lyrics_dir):
             return "Error: Intento de escritura de archivo no autorizado.", 400
             
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(content)
     
-    return redirect(url_for('resume'))
+    return redirect(url_for('resume', job_id=job_id))
 
 
 # --- Rutas de API --- #
@@ -186,36 +226,29 @@ def suno_custom_check_api():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/suno-limiter/metrics')
+def suno_limiter_metrics_api():
+    """
+    Tiempos de espera en cola, rechazos y generaciones en curso del limitador de Suno,
+    para ajustar el rendimiento a los límites de la cuenta.
+    """
+    try:
+        return jsonify(get_rate_limiter(account_key(SUNO_COOKIE)).metrics())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def task_status(job_id):
+    """Estado de la tarea consultado al backend de resultados de Celery."""
+    task = celery_app.AsyncResult(job_id)
+    return status_payload('FAILURE' if task.failed() else task.state, task.info)
+
+
 @app.route('/api/status/<job_id>')
 def job_status_api(job_id):
+    """Sondeo del estado de la tarea. La página de estado lo usa si no hay eventos (SSE)."""
     try:
-        task = celery_app.AsyncResult(job_id)
-
-        if task.failed():
-            response = {
-                'state': 'FAILURE',
-                'progress': '0%',
-                'details': str(task.info),
-            }
-        elif task.state == 'PENDING':
-            response = {
-                'state': task.state,
-                'progress': '0%',
-                'details': 'La tarea está en la cola, esperando para empezar...'
-            }
-        elif task.state == 'SUCCESS':
-            response = {
-                'state': task.state,
-                'progress': task.info.get('progress', '100%'),
-                'details': task.info.get('details', 'Completado'),
-                'result': task.info.get('result') # Corregido para desempaquetar el resultado
-            }
-        else:  # Otros estados como STARTED o PROGRESS
-            response = {
-                'state': task.state,
-                'progress': task.info.get('progress', '0%'),
-                'details': task.info.get('details', '')
-            }
+        response = task_status(job_id)
     except Exception as e:
         # Si ocurre cualquier error al consultar el estado (como el KeyError),
         # devolvemos una respuesta de fallo genérica para no romper la UI.
@@ -229,6 +262,64 @@ def job_status_api(job_id):
     return jsonify(response)
 
 
+@app.route('/api/events/<job_id>')
+def job_events_api(job_id):
+    """
+    Server-sent events con el progreso de la tarea, publicados por los workers en Redis.
+    Sin Redis responde 503 y la página de estado recurre al sondeo de '/api/status'.
+    """
+    client = get_redis()
+    if client is None:
+        return jsonify({'error': 'El canal de eventos de progreso no está disponible.'}), 503
+    return Response(
+        stream_with_context(event_stream(job_id, lambda: task_status(job_id), client)),
+        mimetype='text/event-stream',
+        # Sin caché ni búfer en proxies intermedios, para que cada evento llegue al momento
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_jobs_api():
+    """
+    Envío masivo de álbumes. Acepta una lista de álbumes (mismos campos que el formulario)
+    o un objeto {"jobs": [...], "user": ..., "priority": 0-9, "review": true|false}.
+    Cada álbum puede indicar su propio 'job_id', 'user', 'priority' o 'review'.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        data = {'jobs': data}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Se esperaba un JSON con la lista de trabajos.'}), 400
+    options = {key: data[key] for key in ('user', 'priority', 'review') if key in data}
+    try:
+        jobs = job_scheduler.submit(data.get('jobs'), **options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    for job in jobs:
+        job['status_url'] = url_for('status', job_id=job['job_id'])
+    queue = job_scheduler.overview()
+    del queue['jobs']
+    return jsonify({'jobs': jobs, 'queue': queue}), 202
+
+
+@app.route('/api/queue')
+def queue_api():
+    """Profundidad de la cola del planificador y de las colas de Celery, con la hora de inicio estimada de cada trabajo."""
+    return jsonify(job_scheduler.overview())
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Métricas de Prometheus: duración de los spans del pipeline y esperas en cola. Con
+    PROMETHEUS_MULTIPROC_DIR incluye las de los workers de esta máquina.
+    """
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
 @app.route('/api/test-suno-custom-generate', methods=['POST'])
 def test_suno_custom_generate_api():
     data = request.get_json()
@@ -267,15 +358,19 @@ def test_suno_custom_generate_api():
 
 # --- Rutas para servir archivos generados ---
 
-@app.route('/videos/<path:filename>')
-def serve_video(filename):
-    # Sirve el video final desde la carpeta 'output'
-    return send_from_directory(os.path.join(os.getcwd(), OUTPUT_FOLDER), filename, as_attachment=False)
-
-@app.route('/songs/<path:filename>')
-def serve_song(filename):
-    # Sirve las canciones generadas desde la carpeta 'songs'
-    return send_from_directory(os.path.join(os.getcwd(), SONGS_FOLDER), filename, as_attachment=False)
+@app.route('/videos/<path:filename>', defaults={'job_id': None})
+@app.route('/jobs/<job_id>/videos/<path:filename>')
+def serve_video(job_id, filename):
+    # Sirve el video final desde la carpeta 'output' del trabajo
+    workspace = Workspace.for_job(job_id) if job_id else Workspace(".")
+    return send_from_directory(os.path.abspath(workspace.output_dir), filename, as_attachment=False)
+
+@app.route('/songs/<path:filename>', defaults={'job_id': None})
+@app.route('/jobs/<job_id>/songs/<path:filename>')
+def serve_song(job_id, filename):
+    # Sirve las canciones generadas desde la carpeta 'songs' del trabajo
+    workspace = Workspace.for_job(job_id) if job_id else Workspace(".")
+    return send_from_directory(os.path.abspath(workspace.songs_dir), filename, as_attachment=False)
 
 @app.route('/v1/models', methods=['GET'])
 def get_models():
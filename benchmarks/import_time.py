@@ -0,0 +1,51 @@
+"""
+Mide el tiempo de importación en frío de los puntos de entrada (worker de Celery,
+servidor Flask y orquestador), cada uno en un proceso nuevo.
+
+Con --eager se importan además los SDK pesados (moviepy, langgraph, openai, groq,
+google-generativeai, googleapiclient), lo que reproduce el comportamiento anterior
+a la carga diferida y sirve como referencia.
+
+    python benchmarks/import_time.py --runs 5
+    python benchmarks/import_time.py --runs 5 --eager
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+MODULES = ["tasks", "app", "src.main_orchestrator"]
+HEAVY_MODULES = ["moviepy", "langgraph.graph", "openai", "groq", "google.generativeai", "googleapiclient.discovery"]
+
+
+def time_import(module: str, eager: bool) -> float:
+    imports = ([*HEAVY_MODULES] if eager else []) + [module]
+    code = (
+        "import time, importlib\n"
+        "start = time.perf_counter()\n"
+        f"for name in {imports!r}:\n"
+        "    importlib.import_module(name)\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--eager", action="store_true", help="Importar también los SDK pesados.")
+    args = parser.parse_args()
+
+    print(f"Modo: {'eager' if args.eager else 'diferido'} ({args.runs} ejecuciones por módulo)")
+    for module in MODULES:
+        samples = [time_import(module, args.eager) for _ in range(args.runs)]
+        print(f"  {module:<24} mediana {statistics.median(samples):.3f}s  (min {min(samples):.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
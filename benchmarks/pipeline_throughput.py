@@ -0,0 +1,103 @@
+"""
+Rendimiento del pipeline completo en modo simulación (SIMULATION_MODE=1).
+
+Ejecuta N álbumes de principio a fin (plan, letras, Suno, render, metadatos y subida) con
+el ejecutor sin servicios, contra los dobles locales de los LLM, Suno y YouTube. Reporta
+álbumes por hora, canciones por minuto y el tiempo de cada etapa. No necesita claves ni
+credenciales; el render sí necesita ffmpeg.
+
+    python benchmarks/pipeline_throughput.py --albums 8 --songs 4 --workers 4
+    python benchmarks/pipeline_throughput.py --albums 4 --llm-latency 2 --suno-latency 30 --failure-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--albums", type=int, default=4)
+    parser.add_argument("--songs", type=int, default=3, help="Canciones con letra por álbum.")
+    parser.add_argument("--instrumental", type=int, default=0, help="Canciones instrumentales por álbum.")
+    parser.add_argument("--workers", type=int, default=2, help="Álbumes a la vez.")
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Latencia de cada llamada al LLM simulado (s).")
+    parser.add_argument("--suno-latency", type=float, default=3.0, help="Segundos hasta que un clip simulado está listo.")
+    parser.add_argument("--youtube-latency", type=float, default=0.5, help="Duración de cada subida simulada (s).")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probabilidad de fallo de los tres servicios.")
+    parser.add_argument("--song-duration", type=float, default=10.0, help="Duración del audio sintético (s).")
+    parser.add_argument("--suno-rate", type=float, help="Generaciones por minuto del limitador de Suno (por defecto, el de la configuración).")
+    parser.add_argument("--subtitles", action="store_true", help="Renderizar con subtítulos (necesita una fuente del sistema).")
+    parser.add_argument("--seed", type=int, help="Semilla de la latencia y los fallos simulados.")
+    parser.add_argument("--report", help="Guardar los resultados de cada álbum en este archivo JSON.")
+    args = parser.parse_args()
+
+    # La configuración se lee al importar: preparar el entorno antes de importar el pipeline
+    os.environ.update({
+        "SIMULATION_MODE": "1",
+        "SIM_LLM_LATENCY": str(args.llm_latency),
+        "SIM_SUNO_LATENCY": str(args.suno_latency),
+        "SIM_YOUTUBE_LATENCY": str(args.youtube_latency),
+        "SIM_LLM_FAILURE_RATE": str(args.failure_rate),
+        "SIM_SUNO_FAILURE_RATE": str(args.failure_rate),
+        "SIM_YOUTUBE_FAILURE_RATE": str(args.failure_rate),
+        "SIM_SONG_DURATION": str(args.song_duration),
+        # Cada ejecución mide llamadas reales a los dobles, no respuestas de la caché
+        "LLM_CACHE_MODE": "off",
+    })
+    if args.seed is not None:
+        os.environ["SIM_SEED"] = str(args.seed)
+    if args.suno_rate:
+        os.environ["SUNO_GENERATE_RATE_PER_MINUTE"] = str(args.suno_rate)
+    # Las rutas de salida son relativas: trabajar en un directorio temporal
+    report_path = os.path.abspath(args.report) if args.report else None
+    os.chdir(tempfile.mkdtemp(prefix="pipeline_throughput_"))
+
+    from src.headless_runner import load_jobs, run_jobs
+    from src.main_orchestrator import PIPELINE_STAGES
+
+    catalog = [{
+        "user_prompt": f"álbum de prueba {i + 1}", "song_style": "synthwave",
+        "num_female_songs": args.songs, "num_male_songs": 0, "num_instrumental_songs": args.instrumental,
+        "with_subtitles": args.subtitles,
+    } for i in range(args.albums)]
+    with open("catalog.json", 'w', encoding='utf-8') as f:
+        json.dump(catalog, f)
+    jobs = load_jobs("catalog.json")
+
+    started = time.monotonic()
+    results = run_jobs(jobs, workers=args.workers, pool=args.pool)
+    elapsed = time.monotonic() - started
+
+    completed = [r for r in results if r["status"] == "completed"]
+    songs = len(completed) * (args.songs + args.instrumental)
+    print("\n=== RESULTADOS ===")
+    print(f"Álbumes: {args.albums} | completados: {len(completed)} | fallidos: {len(results) - len(completed)}")
+    print(f"Tiempo total: {elapsed:.1f}s | {len(completed) / elapsed * 3600:.1f} álbumes/hora | {songs / elapsed * 60:.1f} canciones/min")
+    if completed:
+        durations = sorted(r["seconds"] for r in completed)
+        print(f"Duración por álbum p50: {statistics.median(durations):.1f}s | máx: {durations[-1]:.1f}s")
+        for stage in PIPELINE_STAGES:
+            times = sorted(r["timing"]["stages"][stage] for r in completed
+                           if r.get("timing") and stage in r["timing"]["stages"])
+            if times:
+                print(f"  {stage:<8} p50: {statistics.median(times):.2f}s | máx: {times[-1]:.2f}s")
+    for result in results:
+        if result.get("error"):
+            print(f"Fallo en {result['job_id']}: {result['error']}")
+
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({"elapsed": elapsed, "args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if len(completed) == len(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Prueba de carga del cliente de Suno contra el servidor simulado local.
+
+Lanza N generaciones concurrentes (generate -> feed -> descarga) a través de
+SunoApiClient y create_and_download_song, respetando el limitador compartido,
+y reporta el rendimiento obtenido. No consume créditos de Suno.
+
+    python benchmarks/suno_load.py --songs 20 --workers 8 --latency 5
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from src.fake_suno_server import start_in_thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--songs", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=5.0, help="Latencia de generación simulada (s).")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server, base_url = start_in_thread(latency=args.latency, failure_rate=args.failure_rate, song_duration=5)
+
+    # La configuración se lee al importar: preparar el entorno antes de importar el cliente
+    os.environ["SUNO_CLERK_BASE_URL"] = f"{base_url}/clerk/v1"
+    os.environ["SUNO_API_BASE_URL"] = f"{base_url}/api"
+    os.environ["SUNO_POLL_INTERVAL"] = str(args.poll_interval)
+    os.environ.setdefault("SUNO_COOKIE", "fake-cookie")
+    # Las rutas de salida son relativas: trabajar en un directorio temporal
+    os.chdir(tempfile.mkdtemp(prefix="suno_load_"))
+
+    from src.suno_api import SunoApiClient
+    from src.suno_handler import create_and_download_song
+
+    client = SunoApiClient()
+
+    def run_one(i):
+        started = time.monotonic()
+        paths = create_and_download_song(client, lyrics=f"Letra {i}", song_style="synthwave", song_title=f"Load {i}")
+        return time.monotonic() - started, len(paths)
+
+    started = time.monotonic()
+    latencies, files, failures = [], 0, 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_one, i) for i in range(args.songs)]
+        for future in as_completed(futures):
+            try:
+                latency, count = future.result()
+                latencies.append(latency)
+                files += count
+            except Exception as e:
+                failures += 1
+                print(f"Fallo: {e}")
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    print("\n=== RESULTADOS ===")
+    print(f"Canciones solicitadas: {args.songs} | completadas: {len(latencies)} | fallidas: {failures}")
+    print(f"Archivos descargados: {files}")
+    print(f"Tiempo total: {elapsed:.1f}s | rendimiento: {len(latencies) / elapsed * 60:.1f} canciones/min")
+    if latencies:
+        print(f"Latencia p50: {latencies[len(latencies) // 2]:.1f}s | máx: {latencies[-1]:.1f}s")
+    print(f"Limitador: {client.rate_limiter.metrics()}")
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ logging.basicConfig(level=logging.INFO)
 # Añadir directorio raíz al path
 sys.path.append(os.getcwd())
 
+from src.config import SONGS_DIR
 from src.video_assembler import assemble_video
 
 print("Iniciando prueba de ensamblaje de video...")
@@ -19,11 +20,11 @@ class MockTask:
         print(f"Celery State Update: {state} - {meta}")
 
 try:
-    # Llamar a la función directamente
-    # Pasamos listas vacías porque la función ahora escanea los directorios por sí misma
-    # y maneja la ausencia de letras/subtítulos
+    # Llamar a la función directamente con todas las canciones de la carpeta 'songs'
+    # (el ensamblador solo usa las rutas que recibe)
+    song_paths = sorted(os.path.join(SONGS_DIR, f) for f in os.listdir(SONGS_DIR) if f.lower().endswith(('.mp3', '.wav', '.aac')))
     output_path = assemble_video(
-        song_paths=[], 
+        song_paths=song_paths, 
         lyrics_list=[], 
         with_subtitles=False, # Probamos sin subtítulos primero para aislar el problema de duración
         task_instance=MockTask()
@@ -4,22 +4,39 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-SUNO_COOKIE = os.getenv("SUNO_COOKIE")
+# Modo simulación: los LLM, Suno y YouTube se sustituyen por dobles locales (ver
+# src/simulation.py) y las credenciales que falten toman un valor ficticio, de modo que un
+# trabajo completo puede ejecutarse sin claves ni cuentas.
+SIMULATION_MODE = os.getenv("SIMULATION_MODE", "0").lower() in ("1", "true", "yes", "on")
+_SIMULATED_SECRET = "simulated" if SIMULATION_MODE else None
 
-if not OPENAI_API_KEY:
-    raise ValueError("No se encontró la clave API de OpenAI. Asegúrese de que su archivo .env esté configurado correctamente.")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or _SIMULATED_SECRET
+GROQ_API_KEY = os.getenv("GROQ_API_KEY") or _SIMULATED_SECRET
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or _SIMULATED_SECRET
+SUNO_COOKIE = os.getenv("SUNO_COOKIE") or _SIMULATED_SECRET
 
-if not GROQ_API_KEY:
-    raise ValueError("No se encontró la clave API de Groq. Asegúrese de que su archivo .env esté configurado correctamente.")
+# Las claves se validan por capacidad en el momento de usarlas (ver 'require_config'),
+# de modo que importar la configuración nunca falla y cada proceso solo necesita
+# las credenciales de los servicios que realmente utiliza.
+_MISSING_CONFIG_MESSAGES = {
+    "OPENAI_API_KEY": "No se encontró la clave API de OpenAI. Asegúrese de que su archivo .env esté configurado correctamente.",
+    "GROQ_API_KEY": "No se encontró la clave API de Groq. Asegúrese de que su archivo .env esté configurado correctamente.",
+    "GEMINI_API_KEY": "No se encontró la clave API de Gemini. Asegúrese de que su archivo .env esté configurado correctamente.",
+    "SUNO_COOKIE": "No se encontró la cookie de Suno. Asegúrese de que su archivo .env esté configurado correctamente.",
+}
 
-if not GEMINI_API_KEY:
-    raise ValueError("No se encontró la clave API de Gemini. Asegúrese de que su archivo .env esté configurado correctamente.")
+# Clave necesaria para cada proveedor de LLM
+PROVIDER_API_KEYS = {
+    "openai": "OPENAI_API_KEY",
+    "groq": "GROQ_API_KEY",
+    "gemini": "GEMINI_API_KEY",
+}
 
-if not SUNO_COOKIE:
-    raise ValueError("No se encontró la cookie de Suno. Asegúrese de que su archivo .env esté configurado correctamente.")
+def require_config(*names: str):
+    """Lanza ValueError si alguna de las variables de configuración indicadas no está definida."""
+    for name in names:
+        if not globals().get(name):
+            raise ValueError(_MISSING_CONFIG_MESSAGES.get(name, f"Falta la variable de configuración '{name}'."))
 
 # Rutas corregidas para apuntar a la raíz del proyecto
 CLIPS_DIR = "clips"
@@ -28,9 +45,220 @@ OUTPUT_DIR = "output"
 METADATA_DIR = "metadata"
 LYRICS_DIR = "lyrics"
 PUBLICATION_REPORTS_DIR = "publication_reports"
+# Estado interno (registros, checkpoints, etc.), fuera de 'metadata'. El registro de
+# generaciones de Suno de cada trabajo está en el 'state/' de su espacio de trabajo.
+# En simulación, el estado, la caché y los espacios de trabajo van aparte: las letras,
+# canciones y costes simulados nunca llegan a los trabajos reales
+STATE_DIR = os.path.join("state", "simulation") if SIMULATION_MODE else "state"
 
 # Asegurarse de que el path del video de salida sea único para evitar sobreescrituras
 VIDEO_OUTPUT_FILENAME = "final_video.mp4" # Se puede hacer más dinámico si es necesario
 VIDEO_OUTPUT_PATH = os.path.join(OUTPUT_DIR, VIDEO_OUTPUT_FILENAME)
+# Cada trabajo de Celery tiene su propio espacio de trabajo '<WORKSPACES_DIR>/<id>/' con
+# las carpetas anteriores, para poder ejecutar varios trabajos a la vez en un worker
+WORKSPACES_DIR = os.getenv("WORKSPACES_DIR", "simulation_workspaces" if SIMULATION_MODE else "workspaces")
+
+# --- Checkpoints del grafo de LangGraph ---
+# 'sqlite': el estado de cada trabajo se guarda tras cada nodo y la reanudación parte del
+# último checkpoint | 'memory': solo en memoria del proceso (pruebas y ejecuciones sueltas)
+LANGGRAPH_CHECKPOINTER = os.getenv("LANGGRAPH_CHECKPOINTER", "sqlite").lower()
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", os.path.join(STATE_DIR, "checkpoints.sqlite"))
+# Canciones que avanzan a la vez por su rama (Suno, descarga y segmento de video). Las
+# peticiones a Suno siguen limitadas además por SUNO_MAX_IN_FLIGHT
+SONG_PIPELINE_CONCURRENCY = int(os.getenv("SONG_PIPELINE_CONCURRENCY", "4"))
+# Segundos que Redis espera la confirmación de una tarea de Celery antes de entregarla a
+# otro worker (las etapas se confirman al terminar). Debe superar la etapa más larga: si
+# no, una subida o un render en curso se ejecutaría dos veces sobre el mismo checkpoint
+CELERY_VISIBILITY_TIMEOUT = int(os.getenv("CELERY_VISIBILITY_TIMEOUT", str(6 * 3600)))
+
+# --- Eventos de progreso en tiempo real (Redis pub/sub y server-sent events) ---
+# Intervalo mínimo entre eventos de una misma tarea: las ráfagas se agrupan en el último
+PROGRESS_EVENT_INTERVAL = float(os.getenv("PROGRESS_EVENT_INTERVAL", "0.5"))
+# Vigencia del último evento guardado de cada tarea
+PROGRESS_EVENT_TTL = int(os.getenv("PROGRESS_EVENT_TTL", "86400"))
+# Duración máxima de una conexión SSE y segundos entre latidos para mantenerla abierta
+PROGRESS_SSE_TIMEOUT = float(os.getenv("PROGRESS_SSE_TIMEOUT", "3600"))
+PROGRESS_SSE_HEARTBEAT = float(os.getenv("PROGRESS_SSE_HEARTBEAT", "15"))
+
+# --- Planificador de trabajos (envío masivo con prioridades) ---
+# Trabajos del planificador en curso a la vez; el resto espera su turno por prioridad y
+# reparto justo entre usuarios
+SCHEDULER_MAX_ACTIVE_JOBS = int(os.getenv("SCHEDULER_MAX_ACTIVE_JOBS", "8"))
+# Prioridad por defecto de los trabajos (0-9, mayor = antes)
+SCHEDULER_DEFAULT_PRIORITY = int(os.getenv("SCHEDULER_DEFAULT_PRIORITY", "5"))
+# Duración estimada de un trabajo mientras no haya duraciones registradas
+SCHEDULER_DEFAULT_JOB_SECONDS = float(os.getenv("SCHEDULER_DEFAULT_JOB_SECONDS", "1800"))
+# Duraciones recientes con las que se estima la hora de inicio de los trabajos en espera
+SCHEDULER_DURATION_SAMPLES = int(os.getenv("SCHEDULER_DURATION_SAMPLES", "50"))
+# Un trabajo en curso que no termina en este tiempo (worker caído) libera su hueco
+SCHEDULER_ACTIVE_TIMEOUT = float(os.getenv("SCHEDULER_ACTIVE_TIMEOUT", str(6 * 3600)))
+# Un trabajo en pausa (revisión de letras o etapa fallida) conserva su prioridad y su
+# usuario para la reanudación durante este tiempo
+SCHEDULER_PAUSED_TIMEOUT = float(os.getenv("SCHEDULER_PAUSED_TIMEOUT", str(30 * 24 * 3600)))
 
 CLIENT_SECRETS_FILE = "client_secrets.json"
+
+# --- Endpoints de Suno (configurables para apuntar al servidor simulado local) ---
+SUNO_CLERK_BASE_URL = os.getenv("SUNO_CLERK_BASE_URL", "https://clerk.suno.com/v1")
+SUNO_API_BASE_URL = os.getenv("SUNO_API_BASE_URL", "https://studio-api.prod.suno.com/api")
+# Segundos entre consultas a 'feed/v2' mientras se espera una generación
+SUNO_POLL_INTERVAL = float(os.getenv("SUNO_POLL_INTERVAL", "1" if SIMULATION_MODE else "10"))
+
+# --- Autenticación compartida de Suno ---
+# Redis se usa como caché compartida entre workers; si no está disponible se recurre
+# a un archivo local protegido con un bloqueo.
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/1")
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+if SIMULATION_MODE:
+    CACHE_DIR = os.path.join(CACHE_DIR, "simulation")
+SUNO_TOKEN_CACHE_FILE = os.path.join(CACHE_DIR, "suno_token.json")
+# Segundos de antelación con los que se renueva el JWT antes de su expiración
+SUNO_TOKEN_REFRESH_MARGIN = int(os.getenv("SUNO_TOKEN_REFRESH_MARGIN", "15"))
+
+# --- Limitador de peticiones a Suno (compartido entre workers por cuenta) ---
+# Peticiones por minuto permitidas a 'generate/v2-web/' y a 'feed/v2'
+SUNO_GENERATE_RATE_PER_MINUTE = float(os.getenv("SUNO_GENERATE_RATE_PER_MINUTE", "6"))
+SUNO_FEED_RATE_PER_MINUTE = float(os.getenv("SUNO_FEED_RATE_PER_MINUTE", "60"))
+# Ráfaga máxima que admite cada cubo de tokens
+SUNO_RATE_BURST = int(os.getenv("SUNO_RATE_BURST", "2"))
+# Generaciones simultáneas (enviadas y aún no completadas) por cuenta
+SUNO_MAX_IN_FLIGHT = int(os.getenv("SUNO_MAX_IN_FLIGHT", "3"))
+# Tiempo máximo de espera en cola antes de rechazar la petición
+SUNO_LIMITER_MAX_WAIT = float(os.getenv("SUNO_LIMITER_MAX_WAIT", "900"))
+# Vigencia de un hueco de generación si el worker que lo tenía muere sin liberarlo
+SUNO_SLOT_LEASE_TTL = int(os.getenv("SUNO_SLOT_LEASE_TTL", "900"))
+
+# --- Concurrencia de llamadas a LLM ---
+# Llamadas simultáneas permitidas por proveedor (prefijo de 'llm_model', p. ej. 'groq/...')
+LLM_CONCURRENCY_LIMITS = {
+    "openai": int(os.getenv("LLM_CONCURRENCY_OPENAI", "8")),
+    "groq": int(os.getenv("LLM_CONCURRENCY_GROQ", "4")),
+    "gemini": int(os.getenv("LLM_CONCURRENCY_GEMINI", "4")),
+}
+
+# --- Caché de respuestas de LLM ---
+# 'on': usa y guarda respuestas | 'off': desactivada | 'replay': solo respuestas cacheadas
+# (ignora la caducidad y falla si falta alguna), para re-ejecuciones deterministas.
+# Desactivada por defecto: con ella, reenviar el mismo prompt devolvería las mismas letras.
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off").lower()
+LLM_CACHE_DIR = os.path.join(CACHE_DIR, "llm")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "200"))
+
+# --- Streaming de LLM ---
+# Borradores y refinamientos se piden en streaming y se escriben en '<archivo>.partial'
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1").lower() in ("1", "true", "yes", "on")
+# Intervalo mínimo entre actualizaciones de progreso publicadas durante el streaming (s)
+LLM_STREAM_PROGRESS_INTERVAL = float(os.getenv("LLM_STREAM_PROGRESS_INTERVAL", "2"))
+# Longitud a partir de la cual una respuesta en curso se considera desbocada y se corta
+LLM_STREAM_MAX_CHARS = int(os.getenv("LLM_STREAM_MAX_CHARS", "12000"))
+
+# --- Salida estructurada ---
+# Modo por proveedor para letras y metadatos: 'json_schema' (JSON validado contra un esquema),
+# 'json' (solo garantiza JSON válido; Gemini no admite más) u 'off' (formato de texto)
+_DEFAULT_STRUCTURED_OUTPUT = {"openai": "json_schema", "groq": "json_schema", "gemini": "json"}
+LLM_STRUCTURED_OUTPUT = {
+    provider: os.getenv(f"LLM_STRUCTURED_OUTPUT_{provider.upper()}", default).lower()
+    for provider, default in _DEFAULT_STRUCTURED_OUTPUT.items()
+}
+# Peticiones de reparación cuando una respuesta no supera la validación
+LLM_REPAIR_ATTEMPTS = int(os.getenv("LLM_REPAIR_ATTEMPTS", "1"))
+
+# --- Plan de canciones por tramos ---
+# Los álbumes de más de LLM_PLAN_CHUNK_SIZE canciones se planifican en tramos paralelos
+# que comparten un resumen temático del álbum
+LLM_PLAN_CHUNK_SIZE = int(os.getenv("LLM_PLAN_CHUNK_SIZE", "10"))
+# Rondas para regenerar solo las entradas que faltan o tienen títulos duplicados
+LLM_PLAN_REPAIR_ROUNDS = int(os.getenv("LLM_PLAN_REPAIR_ROUNDS", "2"))
+
+# --- Letras casi duplicadas ---
+# Similitud de Jaccard estimada (MinHash) a partir de la cual dos letras se consideran duplicadas
+LYRICS_SIMILARITY_THRESHOLD = float(os.getenv("LYRICS_SIMILARITY_THRESHOLD", "0.5"))
+# Umbral para los estribillos, comparados por separado
+LYRICS_CHORUS_SIMILARITY_THRESHOLD = float(os.getenv("LYRICS_CHORUS_SIMILARITY_THRESHOLD", "0.7"))
+LYRICS_MINHASH_PERMUTATIONS = int(os.getenv("LYRICS_MINHASH_PERMUTATIONS", "128"))
+# Palabras por shingle
+LYRICS_SHINGLE_SIZE = int(os.getenv("LYRICS_SHINGLE_SIZE", "3"))
+# 'regenerate': se regenera la letra repetida | 'review': se aparta para revisión | 'off'
+LYRICS_SIMILARITY_ACTION = os.getenv("LYRICS_SIMILARITY_ACTION", "regenerate").lower()
+# Registro de las letras apartadas para revisión
+LYRICS_REVIEW_LOG_PATH = os.path.join(STATE_DIR, "lyrics_review.jsonl")
+
+# --- Enrutado de LLM por etapa ---
+# Modelos candidatos por etapa del pipeline, en orden de preferencia ('proveedor/modelo',
+# separados por comas). En la etapa 'draft' el modelo elegido en el formulario va primero.
+_DEFAULT_LLM_ROUTE = "openai/gpt-4o-mini,groq/openai/gpt-oss-120b"
+LLM_ROUTES = {
+    stage: [m.strip() for m in os.getenv(f"LLM_ROUTE_{stage.upper()}", _DEFAULT_LLM_ROUTE).split(",") if m.strip()]
+    for stage in ("plan", "draft", "refine", "instrumental", "metadata")
+}
+# Etapas en las que se lanza una petición duplicada (hedge) al siguiente candidato si el primero tarda
+LLM_HEDGE_STAGES = {s.strip() for s in os.getenv("LLM_HEDGE_STAGES", "draft,refine,instrumental,metadata").split(",") if s.strip()}
+# Percentil de latencia del modelo principal a partir del cual se lanza el hedge
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))
+# Espera antes del hedge mientras no haya muestras suficientes del modelo principal
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "30"))
+# Muestras mínimas para usar el percentil y la tasa de error de un modelo
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5"))
+# Tamaño de la ventana móvil de latencias por modelo
+LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "50"))
+# Tasa de error a partir de la cual un modelo pasa al final de la lista de candidatos
+LLM_ROUTER_MAX_ERROR_RATE = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+# Registro de decisiones del enrutador (una línea JSON por llamada)
+LLM_ROUTER_LOG_PATH = os.path.join(STATE_DIR, "llm_router.jsonl")
+
+# --- Contabilidad de uso de LLM ---
+# Una línea JSON por llamada: trabajo, etapa, modelo, tokens, latencia, coste y reintentos
+LLM_USAGE_LOG_PATH = os.path.join(STATE_DIR, "llm_usage.jsonl")
+# Precios en USD por millón de tokens (entrada:salida[:entrada en caché]); 'LLM_PRICES' los
+# sustituye o amplía con el formato 'proveedor/modelo=entrada:salida[:caché],...'. Sin precio
+# de caché, los tokens de entrada cacheados por el proveedor se cobran como el resto.
+_DEFAULT_LLM_PRICES = (
+    "openai/gpt-4o-mini=0.15:0.60:0.075,groq/openai/gpt-oss-120b=0.15:0.75:0.075,"
+    "gemini/gemini-1.5-flash=0.075:0.30"
+)
+LLM_PRICES = {}
+for _price in f"{_DEFAULT_LLM_PRICES},{os.getenv('LLM_PRICES', '')}".split(","):
+    if "=" in _price:
+        _model, _rates = _price.rsplit("=", 1)
+        LLM_PRICES[_model.strip()] = tuple(float(rate) for rate in _rates.split(":", 2))
+
+# --- Modo batch de LLM (catálogos nocturnos) ---
+# 'openai': API Batch del proveedor (OpenAI o Groq) | 'local': sustituto en disco, sin red
+LLM_BATCH_BACKEND = os.getenv("LLM_BATCH_BACKEND", "openai").lower()
+# Carpeta de los trabajos del catálogo: '<carpeta>/<job_id>/lyrics' y '<carpeta>/<job_id>/metadata'
+LLM_BATCH_OUTPUT_DIR = os.getenv("LLM_BATCH_OUTPUT_DIR", "batch_jobs")
+# Estado de cada ejecución (lotes enviados por etapa) y archivos del sustituto local
+LLM_BATCH_STATE_DIR = os.path.join(STATE_DIR, "llm_batch")
+LLM_BATCH_POLL_INTERVAL = float(os.getenv("LLM_BATCH_POLL_INTERVAL", "60"))
+
+# --- Dobles locales del modo simulación (SIMULATION_MODE) ---
+# Latencia media en segundos (±20 %) y probabilidad de fallo de cada servicio simulado.
+# LLM: por llamada; Suno: hasta que un clip está listo / por petición a 'generate';
+# YouTube: por subida completa / por fragmento subido (los fallos se reintentan como 503).
+SIM_LLM_LATENCY = float(os.getenv("SIM_LLM_LATENCY", "0.2"))
+SIM_LLM_FAILURE_RATE = float(os.getenv("SIM_LLM_FAILURE_RATE", "0"))
+SIM_SUNO_LATENCY = float(os.getenv("SIM_SUNO_LATENCY", "3"))
+SIM_SUNO_FAILURE_RATE = float(os.getenv("SIM_SUNO_FAILURE_RATE", "0"))
+SIM_YOUTUBE_LATENCY = float(os.getenv("SIM_YOUTUBE_LATENCY", "0.5"))
+SIM_YOUTUBE_FAILURE_RATE = float(os.getenv("SIM_YOUTUBE_FAILURE_RATE", "0"))
+# Duración en segundos del audio sintético de cada canción
+SIM_SONG_DURATION = float(os.getenv("SIM_SONG_DURATION", "10"))
+# Semilla de la latencia y los fallos simulados (vacía: distinta en cada ejecución). Las
+# respuestas de los LLM simulados son siempre deterministas: dependen solo de los mensajes.
+SIM_SEED = os.getenv("SIM_SEED") or None
+# Registro de las subidas simuladas a YouTube (una línea JSON por video)
+SIM_UPLOADS_LOG_PATH = os.path.join(STATE_DIR, "simulated_uploads.jsonl")
+
+# --- Telemetría: spans de tiempo y métricas de Prometheus (ver src/telemetry.py) ---
+# Puerto en el que cada worker de Celery sirve '/metrics' (0: desactivado). Los workers
+# prefork necesitan PROMETHEUS_MULTIPROC_DIR: las tareas corren en sus procesos hijos
+METRICS_WORKER_PORT = int(os.getenv("METRICS_WORKER_PORT", "9808"))
+# Puerto propio de cada worker según su nombre de nodo ('-n render@%h' -> 'render'), para
+# varios workers en una máquina: "io=9808,suno=9809,render=9810"
+METRICS_WORKER_PORTS = {
+    name.strip(): int(port) for name, port in
+    (item.split("=", 1) for item in os.getenv("METRICS_WORKER_PORTS", "").split(",") if "=" in item)
+}
+# Archivo JSONL donde se anota cada span con su trabajo (vacío: sin traza)
+TELEMETRY_TRACE_PATH = os.getenv("TELEMETRY_TRACE_PATH", "")
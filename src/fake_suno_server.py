@@ -0,0 +1,175 @@
+"""
+Servidor local que imita a Clerk y a la API interna de Suno para pruebas de carga
+sin gastar créditos. Implementa los mismos endpoints que usa SunoApiClient:
+
+    GET  /clerk/v1/client                      -> JWT de sesión
+    GET  /api/user/get_user_session_id/        -> session_id
+    POST /api/generate/v2-web/                 -> 2 clips en estado 'submitted'
+    GET  /api/feed/v2?ids=...                  -> estado de los clips
+    GET  /audio/<clip_id>.mp3                  -> MP3 sintético (silencio)
+
+Uso:
+    python -m src.fake_suno_server --port 8765 --latency 20 --failure-rate 0.1
+
+y en el .env del orquestador:
+    SUNO_CLERK_BASE_URL=http://127.0.0.1:8765/clerk/v1
+    SUNO_API_BASE_URL=http://127.0.0.1:8765/api
+"""
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import threading
+from flask import Flask, request, jsonify, Response
+
+# Cabecera de trama MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono. Con la información
+# lateral y los datos a cero, cada trama decodifica como 1152 muestras de silencio.
+_MP3_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC4])
+_MP3_FRAME_SIZE = 417
+_MP3_SAMPLES_PER_FRAME = 1152
+_MP3_SAMPLE_RATE = 44100
+
+
+def synthetic_mp3(duration_seconds: float) -> bytes:
+    """Genera un MP3 válido de silencio con la duración indicada."""
+    frame = _MP3_FRAME_HEADER + bytes(_MP3_FRAME_SIZE - len(_MP3_FRAME_HEADER))
+    num_frames = max(1, int(round(duration_seconds * _MP3_SAMPLE_RATE / _MP3_SAMPLES_PER_FRAME)))
+    return frame * num_frames
+
+
+def _make_jwt(lifetime: float) -> str:
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+    payload = {"exp": int(time.time() + lifetime), "sub": "fake-user", "jti": str(uuid.uuid4())}
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(payload)}.fake"
+
+
+def _jwt_expired(auth_header: str) -> bool:
+    try:
+        payload = auth_header.split(' ', 1)[1].split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))['exp'] < time.time()
+    except Exception:
+        return True
+
+
+def create_app(latency: float = 30.0, latency_jitter: float = 0.2, failure_rate: float = 0.0,
+               song_duration: float = 30.0, token_lifetime: float = 60.0) -> Flask:
+    """
+    Crea la app del servidor simulado.
+    - latency: segundos hasta que un clip pasa a 'complete' (± latency_jitter en proporción).
+    - failure_rate: probabilidad de que 'generate' responda 500.
+    - song_duration: duración en segundos del MP3 sintético.
+    - token_lifetime: vigencia en segundos de los JWT emitidos.
+    """
+    app = Flask(__name__)
+    clips = {}
+    clips_lock = threading.Lock()
+    stats = {"generate_requests": 0, "generate_failures": 0, "feed_requests": 0, "downloads": 0}
+    audio_bytes = synthetic_mp3(song_duration)
+
+    def authorized():
+        header = request.headers.get("Authorization", "")
+        return header.startswith("Bearer ") and not _jwt_expired(header)
+
+    def clip_view(clip):
+        done = time.time() >= clip["ready_at"]
+        return {
+            "id": clip["id"],
+            "title": clip["title"],
+            "status": "complete" if done else "streaming",
+            "audio_url": f"{request.host_url}audio/{clip['id']}.mp3" if done else "",
+            "metadata": {"tags": clip["tags"], "prompt": clip["prompt"], "duration": song_duration},
+        }
+
+    @app.route('/clerk/v1/client')
+    def clerk_client():
+        jwt = _make_jwt(token_lifetime)
+        return jsonify({"response": {"sessions": [{"last_active_token": {"jwt": jwt}}]}})
+
+    @app.route('/api/user/get_user_session_id/')
+    def session_id():
+        if not authorized():
+            return jsonify({"detail": "Unauthorized"}), 401
+        return jsonify({"session_id": "fake-session-id"})
+
+    @app.route('/api/generate/v2-web/', methods=['POST'])
+    def generate():
+        if not authorized():
+            return jsonify({"detail": "Unauthorized"}), 401
+        stats["generate_requests"] += 1
+        if random.random() < failure_rate:
+            stats["generate_failures"] += 1
+            return jsonify({"detail": "Simulated failure"}), 500
+        payload = request.get_json() or {}
+        created = []
+        with clips_lock:
+            for _ in range(2):
+                delay = latency * random.uniform(1 - latency_jitter, 1 + latency_jitter)
+                clip = {
+                    "id": str(uuid.uuid4()),
+                    "title": payload.get("title", ""),
+                    "tags": payload.get("tags", ""),
+                    "prompt": payload.get("prompt", ""),
+                    "ready_at": time.time() + delay,
+                }
+                clips[clip["id"]] = clip
+                created.append({"id": clip["id"], "title": clip["title"], "status": "submitted"})
+        return jsonify({"clips": created, "status": "running"})
+
+    @app.route('/api/feed/v2')
+    def feed():
+        if not authorized():
+            return jsonify({"detail": "Unauthorized"}), 401
+        stats["feed_requests"] += 1
+        ids = [i for i in request.args.get("ids", "").split(",") if i]
+        with clips_lock:
+            found = [clip_view(clips[i]) for i in ids if i in clips]
+        return jsonify({"clips": found})
+
+    @app.route('/audio/<clip_id>.mp3')
+    def audio(clip_id):
+        if clip_id not in clips:
+            return "Not found", 404
+        stats["downloads"] += 1
+        return Response(audio_bytes, mimetype="audio/mpeg")
+
+    @app.route('/stats')
+    def server_stats():
+        return jsonify(stats)
+
+    return app
+
+
+def start_in_thread(port: int = 0, **app_kwargs):
+    """
+    Arranca el servidor en un hilo en segundo plano (para benchmarks y simulaciones).
+    Devuelve (servidor, url_base); el servidor se detiene con servidor.shutdown().
+    """
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", port, create_app(**app_kwargs), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor simulado de Suno para pruebas de carga.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=30.0, help="Segundos hasta que un clip está completo.")
+    parser.add_argument("--latency-jitter", type=float, default=0.2, help="Variación relativa de la latencia (0-1).")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probabilidad de fallo de 'generate' (0-1).")
+    parser.add_argument("--song-duration", type=float, default=30.0, help="Duración del MP3 sintético en segundos.")
+    parser.add_argument("--token-lifetime", type=float, default=60.0, help="Vigencia de los JWT emitidos en segundos.")
+    args = parser.parse_args()
+
+    app = create_app(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        failure_rate=args.failure_rate,
+        song_duration=args.song_duration,
+        token_lifetime=args.token_lifetime,
+    )
+    app.run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+from src.utils import file_lock
+
+# Estados por los que pasa una canción en el registro
+STATUS_PENDING = "pending"        # identificadores de transacción reservados, aún sin clips
+STATUS_SUBMITTED = "submitted"    # Suno aceptó la petición y devolvió clip ids
+STATUS_COMPLETE = "complete"      # los clips están generados
+STATUS_DOWNLOADED = "downloaded"  # los MP3 están en disco
+
+
+def lyrics_content_hash(title: str, lyrics: str, tags: str, vocal_gender: str, is_instrumental: bool = False) -> str:
+    """Hash estable de los campos de una letra que se envían a Suno."""
+    content = json.dumps({
+        "title": title or '',
+        "prompt": lyrics or '',
+        "tags": tags or '',
+        "gender": vocal_gender or '',
+        "instrumental": bool(is_instrumental),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class GenerationLedger:
+    """
+    Registro en disco de las generaciones de Suno de un trabajo. Asocia el hash de
+    cada letra con sus identificadores de transacción, clip ids y estado, para que
+    un reintento o una reanudación se reenganche a los clips ya solicitados en vez
+    de volver a pagar la generación.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print(f"⚠️ Registro de generación ilegible en {self.path}. Se ignorará.")
+            return {}
+
+    def _save(self, data: dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> dict:
+        with file_lock(self.path):
+            return self._load().get(key)
+
+    def entries(self) -> dict:
+        with file_lock(self.path):
+            return self._load()
+
+    def reserve(self, key: str, title: str) -> dict:
+        """
+        Devuelve la entrada de la letra, creándola con identificadores de transacción
+        persistentes si no existía. Se llama antes de enviar nada a Suno.
+        """
+        with file_lock(self.path):
+            data = self._load()
+            entry = data.get(key)
+            if entry is None:
+                entry = {
+                    "title": title,
+                    "transaction_uuid": str(uuid.uuid4()),
+                    "create_session_token": str(uuid.uuid4()),
+                    "clip_ids": [],
+                    "song_paths": [],
+                    "status": STATUS_PENDING,
+                    "updated_at": time.time(),
+                }
+                data[key] = entry
+                self._save(data)
+            return entry
+
+    def update(self, key: str, **fields) -> dict:
+        with file_lock(self.path):
+            data = self._load()
+            entry = data.setdefault(key, {})
+            entry.update(fields)
+            entry["updated_at"] = time.time()
+            self._save(data)
+            return entry
+
+    def is_downloaded(self, key: str) -> bool:
+        """True si la letra ya tiene todos sus MP3 descargados y presentes en disco."""
+        entry = self.get(key)
+        return bool(
+            entry
+            and entry.get("status") == STATUS_DOWNLOADED
+            and entry.get("song_paths")
+            and all(os.path.exists(p) for p in entry["song_paths"])
+        )
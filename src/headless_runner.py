@@ -0,0 +1,210 @@
+"""
+Ejecución sin servicios: corre uno o varios trabajos por el mismo grafo que los workers
+de Celery, sin Redis, broker ni aplicación web. La concurrencia entre trabajos es local
+(hilos o procesos). Al terminar imprime el tiempo de cada etapa del pipeline por trabajo.
+
+    python -m src.headless_runner catalogo.json --workers 4
+    python -m src.headless_runner catalogo.json --pool process --stop-before upload_to_youtube
+    python -m src.headless_runner --resume <job_id> [<job_id> ...]
+
+El catálogo tiene el mismo formato que el del envío masivo ('/api/jobs'). Sale con
+código 1 si algún trabajo falla y con 2 si el catálogo no es válido.
+"""
+import sys
+import json
+import time
+import uuid
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+from src.config import WORKSPACES_DIR
+from src.job_scheduler import SCHEDULING_FIELDS, album_spec
+from src.llm_usage import usage_scope
+from src.main_orchestrator import (
+    JobContext, PIPELINE_STAGES, get_app_graph, run_video_workflow, resume_video_workflow,
+    stage_of, thread_config, timing_summary
+)
+from src.workspace import Workspace
+
+GRAPH_NODES = [node for nodes in PIPELINE_STAGES.values() for node in nodes]
+
+
+class ConsoleProgress:
+    """Ocupa el lugar de la tarea de Celery: imprime el progreso con el id del trabajo."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._last = None
+
+    def update_state(self, state=None, meta=None):
+        meta = meta or {}
+        line = f"{meta.get('progress', '')} {meta.get('details', '')}".strip()
+        if line and line != self._last:
+            self._last = line
+            print(f"[{self.job_id}] {line}", flush=True)
+
+
+def load_jobs(path: str, base_dir: str = WORKSPACES_DIR) -> List[Dict]:
+    """Trabajos del catálogo, validados y con su espacio de trabajo asignado."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    specs = data.get("jobs") if isinstance(data, dict) and "jobs" in data else data
+    if isinstance(specs, dict):
+        specs = [specs]
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("El catálogo debe contener una lista de trabajos no vacía.")
+
+    jobs = []
+    for position, spec in enumerate(specs):
+        spec = dict(spec) if isinstance(spec, dict) else spec
+        # Los campos de planificación del envío masivo no aplican aquí, salvo el id
+        options = {field: spec.pop(field) for field in SCHEDULING_FIELDS if isinstance(spec, dict) and field in spec}
+        album = album_spec(spec, position)
+        job_id = options.get("job_id") or f"{position + 1}-{uuid.uuid4().hex[:8]}"
+        workspace = Workspace.for_job(job_id, base_dir=base_dir)
+        if options.get("job_id") and get_app_graph().get_state(thread_config(job_id)).values:
+            raise ValueError(f"El trabajo '{job_id}' ya tiene checkpoint. Usa --resume para continuarlo.")
+        jobs.append({"job_id": job_id, "mode": "run", "state": {**album, "workspace_dir": workspace.root}})
+    ids = [job["job_id"] for job in jobs]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Hay trabajos con el mismo 'job_id' en el catálogo.")
+    return jobs
+
+
+def resume_jobs(job_ids: List[str], base_dir: str = WORKSPACES_DIR) -> List[Dict]:
+    return [{"job_id": job_id, "mode": "resume", "state": {"workspace_dir": Workspace.for_job(job_id, base_dir=base_dir).root}}
+            for job_id in job_ids]
+
+
+def needs_suno(job: Dict, stop_before: Optional[str]) -> bool:
+    """Si el trabajo llegará a la etapa de Suno en esta ejecución (y necesita su cliente)."""
+    stages = list(PIPELINE_STAGES)
+    if stop_before and stages.index(stage_of(stop_before)) <= stages.index("suno"):
+        # 'create_songs' solo prepara las ramas; Suno se llama en 'produce_song'
+        return False
+    pending = get_app_graph().get_state(thread_config(job["job_id"])).next
+    return not pending or stages.index(stage_of(pending[0])) <= stages.index("suno")
+
+
+def stage_timings(job_id: str, since: float) -> Optional[Dict]:
+    """Tiempos de los nodos ejecutados desde 'since', con el tiempo total de cada etapa."""
+    timings = [t for t in get_app_graph().get_state(thread_config(job_id)).values.get("node_timings", [])
+               if t["start"] >= since]
+    summary = timing_summary(timings)
+    if summary is None:
+        return None
+    stages = {}
+    for stage, nodes in PIPELINE_STAGES.items():
+        spans = [t for t in timings if t["node"].split(":")[0] in nodes]
+        if spans:
+            # Tiempo de reloj de la etapa: las ramas por canción se solapan
+            stages[stage] = round(max(t["end"] for t in spans) - min(t["start"] for t in spans), 3)
+    summary["stages"] = stages
+    return summary
+
+
+def run_job(job: Dict, stop_before: Optional[str] = None) -> Dict:
+    """Ejecuta (o reanuda) un trabajo completo. Nunca lanza excepciones: el fallo va en el resultado."""
+    job_id = job["job_id"]
+    started = time.time()
+    result = {"job_id": job_id, "mode": job["mode"]}
+    try:
+        client = None
+        if needs_suno(job, stop_before):
+            from src.suno_api import SunoApiClient
+            client = SunoApiClient()
+            client.initialize_session()
+        context = JobContext(ConsoleProgress(job_id), client)
+        pause_before = [stop_before] if stop_before else None
+        with usage_scope(job_id=job_id):
+            if job["mode"] == "resume":
+                outcome = resume_video_workflow(job["state"], context, pause_before=pause_before)
+            else:
+                Workspace(job["state"]["workspace_dir"]).create()
+                outcome = run_video_workflow(job["state"], context, pause_before=pause_before)
+        result.update(status="paused" if outcome["paused_at"] else "completed", paused_at=outcome["paused_at"],
+                      video_path=outcome["video_path"], youtube_url=outcome["youtube_url"])
+    except Exception as e:
+        traceback.print_exc()
+        result.update(status="failed", error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.time() - started, 3)
+    try:
+        result["timing"] = stage_timings(job_id, started)
+    except Exception as e:
+        print(f"Advertencia: no se pudieron leer los tiempos del trabajo {job_id}: {e}")
+        result["timing"] = None
+    return result
+
+
+def run_jobs(jobs: List[Dict], workers: int = 1, pool: str = "thread", stop_before: Optional[str] = None) -> List[Dict]:
+    """Ejecuta los trabajos con hasta 'workers' a la vez. Devuelve los resultados en el orden de 'jobs'."""
+    if pool == "thread":
+        # Los hilos comparten el grafo y su conexión al checkpointer
+        get_app_graph()
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    else:
+        # 'spawn': cada proceso construye su propio grafo en lugar de heredar una conexión SQLite abierta
+        executor = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn"))
+    results = {}
+    with executor:
+        futures = {executor.submit(run_job, job, stop_before): job["job_id"] for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            print(f"{'❌' if result['status'] == 'failed' else '✅'} {result['job_id']}: {result['status']} en {result['seconds']:.1f}s", flush=True)
+    return [results[job["job_id"]] for job in jobs]
+
+
+def format_summary(results: List[Dict]) -> str:
+    stages = list(PIPELINE_STAGES)
+    lines = ["", "=== Tiempos por etapa (s) ===", "\t".join(["trabajo", "estado", "total"] + stages)]
+    for result in results:
+        timing = (result.get("timing") or {}).get("stages", {})
+        cells = [result["job_id"], result["status"], f"{result['seconds']:.1f}"]
+        cells += [f"{timing[stage]:.1f}" if stage in timing else "-" for stage in stages]
+        lines.append("\t".join(cells))
+        if result.get("error"):
+            lines.append(f"    {result['error']}")
+        elif result.get("paused_at"):
+            lines.append(f"    en pausa antes de '{result['paused_at']}'")
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("catalog", nargs="?", help="Archivo JSON con uno o varios trabajos (mismos campos que el formulario).")
+    parser.add_argument("--resume", nargs="+", metavar="JOB_ID", help="Reanudar estos trabajos desde su checkpoint.")
+    parser.add_argument("--workers", type=int, default=1, help="Trabajos a la vez.")
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread",
+                        help="Hilos (por defecto) o procesos, para renders que ocupan la CPU.")
+    parser.add_argument("--stop-before", choices=GRAPH_NODES,
+                        help="Detener cada trabajo antes de este nodo (p. ej. 'upload_to_youtube' para no publicar).")
+    parser.add_argument("--workspaces-dir", default=WORKSPACES_DIR)
+    parser.add_argument("--report", help="Guardar los resultados y tiempos de cada trabajo en este archivo JSON.")
+    args = parser.parse_args(argv)
+    if bool(args.catalog) == bool(args.resume):
+        parser.error("Indica un catálogo o --resume, pero no ambos.")
+
+    try:
+        jobs = resume_jobs(args.resume, args.workspaces_dir) if args.resume else load_jobs(args.catalog, args.workspaces_dir)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+
+    print(f"▶️ {len(jobs)} trabajos, {args.workers} a la vez ({args.pool}).")
+    started = time.time()
+    results = run_jobs(jobs, workers=args.workers, pool=args.pool, stop_before=args.stop_before)
+    print(format_summary(results))
+    failed = sum(1 for result in results if result["status"] == "failed")
+    print(f"\n{len(results) - failed}/{len(results)} trabajos sin errores en {time.time() - started:.1f}s.")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
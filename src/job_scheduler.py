@@ -0,0 +1,423 @@
+"""
+Planificador de trabajos: recibe muchos álbumes a la vez (formulario, '/api/jobs' o esta
+línea de comandos) y los lanza en Celery por turnos, en lugar de encolarlos todos en
+orden de llegada.
+
+- Como mucho hay SCHEDULER_MAX_ACTIVE_JOBS trabajos en curso; el resto espera.
+- El siguiente trabajo es el de mayor prioridad (0-9). A igual prioridad se elige el
+  usuario con menos trabajos en curso, y si empatan, el que lleva más tiempo sin turno.
+  Así, un catálogo de un usuario no bloquea los álbumes de los demás.
+- La prioridad acompaña al trabajo en todas las colas de etapa (ver tasks.py).
+- Un trabajo que se detiene para revisar sus letras (o por una etapa fallida) queda en
+  pausa: libera su hueco, pero al reanudarse vuelve a la cola con su usuario y su
+  prioridad, y sus etapas de Suno, render y subida también esperan su turno.
+- La hora de inicio estimada de cada trabajo en espera sale de la duración media de los
+  últimos trabajos terminados.
+
+El estado vive en Redis para que la web y los workers lo compartan; sin Redis, cada
+proceso usa el suyo en memoria.
+
+    python -m src.job_scheduler catalogo.json --user ana --priority 7
+    python -m src.job_scheduler --queue
+"""
+import sys
+import json
+import copy
+import heapq
+import time
+import uuid
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from src.config import (
+    SCHEDULER_MAX_ACTIVE_JOBS, SCHEDULER_DEFAULT_PRIORITY, SCHEDULER_DEFAULT_JOB_SECONDS,
+    SCHEDULER_DURATION_SAMPLES, SCHEDULER_ACTIVE_TIMEOUT, SCHEDULER_PAUSED_TIMEOUT
+)
+from src.redis_store import get_redis
+from src.telemetry import record_wait
+from src.workspace import Workspace
+
+MAX_PRIORITY = 9
+# Máximo de canciones por tipo, como en el formulario
+MAX_SONGS = 25
+DEFAULT_USER = "default"
+
+# Campos de un álbum y sus valores por defecto (los mismos que el formulario)
+ALBUM_DEFAULTS = {
+    "song_style": "",
+    "is_instrumental": False,
+    "language": "spanish",
+    "with_subtitles": True,
+    "refine_lyrics": True,
+    "num_female_songs": 1,
+    "num_male_songs": 0,
+    "num_instrumental_songs": 1,
+    "llm_model": "openai/gpt-4o-mini",
+    "suno_model": "chirp-crow",
+}
+_BOOL_FIELDS = ("is_instrumental", "with_subtitles", "refine_lyrics")
+_COUNT_FIELDS = ("num_female_songs", "num_male_songs", "num_instrumental_songs")
+# Campos de planificación que cada álbum puede indicar por su cuenta
+SCHEDULING_FIELDS = ("job_id", "user", "priority", "review")
+
+
+def album_spec(spec: dict, position: int = 0) -> dict:
+    """Valida un álbum del envío y lo completa con los valores por defecto del formulario."""
+    label = f"El trabajo {position + 1}"
+    if not isinstance(spec, dict):
+        raise ValueError(f"{label} no es un objeto JSON.")
+    unknown = set(spec) - set(ALBUM_DEFAULTS) - {"user_prompt"}
+    if unknown:
+        raise ValueError(f"{label} tiene campos desconocidos: {', '.join(sorted(unknown))}.")
+    prompt = spec.get("user_prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise ValueError(f"{label} no tiene 'user_prompt'.")
+
+    album = {**ALBUM_DEFAULTS, **spec}
+    for field in _BOOL_FIELDS:
+        if not isinstance(album[field], bool):
+            raise ValueError(f"{label}: '{field}' debe ser true o false.")
+    for field in _COUNT_FIELDS:
+        value = album[field]
+        if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= MAX_SONGS:
+            raise ValueError(f"{label}: '{field}' debe ser un entero entre 0 y {MAX_SONGS}.")
+
+    if album["is_instrumental"]:
+        album["num_female_songs"] = album["num_male_songs"] = 0
+        total = album["num_instrumental_songs"]
+    else:
+        album["num_instrumental_songs"] = 0
+        total = album["num_female_songs"] + album["num_male_songs"]
+    if total == 0:
+        raise ValueError(f"{label} no tiene canciones.")
+    return album
+
+
+def priority_value(value, position: int = 0) -> int:
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= MAX_PRIORITY:
+        raise ValueError(f"El trabajo {position + 1}: 'priority' debe ser un entero entre 0 y {MAX_PRIORITY}.")
+    return value
+
+
+def celery_priority(priority: int) -> int:
+    """Prioridad del mensaje de Celery: con Redis, 0 es la más alta."""
+    return MAX_PRIORITY - priority
+
+
+def admission_order(pending: List[Dict], active_by_user: Dict[str, int], last_turn: Dict[str, int]) -> List[Dict]:
+    """
+    Orden en que se lanzarían los trabajos en espera si todos los huecos se liberaran a
+    la vez: por prioridad y, dentro de cada prioridad, por turnos entre usuarios.
+    """
+    pending = sorted(pending, key=lambda job: job["seq"])
+    active = dict(active_by_user)
+    turns = dict(last_turn)
+    turn = max(turns.values(), default=0)
+    order = []
+    while pending:
+        job = min(pending, key=lambda j: (-j["priority"], active.get(j["user"], 0), turns.get(j["user"], -1), j["seq"]))
+        pending.remove(job)
+        order.append(job)
+        turn += 1
+        active[job["user"]] = active.get(job["user"], 0) + 1
+        turns[job["user"]] = turn
+    return order
+
+
+def estimate_starts(order: List[Dict], active: List[Dict], max_active: int, job_seconds: float, now: float) -> Dict[str, float]:
+    """Hora de inicio estimada de cada trabajo en espera, repartiéndolos entre los huecos."""
+    slots = sorted(max(now, job["started_at"] + job_seconds) for job in active)[:max_active]
+    slots += [now] * (max_active - len(slots))
+    heapq.heapify(slots)
+    starts = {}
+    for job in order:
+        start = heapq.heappop(slots)
+        starts[job["job_id"]] = start
+        heapq.heappush(slots, start + job_seconds)
+    return starts
+
+
+def _timestamp(seconds: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(seconds).isoformat(timespec="seconds") if seconds else None
+
+
+def _empty_state() -> dict:
+    return {"seq": 0, "turn": 0, "jobs": {}, "last_turn": {}, "durations": []}
+
+
+class _LocalStore:
+    """Estado en memoria del proceso, usado cuando Redis no está disponible."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = _empty_state()
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            state = copy.deepcopy(self.state)
+            yield state
+            self.state = state
+
+    def read(self) -> dict:
+        with self.lock:
+            return copy.deepcopy(self.state)
+
+
+class _RedisStore:
+    """Estado compartido en Redis; las modificaciones se hacen con un bloqueo distribuido."""
+    KEY = "scheduler:state"
+
+    def __init__(self, client):
+        self.client = client
+
+    @contextmanager
+    def transaction(self):
+        with self.client.lock("scheduler:lock", timeout=30, blocking_timeout=30):
+            state = self.read()
+            yield state
+            self.client.set(self.KEY, json.dumps(state))
+
+    def read(self) -> dict:
+        raw = self.client.get(self.KEY)
+        return json.loads(raw) if raw else _empty_state()
+
+
+class JobScheduler:
+    """
+    Cola de trabajos con prioridades y reparto justo entre usuarios. 'dispatch(job)' lanza
+    un trabajo admitido (o lo reanuda, si trae 'resume'); quien ejecuta el trabajo llama a
+    'finish(job_id)' al terminar, o a 'pause(job_id)' si se detiene, para liberar su hueco.
+    """
+
+    def __init__(self, dispatch: Callable[[Dict], None], max_active: int = SCHEDULER_MAX_ACTIVE_JOBS,
+                 redis_factory: Callable = None, queue_depths: Callable[[], Dict[str, int]] = None):
+        self.dispatch = dispatch
+        self.max_active = max_active
+        self.redis_factory = redis_factory or get_redis
+        self.queue_depths = queue_depths
+        self.local = _LocalStore()
+
+    def _store(self):
+        client = self.redis_factory()
+        return _RedisStore(client) if client is not None else self.local
+
+    # --- Envío y admisión ---
+
+    def submit(self, specs: List[dict], user: str = DEFAULT_USER, priority: int = SCHEDULER_DEFAULT_PRIORITY,
+               review: bool = True) -> List[Dict]:
+        """
+        Añade los álbumes a la cola y lanza los que quepan. Se validan todos antes de
+        encolar ninguno. Cada álbum puede indicar su propio 'job_id', 'user', 'priority'
+        o 'review' (si es false, el trabajo sigue sin pausa para revisar las letras).
+        """
+        if not isinstance(specs, list) or not specs:
+            raise ValueError("El envío debe contener una lista de trabajos no vacía.")
+        records = []
+        for position, spec in enumerate(specs):
+            spec = dict(spec) if isinstance(spec, dict) else spec
+            options = {field: spec.pop(field) for field in SCHEDULING_FIELDS if isinstance(spec, dict) and field in spec}
+            record = {
+                "job_id": options.get("job_id") or str(uuid.uuid4()),
+                "user": str(options.get("user", user) or DEFAULT_USER)[:64],
+                "priority": priority_value(options.get("priority", priority), position),
+                "review": options.get("review", review),
+                "spec": album_spec(spec, position),
+            }
+            if not isinstance(record["review"], bool):
+                raise ValueError(f"El trabajo {position + 1}: 'review' debe ser true o false.")
+            Workspace.for_job(record["job_id"])  # valida el id
+            records.append(record)
+        ids = [record["job_id"] for record in records]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Hay trabajos con el mismo 'job_id' en el envío.")
+
+        with self._store().transaction() as state:
+            taken = [job_id for job_id in ids if job_id in state["jobs"]]
+            if taken:
+                raise ValueError(f"Ya hay trabajos en cola con el id: {', '.join(taken)}.")
+            for record in records:
+                state["seq"] += 1
+                record.update(seq=state["seq"], status="pending", submitted_at=time.time(), started_at=None)
+                state["jobs"][record["job_id"]] = record
+        print(f"🗂️ Planificador: {len(records)} trabajos en cola.")
+
+        self.admit()
+        jobs = {job["job_id"]: job for job in self.overview()["jobs"]}
+        # Los que ya se lanzaron y terminaron no aparecen en la cola
+        return [jobs.get(job_id, {"job_id": job_id, "status": "finished"}) for job_id in ids]
+
+    def admit(self) -> List[Dict]:
+        """Lanza los trabajos en espera que quepan en los huecos libres. Devuelve los lanzados."""
+        now = time.time()
+        with self._store().transaction() as state:
+            jobs = state["jobs"]
+            for job in list(jobs.values()):
+                if job["status"] == "active" and now - job["started_at"] > SCHEDULER_ACTIVE_TIMEOUT:
+                    print(f"⚠️ Planificador: el trabajo {job['job_id']} no terminó en {SCHEDULER_ACTIVE_TIMEOUT:.0f}s; se libera su hueco.")
+                    del jobs[job["job_id"]]
+                elif job["status"] == "paused" and now - job["paused_at"] > SCHEDULER_PAUSED_TIMEOUT:
+                    # Si se reanuda después, lo hará fuera del planificador
+                    del jobs[job["job_id"]]
+            active = [job for job in jobs.values() if job["status"] == "active"]
+            free = self.max_active - len(active)
+            pending = [job for job in jobs.values() if job["status"] == "pending"]
+            if free <= 0 or not pending:
+                return []
+            chosen = admission_order(pending, self._active_by_user(active), state["last_turn"])[:free]
+            for job in chosen:
+                state["turn"] += 1
+                state["last_turn"][job["user"]] = state["turn"]
+                job.update(status="active", started_at=now)
+
+        for position, job in enumerate(chosen):
+            try:
+                self.dispatch(job)
+                record_wait("scheduler", now - job["submitted_at"])
+            except Exception:
+                # El trabajo (y los siguientes de esta tanda) vuelven a la cola
+                with self._store().transaction() as state:
+                    for failed in chosen[position:]:
+                        if failed["job_id"] in state["jobs"]:
+                            state["jobs"][failed["job_id"]].update(status="pending", started_at=None)
+                raise
+        return chosen
+
+    def finish(self, job_id: str):
+        """Libera el hueco de un trabajo terminado (o que no se puede reanudar) y lanza el siguiente."""
+        with self._store().transaction() as state:
+            job = state["jobs"].pop(job_id, None)
+            if job is None:
+                return
+            if job["status"] == "active":
+                # La duración no cuenta el tiempo en pausa (revisión de las letras)
+                duration = job.get("elapsed", 0) + time.time() - job["started_at"]
+                state["durations"] = (state["durations"] + [duration])[-SCHEDULER_DURATION_SAMPLES:]
+        self.admit()
+
+    def pause(self, job_id: str):
+        """
+        Deja en pausa un trabajo en curso (revisión de las letras o etapa fallida): libera su
+        hueco y lanza el siguiente, pero conserva el trabajo para reanudarlo con 'resume'.
+        """
+        now = time.time()
+        with self._store().transaction() as state:
+            job = state["jobs"].get(job_id)
+            if job is None or job["status"] != "active":
+                return
+            job.update(status="paused", paused_at=now, started_at=None,
+                       elapsed=job.get("elapsed", 0) + now - job["started_at"])
+        self.admit()
+
+    def resume(self, job_id: str, resume: dict) -> bool:
+        """
+        Devuelve a la cola un trabajo en pausa, con su usuario y su prioridad; cuando le toque
+        turno, 'dispatch' lo reanudará con las opciones de 'resume'. Devuelve False si el
+        planificador no tiene el trabajo (p. ej. no se envió a través de él).
+        """
+        with self._store().transaction() as state:
+            job = state["jobs"].get(job_id)
+            if job is None:
+                return False
+            if job["status"] != "paused":
+                raise ValueError(f"El trabajo {job_id} ya está en cola o en curso.")
+            state["seq"] += 1
+            job.update(status="pending", seq=state["seq"], submitted_at=time.time(), resume=resume)
+        self.admit()
+        return True
+
+    # --- Consulta ---
+
+    @staticmethod
+    def _active_by_user(active: List[Dict]) -> Dict[str, int]:
+        counts = {}
+        for job in active:
+            counts[job["user"]] = counts.get(job["user"], 0) + 1
+        return counts
+
+    def overview(self) -> dict:
+        """Profundidad de la cola, trabajos por usuario y hora de inicio estimada de cada trabajo."""
+        state = self._store().read()
+        now = time.time()
+        durations = state["durations"]
+        job_seconds = sum(durations) / len(durations) if durations else SCHEDULER_DEFAULT_JOB_SECONDS
+        jobs = list(state["jobs"].values())
+        active = [job for job in jobs if job["status"] == "active"]
+        order = admission_order([job for job in jobs if job["status"] == "pending"],
+                                self._active_by_user(active), state["last_turn"])
+        starts = estimate_starts(order, active, self.max_active, job_seconds, now)
+
+        paused = [job for job in jobs if job["status"] == "paused"]
+        users = {}
+        for job in jobs:
+            counts = users.setdefault(job["user"], {"pending": 0, "active": 0, "paused": 0})
+            counts[job["status"]] += 1
+        entries = [
+            {"job_id": job["job_id"], "user": job["user"], "priority": job["priority"], "status": "active",
+             "started_at": _timestamp(job["started_at"])}
+            for job in sorted(active, key=lambda j: j["started_at"])
+        ] + [
+            {"job_id": job["job_id"], "user": job["user"], "priority": job["priority"], "status": "pending",
+             "position": position + 1, "estimated_start": _timestamp(starts[job["job_id"]]),
+             "estimated_wait_seconds": round(starts[job["job_id"]] - now)}
+            for position, job in enumerate(order)
+        ] + [
+            {"job_id": job["job_id"], "user": job["user"], "priority": job["priority"], "status": "paused",
+             "paused_at": _timestamp(job["paused_at"])}
+            for job in sorted(paused, key=lambda j: j["paused_at"])
+        ]
+        overview = {
+            "pending": len(order),
+            "active": len(active),
+            "paused": len(paused),
+            "max_active": self.max_active,
+            "avg_job_seconds": round(job_seconds),
+            "users": users,
+            "jobs": entries,
+        }
+        if self.queue_depths:
+            try:
+                overview["queues"] = self.queue_depths()
+            except Exception as e:
+                print(f"Advertencia: no se pudo consultar la profundidad de las colas de Celery: {e}")
+        return overview
+
+
+def main():
+    import requests
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("catalog", nargs="?", help="Archivo JSON con la lista de álbumes (mismos campos que el formulario).")
+    parser.add_argument("--url", default="http://localhost:8000", help="Dirección de la aplicación web.")
+    parser.add_argument("--user", default=DEFAULT_USER)
+    parser.add_argument("--priority", type=int, default=SCHEDULER_DEFAULT_PRIORITY)
+    parser.add_argument("--no-review", action="store_true", help="Continuar sin pausa para revisar las letras.")
+    parser.add_argument("--queue", action="store_true", help="Mostrar el estado de la cola y salir.")
+    args = parser.parse_args()
+
+    if args.queue or not args.catalog:
+        response = requests.get(f"{args.url}/api/queue", timeout=30)
+        response.raise_for_status()
+        print(json.dumps(response.json(), ensure_ascii=False, indent=2))
+        return 0
+
+    with open(args.catalog, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)
+    response = requests.post(f"{args.url}/api/jobs", timeout=60, json={
+        "jobs": jobs, "user": args.user, "priority": args.priority, "review": not args.no_review
+    })
+    data = response.json()
+    if response.status_code >= 400:
+        print(f"❌ {data.get('error', response.text)}")
+        return 1
+    for job in data["jobs"]:
+        eta = f"inicio estimado {job['estimated_start']}" if job.get("estimated_start") else job["status"]
+        print(f"✅ {job['job_id']} (prioridad {job.get('priority')}): {eta}")
+    print(f"Cola: {data['queue']['pending']} en espera, {data['queue']['active']}/{data['queue']['max_active']} en curso.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,560 @@
+"""
+Modo batch para catálogos: reúne las peticiones de LLM pendientes de muchos trabajos
+(plan, borradores, refinamiento y metadatos), las envía como lotes JSONL con el formato
+de la API Batch de OpenAI, sondea hasta que terminan y reparte los resultados en los
+archivos de cada trabajo ('<salida>/<job_id>/lyrics' y '<salida>/<job_id>/metadata').
+
+    python -m src.llm_batch catalogo.json --backend local
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+from typing import Callable, Dict, List
+from src.config import (
+    LLM_BATCH_BACKEND, LLM_BATCH_OUTPUT_DIR, LLM_BATCH_STATE_DIR, LLM_BATCH_POLL_INTERVAL
+)
+from src.utils import (
+    file_lock, parse_lyrics_file, parse_lyrics_response, format_lyrics_file,
+    parse_metadata_response, format_metadata_file
+)
+from src.llm_cache import llm_cache
+from src.llm_client import get_provider_client
+from src.llm_pool import provider_of
+from src.llm_router import llm_router, build_repair_messages
+from src.llm_usage import llm_usage, usage_scope, TokenUsage
+from src.workspace import Workspace
+from src.lyric_generator import (
+    DRAFT_PROVIDER_PARAMS, REFINE_PARAMS, INSTRUMENTAL_PROVIDER_PARAMS, PLAN_PARAMS,
+    build_draft_messages, build_instrumental_messages, build_refine_messages,
+    build_song_plan_messages, parse_refinable_draft, assemble_refined_lyrics, error_draft,
+    validate_refined_lyrics, plan_chunks, parse_plan_entries, merge_plan_entries, complete_song_plan
+)
+from src.metadata_generator import (
+    METADATA_PROVIDER_PARAMS, build_metadata_messages, fallback_metadata, save_metadata
+)
+from src.lyrics_similarity import dedupe_lyrics_files
+from src.main_orchestrator import (
+    natural_sort_key, pad_song_plan, save_song_plan, song_detailed_prompt,
+    instrumental_content, write_draft_files
+)
+
+STAGES = ("plan", "draft", "refine", "metadata")
+# Proveedores con API Batch compatible con la de OpenAI (archivos JSONL + /v1/batches)
+BATCH_PROVIDERS = ("openai", "groq")
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Validación y formato de archivo de las respuestas de cada etapa del router:
+# (validar(texto) -> (datos, errores), formatear(datos) -> texto)
+_accept = lambda content: (content, [])
+_same = lambda parsed: parsed
+RESPONSE_FORMATS = {
+    "plan": (_accept, _same),
+    "draft": (parse_lyrics_response, format_lyrics_file),
+    "instrumental": (lambda content: parse_lyrics_response(content, instrumental=True), format_lyrics_file),
+    "refine": (validate_refined_lyrics, _same),
+    "metadata": (parse_metadata_response, format_metadata_file),
+}
+
+
+# --- Backends ---
+
+class OpenAIBatchBackend:
+    """API Batch de OpenAI. Groq expone la misma API, así que sirve para ambos proveedores."""
+
+    def __init__(self, provider: str = "openai"):
+        self.provider = provider
+
+    def submit(self, jsonl_path: str) -> str:
+        client = get_provider_client(self.provider)
+        with open(jsonl_path, 'rb') as f:
+            batch_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return get_provider_client(self.provider).batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> Dict[str, dict]:
+        client = get_provider_client(self.provider)
+        batch = client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, getattr(batch, "error_file_id", None)):
+            if file_id:
+                lines.extend(client.files.content(file_id).text.splitlines())
+        return parse_output_lines(lines)
+
+
+class LocalBatchBackend:
+    """
+    Sustituto en disco de la API Batch: guarda la entrada en '<directorio>/<batch_id>/'
+    y, pasada la latencia simulada, genera la salida con 'responder(custom_id, body)'.
+    Todo el estado está en archivos, así que otro proceso puede seguir sondeando.
+    """
+
+    def __init__(self, directory: str = os.path.join(LLM_BATCH_STATE_DIR, "local"),
+                 responder: Callable = None, latency: float = 0.0):
+        self.directory = directory
+        self.responder = responder or offline_responder
+        self.latency = latency
+
+    def _batch_dir(self, batch_id: str) -> str:
+        return os.path.join(self.directory, batch_id)
+
+    def submit(self, jsonl_path: str) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex[:12]}"
+        os.makedirs(self._batch_dir(batch_id))
+        shutil.copy(jsonl_path, os.path.join(self._batch_dir(batch_id), "input.jsonl"))
+        self._write_status(batch_id, {"status": "in_progress", "created_at": time.time()})
+        return batch_id
+
+    def _write_status(self, batch_id: str, status: dict):
+        with open(os.path.join(self._batch_dir(batch_id), "status.json"), 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+
+    def status(self, batch_id: str) -> str:
+        status_path = os.path.join(self._batch_dir(batch_id), "status.json")
+        with file_lock(status_path):
+            with open(status_path, 'r', encoding='utf-8') as f:
+                status = json.load(f)
+            if status["status"] == "in_progress" and time.time() - status["created_at"] >= self.latency:
+                self._process(batch_id)
+                status["status"] = "completed"
+                self._write_status(batch_id, status)
+        return status["status"]
+
+    def _process(self, batch_id: str):
+        with open(os.path.join(self._batch_dir(batch_id), "input.jsonl"), 'r', encoding='utf-8') as f:
+            requests_ = [json.loads(line) for line in f if line.strip()]
+        with open(os.path.join(self._batch_dir(batch_id), "output.jsonl"), 'w', encoding='utf-8') as f:
+            for request in requests_:
+                try:
+                    content = self.responder(request["custom_id"], request["body"])
+                    line = {"custom_id": request["custom_id"], "error": None, "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"role": "assistant", "content": content}}]},
+                    }}
+                except Exception as e:
+                    line = {"custom_id": request["custom_id"], "response": None,
+                            "error": {"code": "responder_error", "message": str(e)}}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def results(self, batch_id: str) -> Dict[str, dict]:
+        with open(os.path.join(self._batch_dir(batch_id), "output.jsonl"), 'r', encoding='utf-8') as f:
+            return parse_output_lines(f.read().splitlines())
+
+
+def parse_output_lines(lines: List[str]) -> Dict[str, dict]:
+    """Convierte las líneas de salida de un lote en {custom_id: {'content': ...} o {'error': ...}}."""
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") == 200:
+            results[item["custom_id"]] = {"content": response["body"]["choices"][0]["message"]["content"],
+                                          "usage": response["body"].get("usage")}
+        else:
+            error = item.get("error") or response.get("body", {}).get("error") or {"message": "respuesta vacía"}
+            results[item["custom_id"]] = {"error": error.get("message", str(error))}
+    return results
+
+
+def offline_responder(custom_id: str, body: dict) -> str:
+    """Respuestas deterministas con el formato que espera cada etapa, para probar sin red."""
+    _, stage, index = custom_id.rsplit("|", 2)
+    user_message = body["messages"][-1]["content"]
+    if stage == "plan":
+        total = int(re.search(r"plan para (\d+) canciones", user_message).group(1))
+        chunk = re.search(r"planificando las canciones (\d+) a", user_message)
+        start = int(chunk.group(1)) if chunk else 1
+        return json.dumps({"song_plan": [
+            {"title": f"Canción simulada {i}", "description": f"Descripción simulada {i}."}
+            for i in range(start, start + total)
+        ]}, ensure_ascii=False)
+    # Con salida estructurada se responde en JSON, como haría el proveedor
+    structured = "response_format" in body
+    if stage == "draft" and "PROMPT:" not in body["messages"][0]["content"]:
+        if structured:
+            return json.dumps({"title": f"Instrumental simulada {index}", "tags": "ambient instrumental, slow tempo"})
+        return f"TITLE: Instrumental simulada {index}\n\nTAGS:\nambient instrumental, slow tempo"
+    if stage == "draft":
+        if structured:
+            return json.dumps({"title": f"Borrador simulado {index}", "lyrics": f"Verse 1:\nLínea simulada {index}",
+                               "tags": "simulated pop, steady tempo", "gender": "Masculino"}, ensure_ascii=False)
+        return (
+            f"TITLE: Borrador simulado {index}\n\nPROMPT:\nVerse 1:\nLínea simulada {index}\n\n"
+            "TAGS:\nsimulated pop, steady tempo\n\nGENERO: Masculino"
+        )
+    if stage == "refine":
+        return f"Verse 1:\nLínea refinada {index}"
+    if structured:
+        return json.dumps({"title": "Video simulado", "description": "Metadatos simulados.", "tags": ["simulado", "batch"]})
+    return f"Título: Video simulado\nDescripción: Metadatos simulados.\nEtiquetas: simulado, batch"
+
+
+# --- Ejecución de un catálogo ---
+
+class BatchRunner:
+    """
+    Ejecuta las etapas de LLM de varios trabajos en lotes: todas las peticiones de una
+    etapa se agrupan por proveedor en un único lote. El estado de la ejecución (lotes
+    enviados y etapas completadas) se guarda en disco, de modo que relanzar el mismo
+    catálogo sondea los lotes ya enviados en lugar de volver a pagarlos.
+    """
+
+    def __init__(self, run_name: str, backend_name: str = LLM_BATCH_BACKEND,
+                 output_dir: str = LLM_BATCH_OUTPUT_DIR, state_dir: str = LLM_BATCH_STATE_DIR,
+                 poll_interval: float = LLM_BATCH_POLL_INTERVAL, local_backend: LocalBatchBackend = None):
+        if backend_name not in ("openai", "local"):
+            raise ValueError(f"Backend de batch desconocido: '{backend_name}'. Usa 'openai' o 'local'.")
+        self.run_name = run_name
+        self.backend_name = backend_name
+        self.local_backend = local_backend or LocalBatchBackend(os.path.join(state_dir, "local"))
+        self.output_dir = output_dir
+        self.state_dir = state_dir
+        self.poll_interval = poll_interval
+        self.manifest_path = os.path.join(state_dir, f"{run_name}.json")
+
+    # --- Estado de la ejecución ---
+
+    def _load_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {"stages": {}}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _update_manifest(self, stage: str, **fields):
+        with file_lock(self.manifest_path):
+            manifest = self._load_manifest()
+            manifest["stages"].setdefault(stage, {}).update(fields)
+            os.makedirs(self.state_dir, exist_ok=True)
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.manifest_path)
+
+    def _backend(self, provider: str):
+        if self.backend_name == "local":
+            return self.local_backend
+        return OpenAIBatchBackend(provider)
+
+    # --- Rutas de cada trabajo (misma disposición que los espacios de trabajo) ---
+
+    def workspace(self, job: dict) -> Workspace:
+        return Workspace(os.path.join(self.output_dir, job["job_id"]))
+
+    def lyrics_dir(self, job: dict) -> str:
+        return self.workspace(job).lyrics_dir
+
+    def metadata_dir(self, job: dict) -> str:
+        return self.workspace(job).metadata_dir
+
+    def _lyrics_files(self, job: dict) -> List[str]:
+        directory = self.lyrics_dir(job)
+        if not os.path.isdir(directory):
+            return []
+        return sorted((os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.txt')), key=natural_sort_key)
+
+    def _load_plan(self, job: dict) -> List[Dict]:
+        with open(os.path.join(self.metadata_dir(job), "song_plan.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _router_stage(stage: str, job: dict) -> str:
+        return "instrumental" if stage == "draft" and job["is_instrumental"] else stage
+
+    @staticmethod
+    def _primary(stage: str, job: dict):
+        return job["llm_model"] if stage == "draft" and not job["is_instrumental"] else None
+
+    def _batch_model(self, stage: str, job: dict) -> str:
+        """Primer candidato de la etapa cuyo proveedor admite la API Batch."""
+        candidates = llm_router.candidates(self._router_stage(stage, job), self._primary(stage, job))
+        if self.backend_name == "local":
+            return candidates[0]
+        for model in candidates:
+            if provider_of(model) in BATCH_PROVIDERS:
+                return model
+        raise ValueError(f"Ningún candidato de la etapa '{stage}' admite la API Batch: {candidates}")
+
+    # --- Peticiones por etapa ---
+
+    def _collect(self, stage: str, jobs: List[dict]) -> List[dict]:
+        """Devuelve las peticiones pendientes de la etapa: custom_id, modelo, mensajes y parámetros."""
+        requests_ = []
+
+        def add(job, index, messages, params=None, provider_params=None):
+            llm_model = self._batch_model(stage, job)
+            if provider_params:
+                params = provider_params.get(provider_of(llm_model), {})
+            requests_.append({
+                "custom_id": f"{job['job_id']}|{stage}|{index}", "llm_model": llm_model,
+                "messages": messages, "params": params,
+                # Datos para reintentar en tiempo real si el lote no devuelve respuesta
+                "router_stage": self._router_stage(stage, job), "primary": self._primary(stage, job),
+                "provider_params": provider_params,
+            })
+
+        for job in jobs:
+            if stage == "plan":
+                if not job["is_instrumental"] and not os.path.exists(os.path.join(self.metadata_dir(job), "song_plan.json")):
+                    # Los álbumes grandes se piden en tramos, como en tiempo real
+                    for i, (start_index, count) in enumerate(plan_chunks(job["total_songs"])):
+                        messages = build_song_plan_messages(job["user_prompt"], count, job["language"],
+                                                            start_index=start_index, album_size=job["total_songs"])
+                        add(job, i, messages, PLAN_PARAMS)
+
+            elif stage == "draft" and not self._lyrics_files(job):
+                song_plan = self._load_plan(job)
+                for i, song_idea in enumerate(song_plan):
+                    prompt = song_detailed_prompt(song_idea, job["user_prompt"])
+                    if job["is_instrumental"]:
+                        messages = build_instrumental_messages(prompt, job["song_style"], job["language"], i + 1, len(song_plan))
+                        add(job, i, messages, provider_params=INSTRUMENTAL_PROVIDER_PARAMS)
+                    else:
+                        gender = "Femenino" if i < job["num_female_songs"] else "Masculino"
+                        messages = build_draft_messages(prompt, job["song_style"], job["language"], gender, i + 1, len(song_plan))
+                        add(job, i, messages, provider_params=DRAFT_PROVIDER_PARAMS)
+
+            elif stage == "refine" and job["refine_lyrics"] and not job["is_instrumental"]:
+                for i, filepath in enumerate(self._lyrics_files(job)):
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        parsed_draft = parse_refinable_draft(f.read())
+                    if parsed_draft is not None:
+                        add(job, i, build_refine_messages(job["user_prompt"], parsed_draft['prompt'], job["song_style"]), REFINE_PARAMS)
+
+            elif stage == "metadata":
+                metadata_dir = self.metadata_dir(job)
+                already_done = os.path.isdir(metadata_dir) and any(f.startswith("metadata_") for f in os.listdir(metadata_dir))
+                lyrics_files = self._lyrics_files(job)
+                if not already_done and lyrics_files:
+                    with open(lyrics_files[0], 'r', encoding='utf-8') as f:
+                        base_lyrics = parse_lyrics_file(f.read()).get('prompt', '')
+                    add(job, 0, build_metadata_messages(base_lyrics, job["user_prompt"], job["song_style"]),
+                        provider_params=METADATA_PROVIDER_PARAMS)
+        return requests_
+
+    def _execute(self, stage: str, requests_: List[dict]) -> Dict[str, dict]:
+        """Resuelve las peticiones: primero la caché de LLM, el resto en un lote por proveedor."""
+        results = {}
+        by_provider = {}
+        for request in requests_:
+            provider = provider_of(request["llm_model"])
+            model_name = request["llm_model"].split('/', 1)[-1]
+            request["cache_key"] = llm_cache.make_key(provider, model_name, request["messages"], request["params"])
+            cached = llm_cache.get(request["cache_key"]) if llm_cache.mode == "on" else None
+            if cached is not None:
+                results[request["custom_id"]] = {"content": cached}
+            else:
+                by_provider.setdefault(provider, []).append(request)
+        if results:
+            print(f"♻️ Batch [{stage}]: {len(results)} respuestas servidas desde la caché.")
+
+        stage_state = self._load_manifest()["stages"].get(stage, {})
+        batches = dict(stage_state.get("batches", {}))
+        for provider, provider_requests in by_provider.items():
+            if provider not in batches:
+                batches[provider] = self._submit(stage, provider, provider_requests)
+                self._update_manifest(stage, batches=batches, status="submitted")
+
+        for provider, batch_id in batches.items():
+            batch_results = self._wait(stage, provider, batch_id)
+            for request in by_provider.get(provider, []):
+                result = batch_results.get(request["custom_id"])
+                if result and "content" in result:
+                    llm_cache.put(request["cache_key"], result["content"], provider, request["llm_model"].split('/', 1)[-1])
+                    self._record_usage(request, result)
+            results.update(batch_results)
+        return results
+
+    @staticmethod
+    def _job_id(request: dict) -> str:
+        return request["custom_id"].split("|", 1)[0]
+
+    def _record_usage(self, request: dict, result: dict):
+        """Anota en el registro de uso de LLM una respuesta del lote (sin latencia por petición)."""
+        usage = result.get("usage") or {}
+        tokens = TokenUsage(
+            usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0,
+            (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+        ) if usage else None
+        with usage_scope(job_id=self._job_id(request), stage=request["router_stage"], attempt="batch"):
+            llm_usage.record(request["llm_model"], None, tokens)
+
+    def _submit(self, stage: str, provider: str, requests_: List[dict]) -> str:
+        os.makedirs(self.state_dir, exist_ok=True)
+        jsonl_path = os.path.join(self.state_dir, f"{self.run_name}_{stage}_{provider}.jsonl")
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            for request in requests_:
+                body = {"model": request["llm_model"].split('/', 1)[-1], "messages": request["messages"], **request["params"]}
+                f.write(json.dumps({"custom_id": request["custom_id"], "method": "POST",
+                                    "url": "/v1/chat/completions", "body": body}, ensure_ascii=False) + "\n")
+        batch_id = self._backend(provider).submit(jsonl_path)
+        print(f"📦 Batch [{stage}]: lote {batch_id} enviado a {provider} con {len(requests_)} peticiones.")
+        return batch_id
+
+    def _wait(self, stage: str, provider: str, batch_id: str) -> Dict[str, dict]:
+        backend = self._backend(provider)
+        while True:
+            status = backend.status(batch_id)
+            if status in TERMINAL_STATUSES:
+                break
+            print(f"⏳ Batch [{stage}]: lote {batch_id} en estado '{status}'. Nuevo sondeo en {self.poll_interval:.0f}s.")
+            time.sleep(self.poll_interval)
+        if status != "completed":
+            print(f"⚠️ Batch [{stage}]: el lote {batch_id} terminó en estado '{status}'.")
+            return {}
+        return backend.results(batch_id)
+
+    def _realtime_retry(self, request: dict, messages: List[Dict] = None):
+        """
+        Las peticiones fallidas del lote se reintentan en tiempo real con el router; con
+        'messages' se pide la reparación de una respuesta no válida. Devuelve el texto
+        validado en el formato de archivo de la etapa, o None.
+        """
+        validate, render = RESPONSE_FORMATS[request["router_stage"]]
+        try:
+            with usage_scope(job_id=self._job_id(request)):
+                parsed = llm_router.complete_validated(
+                    request["router_stage"], messages or request["messages"], validate, primary=request["primary"],
+                    provider_params=request["provider_params"], **request["params"]
+                )
+            return render(parsed)
+        except Exception as e:
+            print(f"Error en el reintento en tiempo real de {request['custom_id']}: {e}")
+            return None
+
+    def _validated(self, stage: str, request: dict, content: str):
+        """Valida la respuesta del lote; si no es válida, pide su reparación en tiempo real."""
+        validate, render = RESPONSE_FORMATS[request["router_stage"]]
+        parsed, errors = validate(content)
+        if not errors:
+            return render(parsed)
+        print(f"🩹 Batch [{stage}]: respuesta no válida para {request['custom_id']} ({'; '.join(errors)}).")
+        return self._realtime_retry(request, build_repair_messages(request["messages"], content, errors))
+
+    # --- Reparto de resultados ---
+
+    def _apply(self, stage: str, jobs: List[dict], requests_: List[dict], results: Dict[str, dict]):
+        contents = {}
+        for request in requests_:
+            result = results.get(request["custom_id"], {})
+            content = result.get("content")
+            if content is None:
+                print(f"⚠️ Batch [{stage}]: sin respuesta para {request['custom_id']} ({result.get('error', 'no incluida en el lote')}).")
+                content = self._realtime_retry(request)
+            else:
+                content = self._validated(stage, request, content)
+            contents[request["custom_id"]] = content
+
+        for job in jobs:
+            key = lambda index: f"{job['job_id']}|{stage}|{index}"
+            if stage == "plan":
+                if job["is_instrumental"]:
+                    if not os.path.exists(os.path.join(self.metadata_dir(job), "song_plan.json")):
+                        song_plan = [{"title": f"Instrumental Song {i+1}", "description": job["user_prompt"]} for i in range(job["total_songs"])]
+                        save_song_plan(song_plan, self.metadata_dir(job))
+                elif key(0) in contents:
+                    # Se descartan los títulos duplicados entre tramos y se regeneran solo los que faltan
+                    song_plan, seen = [], set()
+                    for i in range(len(plan_chunks(job["total_songs"]))):
+                        merge_plan_entries(song_plan, parse_plan_entries(contents.get(key(i))), job["total_songs"], seen)
+                    complete_song_plan(song_plan, seen, job["user_prompt"], job["total_songs"], job["language"])
+                    save_song_plan(pad_song_plan(song_plan, job["total_songs"], job["user_prompt"]), self.metadata_dir(job))
+
+            elif stage == "draft" and key(0) in contents:
+                song_plan = self._load_plan(job)
+                drafts = []
+                for i, song_idea in enumerate(song_plan):
+                    content = contents.get(key(i))
+                    if job["is_instrumental"]:
+                        drafts.append(instrumental_content(song_idea, content or "TITLE: Error\nTAGS: error"))
+                    else:
+                        drafts.append(content or error_draft(i + 1, "sin respuesta del lote"))
+                write_draft_files(song_plan, drafts, self.lyrics_dir(job))
+                if not job["is_instrumental"]:
+                    # En batch no se regenera en tiempo real: los duplicados quedan para revisión
+                    dedupe_lyrics_files(self._lyrics_files(job))
+
+            elif stage == "refine":
+                for i, filepath in enumerate(self._lyrics_files(job)):
+                    if not contents.get(key(i)):
+                        continue
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        parsed_draft = parse_lyrics_file(f.read())
+                    with open(filepath, 'w', encoding='utf-8') as f:
+                        f.write(assemble_refined_lyrics(parsed_draft, contents[key(i)]))
+                if job["refine_lyrics"] and not job["is_instrumental"]:
+                    dedupe_lyrics_files(self._lyrics_files(job))
+
+            elif stage == "metadata" and key(0) in contents:
+                text = contents[key(0)] or fallback_metadata(job["user_prompt"], job["song_style"])
+                save_metadata(text, job["user_prompt"], self.metadata_dir(job))
+
+    def run(self, jobs: List[dict]) -> dict:
+        """Ejecuta las etapas pendientes de todos los trabajos. Devuelve las carpetas de cada trabajo."""
+        jobs = [normalize_job(job, i) for i, job in enumerate(jobs)]
+        for stage in STAGES:
+            if self._load_manifest()["stages"].get(stage, {}).get("status") == "done":
+                print(f"⏭️ Batch [{stage}]: etapa ya completada en esta ejecución.")
+                continue
+            requests_ = self._collect(stage, jobs)
+            print(f"🧾 Batch [{stage}]: {len(requests_)} peticiones de {len(jobs)} trabajos.")
+            results = self._execute(stage, requests_) if requests_ else {}
+            self._apply(stage, jobs, requests_, results)
+            self._update_manifest(stage, status="done", requests=len(requests_))
+        return {job["job_id"]: self.workspace(job).root for job in jobs}
+
+
+def normalize_job(job: dict, position: int = 0) -> dict:
+    """Completa un trabajo del catálogo con los mismos valores por defecto que el formulario."""
+    job = dict(job)
+    job.setdefault("song_style", "")
+    job.setdefault("language", "spanish")
+    job.setdefault("is_instrumental", False)
+    job.setdefault("refine_lyrics", True)
+    job.setdefault("num_female_songs", 0)
+    job.setdefault("num_male_songs", 0)
+    job.setdefault("num_instrumental_songs", 1)
+    job.setdefault("llm_model", "openai/gpt-4o-mini")
+    if job["is_instrumental"]:
+        job["total_songs"] = job["num_instrumental_songs"]
+    else:
+        job["total_songs"] = job["num_female_songs"] + job["num_male_songs"]
+    if job["total_songs"] == 0:
+        raise ValueError(f"El trabajo {position + 1} del catálogo no tiene canciones.")
+    if not job.get("job_id"):
+        safe_prompt = "".join(c for c in job["user_prompt"] if c.isalnum() or c in " _-").strip().replace(" ", "_")
+        job["job_id"] = f"{position + 1}_{safe_prompt[:30]}"
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("catalog", help="Archivo JSON con la lista de trabajos (mismos campos que el formulario).")
+    parser.add_argument("--backend", default=LLM_BATCH_BACKEND, choices=["openai", "local"])
+    parser.add_argument("--run-name", help="Nombre de la ejecución; relanzar con el mismo nombre la reanuda.")
+    parser.add_argument("--output-dir", default=LLM_BATCH_OUTPUT_DIR)
+    parser.add_argument("--poll-interval", type=float, default=LLM_BATCH_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    with open(args.catalog, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)
+    run_name = args.run_name or os.path.splitext(os.path.basename(args.catalog))[0]
+    runner = BatchRunner(run_name, backend_name=args.backend, output_dir=args.output_dir, poll_interval=args.poll_interval)
+    for job_id, job_dir in runner.run(jobs).items():
+        print(f"✅ {job_id}: {job_dir}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from src.config import LLM_CACHE_MODE, LLM_CACHE_DIR, LLM_CACHE_TTL, LLM_CACHE_MAX_MB
+
+# Cada cuántas escrituras se comprueba el tamaño total de la caché
+_EVICTION_CHECK_EVERY = 25
+
+
+class LLMCacheMiss(Exception):
+    """En modo 'replay', la petición no estaba en la caché."""
+
+
+class LLMResponseCache:
+    """
+    Caché en disco de respuestas de LLM, indexada por proveedor, modelo, mensajes y
+    parámetros de muestreo. Un archivo JSON por entrada; caducidad por TTL y expulsión
+    de las entradas menos usadas cuando se supera el tamaño máximo.
+    """
+
+    def __init__(self, directory: str = LLM_CACHE_DIR, mode: str = LLM_CACHE_MODE,
+                 ttl: int = LLM_CACHE_TTL, max_bytes: int = int(LLM_CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("on", "replay")
+
+    @staticmethod
+    def make_key(provider: str, model: str, messages: list, params: dict) -> str:
+        payload = json.dumps(
+            {"provider": provider, "model": model, "messages": messages, "params": params},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def get(self, key: str):
+        """Devuelve la respuesta cacheada o None. En modo 'replay' un fallo lanza LLMCacheMiss."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry is not None and self.mode != "replay" and time.time() - entry.get("created_at", 0) > self.ttl:
+            self._count("expired")
+            entry = None
+
+        if entry is None:
+            self._count("misses")
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"Modo replay: no hay respuesta cacheada para la clave {key[:12]}.")
+            return None
+
+        self._count("hits")
+        # Actualizar la fecha de acceso para la expulsión LRU
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry["response"]
+
+    def put(self, key: str, response, provider: str, model: str):
+        if self.mode != "on":
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"created_at": time.time(), "provider": provider, "model": model, "response": response}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._count("stores")
+
+        with self._lock:
+            self._writes += 1
+            check = self._writes % _EVICTION_CHECK_EVERY == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """Borra las entradas caducadas y, si se supera el tamaño máximo, las menos usadas."""
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes and now - mtime <= self.ttl:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            self._count("evictions", removed)
+            print(f"🧹 Caché de LLM: {removed} entradas expulsadas.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["mode"] = self.mode
+        return stats
+
+
+llm_cache = LLMResponseCache()
@@ -0,0 +1,236 @@
+import time
+import threading
+from typing import Callable, List, Dict
+from src import config
+from src.config import LLM_STREAMING, LLM_STRUCTURED_OUTPUT
+from src.llm_pool import provider_of, provider_slot
+from src.llm_cache import llm_cache
+from src.llm_stats import llm_stats
+from src.llm_usage import llm_usage, TokenUsage, current_scope
+from src.telemetry import span, record_wait
+
+# --- Registro de clientes de proveedores ---
+# Los SDK (openai, groq, google.generativeai) son pesados de importar: cada cliente se
+# crea en su primer uso y se valida solo la clave del proveedor que se va a utilizar.
+
+def _create_openai_client():
+    import openai
+    return openai.OpenAI(api_key=config.OPENAI_API_KEY)
+
+def _create_groq_client():
+    from groq import Groq
+    return Groq(api_key=config.GROQ_API_KEY)
+
+def _create_gemini_client():
+    import google.generativeai as genai
+    genai.configure(api_key=config.GEMINI_API_KEY)
+    return genai
+
+_CLIENT_FACTORIES = {
+    "openai": _create_openai_client,
+    "groq": _create_groq_client,
+    "gemini": _create_gemini_client,
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_provider_client(provider: str):
+    """Devuelve el cliente del proveedor, creándolo (e importando su SDK) la primera vez."""
+    with _clients_lock:
+        if provider not in _clients:
+            config.require_config(config.PROVIDER_API_KEYS[provider])
+            _clients[provider] = _CLIENT_FACTORIES[provider]()
+        return _clients[provider]
+
+
+class StreamAborted(Exception):
+    """El consumidor del streaming cortó la respuesta (p. ej. formato roto)."""
+
+
+class StreamCancelled(StreamAborted):
+    """El consumidor ya no necesita la respuesta (un hedge perdedor): no cuenta como fallo del modelo."""
+
+
+def structured_output_params(provider_params: Dict[str, dict], name: str, schema: dict) -> Dict[str, dict]:
+    """
+    Añade a los parámetros de cada proveedor el 'response_format' que admite según
+    LLM_STRUCTURED_OUTPUT: 'json_schema' (salida validada contra 'schema'), 'json'
+    (solo JSON válido) u 'off' (texto libre, se valida con el formato de texto).
+    """
+    structured = {}
+    for provider, params in provider_params.items():
+        mode = LLM_STRUCTURED_OUTPUT.get(provider, "off")
+        params = dict(params)
+        if mode == "json_schema":
+            params["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": name, "schema": schema, "strict": True},
+            }
+        elif mode == "json":
+            params["response_format"] = {"type": "json_object"}
+        structured[provider] = params
+    return structured
+
+
+def _gemini_generation_config(params: Dict):
+    # Gemini no admite 'response_format': solo el modo JSON por tipo MIME
+    if params.get("response_format"):
+        return {"response_mime_type": "application/json"}
+    return None
+
+
+def _token_usage(response):
+    """Tokens de entrada y salida de una respuesta (o del último fragmento de un streaming)."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        # Groq devuelve el uso del streaming en 'x_groq.usage'
+        usage = getattr(getattr(response, "x_groq", None), "usage", None)
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        # OpenAI y Groq informan de la parte del prompt servida desde su caché
+        cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+        return TokenUsage(usage.prompt_tokens or 0, usage.completion_tokens or 0, cached or 0)
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is not None and getattr(metadata, "prompt_token_count", None) is not None:
+        return TokenUsage(metadata.prompt_token_count or 0, metadata.candidates_token_count or 0,
+                          getattr(metadata, "cached_content_token_count", None) or 0)
+    return None
+
+
+def _call_provider(provider: str, model_name: str, messages: List[Dict], params: Dict):
+    """Devuelve (texto, TokenUsage o None)."""
+    if config.SIMULATION_MODE:
+        from src.simulation import simulated_completion
+        return simulated_completion(provider, model_name, messages, params)
+    client = get_provider_client(provider)
+
+    if provider == "groq":
+        completion = client.chat.completions.create(model=model_name, messages=messages, stream=False, **params)
+        return completion.choices[0].message.content, _token_usage(completion)
+
+    if provider == "gemini":
+        # Gemini recibe un único prompt con el contenido de todos los mensajes
+        model = client.GenerativeModel(model_name)
+        full_prompt = "\n\n".join(message["content"] for message in messages)
+        response = model.generate_content(full_prompt, generation_config=_gemini_generation_config(params))
+        return response.text, _token_usage(response)
+
+    response = client.chat.completions.create(model=model_name, messages=messages, **params)
+    return response.choices[0].message.content, _token_usage(response)
+
+
+def _stream_provider(provider: str, model_name: str, messages: List[Dict], params: Dict):
+    """
+    Genera los fragmentos de texto de la respuesta a medida que llegan y, al final,
+    un TokenUsage si el proveedor informa del uso.
+    """
+    if config.SIMULATION_MODE:
+        from src.simulation import simulated_stream
+        yield from simulated_stream(provider, model_name, messages, params)
+        return
+    client = get_provider_client(provider)
+
+    if provider == "gemini":
+        model = client.GenerativeModel(model_name)
+        full_prompt = "\n\n".join(message["content"] for message in messages)
+        usage = None
+        for chunk in model.generate_content(full_prompt, stream=True, generation_config=_gemini_generation_config(params)):
+            usage = _token_usage(chunk) or usage
+            if chunk.text:
+                yield chunk.text
+        if usage:
+            yield usage
+        return
+
+    if provider == "openai":
+        # El último fragmento trae el uso de tokens (sin 'choices')
+        params = {**params, "stream_options": {"include_usage": True}}
+    stream = client.chat.completions.create(model=model_name, messages=messages, stream=True, **params)
+    usage = None
+    try:
+        for chunk in stream:
+            usage = _token_usage(chunk) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        if usage:
+            yield usage
+    finally:
+        # Cerrar la conexión si el consumidor abandona el streaming antes de tiempo
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+
+def _stream_completion(provider: str, model_name: str, messages: List[Dict], params: Dict, on_token: Callable):
+    """Devuelve (texto, TokenUsage o None)."""
+    llm_model = f"{provider}/{model_name}"
+    start = time.monotonic()
+    parts = []
+    usage = None
+    chunks = _stream_provider(provider, model_name, messages, params)
+    try:
+        for text in chunks:
+            if isinstance(text, TokenUsage):
+                usage = text
+                continue
+            if not parts:
+                ttft = time.monotonic() - start
+                llm_stats.record_ttft(llm_model, ttft)
+                print(f"⚡ Primer token de {llm_model} en {ttft:.2f}s.")
+            parts.append(text)
+            on_token(text)
+    finally:
+        # Si el consumidor lanza StreamAborted, cerrar el generador corta la conexión
+        chunks.close()
+    return "".join(parts), usage
+
+
+def chat_completion(llm_model: str, messages: List[Dict], on_token: Callable = None, **params) -> str:
+    """
+    Punto único de llamada a los proveedores de LLM. 'llm_model' tiene el formato
+    'proveedor/modelo' (p. ej. 'groq/llama-3.3-70b-versatile'). Las respuestas pasan
+    por la caché en disco, la concurrencia se limita por proveedor y cada llamada se anota
+    (tokens, latencia y coste) en el registro de uso del trabajo en curso.
+    Con 'on_token', la respuesta se pide en streaming y cada fragmento se pasa a
+    'on_token(texto)'; si este lanza StreamAborted, la llamada se corta y el error se propaga.
+    Los errores del proveedor se propagan a quien llama.
+    """
+    provider = provider_of(llm_model)
+    model_name = llm_model.split('/', 1)[1] if '/' in llm_model else llm_model
+
+    cache_key = llm_cache.make_key(provider, model_name, messages, params)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        print(f"♻️ Respuesta de {provider}/{model_name} servida desde la caché.")
+        llm_usage.record(f"{provider}/{model_name}", 0.0, status="cached")
+        if on_token:
+            on_token(cached)
+        return cached
+
+    queued = time.monotonic()
+    with provider_slot(llm_model):
+        record_wait(f"llm:{provider}", time.monotonic() - queued)
+        start = time.monotonic()
+        try:
+            with span("llm", f"{provider}/{model_name}", stage=current_scope().get("stage")):
+                if on_token and LLM_STREAMING:
+                    content, usage = _stream_completion(provider, model_name, messages, params, on_token)
+                else:
+                    content, usage = _call_provider(provider, model_name, messages, params)
+                    if on_token:
+                        on_token(content)
+        except StreamCancelled as e:
+            llm_usage.record(f"{provider}/{model_name}", time.monotonic() - start, status="cancelled", error=str(e)[:200])
+            raise
+        except Exception as e:
+            latency = time.monotonic() - start
+            llm_stats.record(f"{provider}/{model_name}", latency, ok=False)
+            llm_usage.record(f"{provider}/{model_name}", latency, status="error", error=str(e)[:200])
+            raise
+        latency = time.monotonic() - start
+        llm_stats.record(f"{provider}/{model_name}", latency, ok=True)
+        llm_usage.record(f"{provider}/{model_name}", latency, usage)
+
+    llm_cache.put(cache_key, content, provider, model_name)
+    return content
@@ -0,0 +1,66 @@
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List
+from src.config import LLM_CONCURRENCY_LIMITS
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def provider_of(llm_model: str) -> str:
+    """Devuelve el proveedor ('openai', 'groq' o 'gemini') a partir del prefijo de 'llm_model'."""
+    prefix = (llm_model or "").split('/', 1)[0].lower()
+    return prefix if prefix in LLM_CONCURRENCY_LIMITS else "openai"
+
+
+def _semaphore(provider: str) -> threading.BoundedSemaphore:
+    with _semaphores_lock:
+        if provider not in _semaphores:
+            _semaphores[provider] = threading.BoundedSemaphore(LLM_CONCURRENCY_LIMITS[provider])
+        return _semaphores[provider]
+
+
+@contextmanager
+def provider_slot(llm_model: str):
+    """
+    Limita las llamadas simultáneas al proveedor de 'llm_model' dentro del proceso.
+    Debe envolver únicamente la llamada de red al proveedor.
+    """
+    semaphore = _semaphore(provider_of(llm_model))
+    semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def map_concurrently(fn: Callable, items: Iterable, llm_model: str, on_done: Callable = None) -> List:
+    """
+    Aplica 'fn' a cada elemento en un pool de hilos dimensionado según el límite del
+    proveedor y devuelve los resultados en el MISMO orden que 'items', sin importar
+    el orden de finalización. 'on_done(completados, total)' se llama tras cada resultado.
+    Cada tarea se ejecuta con una copia del contexto de quien llama (trabajo en curso
+    del registro de uso de LLM).
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = min(len(items), LLM_CONCURRENCY_LIMITS[provider_of(llm_model)])
+    completed = 0
+    completed_lock = threading.Lock()
+
+    def run(item):
+        nonlocal completed
+        result = fn(item)
+        if on_done:
+            with completed_lock:
+                completed += 1
+                on_done(completed, len(items))
+        return result
+
+    # Una copia por tarea: un mismo contexto no puede estar activo en dos hilos a la vez
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda context, item: context.run(run, item), contexts, items))
@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List
+from src import config
+from src.config import (
+    LLM_ROUTES, LLM_HEDGE_STAGES, LLM_HEDGE_PERCENTILE, LLM_HEDGE_DEFAULT_DELAY,
+    LLM_ROUTER_MIN_SAMPLES, LLM_ROUTER_MAX_ERROR_RATE, LLM_ROUTER_LOG_PATH, LLM_REPAIR_ATTEMPTS
+)
+from src.llm_client import chat_completion
+from src.llm_pool import provider_of
+from src.llm_stats import llm_stats
+from src.llm_usage import usage_scope
+
+
+class InvalidLLMResponse(Exception):
+    """La respuesta del LLM no superó la validación ni tras las peticiones de reparación."""
+
+
+def build_repair_messages(messages: List[Dict], content: str, errors: List[str]) -> List[Dict]:
+    """Pide al modelo que corrija su respuesta anterior indicando qué falló en la validación."""
+    return messages + [
+        {"role": "assistant", "content": content},
+        {"role": "user", "content": (
+            "Tu respuesta anterior no es válida: " + "; ".join(errors) + ". "
+            "Devuelve de nuevo la respuesta completa corregida, con el mismo formato y sin texto adicional."
+        )},
+    ]
+
+
+class LLMRouter:
+    """
+    Elige el modelo de cada etapa del pipeline ('plan', 'draft', 'refine', 'instrumental',
+    'metadata') a partir de su lista de candidatos en LLM_ROUTES.
+
+    - Los modelos con una tasa de error alta en la ventana móvil, o sin clave configurada,
+      pasan al final de la lista.
+    - Si la etapa admite hedge y la petición en curso supera el percentil de latencia de
+      su modelo, se lanza una petición duplicada al siguiente candidato y gana la primera
+      respuesta correcta.
+    - Si una petición falla, se pasa al siguiente candidato.
+    """
+
+    def __init__(self, stats=llm_stats, log_path: str = LLM_ROUTER_LOG_PATH):
+        self.stats = stats
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "failures": 0, "repairs": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _is_healthy(self, llm_model: str) -> bool:
+        if not getattr(config, config.PROVIDER_API_KEYS[provider_of(llm_model)], None):
+            return False
+        if self.stats.sample_count(llm_model) < LLM_ROUTER_MIN_SAMPLES:
+            return True
+        return self.stats.error_rate(llm_model) < LLM_ROUTER_MAX_ERROR_RATE
+
+    def candidates(self, stage: str, primary: str = None) -> List[str]:
+        """Candidatos de la etapa en orden de uso: primero el preferido y los modelos sanos."""
+        models = []
+        for model in ([primary] if primary else []) + LLM_ROUTES.get(stage, []):
+            if model not in models:
+                models.append(model)
+        healthy = [m for m in models if self._is_healthy(m)]
+        return healthy + [m for m in models if m not in healthy]
+
+    def hedge_delay(self, llm_model: str) -> float:
+        """Segundos de espera antes de duplicar una petición a 'llm_model'."""
+        if self.stats.sample_count(llm_model) >= LLM_ROUTER_MIN_SAMPLES:
+            latency = self.stats.percentile(llm_model, LLM_HEDGE_PERCENTILE)
+            if latency is not None:
+                return latency
+        return LLM_HEDGE_DEFAULT_DELAY
+
+    def complete(self, stage: str, messages: List[Dict], primary: str = None,
+                 provider_params: Dict[str, dict] = None, on_token: Callable = None, **params) -> str:
+        """
+        Resuelve la petición con el primer candidato que responda. 'provider_params' permite
+        ajustar los parámetros por proveedor (p. ej. {'groq': {...}}); el resto usa 'params'.
+        Con 'on_token(texto, modelo)' cada intento se pide en streaming; el modelo identifica
+        el intento, ya que con hedge puede haber dos respuestas llegando a la vez.
+        Si todos los candidatos fallan se propaga el último error.
+        """
+        candidates = self.candidates(stage, primary)
+        if not candidates:
+            raise ValueError(f"No hay modelos configurados para la etapa '{stage}'.")
+        hedging = stage in LLM_HEDGE_STAGES
+        self._count("calls")
+
+        executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix=f"llm-{stage}")
+        pending = {}
+        attempts = []
+        launched = 0
+        last_error = None
+        start = time.monotonic()
+
+        def call(model, attempt, model_params, attempt_on_token):
+            # La etapa y el tipo de intento quedan en el registro de uso de LLM
+            with usage_scope(stage=stage, attempt=attempt):
+                return chat_completion(model, messages, on_token=attempt_on_token, **model_params)
+
+        def launch(attempt="primary"):
+            nonlocal launched
+            model = candidates[launched]
+            launched += 1
+            model_params = (provider_params or {}).get(provider_of(model), params)
+            attempt_on_token = (lambda text, model=model: on_token(text, model)) if on_token else None
+            future = executor.submit(contextvars.copy_context().run, call, model, attempt, model_params, attempt_on_token)
+            pending[future] = (model, time.monotonic())
+            return model
+
+        try:
+            launch()
+            while pending:
+                timeout = None
+                if hedging and len(pending) == 1 and launched < len(candidates):
+                    (model, started), = pending.values()
+                    timeout = max(0.0, started + self.hedge_delay(model) - time.monotonic())
+
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    slow_model = next(iter(pending.values()))[0]
+                    hedge_model = launch("hedge")
+                    self._count("hedges")
+                    print(f"⏱️ Router [{stage}]: {slow_model} supera su p{int(LLM_HEDGE_PERCENTILE * 100)}; "
+                          f"petición duplicada a {hedge_model}.")
+                    continue
+
+                for future in done:
+                    model, started = pending.pop(future)
+                    latency = time.monotonic() - started
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        last_error = e
+                        attempts.append({"model": model, "status": "error", "latency": round(latency, 3), "error": str(e)[:200]})
+                        print(f"⚠️ Router [{stage}]: {model} falló tras {latency:.1f}s: {e}")
+                        if not pending and launched < len(candidates):
+                            print(f"↪️ Router [{stage}]: usando {launch('fallback')} como respaldo.")
+                            self._count("fallbacks")
+                        continue
+
+                    attempts.append({"model": model, "status": "ok", "latency": round(latency, 3)})
+                    if pending:
+                        # La respuesta llegó antes que otra petición en curso: ganó un hedge
+                        self._count("hedge_wins")
+                        attempts.extend({"model": m, "status": "abandoned"} for m, _ in pending.values())
+                    total = time.monotonic() - start
+                    print(f"🔀 Router [{stage}]: respuesta de {model} en {total:.1f}s ({len(attempts)} intento(s)).")
+                    self._log(stage, model, total, candidates, attempts)
+                    return content
+        finally:
+            # Las peticiones perdedoras no se pueden cancelar: terminan en segundo plano
+            # y su resultado queda en la caché y en las estadísticas de latencia.
+            executor.shutdown(wait=False)
+
+        self._count("failures")
+        self._log(stage, None, time.monotonic() - start, candidates, attempts)
+        raise last_error
+
+    def complete_validated(self, stage: str, messages: List[Dict], validate: Callable,
+                           on_token: Callable = None, **kwargs):
+        """
+        Como 'complete', pero valida la respuesta con 'validate(texto) -> (datos, errores)'.
+        Si hay errores se hace una petición de reparación dirigida (hasta LLM_REPAIR_ATTEMPTS)
+        en lugar de dejar pasar la respuesta rota. Devuelve los datos validados o lanza
+        InvalidLLMResponse.
+        """
+        content = self.complete(stage, messages, on_token=on_token, **kwargs)
+        for attempt in range(LLM_REPAIR_ATTEMPTS + 1):
+            parsed, errors = validate(content)
+            if not errors:
+                return parsed
+            if attempt == LLM_REPAIR_ATTEMPTS:
+                break
+            self._count("repairs")
+            print(f"🩹 Router [{stage}]: respuesta no válida ({'; '.join(errors)}). Pidiendo una reparación...")
+            # La reparación no se emite en streaming: el archivo parcial ya muestra el intento
+            with usage_scope(repair=attempt + 1):
+                content = self.complete(stage, build_repair_messages(messages, content, errors), **kwargs)
+        raise InvalidLLMResponse(f"Respuesta no válida en la etapa '{stage}': {'; '.join(errors)}")
+
+    def _log(self, stage: str, winner: str, total: float, candidates: List[str], attempts: List[dict]):
+        record = {
+            "ts": time.time(), "stage": stage, "winner": winner, "latency": round(total, 3),
+            "candidates": candidates, "attempts": attempts,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Advertencia: no se pudo escribir el registro del router de LLM: {e}")
+
+    def summary(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        counters["models"] = self.stats.summary()
+        return counters
+
+
+llm_router = LLMRouter()
+
+
+def summarize_log(path: str = LLM_ROUTER_LOG_PATH) -> dict:
+    """Resume el registro de decisiones por etapa: latencias p50/p95, hedges y respaldos."""
+    stages = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            stage = stages.setdefault(record["stage"], {"calls": 0, "latencies": [], "hedged": 0, "fallbacks": 0, "failures": 0, "winners": {}})
+            stage["calls"] += 1
+            stage["latencies"].append(record["latency"])
+            statuses = [a["status"] for a in record["attempts"]]
+            stage["hedged"] += "abandoned" in statuses
+            stage["fallbacks"] += "error" in statuses and record["winner"] is not None
+            stage["failures"] += record["winner"] is None
+            if record["winner"]:
+                stage["winners"][record["winner"]] = stage["winners"].get(record["winner"], 0) + 1
+
+    for stage in stages.values():
+        latencies = sorted(stage.pop("latencies"))
+        stage["p50"] = latencies[len(latencies) // 2]
+        stage["p95"] = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    return stages
+
+
+if __name__ == "__main__":
+    print(json.dumps(summarize_log(sys.argv[1] if len(sys.argv) > 1 else LLM_ROUTER_LOG_PATH), indent=2, ensure_ascii=False))
@@ -0,0 +1,74 @@
+import threading
+from collections import deque
+from src.config import LLM_ROUTER_WINDOW
+
+
+class LLMLatencyStats:
+    """
+    Ventana móvil de latencias y errores por modelo ('proveedor/modelo').
+    Solo se registran las llamadas de red reales: los aciertos de la caché no cuentan.
+    """
+
+    def __init__(self, window: int = LLM_ROUTER_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._ttft = {}
+
+    def record(self, llm_model: str, latency: float, ok: bool):
+        with self._lock:
+            if llm_model not in self._samples:
+                self._samples[llm_model] = deque(maxlen=self.window)
+            self._samples[llm_model].append((latency, ok))
+
+    def record_ttft(self, llm_model: str, ttft: float):
+        """Tiempo hasta el primer token de una llamada en streaming."""
+        with self._lock:
+            if llm_model not in self._ttft:
+                self._ttft[llm_model] = deque(maxlen=self.window)
+            self._ttft[llm_model].append(ttft)
+
+    def ttft_percentile(self, llm_model: str, pct: float):
+        with self._lock:
+            values = sorted(self._ttft.get(llm_model, ()))
+        if not values:
+            return None
+        return values[min(len(values) - 1, max(0, int(round(pct * (len(values) - 1)))))]
+
+    def _snapshot(self, llm_model: str) -> list:
+        with self._lock:
+            return list(self._samples.get(llm_model, ()))
+
+    def sample_count(self, llm_model: str) -> int:
+        return len(self._snapshot(llm_model))
+
+    def percentile(self, llm_model: str, pct: float):
+        """Percentil (0-1) de la latencia de las llamadas correctas, o None si no hay muestras."""
+        latencies = sorted(latency for latency, ok in self._snapshot(llm_model) if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, max(0, int(round(pct * (len(latencies) - 1)))))
+        return latencies[index]
+
+    def error_rate(self, llm_model: str) -> float:
+        samples = self._snapshot(llm_model)
+        if not samples:
+            return 0.0
+        return sum(1 for _, ok in samples if not ok) / len(samples)
+
+    def summary(self) -> dict:
+        with self._lock:
+            models = list(self._samples)
+        return {
+            model: {
+                "samples": self.sample_count(model),
+                "p50": self.percentile(model, 0.5),
+                "p95": self.percentile(model, 0.95),
+                "error_rate": round(self.error_rate(model), 3),
+                "ttft_p50": self.ttft_percentile(model, 0.5),
+            }
+            for model in models
+        }
+
+
+llm_stats = LLMLatencyStats()
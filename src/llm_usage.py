@@ -0,0 +1,162 @@
+"""
+Contabilidad de las llamadas a LLM por trabajo: tokens de entrada y salida (y los que
+el proveedor sirvió desde su caché de prompts), latencia, coste estimado y reintentos (hedges, respaldos y reparaciones) de cada etapa.
+
+Cada llamada se anota en 'state/llm_usage.jsonl' con el trabajo y la etapa del contexto
+en curso ('usage_scope'). El resumen de un trabajo se incluye en su informe de
+publicación y el registro se puede consultar para todos los trabajos:
+
+    python -m src.llm_usage --by model
+    python -m src.llm_usage --job <id> --by stage
+"""
+import os
+import json
+import time
+import argparse
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+from src.config import LLM_USAGE_LOG_PATH, LLM_PRICES
+from src.utils import file_lock
+
+
+class TokenUsage(NamedTuple):
+    prompt_tokens: int
+    completion_tokens: int
+    # Parte de 'prompt_tokens' servida desde la caché de prompts del proveedor
+    cached_tokens: int = 0
+
+
+# Trabajo, etapa e intento de la llamada en curso. Los pools de hilos del pipeline copian
+# este contexto a cada tarea, de modo que las llamadas en paralelo se atribuyen bien.
+_scope = contextvars.ContextVar("llm_usage_scope", default={})
+
+
+@contextmanager
+def usage_scope(**fields):
+    """Añade campos ('job_id', 'stage', 'attempt', 'repair') al contexto de las llamadas."""
+    token = _scope.set({**_scope.get(), **fields})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope() -> dict:
+    return dict(_scope.get())
+
+
+def call_cost(llm_model: str, usage: Optional[TokenUsage]) -> Optional[float]:
+    """Coste estimado en USD según LLM_PRICES, o None si el modelo no tiene precio."""
+    prices = LLM_PRICES.get(llm_model)
+    if usage is None or not prices:
+        return None
+    cached_price = prices[2] if len(prices) > 2 else prices[0]
+    uncached = usage.prompt_tokens - usage.cached_tokens
+    return round((uncached * prices[0] + usage.cached_tokens * cached_price
+                  + usage.completion_tokens * prices[1]) / 1_000_000, 6)
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class LLMUsageLedger:
+    """Registro de uso de LLM en JSONL, compartido entre procesos con un bloqueo de archivo."""
+
+    def __init__(self, path: str = LLM_USAGE_LOG_PATH):
+        self.path = path
+
+    # --- Registro ---
+
+    def record(self, llm_model: str, latency: Optional[float], usage: Optional[TokenUsage] = None,
+               status: str = "ok", **fields):
+        """Anota una llamada con el trabajo y la etapa del contexto en curso."""
+        scope = current_scope()
+        entry = {
+            "ts": time.time(),
+            "job_id": scope.get("job_id"),
+            "stage": scope.get("stage"),
+            "attempt": scope.get("attempt", "primary"),
+            "repair": scope.get("repair", 0),
+            "model": llm_model,
+            "provider": llm_model.split("/", 1)[0],
+            "status": status,
+            "latency": round(latency, 3) if latency is not None else None,
+            "prompt_tokens": usage.prompt_tokens if usage else None,
+            "completion_tokens": usage.completion_tokens if usage else None,
+            "cached_tokens": usage.cached_tokens if usage else None,
+            "cost_usd": call_cost(llm_model, usage),
+            **fields,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with file_lock(self.path):
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Advertencia: no se pudo escribir el registro de uso de LLM: {e}")
+
+    def entries(self, job_id: str = None) -> List[dict]:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        return [e for e in entries if job_id is None or e.get("job_id") == job_id]
+
+    # --- Consultas ---
+
+    @staticmethod
+    def _aggregate(entries: List[dict]) -> dict:
+        latencies = [e["latency"] for e in entries if e.get("latency") is not None and e["status"] == "ok"]
+        costs = [e["cost_usd"] for e in entries if e.get("cost_usd") is not None]
+        prompt_tokens = sum(e.get("prompt_tokens") or 0 for e in entries)
+        cached_tokens = sum(e.get("cached_tokens") or 0 for e in entries)
+        return {
+            "calls": len(entries),
+            "errors": sum(e["status"] == "error" for e in entries),
+            "cached": sum(e["status"] == "cached" for e in entries),
+            # Hedges, respaldos y peticiones de reparación
+            "retries": sum(e.get("attempt") in ("hedge", "fallback") or bool(e.get("repair")) for e in entries),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": sum(e.get("completion_tokens") or 0 for e in entries),
+            # Tokens de entrada servidos desde la caché de prompts del proveedor
+            "cached_tokens": cached_tokens,
+            "cache_hit_ratio": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else None,
+            "cost_usd": round(sum(costs), 6) if costs else None,
+            "latency_total": round(sum(latencies), 3),
+            "latency_p50": _percentile(latencies, 0.5),
+            "latency_p95": _percentile(latencies, 0.95),
+        }
+
+    def summarize(self, job_id: str = None, group_by: tuple = ("stage", "model")) -> dict:
+        """Totales y desglose por cada campo de 'group_by' ('stage', 'model', 'provider', 'job_id')."""
+        entries = self.entries(job_id)
+        summary = {"totals": self._aggregate(entries)}
+        for field in group_by:
+            groups: Dict[str, List[dict]] = {}
+            for entry in entries:
+                groups.setdefault(str(entry.get(field)), []).append(entry)
+            summary[f"by_{field}"] = {key: self._aggregate(group) for key, group in sorted(groups.items())}
+        return summary
+
+
+llm_usage = LLMUsageLedger()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumen del uso de LLM (tokens, coste y latencia).")
+    parser.add_argument("--job", help="Solo el trabajo indicado")
+    parser.add_argument("--by", choices=("stage", "model", "provider", "job_id"), action="append",
+                        help="Campo por el que desglosar (se puede repetir)")
+    parser.add_argument("--log", default=LLM_USAGE_LOG_PATH, help="Ruta del registro de uso")
+    args = parser.parse_args()
+    summary = LLMUsageLedger(args.log).summarize(args.job, tuple(args.by or ("stage", "model")))
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,133 @@
-import openai
-from groq import Groq
-import google.generativeai as genai
-from src.config import OPENAI_API_KEY, GROQ_API_KEY, GEMINI_API_KEY
-from src.utils import parse_lyrics_file
-from typing import List, Dict
-
-# Initialize clients for all services
-openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
-groq_client = Groq(api_key=GROQ_API_KEY)
-genai.configure(api_key=GEMINI_API_KEY)
+import re
+import json
+import hashlib
+import unicodedata
+from src.config import LLM_PLAN_CHUNK_SIZE, LLM_PLAN_REPAIR_ROUNDS
+from src.utils import parse_lyrics_file, parse_lyrics_response, format_lyrics_file
+from src.llm_router import llm_router
+from src.llm_client import structured_output_params
+from src.llm_pool import provider_of, map_concurrently
+from typing import Callable, List, Dict
+
+# Esquemas de la salida estructurada (estrictos: todas las claves obligatorias)
+DRAFT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "lyrics": {"type": "string"},
+        "tags": {"type": "string"},
+        "gender": {"type": "string", "enum": ["Masculino", "Femenino"]},
+    },
+    "required": ["title", "lyrics", "tags", "gender"],
+    "additionalProperties": False,
+}
+INSTRUMENTAL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "tags": {"type": "string"},
+    },
+    "required": ["title", "tags"],
+    "additionalProperties": False,
+}
+
+# Parámetros de muestreo del borrador según el proveedor que termine respondiendo
+DRAFT_PROVIDER_PARAMS = structured_output_params({
+    "openai": {"temperature": 0.7},
+    "groq": {"temperature": 0.7, "max_tokens": 4096, "top_p": 1},
+    "gemini": {},
+}, "song_draft", DRAFT_SCHEMA)
+REFINE_PARAMS = {"temperature": 0.7}
+INSTRUMENTAL_PARAMS = {"temperature": 0.7}
+INSTRUMENTAL_PROVIDER_PARAMS = structured_output_params(
+    {provider: INSTRUMENTAL_PARAMS for provider in ("openai", "groq", "gemini")}, "instrumental_song", INSTRUMENTAL_SCHEMA
+)
+PLAN_PARAMS = {"temperature": 0.8, "response_format": {"type": "json_object"}}
+
+# Marca de los borradores que no se pudieron generar (no se envían a Suno)
+ERROR_DRAFT_MARKER = "[Borrador no generado por un error"
+
+# Los prompts se ordenan para aprovechar la caché de prompts de los proveedores, que solo
+# reutiliza un prefijo idéntico: primero las instrucciones fijas (iguales para todos los
+# trabajos), después el contexto del trabajo (idioma, estilo, concepto) y al final lo que
+# cambia en cada canción. Ningún texto fijo debe interpolar variables.
+DRAFT_SYSTEM_PROMPT = (
+    "Eres un compositor. Tu tarea es escribir una canción completa y, por separado, detallar su estilo musical. "
+    "La letra y el título de la canción deben estar en el idioma indicado en el contexto del trabajo. "
+    "Para los TAGS, tu tarea es describir en INGLÉS el estilo musical del contexto del trabajo. No describas la letra que acabas de crear. No menciones el tema de la canción ni su título. "
+    "La descripción de los TAGS debe ser puramente musical, enfocada en la instrumentación, el tempo, la atmósfera, la estructura y los elementos sonoros típicos de ese estilo. "
+    "El género del cantante se indica con cada canción. Debes reflejarlo en la descripción de los TAGS (ej. 'powerful masculine vocals' o 'powerful feminine vocals'). "
+    "Debes estructurar tu respuesta EXACTAMENTE de la siguiente manera, sin texto adicional antes o después:"
+    "\n\nTITLE: [El título de la canción aquí]"
+    "\n\nPROMPT:"
+    "\nIntro:"
+    "\n[4 líneas de la introducción]"
+    "\n\nVerse 1:"
+    "\n[8 líneas de la primera estrofa]"
+    "\n\nPre-Chorus:"
+    "\n[4 líneas del pre-estribillo]"
+    "\n\nChorus:"
+    "\n[4 líneas del estribillo]"
+    "\n\nChorus:"
+    "\n[4 líneas del estribillo repetido, cambiar la temrinacion de dos lineas sin perder la rima]"
+    "\n\nVerse 2:"
+    "\n[8 líneas de la segunda estrofa]"
+    "\n\nPre-Chorus:"
+    "\n[4 líneas del pre-estribillo]"
+    "\n\nChorus:"
+    "\n[4 líneas del estribillo]"
+    "\n\nChorus:"
+    "\n[4 líneas del estribillo repetido]"
+    "\n\nBridge:"
+    "\n[4-8 líneas del puente, debe ser solo la letra]"
+    "\n\nOutro:"
+    "\n[4 líneas del final]"
+    "\n\nTAGS:"
+    "\n[Un único párrafo en INGLÉS de 500 a 1000 caracteres que describa únicamente el estilo musical del trabajo, su instrumentación, tempo, y ambiente, mencionando el estilo vocal pero sin hacer referencia a la letra o tema de la canción.]"
+    "\n\nGENERO: [Aquí 'Masculino' o 'Femenino']"
+    "\n\nSi se te pide la respuesta en formato JSON, devuelve un objeto con las claves 'title' (el título), "
+    "'lyrics' (la letra completa con sus secciones, como en PROMPT), 'tags' y 'gender' ('Masculino' o 'Femenino')."
+)
+
+def job_context(language: str, song_style: str) -> str:
+    """Bloque con el contexto del trabajo, idéntico para todas sus canciones."""
+    return (
+        "\n\nContexto del trabajo:"
+        f"\nIdioma: '{language}'"
+        f"\nEstilo musical general: '{song_style}'"
+    )
+
+def build_draft_messages(
+    prompt: str,
+    song_style: str,
+    language: str = "spanish",
+    gender: str = "Masculino",
+    song_index: int = 1,
+    total_songs: int = 1,
+    avoid_lyrics: str = None
+) -> List[Dict]:
+    """
+    Construye los mensajes para el borrador de una canción. El mensaje de sistema es el
+    mismo para todas las canciones del trabajo; el de usuario lleva lo propio de cada una.
+    'avoid_lyrics' es una letra del álbum de la que el borrador debe alejarse
+    (regeneración de duplicados).
+    """
+    user_prompt_draft = (
+        f"Tema de la canción: '{prompt}'\n"
+        f"Género del cantante: '{gender}'"
+    )
+    if total_songs > 1:
+        user_prompt_draft += f"\nEsta es la canción {song_index} de un total de {total_songs}."
+    if avoid_lyrics:
+        user_prompt_draft += (
+            "\n\nYa existe en el álbum una canción con esta letra y la tuya se parecía demasiado. "
+            "Escribe una letra claramente distinta, sobre todo en el estribillo:\n" + avoid_lyrics[:1500]
+        )
+
+    return [
+        {"role": "system", "content": DRAFT_SYSTEM_PROMPT + job_context(language, song_style)},
+        {"role": "user", "content": user_prompt_draft}
+    ]
 
 def generate_draft_lyrics(
     prompt: str, 
@@ -17,260 +136,354 @@ def generate_draft_lyrics(
     gender: str = "Masculino", 
     song_index: int = 1, 
     total_songs: int = 1,
-    llm_model: str = "openai/gpt-4o-mini"
+    llm_model: str = "openai/gpt-4o-mini",
+    on_token: Callable = None,
+    avoid_lyrics: str = None
 ) -> str:
     """
     Genera el borrador de la letra y tags para una única canción, usando el modelo de lenguaje especificado.
+    La respuesta (JSON o texto) se valida y se devuelve en el formato del archivo de letras;
+    si no es válida ni tras la reparación, se devuelve el borrador de error.
+    'on_token(texto, modelo)' recibe la respuesta en streaming a medida que llega.
     """
-    system_prompt_draft = (
-        f"Eres un compositor. Tu tarea es escribir una canción completa y, por separado, detallar su estilo musical."
-        f"La letra y el título de la canción deben estar en '{language}'."
-        f"Para los TAGS, tu tarea es describir el estilo musical '{song_style}' en INGLÉS. No describas la letra que acabas de crear. No menciones el tema de la canción ni su título."
-        f"La descripción de los TAGS debe ser puramente musical, enfocada en la instrumentación, el tempo, la atmósfera, la estructura y los elementos sonoros típicos del estilo '{song_style}'."
-        f"El género del cantante es '{gender}'. Debes reflejar esto en la descripción de los TAGS (ej. 'powerful masculine vocals' o 'powerful feminine vocals')."
-        "Debes estructurar tu respuesta EXACTAMENTE de la siguiente manera, sin texto adicional antes o después:"
-        "\n\nTITLE: [El título de la canción aquí]"
-        "\n\nPROMPT:"
-        "\nIntro:"
-        "\n[4 líneas de la introducción]"
-        "\n\nVerse 1:"
-        "\n[8 líneas de la primera estrofa]"
-        "\n\nPre-Chorus:"
-        "\n[4 líneas del pre-estribillo]"
-        "\n\nChorus:"
-        "\n[4 líneas del estribillo]"
-        "\n\nChorus:"
-        "\n[4 líneas del estribillo repetido, cambiar la temrinacion de dos lineas sin perder la rima]"
-        "\n\nVerse 2:"
-        "\n[8 líneas de la segunda estrofa]"
-        "\n\nPre-Chorus:"
-        "\n[4 líneas del pre-estribillo]"
-        "\n\nChorus:"
-        "\n[4 líneas del estribillo]"
-        "\n\nChorus:"
-        "\n[4 líneas del estribillo repetido]"
-        "\n\nBridge:"
-        "\n[4-8 líneas del puente, debe ser solo la letra]"
-        "\n\nOutro:"
-        "\n[4 líneas del final]"
-        "\n\nTAGS:"
-        "\n[Un único párrafo en INGLÉS de 500 a 1000 caracteres que describa únicamente el estilo musical '{song_style}', su instrumentación, tempo, y ambiente, mencionando el estilo vocal pero sin hacer referencia a la letra o tema de la canción.]"
-        "\n\nGENERO: [Aquí 'Masculino' o 'Femenino']"
-    )
-    user_prompt_draft = (
-        f"Tema de la canción: '{prompt}'\n"
-        f"Estilo musical general: '{song_style}'\n"
-        f"Género del cantante: '{gender}'"
-    )
-    if total_songs > 1:
-        user_prompt_draft += f"\nEsta es la canción {song_index} de un total de {total_songs}."
+    messages = build_draft_messages(prompt, song_style, language, gender, song_index, total_songs, avoid_lyrics)
 
     try:
-        if llm_model.startswith("groq/"):
-            model_name = llm_model.split('/', 1)[1]
-            print(f"Generando borrador de letras con Groq (Modelo: {model_name})...")
-            completion = groq_client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt_draft},
-                    {"role": "user", "content": user_prompt_draft}
-                ],
-                temperature=0.7,
-                max_tokens=4096,
-                top_p=1,
-                stream=False,
-            )
-            return completion.choices[0].message.content
-        
-        elif llm_model.startswith("gemini/"):
-            model_name = llm_model.split('/', 1)[1]
-            print(f"Generando borrador de letras con Google Gemini (Modelo: {model_name})...")
-            model = genai.GenerativeModel(model_name)
-            full_prompt = f"{system_prompt_draft}\n\n{user_prompt_draft}"
-            response = model.generate_content(full_prompt)
-            return response.text
-
-        else: # Default to OpenAI
-            model_name = llm_model.split('/', 1)[1]
-            print(f"Generando borrador de letras con OpenAI (Modelo: {model_name})...")
-            response = openai_client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt_draft},
-                    {"role": "user", "content": user_prompt_draft}
-                ],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+        model_name = llm_model.split('/', 1)[-1]
+        preferred = llm_model if provider_of(llm_model) != "openai" else f"openai/{model_name}"
+        print(f"Generando borrador de letras (modelo preferido: {preferred})...")
+        parsed = llm_router.complete_validated(
+            "draft", messages, parse_lyrics_response,
+            primary=preferred, provider_params=DRAFT_PROVIDER_PARAMS, on_token=on_token
+        )
+        return format_lyrics_file(parsed)
 
     except Exception as e:
         print(f"Error al generar el borrador de las letras para la canción {song_index} con el modelo {llm_model}: {e}")
-        return f"TITLE: Error Song {song_index}\nPROMPT: [Borrador no generado por un error: {e}]\nTAGS: error\nGENERO: "
+        return error_draft(song_index, e)
 
-def refine_lyrics(
-    initial_user_prompt: str,
-    draft_lyrics_content: str,
-    song_style: str
-) -> str:
-    """
-    Refina la letra de una canción usando un modelo de lenguaje avanzado (GPT-4o-mini).
-    """
-    print(f"Refinando letras para el prompt: '{initial_user_prompt}'...")
-    
+def error_draft(song_index: int, error) -> str:
+    """Contenido de reemplazo cuando no se pudo generar el borrador de una canción."""
+    return f"TITLE: Error Song {song_index}\nPROMPT: {ERROR_DRAFT_MARKER}: {error}]\nTAGS: error\nGENERO: "
+
+def parse_refinable_draft(draft_lyrics_content: str):
+    """Devuelve el borrador parseado si tiene una letra válida para refinar, o None."""
     try:
         parsed_draft = parse_lyrics_file(draft_lyrics_content)
-        draft_lyrics = parsed_draft.get('prompt', '')
-        if not draft_lyrics or "[Borrador no generado por un error" in draft_lyrics:
-            print("Advertencia: No se pudo extraer una letra válida del borrador para refinar. Saltando refinamiento.")
-            return draft_lyrics_content
     except Exception as e:
         print(f"Error al parsear el borrador de la letra: {e}. Saltando refinamiento.")
-        return draft_lyrics_content
+        return None
+    draft_lyrics = parsed_draft.get('prompt', '')
+    if not draft_lyrics or ERROR_DRAFT_MARKER in draft_lyrics:
+        print("Advertencia: No se pudo extraer una letra válida del borrador para refinar. Saltando refinamiento.")
+        return None
+    return parsed_draft
 
+REFINE_SYSTEM_PROMPT = (
+    "Eres un compositor y letrista profesional de talla mundial, con un profundo conocimiento de la teoría musical, la poesía, la narrativa y la psicología de la música en todos los idiomas. "
+    "Tu tarea es tomar un borrador de letra de canción y transformarlo en una obra maestra. "
+    "Debes analizar el tema principal, el estilo musical y la letra del borrador, y luego reescribirla para maximizar su impacto, coherencia, "
+    "calidad de rima, flujo y profundidad emocional. Utiliza todo tu conocimiento y entrenamiento sobre el tema para enriquecer la letra."
+    "\n\n**Instrucciones de Mejora Crítica:**\n"
+    "1. **Coherencia y Narrativa Profunda:** Asegúrate de que la historia o el mensaje sea cristalino y se desarrolle con una tensión y liberación narrativa que cautive al oyente.\n"
+    "2. **Calidad de Rima Excepcional:** Eleva las rimas. Busca rimas internas, asonantes, consonantes y multisilábicas que suenen naturales y sofisticadas. Las terminaciones de las palabras deben combinar y fluir perfectamente.\n"
+    "3. **Flujo y Musicalidad:** Cada línea debe tener un ritmo y una cadencia que no solo se lea bien, sino que se sienta inherentemente musical. Piensa en cómo las sílabas y los acentos crearán un patrón rítmico sobre una melodía.\n"
+    "4. **Profundidad y Originalidad:** Infunde la letra con metáforas originales, imágenes poéticas potentes y un lenguaje evocador que provoque una respuesta emocional genuina.\n"
+    "5. **Sentido y Precisión:** Cada palabra debe estar ahí por una razón. La gramática debe ser impecable y cada frase debe ser concisa y poderosa.\n\n"
+    "**IMPORTANTE:** Devuelve únicamente la letra mejorada, manteniendo la misma estructura de secciones (Intro, Verse 1, Chorus, etc.). No incluyas ningún texto adicional, explicaciones o comentarios."
+)
+
+def build_refine_messages(initial_user_prompt: str, draft_lyrics: str, song_style: str) -> List[Dict]:
+    """
+    Construye los mensajes para refinar la letra de un borrador: instrucciones fijas, el
+    tema y el estilo del trabajo y, al final, el borrador de la canción.
+    """
     system_prompt = (
-        "Eres un compositor y letrista profesional de talla mundial, con un profundo conocimiento de la teoría musical, la poesía, la narrativa y la psicología de la música en todos los idiomas. "
-        "Tu tarea es tomar un borrador de letra de canción y transformarlo en una obra maestra. "
-        "Debes analizar el tema principal, el estilo musical y la letra del borrador, y luego reescribirla para maximizar su impacto, coherencia, "
-        "calidad de rima, flujo y profundidad emocional. Utiliza todo tu conocimiento y entrenamiento sobre el tema para enriquecer la letra."
+        REFINE_SYSTEM_PROMPT
+        + f"\n\n**Tema principal de la canción (Prompt Original):** '{initial_user_prompt}'"
+        + f"\n**Estilo Musical:** '{song_style}'"
     )
-    
     user_prompt = (
-        f"Por favor, mejora la siguiente letra de canción para que alcance un nivel de autor profesional.\n"
-        f"**Tema principal de la canción (Prompt Original):** '{initial_user_prompt}'\n"
-        f"**Estilo Musical:** '{song_style}'\n\n"
-        f"**Borrador de la Letra:**\n{draft_lyrics}\n\n"
-        "**Instrucciones de Mejora Crítica:**\n"
-        "1. **Coherencia y Narrativa Profunda:** Asegúrate de que la historia o el mensaje sea cristalino y se desarrolle con una tensión y liberación narrativa que cautive al oyente.\n"
-        "2. **Calidad de Rima Excepcional:** Eleva las rimas. Busca rimas internas, asonantes, consonantes y multisilábicas que suenen naturales y sofisticadas. Las terminaciones de las palabras deben combinar y fluir perfectamente.\n"
-        "3. **Flujo y Musicalidad:** Cada línea debe tener un ritmo y una cadencia que no solo se lea bien, sino que se sienta inherentemente musical. Piensa en cómo las sílabas y los acentos crearán un patrón rítmico sobre una melodía.\n"
-        "4. **Profundidad y Originalidad:** Infunde la letra con metáforas originales, imágenes poéticas potentes y un lenguaje evocador que provoque una respuesta emocional genuina.\n"
-        "5. **Sentido y Precisión:** Cada palabra debe estar ahí por una razón. La gramática debe ser impecable y cada frase debe ser concisa y poderosa.\n\n"
-        "**IMPORTANTE:** Devuelve únicamente la letra mejorada, manteniendo la misma estructura de secciones (Intro, Verse 1, Chorus, etc.). No incluyas ningún texto adicional, explicaciones o comentarios."
+        "Por favor, mejora la siguiente letra de canción para que alcance un nivel de autor profesional.\n\n"
+        f"**Borrador de la Letra:**\n{draft_lyrics}"
     )
 
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def validate_refined_lyrics(content: str):
+    """La letra refinada no puede estar vacía ni traer las cabeceras del archivo. Devuelve (letra, errores)."""
+    refined_lyrics = (content or "").strip()
+    errors = []
+    if not refined_lyrics:
+        errors.append("la letra está vacía")
+    elif re.search(r'^\s*(TITLE|TAGS|GENERO):', refined_lyrics, flags=re.IGNORECASE | re.MULTILINE):
+        errors.append("incluye marcadores TITLE/TAGS/GENERO; devuelve solo la letra")
+    return refined_lyrics, errors
+
+def assemble_refined_lyrics(parsed_draft: Dict, refined_lyrics: str) -> str:
+    """Reconstruye el formato del archivo de letras con la letra refinada."""
+    final_output = f"TITLE: {parsed_draft.get('title', 'Sin Título')}\n\n"
+    final_output += f"PROMPT:\n{refined_lyrics}\n\n"
+    final_output += f"TAGS:\n{parsed_draft.get('tags', '')}\n\n"
+    final_output += f"GENERO: {parsed_draft.get('gender', '')}"
+    return final_output
+
+def refine_lyrics(
+    initial_user_prompt: str,
+    draft_lyrics_content: str,
+    song_style: str,
+    on_token: Callable = None
+) -> str:
+    """
+    Refina la letra de una canción con los modelos de la etapa 'refine' del enrutador de LLM.
+    'on_token(texto, modelo)' recibe la letra refinada en streaming a medida que llega.
+    """
+    print(f"Refinando letras para el prompt: '{initial_user_prompt}'...")
+
+    parsed_draft = parse_refinable_draft(draft_lyrics_content)
+    if parsed_draft is None:
+        return draft_lyrics_content
+
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7,
-        )
-        refined_lyrics = response.choices[0].message.content
-        
-        # Reconstruir el formato original con la letra refinada
-        parsed_draft['prompt'] = refined_lyrics
-        
-        final_output = f"TITLE: {parsed_draft.get('title', 'Sin Título')}\n\n"
-        final_output += f"PROMPT:\n{refined_lyrics}\n\n"
-        final_output += f"TAGS:\n{parsed_draft.get('tags', '')}\n\n"
-        final_output += f"GENERO: {parsed_draft.get('gender', '')}"
-        
-        return final_output
+        messages = build_refine_messages(initial_user_prompt, parsed_draft['prompt'], song_style)
+        refined_lyrics = llm_router.complete_validated("refine", messages, validate_refined_lyrics, on_token=on_token, **REFINE_PARAMS)
+        return assemble_refined_lyrics(parsed_draft, refined_lyrics)
 
     except Exception as e:
-        print(f"Error al refinar las letras con gpt-4o-mini: {e}")
+        print(f"Error al refinar las letras: {e}")
         return draft_lyrics_content
 
+INSTRUMENTAL_SYSTEM_PROMPT = (
+    "Eres un experto musicólogo. Tu tarea es crear un título para una canción instrumental y describir su estilo musical. "
+    "El título de la canción debe estar en el idioma indicado en el contexto del trabajo. "
+    "Para los TAGS, tu tarea es describir en INGLÉS el estilo musical del contexto del trabajo. No menciones el tema de la canción ni su título. "
+    "La descripción de los TAGS debe ser puramente musical, enfocada en la instrumentación, el tempo, la atmósfera, la estructura y los elementos sonoros típicos de ese estilo. "
+    "Debes estructurar tu respuesta EXACTAMENTE de la siguiente manera, sin texto adicional antes o después:"
+    "\n\nTITLE: [El título de la canción aquí]"
+    "\n\nTAGS:"
+    "\n[Un único párrafo en INGLÉS de 500 a 1000 caracteres que describa únicamente el estilo musical del trabajo, su instrumentación, tempo, y ambiente, sin hacer referencia al tema de la canción.]"
+    "\n\nSi se te pide la respuesta en formato JSON, devuelve un objeto con las claves 'title' y 'tags'."
+)
+
+def build_instrumental_messages(prompt: str, song_style: str, language: str = "spanish", song_index: int = 1, total_songs: int = 1) -> List[Dict]:
+    """Construye los mensajes para el prompt de una canción instrumental (prefijo común del trabajo)."""
+    user_prompt = f"Tema de la canción: '{prompt}'"
+    if total_songs > 1:
+        user_prompt += f"\nEsta es la canción {song_index} de un total de {total_songs}."
+
+    return [
+        {"role": "system", "content": INSTRUMENTAL_SYSTEM_PROMPT + job_context(language, song_style)},
+        {"role": "user", "content": user_prompt}
+    ]
+
 def generate_instrumental_prompt_for_song(prompt: str, song_style: str, language: str = "spanish", song_index: int = 1, total_songs: int = 1) -> str:
     """
     Genera un prompt para una única canción instrumental (título y tags).
     """
     try:
-        system_prompt = (
-            f"Eres un experto musicólogo. Tu tarea es crear un título para una canción instrumental y describir su estilo musical."
-            f"El título de la canción debe estar en '{language}'."
-            f"Para los TAGS, tu tarea es describir el estilo musical '{song_style}' en INGLÉS. No menciones el tema de la canción ni su título."
-            f"La descripción de los TAGS debe ser puramente musical, enfocada en la instrumentación, el tempo, la atmósfera, la estructura y los elementos sonoros típicos del estilo '{song_style}'."
-            "Debes estructurar tu respuesta EXACTAMENTE de la siguiente manera, sin texto adicional antes o después:"
-            "\n\nTITLE: [El título de la canción aquí]"
-            "\n\nTAGS:"
-            "\n[Un único párrafo en INGLÉS de 500 a 1000 caracteres que describa únicamente el estilo musical '{song_style}', su instrumentación, tempo, y ambiente, sin hacer referencia al tema de la canción.]"
-        )
-        user_prompt = (
-            f"Tema de la canción: '{prompt}'\n"
-            f"Estilo musical general: '{song_style}'"
-        )
-        if total_songs > 1:
-            user_prompt += f"\nEsta es la canción {song_index} de un total de {total_songs}."
-
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7,
+        messages = build_instrumental_messages(prompt, song_style, language, song_index, total_songs)
+        parsed = llm_router.complete_validated(
+            "instrumental", messages, lambda content: parse_lyrics_response(content, instrumental=True),
+            provider_params=INSTRUMENTAL_PROVIDER_PARAMS, **INSTRUMENTAL_PARAMS
         )
-        
-        return response.choices[0].message.content
+        return format_lyrics_file(parsed)
     except Exception as e:
         print(f"Error al generar el prompt instrumental para la canción {song_index}: {e}")
         return "TITLE: Error\nTAGS: error"
 
-def generate_song_plan(
+PLAN_SYSTEM_PROMPT = (
+    "Eres un productor musical y un conceptualizador creativo de talla mundial. Tu tarea es tomar una idea general para un álbum o una serie de canciones y desglosarla en una lista de temas de canciones únicos, originales y creativos. "
+    "Cada tema debe tener un título evocador y una breve descripción que sirva de guía para un compositor. "
+    "CRÍTICO: Debes evitar a toda costa títulos genéricos como 'Canción 1', 'Track 1', 'Intro', etc. Cada título debe ser una frase artística."
+    "El objetivo es evitar la repetición y asegurar que cada canción explore un ángulo, emoción o momento diferente dentro del concepto general."
+    "\n\n**Instrucciones de Formato y Calidad:**\n"
+    "1. **Títulos Creativos:** NUNCA uses números o nombres genéricos (ej. NO 'Canción 1', NO 'Tema 2'). Usa títulos poéticos, intrigantes o descriptivos (ej. 'Ecos del Vacío', 'Bailando en la Tormenta', 'El Último Suspiro').\n"
+    "2. **Descripciones Únicas:** Cada descripción debe ser específica para ESE título. No repitas la misma frase del concepto general. Explica qué hace única a esta canción (tempo, emoción, historia específica).\n"
+    "3. **Idioma:** Asegúrate de que TANTO el título COMO la descripción estén en el idioma obligatorio que se indica.\n"
+    "4. **Formato JSON:** Devuelve tu respuesta como un único objeto JSON válido.\n\n"
+    "La clave principal debe ser 'song_plan', y su valor debe ser un array de objetos.\n"
+    "Cada objeto en el array debe tener exactamente dos claves: 'title' y 'description'.\n\n"
+    "**Ejemplo de Salida (para un concepto de 'Amor perdido' en Español):**\n"
+    "{\n"
+    '  "song_plan": [\n'
+    '    {\n'
+    '      "title": "Cartas sin Enviar",\n'
+    '      "description": "Una balada lenta y acústica que explora el arrepentimiento de no haber dicho lo que se sentía a tiempo."\n'
+    '    },\n'
+    '    {\n'
+    '      "title": "Fuego en la Lluvia",\n'
+    '      "description": "Un tema más rápido y rockero que representa la ira y la confusión tras la ruptura, con metáforas de elementos opuestos."\n'
+    '    }\n'
+    '  ]\n'
+    "}"
+)
+
+def build_song_plan_messages(
     user_prompt: str,
     total_songs: int,
     language: str,
-    llm_model: str = "openai/gpt-4o-mini"
-) -> str:
+    theme_summary: str = None,
+    start_index: int = 1,
+    album_size: int = None,
+    avoid_titles: List[str] = ()
+) -> List[Dict]:
     """
-    Genera un plan de canciones con títulos y descripciones únicos.
+    Construye los mensajes para el plan de canciones (salida JSON). Para un tramo de un
+    álbum grande se indican el resumen temático compartido, la posición del tramo
+    ('start_index' de 'album_size') y los títulos que ya están en uso. Lo común a todos
+    los tramos va primero, para que compartan el prefijo en la caché del proveedor.
     """
-    print(f"Generando plan de canciones para el prompt: '{user_prompt}'...")
+    user_prompt_plan = (
+        f"**Concepto General:** '{user_prompt}'\n"
+        f"**Idioma OBLIGATORIO para los títulos y descripciones:** '{language}'"
+    )
+    if theme_summary:
+        user_prompt_plan += f"\n\n**Resumen temático compartido del álbum:** {theme_summary}"
+    user_prompt_plan += f"\n\nBasado en el concepto general, genera un plan para {total_songs} canciones únicas."
+    if album_size and album_size > total_songs:
+        user_prompt_plan += (
+            f"\n\nEstás planificando las canciones {start_index} a {start_index + total_songs - 1} de un álbum de {album_size}. "
+            "El resto del álbum se planifica por separado: cubre los ángulos propios de estas canciones."
+        )
+    if avoid_titles:
+        user_prompt_plan += "\n\n**Títulos ya usados en el álbum (no los repitas):** " + "; ".join(avoid_titles)
 
+    return [
+        {"role": "system", "content": PLAN_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt_plan}
+    ]
+
+def build_theme_summary_messages(user_prompt: str, total_songs: int, language: str, sections: int) -> List[Dict]:
+    """Construye los mensajes del resumen temático que comparten los tramos de un álbum grande."""
     system_prompt = (
-        "Eres un productor musical y un conceptualizador creativo de talla mundial. Tu tarea es tomar una idea general para un álbum o una serie de canciones y desglosarla en una lista de temas de canciones únicos, originales y creativos. "
-        "Cada tema debe tener un título evocador y una breve descripción que sirva de guía para un compositor. "
-        "CRÍTICO: Debes evitar a toda costa títulos genéricos como 'Canción 1', 'Track 1', 'Intro', etc. Cada título debe ser una frase artística."
-        "El objetivo es evitar la repetición y asegurar que cada canción explore un ángulo, emoción o momento diferente dentro del concepto general."
+        "Eres un productor musical y un conceptualizador creativo de talla mundial. "
+        "Tu tarea es resumir el concepto de un álbum y dividir su arco narrativo en tramos."
     )
-
-    user_prompt_plan = (
-        f"Basado en el siguiente concepto general, genera un plan para {total_songs} canciones únicas.\n"
-        f"**Concepto General:** '{user_prompt}'\n"
-        f"**Idioma OBLIGATORIO para los títulos y descripciones:** '{language}'\n\n"
-        "**Instrucciones de Formato y Calidad:**\n"
-        "1. **Títulos Creativos:** NUNCA uses números o nombres genéricos (ej. NO 'Canción 1', NO 'Tema 2'). Usa títulos poéticos, intrigantes o descriptivos (ej. 'Ecos del Vacío', 'Bailando en la Tormenta', 'El Último Suspiro').\n"
-        "2. **Descripciones Únicas:** Cada descripción debe ser específica para ESE título. No repitas la misma frase del concepto general. Explica qué hace única a esta canción (tempo, emoción, historia específica).\n"
-        "3. **Idioma:** Asegúrate de que TANTO el título COMO la descripción estén en '{language}'.\n"
-        "4. **Formato JSON:** Devuelve tu respuesta como un único objeto JSON válido.\n\n"
-        "La clave principal debe ser 'song_plan', y su valor debe ser un array de objetos.\n"
-        "Cada objeto en el array debe tener exactamente dos claves: 'title' y 'description'.\n\n"
-        "**Ejemplo de Salida (para un concepto de 'Amor perdido' en Español):**\n"
-        "{\n"
-        '  "song_plan": [\n'
-        '    {\n'
-        '      "title": "Cartas sin Enviar",\n'
-        '      "description": "Una balada lenta y acústica que explora el arrepentimiento de no haber dicho lo que se sentía a tiempo."\n'
-        '    },\n'
-        '    {\n'
-        '      "title": "Fuego en la Lluvia",\n'
-        '      "description": "Un tema más rápido y rockero que representa la ira y la confusión tras la ruptura, con metáforas de elementos opuestos."\n'
-        '    }\n'
-        '  ]\n'
-        "}"
+    user_prompt_summary = (
+        f"Concepto del álbum: '{user_prompt}'. El álbum tendrá {total_songs} canciones en '{language}'.\n"
+        f"Devuelve un objeto JSON con dos claves: 'summary' (un párrafo de 80 palabras como máximo con el tono, "
+        f"el universo y los motivos del álbum) y 'sections' (una lista de {sections} frases, una por tramo consecutivo "
+        "de canciones, que describa el ángulo emocional o narrativo propio de ese tramo, sin repetirse entre sí)."
     )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt_summary}
+    ]
+
+def plan_chunks(total_songs: int, chunk_size: int = LLM_PLAN_CHUNK_SIZE) -> List[tuple]:
+    """Divide el álbum en tramos consecutivos: [(primera canción, número de canciones), ...]."""
+    chunk_size = max(1, chunk_size)
+    return [(start + 1, min(chunk_size, total_songs - start)) for start in range(0, total_songs, chunk_size)]
+
+def title_hash(title: str) -> str:
+    """Huella del título normalizado (sin acentos, mayúsculas ni signos) para detectar duplicados."""
+    text = unicodedata.normalize("NFKD", title or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    normalized = " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
 
+def parse_plan_entries(plan_str: str) -> List[Dict]:
+    """Entradas del plan con título y descripción, o una lista vacía si la respuesta no es válida."""
     try:
-        # Por ahora, esta función usará OpenAI por defecto para asegurar una salida JSON consistente.
-        # Se puede extender en el futuro para otros modelos si se valida su capacidad de seguir instrucciones JSON.
-        model_name = "gpt-4o-mini" # Forzar un modelo conocido para JSON
-        print(f"Generando plan de canciones con OpenAI (Modelo: {model_name})...")
-        
-        response = openai_client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt_plan}
-            ],
-            temperature=0.8,
-            response_format={"type": "json_object"},
-        )
-        return response.choices[0].message.content
+        song_plan = json.loads(plan_str or "").get("song_plan", [])
+    except (ValueError, AttributeError):
+        return []
+    if not isinstance(song_plan, list):
+        return []
+    return [
+        {"title": str(entry["title"]).strip(), "description": str(entry.get("description") or "").strip()}
+        for entry in song_plan
+        if isinstance(entry, dict) and str(entry.get("title") or "").strip()
+    ]
+
+def merge_plan_entries(song_plan: List[Dict], entries: List[Dict], total_songs: int, seen: set) -> int:
+    """
+    Añade a 'song_plan' las entradas cuyo título no esté ya en 'seen' (huellas de los
+    títulos aceptados) hasta llegar a 'total_songs'. Devuelve cuántas se descartaron.
+    """
+    discarded = 0
+    for entry in entries:
+        fingerprint = title_hash(entry["title"])
+        if fingerprint in seen or len(song_plan) >= total_songs:
+            discarded += 1
+            continue
+        seen.add(fingerprint)
+        song_plan.append(entry)
+    return discarded
 
+def generate_theme_summary(user_prompt: str, total_songs: int, language: str, sections: int):
+    """Resumen temático y ángulo de cada tramo. Si falla, los tramos usan el concepto del usuario."""
+    try:
+        content = llm_router.complete("plan", build_theme_summary_messages(user_prompt, total_songs, language, sections), **PLAN_PARAMS)
+        data = json.loads(content)
+        summary = str(data.get("summary") or "").strip() or user_prompt
+        angles = [str(section).strip() for section in data.get("sections") or []]
     except Exception as e:
-        print(f"Error al generar el plan de canciones con el modelo {llm_model}: {e}")
-        return '{"song_plan": []}'
+        print(f"Advertencia: no se pudo generar el resumen temático del álbum ({e}). Se usará el concepto del usuario.")
+        summary, angles = user_prompt, []
+    return summary, angles + [""] * (sections - len(angles))
+
+def complete_song_plan(song_plan: List[Dict], seen: set, user_prompt: str, total_songs: int,
+                       language: str, theme_summary: str = None) -> List[Dict]:
+    """Regenera solo las entradas que faltan (o que se descartaron por duplicadas) del plan."""
+    for round_number in range(LLM_PLAN_REPAIR_ROUNDS):
+        missing = total_songs - len(song_plan)
+        if missing <= 0:
+            break
+        print(f"Regenerando {missing} entrada(s) del plan (ronda {round_number + 1}/{LLM_PLAN_REPAIR_ROUNDS})...")
+        messages = build_song_plan_messages(
+            user_prompt, missing, language, theme_summary=theme_summary,
+            start_index=len(song_plan) + 1, album_size=total_songs,
+            avoid_titles=[entry["title"] for entry in song_plan]
+        )
+        try:
+            entries = parse_plan_entries(llm_router.complete("plan", messages, **PLAN_PARAMS))
+        except Exception as e:
+            print(f"Error al regenerar las entradas del plan: {e}")
+            continue
+        merge_plan_entries(song_plan, entries, total_songs, seen)
+    return song_plan
+
+def generate_song_plan(
+    user_prompt: str,
+    total_songs: int,
+    language: str,
+    llm_model: str = "openai/gpt-4o-mini"
+) -> str:
+    """
+    Genera un plan de canciones con títulos y descripciones únicos. Los álbumes grandes se
+    planifican en tramos paralelos con un resumen temático compartido; después se
+    descartan los títulos duplicados y se regeneran solo las entradas que faltan.
+    """
+    print(f"Generando plan de canciones para el prompt: '{user_prompt}'...")
+
+    # El plan necesita una salida JSON: la ruta 'plan' solo debe incluir modelos que
+    # admitan response_format (LLM_ROUTE_PLAN).
+    chunks = plan_chunks(total_songs)
+    theme_summary, angles = None, []
+    if len(chunks) > 1:
+        theme_summary, angles = generate_theme_summary(user_prompt, total_songs, language, len(chunks))
+        print(f"Plan dividido en {len(chunks)} tramos paralelos de hasta {LLM_PLAN_CHUNK_SIZE} canciones.")
+
+    def plan_chunk(indexed_chunk):
+        i, (start_index, count) = indexed_chunk
+        summary = f"{theme_summary} Ángulo de este tramo: {angles[i]}" if theme_summary and angles[i] else theme_summary
+        messages = build_song_plan_messages(user_prompt, count, language, theme_summary=summary,
+                                            start_index=start_index, album_size=total_songs)
+        try:
+            return parse_plan_entries(llm_router.complete("plan", messages, **PLAN_PARAMS))
+        except Exception as e:
+            print(f"Error al generar el tramo {i + 1} del plan de canciones con el modelo {llm_model}: {e}")
+            return []
+
+    results = map_concurrently(plan_chunk, list(enumerate(chunks)), llm_router.candidates("plan")[0])
 
+    song_plan, seen = [], set()
+    discarded = sum(merge_plan_entries(song_plan, entries, total_songs, seen) for entries in results)
+    if discarded:
+        print(f"⚠️ Se descartaron {discarded} entrada(s) del plan con títulos duplicados o sobrantes.")
+    complete_song_plan(song_plan, seen, user_prompt, total_songs, language, theme_summary)
+    return json.dumps({"song_plan": song_plan}, ensure_ascii=False)
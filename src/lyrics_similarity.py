@@ -0,0 +1,201 @@
+"""
+Detección de letras casi idénticas antes de gastar créditos de Suno.
+
+Cada letra se reduce a un conjunto de shingles (k palabras consecutivas de sus líneas
+normalizadas) y a una firma MinHash calculada con NumPy; la fracción de posiciones
+iguales entre dos firmas estima la similitud de Jaccard. Los estribillos se comparan
+también por separado, porque son la parte que más se repite entre canciones.
+"""
+import os
+import re
+import json
+import time
+import zlib
+import unicodedata
+from typing import Callable, Dict, List, Optional
+from src.config import (
+    LYRICS_SIMILARITY_THRESHOLD, LYRICS_CHORUS_SIMILARITY_THRESHOLD, LYRICS_MINHASH_PERMUTATIONS,
+    LYRICS_SHINGLE_SIZE, LYRICS_SIMILARITY_ACTION, LYRICS_REVIEW_LOG_PATH
+)
+from src.utils import parse_lyrics_file
+from src.llm_pool import map_concurrently
+
+# Cabeceras de sección de las letras ('Verse 1:', 'Chorus:', 'Estribillo:', ...)
+_SECTION_HEADER = re.compile(r'^\s*(?:\[([^\]]{1,30})\]|([A-Za-zÀ-ÿ][A-Za-zÀ-ÿ\- ]{0,20}?\s*\d*)\s*:)\s*$')
+_CHORUS_NAMES = ("chorus", "estribillo", "coro")
+REVIEW_SUFFIX = ".review"
+
+
+def normalize_line(line: str) -> str:
+    """Minúsculas, sin acentos ni signos de puntuación."""
+    text = unicodedata.normalize("NFKD", line)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^a-z0-9ñ]+", " ", text).split())
+
+
+def split_sections(lyrics: str) -> Dict[str, List[str]]:
+    """Devuelve {'all': líneas, 'chorus': líneas de los estribillos}, ya normalizadas."""
+    sections = {"all": [], "chorus": []}
+    in_chorus = False
+    for raw_line in lyrics.splitlines():
+        header = _SECTION_HEADER.match(raw_line)
+        if header:
+            in_chorus = any(name in (header.group(1) or header.group(2)).lower() for name in _CHORUS_NAMES)
+            continue
+        line = normalize_line(raw_line)
+        if not line:
+            continue
+        sections["all"].append(line)
+        if in_chorus:
+            sections["chorus"].append(line)
+    return sections
+
+
+def shingles(lines: List[str], size: int = LYRICS_SHINGLE_SIZE) -> set:
+    """Shingles de 'size' palabras dentro de cada línea (las líneas cortas cuentan enteras)."""
+    result = set()
+    for line in lines:
+        words = line.split()
+        if len(words) <= size:
+            result.add(line)
+            continue
+        result.update(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return result
+
+
+def minhash_signatures(shingle_sets: List[set], permutations: int = LYRICS_MINHASH_PERMUTATIONS, seed: int = 1):
+    """
+    Firmas MinHash (una fila por conjunto) con hashing multiplicativo vectorizado:
+    h(x) = (a·x + b) mod 2^64, quedándose con los 32 bits altos. Un conjunto vacío
+    tiene una firma de valores máximos (quien compara debe descartarlo).
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**63, size=permutations, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, size=permutations, dtype=np.uint64)
+    empty = np.full(permutations, np.iinfo(np.uint32).max, dtype=np.uint64)
+
+    signatures = np.empty((len(shingle_sets), permutations), dtype=np.uint64)
+    for row, items in enumerate(shingle_sets):
+        if not items:
+            signatures[row] = empty
+            continue
+        hashes = np.fromiter((zlib.crc32(item.encode("utf-8")) for item in items), dtype=np.uint64, count=len(items))
+        with np.errstate(over="ignore"):
+            permuted = (hashes[:, None] * a[None, :] + b[None, :]) >> np.uint64(32)
+        signatures[row] = permuted.min(axis=0)
+    return signatures
+
+
+def similarity_matrix(signatures):
+    """Similitud de Jaccard estimada entre todas las firmas (matriz simétrica)."""
+    import numpy as np
+
+    count = len(signatures)
+    matrix = np.zeros((count, count))
+    for i in range(count):
+        matrix[i, i + 1:] = (signatures[i + 1:] == signatures[i]).mean(axis=1)
+    return matrix + matrix.T
+
+
+def find_similar_pairs(lyrics_by_name: Dict[str, str], threshold: float = LYRICS_SIMILARITY_THRESHOLD,
+                       chorus_threshold: float = LYRICS_CHORUS_SIMILARITY_THRESHOLD) -> List[dict]:
+    """
+    Pares de letras cuya similitud supera 'threshold' (letra completa) o
+    'chorus_threshold' (solo estribillos), en el orden de 'lyrics_by_name'.
+    """
+    import numpy as np
+
+    names = list(lyrics_by_name)
+    if len(names) < 2:
+        return []
+    sections = [split_sections(lyrics_by_name[name]) for name in names]
+    full = similarity_matrix(minhash_signatures([shingles(s["all"]) for s in sections]))
+    chorus = similarity_matrix(minhash_signatures([shingles(s["chorus"]) for s in sections]))
+
+    # Las letras vacías (o sin estribillo, para la comparación de estribillos) no cuentan
+    has_lines = np.array([bool(s["all"]) for s in sections])
+    has_chorus = np.array([bool(s["chorus"]) for s in sections])
+    flagged = (full >= threshold) | ((chorus >= chorus_threshold) & np.outer(has_chorus, has_chorus))
+    flagged &= np.outer(has_lines, has_lines)
+
+    return [
+        {"a": names[i], "b": names[j], "similarity": round(float(full[i, j]), 3),
+         "chorus_similarity": round(float(chorus[i, j]), 3)}
+        for i, j in np.argwhere(np.triu(flagged, k=1))
+    ]
+
+
+def _offenders(pairs: List[dict]) -> Dict[str, str]:
+    """De cada par se marca la segunda letra, salvo que el par ya tenga una marcada. {marcada: referencia}."""
+    offenders = {}
+    for pair in pairs:
+        if pair["a"] not in offenders and pair["b"] not in offenders:
+            offenders[pair["b"]] = pair["a"]
+    return offenders
+
+
+def _read_lyrics(filepaths: List[str]) -> Dict[str, str]:
+    lyrics = {}
+    for filepath in filepaths:
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                lyrics[filepath] = parse_lyrics_file(f.read()).get('prompt', '')
+        except OSError as e:
+            print(f"⚠️ No se pudo leer {filepath} para comparar letras: {e}")
+    return lyrics
+
+
+def queue_for_review(filepath: str, reference: str, pair: Optional[dict], log_path: str = LYRICS_REVIEW_LOG_PATH) -> str:
+    """Aparta la letra ('<archivo>.review', fuera de la generación y del resume) y la registra."""
+    review_path = filepath + REVIEW_SUFFIX
+    os.replace(filepath, review_path)
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"ts": time.time(), "file": review_path, "similar_to": reference, "pair": pair},
+                           ensure_ascii=False) + "\n")
+    print(f"📝 Letra '{os.path.basename(filepath)}' apartada para revisión: se parece demasiado a '{os.path.basename(reference)}'.")
+    return review_path
+
+
+def dedupe_lyrics_files(filepaths: List[str], regenerate: Callable = None, llm_model: str = "openai/gpt-4o-mini",
+                        action: str = LYRICS_SIMILARITY_ACTION, log_path: str = LYRICS_REVIEW_LOG_PATH) -> List[str]:
+    """
+    Compara todas las letras de 'filepaths' y actúa solo sobre las que se parecen
+    demasiado a otra anterior. Con action='regenerate' se llama en paralelo (con el
+    límite de concurrencia de 'llm_model') a 'regenerate(ruta, letra_de_referencia)',
+    que reescribe el archivo, y se vuelve a comprobar; lo que siga duplicado (o todo,
+    con action='review') se aparta para revisión. Devuelve las rutas que siguen
+    adelante, en el mismo orden.
+    """
+    if action == "off" or len(filepaths) < 2:
+        return filepaths
+
+    start = time.monotonic()
+    lyrics = _read_lyrics(filepaths)
+    pairs = find_similar_pairs(lyrics)
+    print(f"🔎 Similitud de letras: {len(filepaths)} archivos comparados en {time.monotonic() - start:.2f}s, "
+          f"{len(pairs)} par(es) por encima del umbral.")
+    if not pairs:
+        return filepaths
+
+    offenders = _offenders(pairs)
+    if action == "regenerate" and regenerate:
+        def regenerate_one(offender):
+            filepath, reference = offender
+            print(f"♻️ Regenerando '{os.path.basename(filepath)}' por su parecido con '{os.path.basename(reference)}'...")
+            try:
+                regenerate(filepath, lyrics[reference])
+            except Exception as e:
+                print(f"Error al regenerar la letra {filepath}: {e}")
+
+        map_concurrently(regenerate_one, offenders.items(), llm_model)
+        lyrics = _read_lyrics(filepaths)
+        pairs = find_similar_pairs(lyrics)
+        offenders = _offenders(pairs)
+
+    pair_of = {pair["b"]: pair for pair in pairs}
+    for filepath, reference in offenders.items():
+        queue_for_review(filepath, reference, pair_of.get(filepath), log_path)
+    return [filepath for filepath in filepaths if filepath not in offenders]
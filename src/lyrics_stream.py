@@ -0,0 +1,105 @@
+import os
+import time
+import threading
+from typing import Callable
+from src.config import LLM_STREAM_PROGRESS_INTERVAL, LLM_STREAM_MAX_CHARS
+from src.llm_client import StreamAborted, StreamCancelled
+from src.utils import streamed_lyrics_error, LYRICS_FORMAT_MARKERS
+
+# Caracteres finales de cada stream que se publican como vista previa
+PREVIEW_CHARS = 240
+
+
+class StreamProgress:
+    """
+    Reúne el avance de varias respuestas en streaming que llegan en paralelo y lo publica
+    con 'publish(detalles, streams)', como mucho una vez cada 'interval' segundos.
+    """
+
+    def __init__(self, publish: Callable, label: str, interval: float = LLM_STREAM_PROGRESS_INTERVAL):
+        self.publish = publish
+        self.label = label
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._streams = {}
+        self._last_publish = 0.0
+
+    def update(self, key: str, text: str):
+        with self._lock:
+            self._streams[key] = {"chars": len(text), "preview": text[-PREVIEW_CHARS:]}
+            now = time.monotonic()
+            if now - self._last_publish < self.interval:
+                return
+            self._last_publish = now
+            streams = {k: dict(v) for k, v in self._streams.items()}
+        summary = ", ".join(f"{k}: {v['chars']} caracteres" for k, v in streams.items())
+        self.publish(f"{self.label} ({summary})", streams)
+
+
+class LyricsStreamWriter:
+    """
+    Consumidor de 'on_token' para una letra. Escribe la respuesta a medida que llega en
+    '<ruta>.partial' y corta la llamada (StreamAborted) si el texto rompe el formato.
+
+    Con hedge pueden llegar dos respuestas a la vez: el archivo pertenece al primer intento
+    que produce texto, y si ese intento se corta pasa al siguiente. Tras 'discard' el
+    escritor queda cerrado y corta los intentos que sigan llegando en segundo plano.
+    """
+
+    def __init__(self, final_path: str, progress: StreamProgress = None, key: str = None,
+                 markers: tuple = LYRICS_FORMAT_MARKERS, forbidden: tuple = ()):
+        self.partial_path = f"{final_path}.partial"
+        self.progress = progress
+        self.key = key or os.path.basename(final_path)
+        self.markers = markers
+        self.forbidden = forbidden
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._owner = None
+        self._closed = False
+
+    def __call__(self, text: str, llm_model: str = "default"):
+        with self._lock:
+            if self._closed:
+                # El nodo ya tiene su respuesta: no recrear el archivo ni seguir gastando tokens
+                raise StreamCancelled(f"La respuesta de {llm_model} ya no es necesaria.")
+            self._buffers[llm_model] = self._buffers.get(llm_model, "") + text
+            content = self._buffers[llm_model]
+            error = streamed_lyrics_error(content, self.markers, self.forbidden, max_chars=LLM_STREAM_MAX_CHARS)
+            if error:
+                del self._buffers[llm_model]
+                if self._owner == llm_model:
+                    self._owner = None
+                    self._rewrite_from_other_attempt()
+                raise StreamAborted(f"Formato roto en la respuesta de {llm_model}: {error}")
+
+            if self._owner is None:
+                self._owner = llm_model
+                with open(self.partial_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+            elif self._owner == llm_model:
+                with open(self.partial_path, 'a', encoding='utf-8') as f:
+                    f.write(text)
+
+        if self.progress and self._owner == llm_model:
+            self.progress.update(self.key, content)
+
+    def _rewrite_from_other_attempt(self):
+        if not self._buffers:
+            self._remove_partial()
+            return
+        self._owner, content = next(iter(self._buffers.items()))
+        with open(self.partial_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def discard(self):
+        """Borra el archivo temporal una vez escrito el definitivo y cierra el escritor."""
+        with self._lock:
+            self._closed = True
+            self._remove_partial()
+
+    def _remove_partial(self):
+        try:
+            os.remove(self.partial_path)
+        except OSError:
+            pass
@@ -2,27 +2,43 @@
 import os
 import json
 import re
-from typing import List, TypedDict, Dict
-from langgraph.graph import StateGraph, END
+import time
+import uuid
+import operator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Annotated, List, TypedDict, Dict, TYPE_CHECKING
 from celery import Task
 
 # Importar nuestros módulos de ayuda
-from src.config import (
-    LYRICS_DIR, SONGS_DIR, CLIPS_DIR, OUTPUT_DIR, 
-    METADATA_DIR, PUBLICATION_REPORTS_DIR, VIDEO_OUTPUT_PATH
-)
+from src.config import LANGGRAPH_CHECKPOINTER, CHECKPOINT_DB_PATH, SONG_PIPELINE_CONCURRENCY
 from src.lyric_generator import (
     generate_draft_lyrics, 
     refine_lyrics, 
     generate_instrumental_prompt_for_song,
-    generate_song_plan
+    generate_song_plan,
+    parse_plan_entries,
+    merge_plan_entries,
+    ERROR_DRAFT_MARKER
 )
 from src.suno_handler import create_and_download_song
 from src.suno_api import SunoApiClient
-from src.video_assembler import assemble_video
+from src.generation_ledger import GenerationLedger, lyrics_content_hash
+from src.video_assembler import assemble_video, render_song_segment, concatenate_segments
 from src.metadata_generator import generate_youtube_metadata
 from src.youtube_uploader import upload_video_to_youtube
-from src.utils import parse_lyrics_file
+from src.utils import parse_lyrics_file, parse_lyrics_response, format_lyrics_file, parse_metadata_file
+from src.llm_pool import map_concurrently
+from src.llm_cache import llm_cache
+from src.llm_router import llm_router
+from src.llm_usage import llm_usage, current_scope
+from src.telemetry import span
+from src.lyrics_stream import StreamProgress, LyricsStreamWriter
+from src.lyrics_similarity import dedupe_lyrics_files
+from src.workspace import workspace_of
+
+if TYPE_CHECKING:
+    from langgraph.runtime import Runtime
 
 # --- Funciones de ayuda de ordenación ---
 def natural_sort_key(s):
@@ -35,6 +51,110 @@ def natural_sort_key(s):
     
     return [atoi(c) for c in re.split(r'(\d+)', s)]
 
+# --- Funciones de ayuda de letras (compartidas con el modo batch) ---
+def parse_song_plan(plan_str: str, total_songs: int, user_prompt: str) -> List[Dict]:
+    """
+    Convierte la respuesta JSON del LLM en el plan, sin títulos duplicados. Si faltan
+    entradas, solo esas se completan con un título genérico.
+    """
+    song_plan = []
+    merge_plan_entries(song_plan, parse_plan_entries(plan_str), total_songs, set())
+    return pad_song_plan(song_plan, total_songs, user_prompt)
+
+def pad_song_plan(song_plan: List[Dict], total_songs: int, user_prompt: str) -> List[Dict]:
+    """Completa con títulos genéricos solo las entradas que faltan del plan."""
+    if len(song_plan) < total_songs:
+        print(f"⚠️ Advertencia: El plan de canciones tiene {len(song_plan)} de {total_songs} entradas válidas. "
+              "Las que faltan se generarán sin un plan detallado.")
+        song_plan += [{"title": f"Song {i+1}", "description": user_prompt} for i in range(len(song_plan), total_songs)]
+    return song_plan
+
+def save_song_plan(song_plan: List[Dict], metadata_dir: str) -> str:
+    """Guarda el plan en 'metadata_dir/song_plan.json' para que sea visible."""
+    os.makedirs(metadata_dir, exist_ok=True)
+    plan_filepath = os.path.join(metadata_dir, "song_plan.json")
+    with open(plan_filepath, 'w', encoding='utf-8') as f:
+        json.dump(song_plan, f, indent=4, ensure_ascii=False)
+    print(f"Plan de canciones guardado en: {plan_filepath}")
+    return plan_filepath
+
+def song_detailed_prompt(song_idea: Dict, user_prompt: str) -> str:
+    """Prompt detallado para el compositor a partir de una entrada del plan."""
+    return (
+        f"Título de la canción: \"{song_idea.get('title')}\".\n"
+        f"Descripción del tema: \"{song_idea.get('description')}\".\n"
+        f"Basado en el concepto general: \"{user_prompt}\"."
+    )
+
+def instrumental_content(song_idea: Dict, content: str) -> str:
+    # Forzar el título del plan en el contenido; sin letra, pero con la sección PROMPT
+    # para que los tags se lean con 'parse_lyrics_file'
+    parsed, _ = parse_lyrics_response(content, instrumental=True)
+    return format_lyrics_file({'title': song_idea.get('title'), 'prompt': '', 'tags': parsed['tags']})
+
+def is_generable(parsed_data: Dict, is_instrumental: bool) -> bool:
+    """Indica si la letra parseada se puede enviar a Suno (no es un borrador de error)."""
+    if is_instrumental:
+        return parsed_data.get('tags', '').strip().lower() not in ('', 'error')
+    prompt = parsed_data.get('prompt', '')
+    return bool(prompt.strip()) and ERROR_DRAFT_MARKER not in prompt
+
+def write_draft_files(song_plan: List[Dict], contents: List[str], lyrics_dir: str) -> List[str]:
+    """
+    Guarda los borradores en 'lyrics_dir' ('1_Titulo.txt', ...) en el orden del plan,
+    forzando el título del plan y renombrando los títulos duplicados.
+    """
+    draft_filepaths = []
+    os.makedirs(lyrics_dir, exist_ok=True)
+    generated_titles = set()
+
+    # El post-procesado (títulos, duplicados, nombres de archivo) es secuencial y
+    # sigue el orden del plan, por lo que no depende del orden de finalización.
+    for i, (song_idea, content) in enumerate(zip(song_plan, contents)):
+        song_index = i + 1
+        try:
+            # Asegurarse de que el título del plan se use, evitando el que genera el LLM
+            parsed_data, _ = parse_lyrics_response(content)
+            original_title = song_idea.get('title', f'song_{song_index}')
+            
+            if parsed_data.get('title') != original_title:
+                print(f"Forzando título del plan: '{original_title}' sobre el título generado '{parsed_data.get('title')}'.")
+
+            new_title = original_title
+            suffix_n = 2
+            while new_title in generated_titles:
+                new_title = f"{original_title} ({suffix_n})"
+                suffix_n += 1
+
+            if new_title != original_title:
+                print(f"⚠️ Título duplicado detectado en el plan. Renombrando '{original_title}' a '{new_title}'.")
+            
+            generated_titles.add(new_title)
+            # El archivo se reescribe en el formato canónico, aunque el LLM respondiera en JSON
+            content = format_lyrics_file({**parsed_data, 'title': new_title})
+            
+            safe_title = "".join(c for c in new_title if c.isalnum() or c in " _-").rstrip()
+            filepath = os.path.join(lyrics_dir, f"{song_index}_{safe_title}.txt")
+            
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(content)
+            print(f"Borrador de canción guardado en: {filepath}")
+            draft_filepaths.append(filepath)
+
+        except Exception as e:
+            print(f"Error al procesar y guardar el borrador para la canción {song_index}: {e}")
+
+    return draft_filepaths
+
+def merge_song_results(current: List[Dict], update: List[Dict]) -> List[Dict]:
+    """
+    Reductor de 'song_results': cada rama por canción añade su resultado. Si una canción
+    se vuelve a producir (reanudación), su nuevo resultado sustituye al anterior.
+    """
+    merged = {result["index"]: result for result in (current or [])}
+    merged.update({result["index"]: result for result in (update or [])})
+    return [merged[index] for index in sorted(merged)]
+
 # --- Definir el estado del agente ---
 class AgentState(TypedDict):
     user_prompt: str
@@ -52,26 +172,96 @@ class AgentState(TypedDict):
     draft_filepaths: List[str]
     lyrics_list: List[str]
     song_paths: List[str]
+    song_jobs: List[Dict] # Canciones que pasan a Suno, una rama 'produce_song' por cada una
+    song_results: Annotated[List[Dict], merge_song_results] # Resultado de cada rama por canción
+    segment_paths: List[str] # Segmento de video de cada canción, en el orden de 'song_paths'
+    defer_segment_render: bool # Los segmentos se renderizan en 'assemble_video' y no en cada rama
+    node_timings: Annotated[List[Dict], operator.add] # Inicio y fin de cada nodo ejecutado (ver 'timed_node')
     metadata_path: str
     final_video_path: str
     youtube_url: str
-    task_instance: Task
-    suno_client: SunoApiClient
     resume_from_node: str
+    workspace_dir: str # Raíz de los archivos del trabajo (ver src/workspace.py)
+    priority: int # Prioridad del trabajo en el planificador (0-9), para sus colas de etapa
+
+@dataclass
+class JobContext:
+    """
+    Objetos vivos del trabajo (tarea de Celery y cliente de Suno). Se inyectan en cada
+    ejecución del grafo en lugar de ir en el estado, que se guarda en los checkpoints.
+    """
+    task_instance: Task = None
+    suno_client: SunoApiClient = None
+
+def job_context(runtime) -> JobContext:
+    """Contexto de la ejecución en curso, o uno vacío si el nodo se llama directamente."""
+    context = getattr(runtime, "context", None)
+    return context if context is not None else JobContext()
 
 # --- Funciones de ayuda ---
-def update_progress(task_instance: Task, step: int, total_steps: int, details: str):
+def update_progress(task_instance: Task, step: int, total_steps: int, details: str, extra: Dict = None):
     if not task_instance:
         print(f"(Simulado) Progreso: {details}")
         return
     progress_percentage = int((step / total_steps) * 100)
     task_instance.update_state(
         state='PROGRESS',
-        meta={'details': details, 'progress': f'{progress_percentage}%'}
+        meta={'details': details, 'progress': f'{progress_percentage}%', **(extra or {})}
+    )
+
+def stream_progress(task_instance: Task, step: int, label: str) -> StreamProgress:
+    """Publica el avance de las respuestas en streaming en la meta de la tarea ('streams')."""
+    return StreamProgress(
+        lambda details, streams: update_progress(task_instance, step, TOTAL_STEPS, details, extra={'streams': streams}),
+        label
     )
 
 TOTAL_STEPS = 8 # Ajustado a 8 pasos (plan, borrador, etc.)
 
+def load_song_plan(state: AgentState) -> List[Dict]:
+    """Plan de canciones del estado o, al reanudar, del archivo 'song_plan.json'."""
+    song_plan = state.get("song_plan")
+    if not song_plan:
+        print("Plan de canciones no encontrado en el estado, intentando cargar desde archivo...")
+        plan_filepath = workspace_of(state).song_plan_path
+        if os.path.exists(plan_filepath):
+            with open(plan_filepath, 'r', encoding='utf-8') as f:
+                song_plan = json.load(f)
+            print("Plan de canciones cargado exitosamente desde el archivo.")
+        else:
+            raise ValueError("No se encontró el plan de canciones ni en el estado ni en el archivo. No se puede continuar.")
+    return song_plan
+
+def draft_regenerator(state: AgentState, refine: bool = False):
+    """
+    Devuelve 'regenerate(ruta, letra_de_referencia)' para 'dedupe_lyrics_files': escribe un
+    nuevo borrador de la canción del archivo, alejándose de la letra de referencia, y lo
+    refina si 'refine'. Se conserva el título del archivo.
+    """
+    def regenerate(filepath: str, reference_lyrics: str):
+        song_plan = load_song_plan(state)
+        song_index = int(os.path.basename(filepath).split('_', 1)[0])
+        with open(filepath, 'r', encoding='utf-8') as f:
+            title = parse_lyrics_file(f.read())['title']
+        content = generate_draft_lyrics(
+            prompt=song_detailed_prompt(song_plan[song_index - 1], state['user_prompt']),
+            song_style=state["song_style"],
+            language=state.get("language", "spanish"),
+            gender="Femenino" if song_index <= state.get("num_female_songs", 0) else "Masculino",
+            song_index=song_index,
+            total_songs=len(song_plan),
+            llm_model=state.get("llm_model", "openai/gpt-4o-mini"),
+            avoid_lyrics=reference_lyrics
+        )
+        parsed, _ = parse_lyrics_response(content)
+        content = format_lyrics_file({**parsed, 'title': title})
+        if refine:
+            content = refine_lyrics(state["user_prompt"], content, state["song_style"])
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    return regenerate
+
 # --- Lógica de enrutamiento condicional ---
 def should_refine_lyrics(state: AgentState) -> str:
     """
@@ -89,8 +279,8 @@ def should_refine_lyrics(state: AgentState) -> str:
 
 # --- Nodos del Grafo ---
 
-def node_generate_song_plan(state: AgentState) -> Dict:
-    task = state["task_instance"]
+def node_generate_song_plan(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+    task = job_context(runtime).task_instance
     update_progress(task, 1, TOTAL_STEPS, "Fase 1: Creando plan de canciones...")
 
     is_instrumental = state.get("is_instrumental", False)
@@ -114,64 +304,42 @@ def node_generate_song_plan(state: AgentState) -> Dict:
         llm_model=state.get("llm_model", "openai/gpt-4o-mini")
     )
     
-    try:
-        plan_data = json.loads(plan_str)
-        song_plan = plan_data.get("song_plan", [])
-        if not song_plan or len(song_plan) != total_songs:
-            print(f"⚠️ Advertencia: El plan de canciones no se generó correctamente. Se generarán {total_songs} canciones sin un plan detallado.")
-            song_plan = [{"title": f"Song {i+1}", "description": state["user_prompt"]} for i in range(total_songs)]
-    except json.JSONDecodeError:
-        print("Error al decodificar el JSON del plan de canciones. Se generarán canciones sin un plan detallado.")
-        song_plan = [{"title": f"Song {i+1}", "description": state["user_prompt"]} for i in range(total_songs)]
-
-    # Guardar el plan en un archivo para que sea visible
-    os.makedirs(METADATA_DIR, exist_ok=True)
-    plan_filepath = os.path.join(METADATA_DIR, "song_plan.json")
-    with open(plan_filepath, 'w', encoding='utf-8') as f:
-        json.dump(song_plan, f, indent=4, ensure_ascii=False)
-    print(f"Plan de canciones guardado en: {plan_filepath}")
+    song_plan = parse_song_plan(plan_str, total_songs, state["user_prompt"])
+    save_song_plan(song_plan, workspace_of(state).metadata_dir)
 
     return {"song_plan": song_plan}
 
 
-def node_generate_lyrics_drafts(state: AgentState) -> Dict:
-    task = state["task_instance"]
+def node_generate_lyrics_drafts(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+    task = job_context(runtime).task_instance
     update_progress(task, 2, TOTAL_STEPS, "Fase 2: Creando borradores de letras...")
 
-    song_plan = state.get("song_plan")
-    if not song_plan:
-        print("Plan de canciones no encontrado en el estado, intentando cargar desde archivo...")
-        plan_filepath = os.path.join(METADATA_DIR, "song_plan.json")
-        if os.path.exists(plan_filepath):
-            with open(plan_filepath, 'r', encoding='utf-8') as f:
-                song_plan = json.load(f)
-            print("Plan de canciones cargado exitosamente desde el archivo.")
-        else:
-            raise ValueError("No se encontró el plan de canciones ni en el estado ni en el archivo. No se puede continuar.")
-
-    draft_filepaths = []
-    os.makedirs(LYRICS_DIR, exist_ok=True)
-    generated_titles = set()
-    
+    song_plan = load_song_plan(state)
     total_songs = len(song_plan)
     num_female = state.get("num_female_songs", 0)
-
-    for i, song_idea in enumerate(song_plan):
+    is_instrumental = state.get("is_instrumental", False)
+    llm_model = state.get("llm_model", "openai/gpt-4o-mini")
+    # El pool se dimensiona según el primer candidato del router para la etapa
+    pool_model = llm_router.candidates("instrumental")[0] if is_instrumental else llm_model
+
+    # Los borradores se escriben en '<n>_<título>.txt.partial' mientras llegan en streaming
+    lyrics_dir = workspace_of(state).lyrics_dir
+    os.makedirs(lyrics_dir, exist_ok=True)
+    progress = stream_progress(task, 2, "Fase 2: Escribiendo borradores")
+    writers = []
+
+    def generate_content(indexed_idea):
+        i, song_idea = indexed_idea
         song_index = i + 1
-        update_progress(task, 2, TOTAL_STEPS, f"Generando borrador {song_index}/{total_songs}: '{song_idea.get('title')}'...")
 
         # Determinar el género para esta canción específica
         gender = "Femenino" if i < num_female else "Masculino"
         
         # Crear un prompt más detallado para el compositor de letras
-        detailed_prompt = (
-            f"Título de la canción: \"{song_idea.get('title')}\".\n"
-            f"Descripción del tema: \"{song_idea.get('description')}\".\n"
-            f"Basado en el concepto general: \"{state['user_prompt']}\"."
-        )
+        detailed_prompt = song_detailed_prompt(song_idea, state['user_prompt'])
 
         # Para instrumentales, el plan es más simple, solo generamos el prompt de Suno
-        if state.get("is_instrumental", False):
+        if is_instrumental:
             content = generate_instrumental_prompt_for_song(
                 prompt=detailed_prompt,
                 song_style=state["song_style"],
@@ -179,63 +347,51 @@ def node_generate_lyrics_drafts(state: AgentState) -> Dict:
                 song_index=song_index,
                 total_songs=total_songs
             )
-            # Forzar el título del plan en el contenido
-            content = f"TITLE: {song_idea.get('title')}\n{content.split('TAGS:', 1)[-1]}"
-        else:
-            content = generate_draft_lyrics(
-                prompt=detailed_prompt,
-                song_style=state["song_style"],
-                language=state.get("language", "spanish"),
-                gender=gender,
-                song_index=song_index,
-                total_songs=total_songs,
-                llm_model=state.get("llm_model", "openai/gpt-4o-mini")
-            )
-        
-        try:
-            # Asegurarse de que el título del plan se use, evitando el que genera el LLM
-            parsed_data = parse_lyrics_file(content)
-            original_title = song_idea.get('title', f'song_{song_index}')
-            
-            # Reemplazar el título en el contenido por el del plan para consistencia
-            if parsed_data.get('title') != original_title:
-                print(f"Forzando título del plan: '{original_title}' sobre el título generado '{parsed_data.get('title')}'.")
-                content = content.replace(f"TITLE: {parsed_data.get('title')}", f"TITLE: {original_title}", 1)
+            return instrumental_content(song_idea, content)
+
+        safe_title = "".join(c for c in song_idea.get('title', '') if c.isalnum() or c in " _-").rstrip()
+        writer = LyricsStreamWriter(os.path.join(lyrics_dir, f"{song_index}_{safe_title}.txt"), progress, key=f"Canción {song_index}")
+        writers.append(writer)
+        return generate_draft_lyrics(
+            prompt=detailed_prompt,
+            song_style=state["song_style"],
+            language=state.get("language", "spanish"),
+            gender=gender,
+            song_index=song_index,
+            total_songs=total_songs,
+            llm_model=llm_model,
+            on_token=writer
+        )
 
-            new_title = original_title
-            suffix_n = 2
-            while new_title in generated_titles:
-                new_title = f"{original_title} ({suffix_n})"
-                suffix_n += 1
+    def report_done(completed, total):
+        update_progress(task, 2, TOTAL_STEPS, f"Borradores generados: {completed}/{total}...")
 
-            if new_title != original_title:
-                print(f"⚠️ Título duplicado detectado en el plan. Renombrando '{original_title}' a '{new_title}'.")
-                content = content.replace(f"TITLE: {original_title}", f"TITLE: {new_title}", 1)
-            
-            generated_titles.add(new_title)
-            
-            safe_title = "".join(c for c in new_title if c.isalnum() or c in " _-").rstrip()
-            filepath = os.path.join(LYRICS_DIR, f"{song_index}_{safe_title}.txt")
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            print(f"Borrador de canción guardado en: {filepath}")
-            draft_filepaths.append(filepath)
+    # Las llamadas al LLM se lanzan en paralelo; los resultados vuelven en el orden del plan
+    update_progress(task, 2, TOTAL_STEPS, f"Generando {total_songs} borradores en paralelo...")
+    contents = map_concurrently(generate_content, list(enumerate(song_plan)), pool_model, on_done=report_done)
 
-        except Exception as e:
-            print(f"Error al procesar y guardar el borrador para la canción {song_index}: {e}")
+    draft_filepaths = write_draft_files(song_plan, contents, lyrics_dir)
+    for writer in writers:
+        writer.discard()
+
+    if not is_instrumental:
+        # Las letras casi idénticas se regeneran antes de gastar créditos de Suno
+        update_progress(task, 2, TOTAL_STEPS, "Comprobando letras duplicadas...")
+        draft_filepaths = dedupe_lyrics_files(draft_filepaths, draft_regenerator(state), llm_model)
 
     return {"draft_filepaths": draft_filepaths}
 
-def node_refine_lyrics(state: AgentState) -> Dict:
-    task = state["task_instance"]
+def node_refine_lyrics(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+    task = job_context(runtime).task_instance
     update_progress(task, 2, TOTAL_STEPS, "Fase 2: Refinando letras con modelo avanzado...")
     
-    refined_lyrics_list = []
     draft_filepaths = state["draft_filepaths"]
+    progress = stream_progress(task, 2, "Fase 2: Refinando letras")
 
-    for i, filepath in enumerate(draft_filepaths):
-        update_progress(task, 2, TOTAL_STEPS, f"Refinando letra {i+1}/{len(draft_filepaths)}...")
+    def refine_file(filepath):
+        draft_content = None
+        # La letra refinada no lleva cabecera: solo se vigila que no aparezcan marcadores
+        writer = LyricsStreamWriter(filepath, progress, markers=(), forbidden=("TITLE:", "TAGS:", "GENERO:"))
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 draft_content = f.read()
@@ -243,7 +399,8 @@ def node_refine_lyrics(state: AgentState) -> Dict:
             refined_content = refine_lyrics(
                 initial_user_prompt=state["user_prompt"],
                 draft_lyrics_content=draft_content,
-                song_style=state["song_style"]
+                song_style=state["song_style"],
+                on_token=writer
             )
             
             # Sobrescribir el archivo con el contenido refinado
@@ -251,17 +408,39 @@ def node_refine_lyrics(state: AgentState) -> Dict:
                 f.write(refined_content)
             
             print(f"Letra refinada y guardada en: {filepath}")
-            refined_lyrics_list.append(refined_content)
+            return refined_content
         except Exception as e:
             print(f"Error al refinar el archivo {filepath}: {e}")
-            # Si falla el refinamiento, añadir el contenido original a la lista
-            if 'draft_content' in locals():
-                refined_lyrics_list.append(draft_content)
+            # Si falla el refinamiento, se conserva el contenido original
+            return draft_content
+        finally:
+            writer.discard()
+
+    def report_done(completed, total):
+        update_progress(task, 2, TOTAL_STEPS, f"Letras refinadas: {completed}/{total}...")
+
+    map_concurrently(refine_file, draft_filepaths, llm_router.candidates("refine")[0], on_done=report_done)
+
+    # El refinamiento puede acercar letras distintas: se comprueban de nuevo y las
+    # letras se leen de los archivos, que pueden haberse regenerado o apartado
+    update_progress(task, 2, TOTAL_STEPS, "Comprobando letras duplicadas...")
+    kept_filepaths = dedupe_lyrics_files(draft_filepaths, draft_regenerator(state, refine=True), state.get("llm_model", "openai/gpt-4o-mini"))
+    refined_lyrics_list = []
+    for filepath in kept_filepaths:
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                refined_lyrics_list.append(f.read())
+        except Exception as e:
+            print(f"⚠️ Error al leer el archivo de letra {filepath}: {e}")
 
-    return {"lyrics_list": refined_lyrics_list}
+    return {"lyrics_list": refined_lyrics_list, "draft_filepaths": kept_filepaths}
 
-def node_create_songs(state: AgentState) -> Dict:
-    task = state["task_instance"]
+def node_create_songs(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+    """
+    Prepara las canciones que pasan a Suno. Cada una sigue después su propia rama
+    ('produce_song'), en paralelo con las demás.
+    """
+    task = job_context(runtime).task_instance
     update_progress(task, 3, TOTAL_STEPS, "Fase 3: Creando canciones con Suno...")
 
     # Si se saltó el refinamiento, las letras no estarán en el estado. Las leemos de los archivos.
@@ -277,57 +456,169 @@ def node_create_songs(state: AgentState) -> Dict:
             except Exception as e:
                 print(f"⚠️ Error al leer el archivo de borrador {filepath}: {e}")
 
-    song_paths = []
-    final_lyrics_for_video = []
-
+    song_jobs = []
     for i, lyrics_file_content in enumerate(lyrics_list):
         parsed_data = parse_lyrics_file(lyrics_file_content)
-        tags = parsed_data.get('tags') or state["song_style"]
-        
-        update_progress(task, 3, TOTAL_STEPS, f"Generando canción {i+1}/{len(lyrics_list)} ('{parsed_data.get('title', 'N/A')}') con voz {parsed_data.get('gender', 'N/A')}...")
-
-        new_song_paths = create_and_download_song(
-            client=state["suno_client"],
-            lyrics=parsed_data.get('prompt', ''),
-            song_style=tags,
-            song_title=parsed_data.get('title', f'song_{i+1}'),
-            vocal_gender=parsed_data.get('gender'),
-            is_instrumental=state.get("is_instrumental", False),
-            task_instance=task,
-            suno_model=state.get("suno_model", "chirp-crow")
-        )
-        
-        if new_song_paths:
-            song_paths.extend(new_song_paths)
-            # Añadir la letra correspondiente por cada canción generada para mantener la sincronización
-            final_lyrics_for_video.extend([parsed_data.get('prompt', '')] * len(new_song_paths))
+        if not is_generable(parsed_data, state.get("is_instrumental", False)):
+            # No se paga una generación de Suno con un borrador de error o sin letra
+            print(f"⚠️ Saltando la canción {i+1} ('{parsed_data.get('title', 'N/A')}'): su borrador no es válido.")
+            continue
+        song_jobs.append({
+            "index": i + 1,
+            "total": len(lyrics_list),
+            "title": parsed_data.get('title', f'song_{i+1}'),
+            "lyrics": parsed_data.get('prompt', ''),
+            "tags": parsed_data.get('tags') or state["song_style"],
+            "gender": parsed_data.get('gender'),
+        })
+
+    if not song_jobs:
+        raise ValueError("No se pudo generar ninguna canción.")
+    return {"song_jobs": song_jobs}
+
+def fan_out_songs(state: AgentState) -> List:
+    """Una rama 'produce_song' por canción; cada rama recibe solo lo que necesita."""
+    from langgraph.types import Send
+
+    shared = {k: state.get(k) for k in ("workspace_dir", "is_instrumental", "suno_model", "with_subtitles", "defer_segment_render")}
+    return [Send("produce_song", {**shared, "song": song}) for song in state["song_jobs"]]
+
+def segment_output_path(workspace, song_path: str) -> str:
+    name = os.path.splitext(os.path.basename(song_path))[0] + ".mp4"
+    return os.path.join(workspace.output_dir, "segments", name)
 
-    if not song_paths:
+def render_all_segments(state: AgentState) -> List[str]:
+    """
+    Renderiza en paralelo los segmentos de todas las canciones del trabajo, cuando no se
+    renderizaron en sus ramas. Devuelve [] si alguno falla (se ensambla el video entero).
+    """
+    workspace = workspace_of(state)
+    song_paths = state["song_paths"]
+    with_subtitles = state.get("with_subtitles", True)
+    lyrics_list = state.get("lyrics_list") or []
+    if len(lyrics_list) != len(song_paths):
+        if with_subtitles:
+            return []
+        lyrics_list = [""] * len(song_paths)
+
+    def render(track):
+        song_path, lyrics = track
+        return render_song_segment(song_path, lyrics, segment_output_path(workspace, song_path),
+                                   with_subtitles=with_subtitles, clips_dir=workspace.clips_dir)
+
+    try:
+        with ThreadPoolExecutor(max_workers=SONG_PIPELINE_CONCURRENCY) as pool:
+            return list(pool.map(render, zip(song_paths, lyrics_list)))
+    except Exception as e:
+        print(f"⚠️ No se pudieron renderizar los segmentos: {e}. Se ensamblará el video entero.")
+        return []
+
+def node_produce_song(state: Dict, runtime: "Runtime[JobContext]" = None) -> Dict:
+    """
+    Rama de una canción: generación en Suno, descarga y render de su segmento de video.
+    Una canción lenta ya no retrasa a las demás; el ensamblaje espera a que terminen todas.
+    """
+    context = job_context(runtime)
+    song = state["song"]
+    workspace = workspace_of(state)
+    with_subtitles = state.get("with_subtitles", True)
+
+    update_progress(context.task_instance, 3, TOTAL_STEPS,
+                    f"Generando canción {song['index']}/{song['total']} ('{song['title']}') con voz {song['gender'] or 'N/A'}...")
+
+    song_paths = create_and_download_song(
+        client=context.suno_client,
+        lyrics=song['lyrics'],
+        song_style=song['tags'],
+        song_title=song['title'],
+        vocal_gender=song['gender'],
+        is_instrumental=state.get("is_instrumental", False),
+        task_instance=context.task_instance,
+        suno_model=state.get("suno_model", "chirp-crow"),
+        # Registro persistente del trabajo: evita volver a pagar canciones ya solicitadas a Suno
+        ledger=GenerationLedger(workspace.generation_ledger_path),
+        songs_dir=workspace.songs_dir
+    ) or []
+
+    segment_paths = []
+    try:
+        # En el pipeline por colas los segmentos se renderizan en la etapa 'render'
+        for song_path in ([] if state.get("defer_segment_render") else song_paths):
+            segment_paths.append(render_song_segment(
+                song_path, song['lyrics'], segment_output_path(workspace, song_path),
+                with_subtitles=with_subtitles, clips_dir=workspace.clips_dir
+            ))
+    except Exception as e:
+        # La canción ya está pagada y descargada: el video se ensamblará entero al final
+        print(f"⚠️ No se pudo renderizar el segmento de '{song['title']}': {e}. Se ensamblará sin segmentos.")
+        segment_paths = []
+
+    return {"song_results": [{
+        "index": song['index'], "song_paths": song_paths, "lyrics": song['lyrics'],
+        "segment_paths": segment_paths, "with_subtitles": with_subtitles,
+    }]}
+
+def node_collect_songs(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+    """Une los resultados de las ramas por canción en el orden final del álbum."""
+    indexes = {song["index"] for song in state.get("song_jobs", [])}
+    results = [r for r in state.get("song_results", []) if r["index"] in indexes]
+    with_subtitles = state.get("with_subtitles", True)
+
+    tracks = []  # (canción, letra, segmento)
+    for result in results:
+        segments = result["segment_paths"]
+        if len(segments) != len(result["song_paths"]) or result["with_subtitles"] != with_subtitles:
+            segments = [None] * len(result["song_paths"])
+        tracks.extend(zip(result["song_paths"], [result["lyrics"]] * len(result["song_paths"]), segments))
+
+    if not tracks:
         raise ValueError("No se pudo generar ninguna canción.")
 
-    song_paths = sorted(song_paths, key=natural_sort_key)
+    tracks.sort(key=lambda track: natural_sort_key(track[0]))
     
     print("\n=== ORDEN FINAL DE CANCIONES ===")
-    for idx, path in enumerate(song_paths, 1):
+    for idx, (path, _, _) in enumerate(tracks, 1):
         print(f"{idx}. {os.path.basename(path)}")
     print("================================\n")
 
-    return {"song_paths": song_paths, "lyrics_list": final_lyrics_for_video}
+    segment_paths = [segment for _, _, segment in tracks]
+    return {
+        "song_paths": [path for path, _, _ in tracks],
+        # Añadir la letra correspondiente por cada canción generada para mantener la sincronización
+        "lyrics_list": [lyrics for _, lyrics, _ in tracks],
+        # Solo se usan los segmentos si todas las canciones tienen el suyo
+        "segment_paths": segment_paths if all(segment_paths) else [],
+    }
 
-def node_assemble_video(state: AgentState) -> Dict:
-    task = state["task_instance"]
+def node_assemble_video(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+    task = job_context(runtime).task_instance
     update_progress(task, 4, TOTAL_STEPS, "Fase 4: Ensamblando el video...")
 
+    workspace = workspace_of(state)
+    if state.get("final_video_path") and os.path.exists(state["final_video_path"]):
+        # Reanudación con el video ya ensamblado: solo faltan los metadatos
+        print(f"♻️ El video ya está ensamblado en: {state['final_video_path']}")
+        return {}
+
+    segment_paths = state.get("segment_paths") or []
+    if not segment_paths and state.get("defer_segment_render"):
+        segment_paths = render_all_segments(state)
+    if segment_paths and len(segment_paths) == len(state["song_paths"]):
+        # Los segmentos ya se renderizaron en las ramas por canción: solo se unen
+        return {"final_video_path": concatenate_segments(segment_paths, workspace.video_output_path)}
+
     final_path = assemble_video(
         song_paths=state["song_paths"],
         lyrics_list=state["lyrics_list"],
-        with_subtitles=state.get("with_subtitles", True)
+        with_subtitles=state.get("with_subtitles", True),
+        clips_dir=workspace.clips_dir,
+        output_path=workspace.video_output_path
     )
     
     return {"final_video_path": final_path}
 
-def node_generate_metadata(state: AgentState) -> Dict:
-    task = state["task_instance"]
+def node_generate_metadata(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+    task = job_context(runtime).task_instance
     update_progress(task, 5, TOTAL_STEPS, "Fase 5: Generando metadatos para YouTube...")
 
     base_lyrics = state["lyrics_list"][0] if state["lyrics_list"] else ""
@@ -335,47 +626,50 @@ def node_generate_metadata(state: AgentState) -> Dict:
     metadata_path = generate_youtube_metadata(
         user_prompt=state["user_prompt"],
         song_style=state["song_style"],
-        lyrics=base_lyrics
+        lyrics=base_lyrics,
+        metadata_dir=workspace_of(state).metadata_dir
     )
     
     return {"metadata_path": metadata_path}
 
-def node_upload_to_youtube(state: AgentState) -> Dict:
-    task = state["task_instance"]
+def node_upload_to_youtube(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+    task = job_context(runtime).task_instance
     update_progress(task, 6, TOTAL_STEPS, "Fase 6: Subiendo a YouTube...")
 
     with open(state["metadata_path"], 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-        title = lines[0].replace("Title:", "").strip()
-        description = lines[1].replace("Description:", "").strip()
-        tags_str = lines[2].replace("Tags:", "").strip()
-        tags = [tag.strip() for tag in tags_str.split(',')]
+        metadata = parse_metadata_file(f.read())
 
     video_url = upload_video_to_youtube(
         video_path=state["final_video_path"],
-        title=title,
-        description=description,
-        tags=tags,
+        title=metadata['title'],
+        description=metadata['description'],
+        tags=metadata['tags'],
         task_instance=task,
         privacy_status="private"
     )
     return {"youtube_url": video_url}
 
-def node_create_publication_report(state: AgentState) -> Dict:
-    task = state["task_instance"]
+def llm_usage_report(job_id: str, num_songs: int) -> Dict:
+    """Resumen de tokens, coste y latencia de LLM del trabajo, por etapa y por modelo."""
+    if not job_id:
+        return None
+    summary = llm_usage.summarize(job_id)
+    summary["job_id"] = job_id
+    cost = summary["totals"]["cost_usd"]
+    summary["cost_per_song_usd"] = round(cost / num_songs, 6) if cost is not None and num_songs else None
+    return summary
+
+def node_create_publication_report(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+    task = job_context(runtime).task_instance
     update_progress(task, 7, TOTAL_STEPS, "Fase 7: Creando informe de publicación...")
     
-    os.makedirs(PUBLICATION_REPORTS_DIR, exist_ok=True)
+    reports_dir = workspace_of(state).reports_dir
+    os.makedirs(reports_dir, exist_ok=True)
     report_filename = f"report_{os.path.splitext(os.path.basename(state['final_video_path']))[0]}.json"
-    report_filepath = os.path.join(PUBLICATION_REPORTS_DIR, report_filename)
+    report_filepath = os.path.join(reports_dir, report_filename)
 
     with open(state["metadata_path"], 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-        title = lines[0].replace("Title:", "").strip()
-        description = lines[1].replace("Description:", "").strip()
-        tags_str = lines[2].replace("Tags:", "").strip()
-        tags = [tag.strip() for tag in tags_str.split(',')]
-        video_metadata = {"title": title, "description": description, "tags": tags}
+        video_metadata = parse_metadata_file(f.read())
 
     report_content = {
         "user_prompt": state.get("user_prompt"),
@@ -384,6 +678,8 @@ def node_create_publication_report(state: AgentState) -> Dict:
         "final_video_path": state.get("final_video_path"),
         "video_metadata": video_metadata,
         "song_paths": state.get("song_paths"),
+        "llm_usage": llm_usage_report(current_scope().get("job_id"), len(state.get("song_paths") or [])),
+        "graph_timing": timing_summary(state.get("node_timings") or []),
     }
 
     with open(report_filepath, 'w', encoding='utf-8') as f:
@@ -394,62 +690,285 @@ def node_create_publication_report(state: AgentState) -> Dict:
 
 # --- Lógica de Enrutamiento y Grafo ---
 
-def route_workflow(state: AgentState) -> str:
+def timed_node(name: str, node):
+    """
+    Envuelve un nodo para anotar en 'node_timings' cuándo empezó y terminó, y medirlo como
+    span de telemetría. Las ramas por canción se anotan como 'produce_song:<n>'.
+    """
+    def run(state: AgentState, runtime: "Runtime[JobContext]" = None) -> Dict:
+        start = time.time()
+        label = f"{name}:{state['song']['index']}" if "song" in state else name
+        with span("node", name, node=label):
+            update = node(state, runtime) or {}
+        return {**update, "node_timings": [{"node": label, "start": round(start, 3), "end": round(time.time(), 3)}]}
+    return run
+
+def timing_summary(timings: List[Dict]) -> Dict:
+    """
+    Duración de cada nodo y tiempo total del grafo. 'parallel_seconds' es el tiempo que
+    se solaparon los nodos en paralelo (suma de duraciones menos tiempo total).
+    """
+    if not timings:
+        return None
+    origin = min(t["start"] for t in timings)
+    wall = max(t["end"] for t in timings) - origin
+    busy = sum(t["end"] - t["start"] for t in timings)
+    return {
+        "wall_seconds": round(wall, 3),
+        "parallel_seconds": round(max(0.0, busy - wall), 3),
+        "nodes": [{"node": t["node"], "offset": round(t["start"] - origin, 3), "seconds": round(t["end"] - t["start"], 3)}
+                  for t in sorted(timings, key=lambda t: t["start"])],
+    }
+
+def route_workflow(state: AgentState):
+    if state.get("resume_from_node") in ("assemble_video", "generate_metadata"):
+        # La subida espera a las dos ramas; si el video ya existe, 'assemble_video' no lo
+        # vuelve a renderizar
+        print(f"Reanudando flujo de trabajo desde el nodo: {state['resume_from_node']}")
+        return ["assemble_video", "generate_metadata"]
     if state.get("resume_from_node"):
         print(f"Reanudando flujo de trabajo desde el nodo: {state['resume_from_node']}")
         return state["resume_from_node"]
     print("Iniciando nuevo flujo de trabajo desde 'generate_song_plan'")
     return "generate_song_plan"
 
-workflow = StateGraph(AgentState)
-workflow.add_node("generate_song_plan", node_generate_song_plan)
-workflow.add_node("generate_lyrics_drafts", node_generate_lyrics_drafts)
-workflow.add_node("refine_lyrics", node_refine_lyrics)
-workflow.add_node("create_songs", node_create_songs)
-workflow.add_node("assemble_video", node_assemble_video)
-workflow.add_node("generate_metadata", node_generate_metadata)
-workflow.add_node("upload_to_youtube", node_upload_to_youtube)
-workflow.add_node("create_publication_report", node_create_publication_report)
-
-workflow.set_conditional_entry_point(route_workflow)
-
-# Flujo principal
-workflow.add_edge("generate_song_plan", "generate_lyrics_drafts")
-
-# Del borrador, decidimos si refinar o ir directo a crear la canción
-workflow.add_conditional_edges(
-    "generate_lyrics_drafts",
-    should_refine_lyrics,
-    {
-        "refine_lyrics": "refine_lyrics",
-        "create_songs": "create_songs"
-    }
-)
-
-workflow.add_edge("refine_lyrics", "create_songs")
-workflow.add_edge("create_songs", "assemble_video")
-workflow.add_edge("assemble_video", "generate_metadata")
-workflow.add_edge("generate_metadata", "upload_to_youtube")
-workflow.add_edge("upload_to_youtube", "create_publication_report")
-workflow.add_edge("create_publication_report", END)
-
-app_graph = workflow.compile()
+def build_workflow():
+    """Construye el grafo de LangGraph. langgraph se importa aquí para no cargarlo al importar el módulo."""
+    from langgraph.graph import StateGraph, END
+
+    workflow = StateGraph(AgentState, context_schema=JobContext)
+    workflow.add_node("generate_song_plan", timed_node("generate_song_plan", node_generate_song_plan))
+    workflow.add_node("generate_lyrics_drafts", timed_node("generate_lyrics_drafts", node_generate_lyrics_drafts))
+    workflow.add_node("refine_lyrics", timed_node("refine_lyrics", node_refine_lyrics))
+    workflow.add_node("create_songs", timed_node("create_songs", node_create_songs))
+    workflow.add_node("produce_song", timed_node("produce_song", node_produce_song))
+    workflow.add_node("collect_songs", timed_node("collect_songs", node_collect_songs))
+    workflow.add_node("assemble_video", timed_node("assemble_video", node_assemble_video))
+    workflow.add_node("generate_metadata", timed_node("generate_metadata", node_generate_metadata))
+    workflow.add_node("upload_to_youtube", timed_node("upload_to_youtube", node_upload_to_youtube))
+    workflow.add_node("create_publication_report", timed_node("create_publication_report", node_create_publication_report))
+
+    workflow.set_conditional_entry_point(route_workflow)
+
+    # Flujo principal
+    workflow.add_edge("generate_song_plan", "generate_lyrics_drafts")
+
+    # Del borrador, decidimos si refinar o ir directo a crear la canción
+    workflow.add_conditional_edges(
+        "generate_lyrics_drafts",
+        should_refine_lyrics,
+        {
+            "refine_lyrics": "refine_lyrics",
+            "create_songs": "create_songs"
+        }
+    )
 
-# --- Puntos de Entrada del Flujo de Trabajo ---
+    workflow.add_edge("refine_lyrics", "create_songs")
+    # Cada canción sigue su propia rama (Suno, descarga y segmento de video) en paralelo;
+    # 'collect_songs' se ejecuta una sola vez, cuando han terminado todas
+    workflow.add_conditional_edges("create_songs", fan_out_songs, ["produce_song"])
+    workflow.add_edge("produce_song", "collect_songs")
+    # Los metadatos solo necesitan las letras y el prompt: se generan mientras se ensambla
+    # el video, y la subida espera a las dos ramas
+    workflow.add_edge("collect_songs", "assemble_video")
+    workflow.add_edge("collect_songs", "generate_metadata")
+    workflow.add_edge(["assemble_video", "generate_metadata"], "upload_to_youtube")
+    workflow.add_edge("upload_to_youtube", "create_publication_report")
+    workflow.add_edge("create_publication_report", END)
+    return workflow
+
+def get_checkpointer():
+    """
+    Checkpointer del grafo: el estado se guarda tras cada nodo, por trabajo ('thread_id'),
+    en SQLite ('sqlite') o solo en memoria del proceso ('memory').
+    """
+    if LANGGRAPH_CHECKPOINTER == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        return InMemorySaver()
+
+    import sqlite3
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    os.makedirs(os.path.dirname(CHECKPOINT_DB_PATH) or ".", exist_ok=True)
+    connection = sqlite3.connect(CHECKPOINT_DB_PATH, check_same_thread=False)
+    # WAL: varios workers pueden escribir checkpoints de trabajos distintos a la vez
+    connection.execute("PRAGMA journal_mode=WAL")
+    return SqliteSaver(connection)
+
+_app_graph = None
+
+def get_app_graph():
+    """Devuelve el grafo compilado con su checkpointer, construyéndolo en el primer uso."""
+    global _app_graph
+    if _app_graph is None:
+        _app_graph = build_workflow().compile(checkpointer=get_checkpointer())
+    return _app_graph
+
+def thread_config(thread_id: str) -> Dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+def run_config(thread_id: str) -> Dict:
+    # Máximo de nodos en paralelo en un paso del grafo (las ramas por canción)
+    return {**thread_config(thread_id), "max_concurrency": SONG_PIPELINE_CONCURRENCY}
+
+def split_runtime(initial_state: dict, context: JobContext = None):
+    """
+    Separa del estado inicial la tarea de Celery y el cliente de Suno (llamadas antiguas
+    que aún los pasan en el estado). Devuelve (estado, JobContext).
+    """
+    state = {k: v for k, v in initial_state.items() if k not in ("task_instance", "suno_client")}
+    if context is None:
+        context = JobContext(initial_state.get("task_instance"), initial_state.get("suno_client"))
+    return state, context
 
-def run_video_workflow(initial_state: dict):
-    print("Iniciando el flujo de trabajo de generación de video de IA...")
-    final_state = app_graph.invoke(initial_state)
-    print("--- Flujo de trabajo completado ---")
+def workflow_result(final_state: Dict, job_id: str, pending_nodes=()) -> Dict:
     return {
         "youtube_url": final_state.get("youtube_url"),
         "video_path": final_state.get("final_video_path"),
         "song_paths": final_state.get("song_paths"),
+        "job_id": job_id,
+        # Nodo en el que se detuvo el grafo (pausa para revisión), o None si terminó
+        "paused_at": pending_nodes[0] if pending_nodes else None,
     }
 
-def resume_video_workflow(initial_state: dict):
+# --- Puntos de Entrada del Flujo de Trabajo ---
+
+def run_video_workflow(initial_state: dict, context: JobContext = None, pause_before: List[str] = None):
+    """
+    Ejecuta el flujo completo. El id del trabajo (su espacio de trabajo) es el hilo del
+    checkpointer; con 'pause_before' el grafo se detiene antes de esos nodos y se
+    continúa después con 'resume_video_workflow'.
+    """
+    print("Iniciando el flujo de trabajo de generación de video de IA...")
+    state, context = split_runtime(initial_state, context)
+    job_id = workspace_of(state).job_id
+    graph = get_app_graph()
+    config = run_config(job_id or f"run-{uuid.uuid4().hex}")
+
+    final_state = graph.invoke(state, config, context=context, interrupt_before=pause_before)
+    pending_nodes = graph.get_state(config).next
+    if pending_nodes:
+        print(f"--- Flujo de trabajo en pausa antes de '{pending_nodes[0]}' ---")
+    else:
+        print("--- Flujo de trabajo completado ---")
+    print(f"Caché de LLM: {llm_cache.stats()}")
+    print(f"Router de LLM: {llm_router.summary()}")
+    return workflow_result(final_state, job_id, pending_nodes)
+
+def _count_pending_generations(lyrics_files: List[str], state: AgentState) -> int:
+    """
+    Cuenta las letras que el registro de generación no marca como descargadas.
+    Devuelve 0 si el registro está vacío (trabajos anteriores a su existencia).
+    """
+    ledger = GenerationLedger(workspace_of(state).generation_ledger_path)
+    if not ledger.entries():
+        return 0
+    pending = 0
+    for filepath in lyrics_files:
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                parsed_data = parse_lyrics_file(f.read())
+        except OSError:
+            continue
+        key = lyrics_content_hash(
+            parsed_data.get('title'),
+            parsed_data.get('prompt', ''),
+            parsed_data.get('tags') or state.get("song_style"),
+            parsed_data.get('gender'),
+            state.get("is_instrumental", False)
+        )
+        if not ledger.is_downloaded(key):
+            pending += 1
+    return pending
+
+def prepare_resume(initial_state: dict) -> str:
+    """
+    Deja el hilo del trabajo listo para continuar y devuelve su id. Con checkpoint, aplica
+    las opciones de reanudación al último estado guardado. Sin checkpoint (trabajos
+    anteriores al checkpointer), deduce el punto de partida de los archivos del espacio de
+    trabajo y lo guarda como checkpoint, sin ejecutar ningún nodo.
+    """
+    state, _ = split_runtime(initial_state)
+    job_id = workspace_of(state).job_id
+    graph = get_app_graph()
+
+    snapshot = graph.get_state(thread_config(job_id)) if job_id else None
+    if snapshot is None or not snapshot.values:
+        thread_id = job_id or f"run-{uuid.uuid4().hex}"
+        all_nodes = [node for node in graph.nodes if not node.startswith("__")]
+        graph.invoke(_state_from_files(state), thread_config(thread_id), interrupt_before=all_nodes)
+        return thread_id
+
+    if not snapshot.next:
+        raise ValueError("Proceso ya completado. El último checkpoint del trabajo no tiene nodos pendientes.")
+    # Las opciones del formulario de reanudación sustituyen a las del checkpoint
+    overrides = {k: state[k] for k in ("with_subtitles", "suno_model", "llm_model")
+                 if k in state and state[k] != snapshot.values.get(k)}
+    if snapshot.next[0] == "create_songs":
+        # Las letras se releen de los archivos, que pueden haberse editado durante la revisión
+        overrides["lyrics_list"] = []
+    if "with_subtitles" in overrides:
+        # Los segmentos ya renderizados llevan la opción anterior: se ensambla el video entero
+        overrides["segment_paths"] = []
+    if overrides and "produce_song" in snapshot.next:
+        # Actualizar el estado descartaría los resultados de las ramas ya terminadas
+        print(f"⚠️ Hay canciones en curso: se reanudan con sus opciones originales (se ignoran {sorted(overrides)}).")
+    elif overrides:
+        graph.update_state(thread_config(job_id), overrides)
+    print(f"✅ Reanudando desde el checkpoint del trabajo '{job_id}': nodo '{snapshot.next[0]}'")
+    return job_id
+
+def resume_video_workflow(initial_state: dict, context: JobContext = None, pause_before: List[str] = None):
+    """
+    Reanuda un trabajo desde su último checkpoint (ver 'prepare_resume') hasta el final,
+    o hasta los nodos de 'pause_before'.
+    """
     print("Iniciando el flujo de trabajo de reanudación de video...")
-    
+    state, context = split_runtime(initial_state, context)
+    graph = get_app_graph()
+    config = run_config(prepare_resume(state))
+
+    print("\n🚀 Iniciando ejecución del workflow...\n")
+    final_state = graph.invoke(None, config, context=context, interrupt_before=pause_before)
+    print("\n--- Flujo de trabajo de reanudación completado ---")
+    print(f"Caché de LLM: {llm_cache.stats()}")
+    print(f"Router de LLM: {llm_router.summary()}")
+    return workflow_result(final_state, workspace_of(state).job_id, graph.get_state(config).next)
+
+# --- Etapas del pipeline (colas de Celery) ---
+
+# Cada etapa se ejecuta en su propia cola de Celery (ver tasks.py): los workers de cada
+# cola se escalan por separado. Los metadatos van con el ensamblaje porque se generan en
+# paralelo con él.
+PIPELINE_STAGES = {
+    "llm": ("generate_song_plan", "generate_lyrics_drafts", "refine_lyrics"),
+    "suno": ("create_songs", "produce_song"),
+    "render": ("collect_songs", "assemble_video", "generate_metadata"),
+    "upload": ("upload_to_youtube", "create_publication_report"),
+}
+
+def stage_of(node: str) -> str:
+    return next(stage for stage, nodes in PIPELINE_STAGES.items() if node in nodes)
+
+def run_stage(thread_id: str, stage: str, context: JobContext = None) -> Dict:
+    """
+    Ejecuta los nodos pendientes del trabajo que pertenecen a 'stage' y se detiene antes
+    del primer nodo de otra etapa. 'paused_at' del resultado indica la etapa siguiente.
+    """
+    graph = get_app_graph()
+    config = run_config(thread_id)
+    snapshot = graph.get_state(config)
+    job_id = workspace_of(snapshot.values).job_id
+    if not snapshot.next or stage_of(snapshot.next[0]) != stage:
+        # La etapa no tiene trabajo pendiente (p. ej. reanudación desde una etapa posterior)
+        return workflow_result(snapshot.values, job_id, snapshot.next)
+
+    other_stages = [node for name, nodes in PIPELINE_STAGES.items() if name != stage for node in nodes]
+    print(f"▶️ Etapa '{stage}' del trabajo '{thread_id}': desde '{snapshot.next[0]}'")
+    final_state = graph.invoke(None, config, context=context, interrupt_before=other_stages)
+    return workflow_result(final_state, job_id, graph.get_state(config).next)
+
+def _state_from_files(initial_state: dict) -> AgentState:
+    """Estado de un trabajo sin checkpoint: el punto de partida se deduce de los archivos."""
     def get_files_by_ext(directory, extensions):
         """Busca archivos de forma recursiva y devuelve una lista de rutas."""
         if not os.path.exists(directory): 
@@ -461,16 +980,18 @@ def resume_video_workflow(initial_state: dict):
                     all_files.append(os.path.join(root, f))
         return all_files
 
-    # 1. Inspeccionar el estado del sistema de archivos
-    report_files = get_files_by_ext(PUBLICATION_REPORTS_DIR, ['.json'])
+    # 1. Inspeccionar el estado del espacio de trabajo del trabajo
+    workspace = workspace_of(initial_state)
+    print(f"Espacio de trabajo: {workspace.root}")
+    report_files = get_files_by_ext(workspace.reports_dir, ['.json'])
     if report_files:
         raise ValueError("Proceso ya completado. Se encontró un informe de publicación.")
 
-    lyrics_files = get_files_by_ext(LYRICS_DIR, ['.txt'])
-    song_files = get_files_by_ext(SONGS_DIR, ['.mp3'])
-    clip_files = get_files_by_ext(CLIPS_DIR, ['.mp4', '.mov'])
-    metadata_files = get_files_by_ext(METADATA_DIR, ['.json', '.txt'])
-    final_video_exists = os.path.exists(VIDEO_OUTPUT_PATH)
+    lyrics_files = get_files_by_ext(workspace.lyrics_dir, ['.txt'])
+    song_files = get_files_by_ext(workspace.songs_dir, ['.mp3'])
+    clip_files = get_files_by_ext(workspace.clips_dir, ['.mp4', '.mov'])
+    metadata_files = get_files_by_ext(workspace.metadata_dir, ['.json', '.txt'])
+    final_video_exists = os.path.exists(workspace.video_output_path)
 
     # 2. Construir el estado inicial
     state = AgentState(**initial_state)
@@ -497,7 +1018,7 @@ def resume_video_workflow(initial_state: dict):
     state['lyrics_list'] = [] # La lista de letras se llenará después del refinamiento
     
     state['song_paths'] = song_files_sorted
-    state['final_video_path'] = VIDEO_OUTPUT_PATH if final_video_exists else None
+    state['final_video_path'] = workspace.video_output_path if final_video_exists else None
     state['user_prompt'] = "Sesión Reanudada"
     state['song_style'] = "Estilo Reanudado"
     state['suno_model'] = initial_state.get('suno_model', 'chirp-auk-turbo')
@@ -514,9 +1035,12 @@ def resume_video_workflow(initial_state: dict):
     elif final_video_exists:
         state['resume_from_node'] = "generate_metadata"
         print("✅ Reanudando desde: Generación de metadata (video listo)")
+    elif lyrics_files_sorted and _count_pending_generations(lyrics_files_sorted, state) > 0:
+        state['resume_from_node'] = "create_songs"
+        print(f"✅ Reanudando desde: Creación de canciones (el registro de generación indica canciones pendientes)")
     elif lyrics_files_sorted and song_files_sorted:
         if not clip_files:
-            raise ValueError("Faltan clips de video. Por favor, añade archivos .mp4 o .mov a la carpeta 'clips' para continuar.")
+            raise ValueError(f"Faltan clips de video. Por favor, añade archivos .mp4 o .mov a la carpeta '{workspace.clips_dir}' para continuar.")
         state['resume_from_node'] = "assemble_video"
         print(f"✅ Reanudando desde: Ensamblaje de video ({len(song_files_sorted)} canciones listas)")
     elif lyrics_files_sorted:
@@ -567,11 +1091,4 @@ def resume_video_workflow(initial_state: dict):
             
             print(f"   ➡️ Video usará TODAS las {len(state['song_paths'])} canciones")
 
-    print("\n🚀 Iniciando ejecución del workflow...\n")
-    final_state = app_graph.invoke(state)
-    print("\n--- Flujo de trabajo de reanudación completado ---")
-    
-    return {
-        "youtube_url": final_state.get("youtube_url"),
-        "video_path": final_state.get("final_video_path"),
-    }
+    return state
@@ -1,67 +1,101 @@
 
 
 import os
-import openai
-from src.config import OPENAI_API_KEY, METADATA_DIR
+from typing import List, Dict
+from src.config import METADATA_DIR
+from src.llm_router import llm_router
+from src.llm_client import structured_output_params
+from src.utils import parse_metadata_response, format_metadata_file
 
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+METADATA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["title", "description", "tags"],
+    "additionalProperties": False,
+}
+METADATA_PARAMS = {"temperature": 0.7}
+METADATA_PROVIDER_PARAMS = structured_output_params(
+    {provider: METADATA_PARAMS for provider in ("openai", "groq", "gemini")}, "youtube_metadata", METADATA_SCHEMA
+)
 
-def generate_youtube_metadata(lyrics: str, user_prompt: str, song_style: str) -> str:
+METADATA_SYSTEM_PROMPT = (
+    "Eres un experto en marketing de YouTube. Tu tarea es generar un título de video, una descripción y etiquetas relevantes basadas en la letra de una canción, el prompt original del usuario y el estilo musical. "
+    "Debes devolver la información en un formato estructurado y fácil de parsear, exactamente como se especifica.\n\n"
+    "Genera lo siguiente para un video de YouTube:\n"
+    "1. Un título de video pegadizo.\n"
+    "2. Una descripción atractiva que resuma el ambiente y el estilo.\n"
+    "3. Una lista de etiquetas relevantes separadas por comas, incluyendo el estilo musical.\n\n"
+    "Formatea la salida exactamente así:\n"
+    "Título: [Tu título aquí]\n"
+    "Descripción: [Tu descripción aquí]\n"
+    "Etiquetas: [etiqueta1, etiqueta2, etiqueta3]\n\n"
+    "Si se te pide la respuesta en formato JSON, devuelve un objeto con las claves 'title', 'description' y 'tags' (lista de etiquetas)."
+)
+
+def build_metadata_messages(lyrics: str, user_prompt: str, song_style: str) -> List[Dict]:
     """
-    Genera metadatos de YouTube usando OpenAI, los guarda en un archivo y devuelve la ruta.
+    Construye los mensajes para generar los metadatos de YouTube: instrucciones fijas,
+    el aviso y el estilo del trabajo y, al final, la letra.
     """
-    print("Generando metadatos de YouTube con gpt-4o-mini...")
-    try:
-        system_prompt = (
-            "Eres un experto en marketing de YouTube. Tu tarea es generar un título de video, una descripción y etiquetas relevantes basadas en la letra de una canción, el prompt original del usuario y el estilo musical. "
-            "Debes devolver la información en un formato estructurado y fácil de parsear, exactamente como se especifica."
-        )
-        user_prompt_formatted = (
-            f"Basado en el siguiente aviso del usuario: '{user_prompt}', el estilo musical: '{song_style}', y las letras de la canción:\n\n{lyrics}\n\n"
-            "Genera lo siguiente para un video de YouTube:\n"
-            "1. Un título de video pegadizo.\n"
-            "2. Una descripción atractiva que resuma el ambiente y el estilo.\n"
-            "3. Una lista de etiquetas relevantes separadas por comas, incluyendo el estilo musical.\n\n"
-            "Formatea la salida exactamente así:\n"
-            "Título: [Tu título aquí]\n"
-            "Descripción: [Tu descripción aquí]\n"
-            "Etiquetas: [etiqueta1, etiqueta2, etiqueta3]"
-        )
+    system_prompt = (
+        METADATA_SYSTEM_PROMPT
+        + f"\n\nAviso del usuario: '{user_prompt}'\nEstilo musical: '{song_style}'"
+    )
+    user_prompt_formatted = f"Letras de la canción:\n\n{lyrics}"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt_formatted}
+    ]
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt_formatted}
-            ],
-            temperature=0.7,
-        )
-
-        text_response = response.choices[0].message.content
-
-    except Exception as e:
-        print(f"Error al generar metadatos con OpenAI: {e}. Usando metadatos de respaldo.")
-        # Create a fallback response string
-        text_response = (
-            f"Título: Canción sobre {user_prompt}\n"
-            f"Descripción: Disfruta esta canción creada con IA sobre {user_prompt} en un estilo {song_style}.\n"
-            f"Etiquetas: AI music, suno, music video, {user_prompt.replace(' ', '_')}, {song_style.replace(' ', '_')}"
-        )
+def fallback_metadata(user_prompt: str, song_style: str) -> str:
+    """Metadatos de respaldo cuando el LLM no responde."""
+    return (
+        f"Título: Canción sobre {user_prompt}\n"
+        f"Descripción: Disfruta esta canción creada con IA sobre {user_prompt} en un estilo {song_style}.\n"
+        f"Etiquetas: AI music, suno, music video, {user_prompt.replace(' ', '_')}, {song_style.replace(' ', '_')}"
+    )
 
+def save_metadata(text_response: str, user_prompt: str, metadata_dir: str = METADATA_DIR) -> str:
+    """Guarda los metadatos en 'metadata_dir' y devuelve la ruta del archivo."""
     # Ensure the metadata directory exists
-    os.makedirs(METADATA_DIR, exist_ok=True)
-    
+    os.makedirs(metadata_dir, exist_ok=True)
+
     # Create a unique filename based on the user prompt
     safe_prompt = "".join(c for c in user_prompt if c.isalnum() or c in " _-").rstrip()
     metadata_filename = f"metadata_{safe_prompt[:20]}.txt"
-    metadata_filepath = os.path.join(METADATA_DIR, metadata_filename)
+    metadata_filepath = os.path.join(metadata_dir, metadata_filename)
 
     # Save the raw text response to the file
     with open(metadata_filepath, 'w', encoding='utf-8') as f:
         f.write(text_response)
 
     print(f"Metadatos guardados en: {metadata_filepath}")
-    
+
     # Return the path to the file
     return metadata_filepath
 
+def generate_youtube_metadata(lyrics: str, user_prompt: str, song_style: str, metadata_dir: str = METADATA_DIR) -> str:
+    """
+    Genera metadatos de YouTube con el enrutador de LLM (etapa 'metadata'), los guarda en un archivo y devuelve la ruta.
+    La respuesta se valida (título, descripción y etiquetas) y se guarda con una línea por campo.
+    """
+    print("Generando metadatos de YouTube...")
+    try:
+        metadata = llm_router.complete_validated(
+            "metadata",
+            build_metadata_messages(lyrics, user_prompt, song_style),
+            parse_metadata_response,
+            provider_params=METADATA_PROVIDER_PARAMS,
+            **METADATA_PARAMS,
+        )
+        text_response = format_metadata_file(metadata)
+
+    except Exception as e:
+        print(f"Error al generar metadatos: {e}. Usando metadatos de respaldo.")
+        text_response = fallback_metadata(user_prompt, song_style)
+
+    return save_metadata(text_response, user_prompt, metadata_dir)
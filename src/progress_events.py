@@ -0,0 +1,151 @@
+"""
+Canal de progreso en tiempo real. Los workers publican cada cambio de estado de una tarea
+en Redis pub/sub ('progress:<id>') y la web lo reenvía al navegador como server-sent
+events ('/api/events/<id>'), en lugar de que cada pestaña consulte el backend de
+resultados cada pocos segundos.
+
+- Las ráfagas se agrupan: como mucho un evento cada PROGRESS_EVENT_INTERVAL segundos por
+  tarea, y el último de la ráfaga siempre se publica. Los estados finales salen al momento.
+- El último evento de cada tarea se guarda en 'progress:last:<id>' para quien se suscribe
+  tarde (p. ej. al recargar la página).
+- Sin Redis no se publica nada y la página de estado vuelve al sondeo de '/api/status'.
+"""
+import json
+import time
+import threading
+from typing import Callable, Dict, Iterator
+from src.config import PROGRESS_EVENT_INTERVAL, PROGRESS_EVENT_TTL, PROGRESS_SSE_TIMEOUT, PROGRESS_SSE_HEARTBEAT
+from src.redis_store import get_redis
+
+TERMINAL_STATES = ("SUCCESS", "FAILURE")
+
+
+def channel_for(task_id: str) -> str:
+    return f"progress:{task_id}"
+
+
+def last_event_key(task_id: str) -> str:
+    return f"progress:last:{task_id}"
+
+
+def status_payload(state: str, info) -> Dict:
+    """Respuesta de estado de una tarea, igual para '/api/status' y para los eventos."""
+    meta = info if isinstance(info, dict) else {}
+    if state == 'FAILURE':
+        return {'state': 'FAILURE', 'progress': '0%', 'details': meta.get('details', str(info))}
+    if state == 'PENDING':
+        return {'state': state, 'progress': '0%', 'details': 'La tarea está en la cola, esperando para empezar...'}
+    if state == 'SUCCESS':
+        return {
+            'state': state,
+            'progress': meta.get('progress', '100%'),
+            'details': meta.get('details', 'Completado'),
+            'result': meta.get('result'),
+            'job_id': meta.get('job_id')
+        }
+    # Otros estados como STARTED o PROGRESS
+    return {
+        'state': state,
+        'progress': meta.get('progress', '0%'),
+        'details': meta.get('details', ''),
+        # Vista previa de las respuestas de LLM que están llegando en streaming
+        'streams': meta.get('streams', {})
+    }
+
+
+class ProgressPublisher:
+    """Publica los cambios de estado de las tareas en Redis, agrupando las ráfagas."""
+
+    def __init__(self, interval: float = PROGRESS_EVENT_INTERVAL, redis_factory: Callable = None):
+        self.interval = interval
+        self.redis_factory = redis_factory or get_redis
+        self._lock = threading.Lock()
+        self._last_sent = {}
+        self._pending = {}
+        self._timers = {}
+
+    def publish(self, task_id: str, state: str, meta=None):
+        event = status_payload(state, meta)
+        with self._lock:
+            if state in TERMINAL_STATES:
+                # Un estado final descarta la actualización agrupada que quedara pendiente
+                timer = self._timers.pop(task_id, None)
+                if timer:
+                    timer.cancel()
+                self._pending.pop(task_id, None)
+                self._last_sent.pop(task_id, None)
+                self._send(task_id, event)
+                return
+
+            wait = self.interval - (time.monotonic() - self._last_sent.get(task_id, float("-inf")))
+            if wait > 0:
+                self._pending[task_id] = event
+                if task_id not in self._timers:
+                    timer = threading.Timer(wait, self._flush, [task_id])
+                    timer.daemon = True
+                    self._timers[task_id] = timer
+                    timer.start()
+                return
+            self._last_sent[task_id] = time.monotonic()
+            self._send(task_id, event)
+
+    def _flush(self, task_id: str):
+        with self._lock:
+            self._timers.pop(task_id, None)
+            event = self._pending.pop(task_id, None)
+            if event is None:
+                return
+            self._last_sent[task_id] = time.monotonic()
+            # Se envía con el bloqueo tomado para que un estado final nunca llegue antes
+            self._send(task_id, event)
+
+    def _send(self, task_id: str, event: Dict):
+        client = self.redis_factory()
+        if client is None:
+            return
+        data = json.dumps(event, ensure_ascii=False)
+        try:
+            client.set(last_event_key(task_id), data, ex=PROGRESS_EVENT_TTL)
+            client.publish(channel_for(task_id), data)
+        except Exception as e:
+            print(f"Advertencia: no se pudo publicar el progreso de la tarea {task_id}: {e}")
+
+
+progress_publisher = ProgressPublisher()
+
+
+def _sse(data: str) -> str:
+    return f"data: {data}\n\n"
+
+
+def event_stream(task_id: str, initial_status: Callable[[], Dict], client=None,
+                 timeout: float = PROGRESS_SSE_TIMEOUT, heartbeat: float = PROGRESS_SSE_HEARTBEAT) -> Iterator[str]:
+    """
+    Genera los server-sent events de una tarea hasta su estado final. El primer evento es
+    el último publicado o, si aún no hay ninguno, 'initial_status()' (una sola consulta al
+    backend de resultados). Los comentarios ': ping' mantienen viva la conexión.
+    """
+    client = client or get_redis()
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    # Suscribirse antes de leer el último evento para no perder ninguno entre medias
+    pubsub.subscribe(channel_for(task_id))
+    try:
+        last = client.get(last_event_key(task_id))
+        event = json.loads(last) if last else initial_status()
+        yield _sse(json.dumps(event, ensure_ascii=False))
+        if event.get('state') in TERMINAL_STATES:
+            return
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=heartbeat)
+            if message is None:
+                yield ": ping\n\n"
+                continue
+            data = message['data']
+            data = data.decode('utf-8') if isinstance(data, bytes) else data
+            yield _sse(data)
+            if json.loads(data).get('state') in TERMINAL_STATES:
+                return
+    finally:
+        pubsub.close()
@@ -0,0 +1,38 @@
+import os
+import time
+import threading
+from src.config import REDIS_URL
+
+# Tiempo que se espera antes de volver a intentar conectar con Redis tras un fallo
+_RETRY_INTERVAL = 30
+
+_client = None
+_client_pid = None
+_last_failure = 0.0
+_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    Devuelve un cliente de Redis compartido por el proceso, o None si Redis no está
+    disponible. Quien lo llama debe recurrir a su alternativa local en ese caso.
+    """
+    global _client, _client_pid, _last_failure
+    with _lock:
+        # Tras un fork (workers de Celery) no se debe reutilizar el pool del padre
+        if _client is not None and _client_pid == os.getpid():
+            return _client
+        if time.time() - _last_failure < _RETRY_INTERVAL:
+            return None
+        try:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=5)
+            client.ping()
+        except Exception as e:
+            print(f"⚠️ Redis no disponible en {REDIS_URL} ({e}). Usando almacenamiento local.")
+            _client = None
+            _last_failure = time.time()
+            return None
+        _client = client
+        _client_pid = os.getpid()
+        return _client
@@ -0,0 +1,302 @@
+"""
+Dobles locales de los servicios externos para el modo simulación (SIMULATION_MODE=1):
+
+- LLM: respuestas deterministas con el formato exacto de cada etapa (plan, borrador,
+  instrumental, refinado y metadatos), en JSON si la llamada pide salida estructurada.
+- Suno: el servidor de src/fake_suno_server.py arrancado en un hilo del proceso (o el que
+  indique SUNO_API_BASE_URL, para compartirlo entre workers), con MP3 sintéticos.
+- YouTube: una subida por fragmentos que lee el video y devuelve una URL ficticia.
+- Clips de fondo: un clip sintético cuando la carpeta de clips está vacía.
+
+Cada servicio tiene su latencia y su probabilidad de fallo (variables SIM_*), de modo que
+un trabajo completo mide el coste propio de la orquestación y su manejo de errores.
+"""
+import os
+import re
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import threading
+import subprocess
+from typing import Dict, List
+from src.config import (
+    SIM_LLM_LATENCY, SIM_LLM_FAILURE_RATE, SIM_SUNO_LATENCY, SIM_SUNO_FAILURE_RATE,
+    SIM_YOUTUBE_LATENCY, SIM_YOUTUBE_FAILURE_RATE, SIM_SONG_DURATION, SIM_SEED, SIM_UPLOADS_LOG_PATH,
+    SUNO_CLERK_BASE_URL, SUNO_API_BASE_URL, CACHE_DIR
+)
+from src.llm_usage import TokenUsage
+from src.telemetry import span
+
+# Fragmento de las subidas simuladas y reintentos permitidos (como en resumable_upload)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_RETRIES = 5
+SYNTHETIC_CLIP_PATH = os.path.join(CACHE_DIR, "synthetic_background.mp4")
+
+
+class SimulatedServiceError(RuntimeError):
+    """Fallo inyectado por un servicio simulado."""
+
+
+# Latencias y fallos: aleatorios, pero reproducibles con SIM_SEED
+_rng = random.Random(SIM_SEED)
+_rng_lock = threading.Lock()
+
+
+def _wait(seconds: float):
+    if seconds > 0:
+        with _rng_lock:
+            factor = _rng.uniform(0.8, 1.2)
+        time.sleep(seconds * factor)
+
+
+def _should_fail(failure_rate: float) -> bool:
+    if failure_rate <= 0:
+        return False
+    with _rng_lock:
+        return _rng.random() < failure_rate
+
+
+# --- LLM ---
+
+_NOUNS = [
+    "el río", "la luna", "la ciudad", "la tormenta", "el camino", "el fuego", "el mar", "el silencio",
+    "la ventana", "el invierno", "la calle", "la sombra", "el puerto", "el desierto", "el jardín", "el tren",
+    "el espejo", "la montaña", "el faro", "la estrella", "la lluvia", "el puente", "la madrugada", "la carta",
+    "el bosque", "el horizonte", "el reloj", "la ceniza", "el verano", "el tambor", "la frontera", "el barco",
+    "la llave", "la campana", "la niebla", "la semilla", "la ola", "el trueno", "la vela", "el cometa",
+]
+_VERBS = [
+    "despierta", "arde", "espera", "vuelve", "canta", "se pierde", "respira", "tiembla", "brilla", "cae",
+    "camina", "se enciende", "susurra", "recuerda", "baila", "se apaga", "crece", "late", "grita", "florece",
+]
+_PREPOSITIONS = ["bajo", "sobre", "tras", "hacia", "entre", "contra", "frente a", "lejos de"]
+_TAG_SENTENCES = [
+    "Driving rhythm section with tight drums and a warm, round bass line that locks into the groove.",
+    "Layered guitars and shimmering synth pads build an expansive, cinematic atmosphere.",
+    "Mid-tempo pulse around 100 BPM with dynamic builds into an anthemic, singalong chorus.",
+    "Polished modern production with wide stereo imaging, punchy transients and a clean low end.",
+    "Subtle percussion details, handclaps and ambient textures keep the arrangement moving.",
+    "Verses stay intimate and sparse before the full band opens up in the pre-chorus.",
+    "A melodic bridge strips the mix back to piano and strings before the final chorus lift.",
+    "The outro fades on echoing vocal ad-libs over a sustained, reverberant chord.",
+]
+_LYRIC_SECTIONS = [
+    ("Intro", 4), ("Verse 1", 8), ("Pre-Chorus", 4), ("Chorus", 4), ("Chorus", 4), ("Verse 2", 8),
+    ("Pre-Chorus", 4), ("Chorus", 4), ("Chorus", 4), ("Bridge", 4), ("Outro", 4),
+]
+
+
+def _message_rng(messages: List[Dict]) -> random.Random:
+    """Generador que depende solo de los mensajes: la misma petición da la misma respuesta."""
+    digest = hashlib.sha1(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def _quoted(pattern: str, text: str, default: str = "") -> str:
+    match = re.search(pattern + r"'(.*?)'", text)
+    return match.group(1) if match else default
+
+
+def _contract(text: str) -> str:
+    return re.sub(r"\bde el\b", "del", re.sub(r"\ba el\b", "al", text))
+
+
+def _line(rng: random.Random) -> str:
+    return _contract(f"{rng.choice(_NOUNS).capitalize()} {rng.choice(_VERBS)} {rng.choice(_PREPOSITIONS)} {rng.choice(_NOUNS)}")
+
+
+def _title(rng: random.Random) -> str:
+    return _contract(f"{rng.choice(_NOUNS).split(' ', 1)[1].capitalize()} de {rng.choice(_NOUNS)}")
+
+
+def _lyrics(rng: random.Random) -> str:
+    chorus = [_line(rng) for _ in range(4)]
+    sections = []
+    for name, count in _LYRIC_SECTIONS:
+        lines = chorus if name == "Chorus" else [_line(rng) for _ in range(count)]
+        sections.append(f"{name}:\n" + "\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def _tags(rng: random.Random, style: str, gender: str = None) -> str:
+    sentences = rng.sample(_TAG_SENTENCES, len(_TAG_SENTENCES))
+    if gender:
+        voice = "masculine" if gender == "Masculino" else "feminine"
+        sentences.insert(1, f"Powerful, expressive {voice} vocals sit upfront in the mix.")
+    return f"{style or 'Pop'}. " + " ".join(sentences)
+
+
+def _refined(rng: random.Random, draft: str) -> str:
+    """La letra del borrador con sus mismas secciones y líneas nuevas."""
+    lines = []
+    for line in draft.strip().split("\n"):
+        stripped = line.strip()
+        lines.append(line if not stripped or stripped.endswith(":") else _line(rng))
+    return "\n".join(lines)
+
+
+def simulated_response(messages: List[Dict], structured: bool = False) -> str:
+    """
+    Respuesta simulada en el formato de la etapa que reconoce en los mensajes. Con
+    'structured', las etapas que admiten salida estructurada responden en JSON.
+    """
+    system = messages[0]["content"] if messages else ""
+    text = "\n".join(message["content"] for message in messages)
+    rng = _message_rng(messages)
+
+    if "'sections'" in text:
+        # Resumen temático de un álbum grande
+        sections = int(re.search(r"una lista de (\d+) frases", text).group(1))
+        return json.dumps({
+            "summary": f"Un álbum sobre {_quoted('Concepto del álbum: ', text, 'el viaje')} y {rng.choice(_NOUNS)}.",
+            "sections": [f"Tramo {i + 1}: {_line(rng).lower()}" for i in range(sections)],
+        }, ensure_ascii=False)
+    if "song_plan" in system:
+        count = int(re.search(r"genera un plan para (\d+) canciones", text).group(1))
+        return json.dumps({"song_plan": [
+            {"title": _title(rng), "description": f"Una canción donde {_line(rng).lower()}."} for _ in range(count)
+        ]}, ensure_ascii=False)
+    if "Borrador de la Letra" in text:
+        return _refined(rng, text.split("**Borrador de la Letra:**", 1)[1])
+    if "Descripción:" in system:
+        prompt, style = _quoted("Aviso del usuario: ", system), _quoted("Estilo musical: ", system)
+        metadata = {
+            "title": f"{_title(rng)} | {style or 'Música'}",
+            "description": f"Una canción sobre {prompt or 'la vida'} en estilo {style or 'libre'}. {_line(rng)}.",
+            "tags": [tag for tag in (prompt, style, rng.choice(_NOUNS).split(' ', 1)[1], "AI music") if tag],
+        }
+        if structured:
+            return json.dumps(metadata, ensure_ascii=False)
+        return (f"Título: {metadata['title']}\nDescripción: {metadata['description']}\n"
+                f"Etiquetas: {', '.join(metadata['tags'])}")
+
+    style = _quoted("Estilo musical general: ", system)
+    if "PROMPT:" in system:
+        gender = "Femenino" if _quoted("Género del cantante: ", text) == "Femenino" else "Masculino"
+        draft = {"title": _title(rng), "lyrics": _lyrics(rng), "tags": _tags(rng, style, gender), "gender": gender}
+        if structured:
+            return json.dumps(draft, ensure_ascii=False)
+        return f"TITLE: {draft['title']}\n\nPROMPT:\n{draft['lyrics']}\n\nTAGS:\n{draft['tags']}\n\nGENERO: {gender}"
+    if "TITLE:" in system:
+        instrumental = {"title": _title(rng), "tags": _tags(rng, style)}
+        if structured:
+            return json.dumps(instrumental, ensure_ascii=False)
+        return f"TITLE: {instrumental['title']}\n\nTAGS:\n{instrumental['tags']}"
+    return f"Respuesta simulada: {_line(rng)}."
+
+
+def _usage(messages: List[Dict], content: str) -> TokenUsage:
+    # Unos 4 caracteres por token, como estimación
+    return TokenUsage(sum(len(message["content"]) for message in messages) // 4, len(content) // 4)
+
+
+def simulated_completion(provider: str, model_name: str, messages: List[Dict], params: Dict):
+    """Sustituto de la llamada al proveedor. Devuelve (texto, TokenUsage)."""
+    _wait(SIM_LLM_LATENCY)
+    if _should_fail(SIM_LLM_FAILURE_RATE):
+        raise SimulatedServiceError(f"Fallo simulado de {provider}/{model_name}.")
+    content = simulated_response(messages, structured=bool(params.get("response_format")))
+    return content, _usage(messages, content)
+
+
+def simulated_stream(provider: str, model_name: str, messages: List[Dict], params: Dict, pieces: int = 20):
+    """Sustituto del streaming: el primer fragmento llega tras un 30 % de la latencia."""
+    content = simulated_response(messages, structured=bool(params.get("response_format")))
+    with _rng_lock:
+        latency = SIM_LLM_LATENCY * _rng.uniform(0.8, 1.2)
+    time.sleep(latency * 0.3)
+    if _should_fail(SIM_LLM_FAILURE_RATE):
+        raise SimulatedServiceError(f"Fallo simulado de {provider}/{model_name}.")
+    step = max(1, math.ceil(len(content) / pieces))
+    for start in range(0, len(content), step):
+        time.sleep(latency * 0.7 / pieces)
+        yield content[start:start + step]
+    yield _usage(messages, content)
+
+
+# --- Suno ---
+
+_suno_server = {}
+_suno_lock = threading.Lock()
+
+
+def suno_base_urls():
+    """
+    URLs de Clerk y de la API de Suno en simulación. Si SUNO_API_BASE_URL está definida se
+    usa ese servidor simulado; si no, se arranca uno en un hilo, una vez por proceso.
+    """
+    if os.getenv("SUNO_API_BASE_URL"):
+        return SUNO_CLERK_BASE_URL, SUNO_API_BASE_URL
+    with _suno_lock:
+        # Los hilos no sobreviven a un fork: cada proceso arranca su propio servidor
+        base_url = _suno_server.get(os.getpid())
+        if base_url is None:
+            from src.fake_suno_server import start_in_thread
+            _, base_url = start_in_thread(latency=SIM_SUNO_LATENCY, failure_rate=SIM_SUNO_FAILURE_RATE,
+                                          song_duration=SIM_SONG_DURATION)
+            _suno_server[os.getpid()] = base_url
+            print(f"🧪 Suno simulado en {base_url}.")
+    return f"{base_url}/clerk/v1", f"{base_url}/api"
+
+
+# --- YouTube ---
+
+def simulated_upload(video_path: str, title: str, description: str, tags: list, task_instance=None,
+                     privacy_status: str = "private", chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """
+    Sustituto de upload_video_to_youtube: lee el video por fragmentos repartiendo la
+    latencia entre ellos y reintenta los fragmentos que fallan, como la subida resumible.
+    Cada subida se anota en SIM_UPLOADS_LOG_PATH. Devuelve la URL (ficticia) del video.
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"No se encontró el video a subir: '{video_path}'.")
+    size = os.path.getsize(video_path)
+    chunks = max(1, math.ceil(size / chunk_size))
+    retry = 0
+    with open(video_path, 'rb') as f:
+        for _ in range(chunks):
+            f.read(chunk_size)
+            while True:
+                if task_instance:
+                    task_instance.update_state(state='PROGRESS', meta={'details': 'Subiendo archivo a YouTube...', 'progress': '95%'})
+                try:
+                    with span("upload", "chunk"):
+                        _wait(SIM_YOUTUBE_LATENCY / chunks)
+                        if _should_fail(SIM_YOUTUBE_FAILURE_RATE):
+                            raise SimulatedServiceError("Fallo simulado de YouTube (503).")
+                    break
+                except SimulatedServiceError:
+                    retry += 1
+                print(f"Error recuperable del servidor simulado (intento {retry}/{UPLOAD_MAX_RETRIES}): 503")
+                if retry > UPLOAD_MAX_RETRIES:
+                    raise RuntimeError("Se superó el número máximo de reintentos para la subida a YouTube.")
+
+    video_id = f"sim{uuid.uuid4().hex[:8]}"
+    os.makedirs(os.path.dirname(SIM_UPLOADS_LOG_PATH) or ".", exist_ok=True)
+    with open(SIM_UPLOADS_LOG_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"time": time.time(), "video_id": video_id, "path": video_path, "bytes": size,
+                            "title": title, "description": description, "tags": tags,
+                            "privacy_status": privacy_status, "retries": retry}, ensure_ascii=False) + "\n")
+    print(f"Video subido con éxito (simulado). ID: {video_id}")
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+# --- Clips de fondo ---
+
+_clip_lock = threading.Lock()
+
+
+def synthetic_clip(path: str = SYNTHETIC_CLIP_PATH) -> str:
+    """Clip de fondo de color liso (5 s, 720p) para simular sin clips. Se genera una sola vez."""
+    with _clip_lock:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp.mp4"
+            cmd = ['ffmpeg', '-f', 'lavfi', '-i', 'color=c=0x1d2b53:s=1280x720:r=24:d=5',
+                   '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-y', temp_path]
+            subprocess.run(cmd, check=True, capture_output=True)
+            os.replace(temp_path, path)
+    return path
@@ -1,24 +1,31 @@
-import requests
 import uuid
 import time
 import os
 import re
-from src.config import SUNO_COOKIE
+from src.config import SUNO_COOKIE, SUNO_CLERK_BASE_URL, SUNO_API_BASE_URL, SUNO_POLL_INTERVAL, SIMULATION_MODE, require_config
+from src.suno_auth import get_shared_session, get_token_manager
+from src.suno_rate_limiter import get_rate_limiter
+from src.telemetry import span, record_wait
 
 class SunoApiClient:
     def __init__(self):
-        self.session = requests.Session()
+        require_config("SUNO_COOKIE")
+        # Una única sesión con pool de conexiones por proceso, compartida entre clientes
+        self.session = get_shared_session()
         self.device_id = str(uuid.uuid4())
-        self.session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0",
-            "device-id": self.device_id
-        })
         # Restaurado: Leer la cookie desde el archivo .env
         self._set_cookies_from_string(SUNO_COOKIE)
         self.auth_token = None
         self.session_id = None # Nueva propiedad para el ID de sesión
-        self.clerk_base_url = "https://clerk.suno.com/v1"
-        self.api_base_url = "https://studio-api.prod.suno.com/api"
+        self.clerk_base_url = SUNO_CLERK_BASE_URL
+        self.api_base_url = SUNO_API_BASE_URL
+        if SIMULATION_MODE:
+            from src.simulation import suno_base_urls
+            self.clerk_base_url, self.api_base_url = suno_base_urls()
+        self.token_manager = get_token_manager(self.clerk_base_url, self.api_base_url)
+        # Límites de peticiones y generaciones simultáneas compartidos por cuenta
+        self.rate_limiter = get_rate_limiter(self.token_manager.account)
+        self._slot_leases = {}
 
     def _set_cookies_from_string(self, cookie_string):
         if not cookie_string:
@@ -33,49 +40,47 @@ class SunoApiClient:
             else:
                 self.session.cookies.set(cookie, None)
 
-    def _get_session_token(self):
-        response = self.session.get(f"{self.clerk_base_url}/client?__clerk_api_version=2025-04-10&_clerk_js_version=5.102.0")
-        response.raise_for_status()
-        data = response.json()
-        jwt_token = data.get("response", {}).get("sessions", [{}])[0].get("last_active_token", {}).get("jwt")
-        if not jwt_token:
-            raise Exception("No se pudo obtener el token JWT de Clerk.")
-        self.auth_token = jwt_token
-        self.session.headers.update({"Authorization": f"Bearer {self.auth_token}"})
-        return jwt_token
+    def _apply_credentials(self, credentials):
+        self.auth_token = credentials['jwt']
+        self.session_id = credentials['session_id']
 
     def initialize_session(self):
-        """Realiza la autenticación completa de dos pasos."""
-        print("Iniciando autenticación de sesión de dos pasos...")
-        # Paso 1: Obtener el token JWT
-        self._get_session_token()
-        print("Paso 1/2: Token JWT obtenido.")
-
-        # Paso 2: Usar el token JWT para obtener un session_id de la API de Suno
-        session_response = self.session.get(f"{self.api_base_url}/user/get_user_session_id/")
-        session_response.raise_for_status()
-        
-        data = session_response.json()
-        session_id = data.get('session_id')
-
-        if not session_id:
-            raise Exception("No se pudo obtener el session-id de la API de Suno.")
-        
-        self.session_id = session_id
-        print(f"Paso 2/2: session-id obtenido: {session_id}")
+        """
+        Obtiene las credenciales de la caché compartida. La autenticación de dos pasos
+        (Clerk + session_id) solo se realiza si ningún worker tiene un token vigente.
+        """
+        self._apply_credentials(self.token_manager.get_credentials())
         print("Autenticación completada.")
 
+    def _request(self, method, url, **kwargs):
+        """
+        Realiza una petición autenticada. El token se renueva antes de expirar y,
+        si la API responde 401, se renueva y se reintenta una vez.
+        """
+        self._apply_credentials(self.token_manager.get_credentials())
+        headers = {"Authorization": f"Bearer {self.auth_token}", "device-id": self.device_id}
+        headers.update(kwargs.pop('headers', {}))
+        response = self.session.request(method, url, headers=headers, **kwargs)
+        if response.status_code == 401:
+            print("Token de Suno rechazado (401). Renovando y reintentando...")
+            self._apply_credentials(self.token_manager.get_credentials(rejected_jwt=self.auth_token))
+            headers["Authorization"] = f"Bearer {self.auth_token}"
+            response = self.session.request(method, url, headers=headers, **kwargs)
+        return response
+
     def check_connection(self):
-        if not self.session_id:
-            self.initialize_session()
-        response = self.session.get(f"{self.api_base_url}/user/get_user_session_id/")
+        response = self._request("GET", f"{self.api_base_url}/user/get_user_session_id/")
         response.raise_for_status()
         return response.json()
 
-    def generate(self, tags, title, prompt, make_instrumental, vocal_gender='female', mv="chirp-crow"):
-        if not self.session_id or not self.auth_token:
-            self.initialize_session()
-        
+    def generate(self, tags, title, prompt, make_instrumental, vocal_gender='female', mv="chirp-crow", transaction_uuid=None, create_session_token=None):
+        """
+        Envía una generación a Suno. 'transaction_uuid' y 'create_session_token' se pueden
+        pasar para reutilizar los identificadores persistidos de un intento anterior.
+        """
+        # El JWT también viaja en el payload: asegurar que esté vigente
+        self._apply_credentials(self.token_manager.get_credentials())
+
         project_id = "8b6d5384-a89a-4050-a65b-7e5172f7cdb7"
 
         suno_gender = 'f'
@@ -90,7 +95,7 @@ class SunoApiClient:
             "tags": tags,
             "title": title,
             "make_instrumental": make_instrumental,
-            "transaction_uuid": str(uuid.uuid4()),
+            "transaction_uuid": transaction_uuid or str(uuid.uuid4()),
             "token": self.auth_token, # CORREGIDO: Usar el token de autenticación
         }
 
@@ -106,7 +111,7 @@ class SunoApiClient:
                 "web_client_pathname": "/create",
                 "is_max_mode": False,
                 "is_mumble": False,
-                "create_session_token": str(uuid.uuid4()),
+                "create_session_token": create_session_token or str(uuid.uuid4()),
                 "disable_volume_normalization": False,
             }
             if not make_instrumental:
@@ -117,7 +122,7 @@ class SunoApiClient:
                 "is_max_mode": False,
                 "create_mode": "custom",
                 "can_control_sliders": ["weirdness_constraint", "style_weight"],
-                "create_session_token": str(uuid.uuid4()),
+                "create_session_token": create_session_token or str(uuid.uuid4()),
                 "disable_volume_normalization": False,
                 "user_tier": "4497580c-f4eb-4f86-9f0e-960eb7c48d7d",
             }
@@ -127,62 +132,80 @@ class SunoApiClient:
             raise ValueError(f"Modelo Suno '{mv}' no soportado.")
         
         payload = {**base_payload, "metadata": metadata}
-        
-        response = self.session.post(f"{self.api_base_url}/generate/v2-web/", json=payload)
-        
-        if not response.ok:
-            error_details = f"Status Code: {response.status_code}"
-            try:
-                error_details += f" - Body: {response.json()}"
-            except ValueError:
-                error_details += f" - Body: {response.text}"
-            raise Exception(f"Suno API Error: {error_details}")
-            
-        return response.json()
+
+        # El hueco de generación se mantiene hasta que poll_for_song vea las canciones completas
+        queued = time.monotonic()
+        lease = self.rate_limiter.acquire_slot()
+        try:
+            self.rate_limiter.acquire("generate")
+            record_wait("suno:generate", time.monotonic() - queued)
+            with span("suno", "generate", model=mv):
+                response = self._request("POST", f"{self.api_base_url}/generate/v2-web/", json=payload)
+
+                if not response.ok:
+                    error_details = f"Status Code: {response.status_code}"
+                    try:
+                        error_details += f" - Body: {response.json()}"
+                    except ValueError:
+                        error_details += f" - Body: {response.text}"
+                    raise Exception(f"Suno API Error: {error_details}")
+
+                data = response.json()
+        except Exception:
+            self.rate_limiter.release_slot(lease)
+            raise
+
+        clip_ids = frozenset(clip['id'] for clip in data.get('clips', []))
+        self._slot_leases[clip_ids] = lease
+        return data
 
     def poll_for_song(self, ids):
-        if not self.session_id:
-            self.initialize_session()
         if isinstance(ids, str):
             ids = [ids]
         endpoint = f"{self.api_base_url}/feed/v2?ids={','.join(ids)}"
-        while True:
-            response = self.session.get(endpoint)
-            response.raise_for_status()
-            data = response.json()
-            clips = data.get('clips', [])
-            if clips and isinstance(clips, list) and all(isinstance(song, dict) and song.get('status') == 'complete' for song in clips):
-                return clips
-            print("Canción no lista, reintentando en 10 segundos...")
-            time.sleep(10)
-
-    def download_song(self, song, output_filename=None):
+        lease = self._slot_leases.pop(frozenset(ids), None)
+        try:
+            while True:
+                self.rate_limiter.acquire("feed")
+                with span("suno", "poll"):
+                    response = self._request("GET", endpoint)
+                    response.raise_for_status()
+                    data = response.json()
+                clips = data.get('clips', [])
+                if clips and isinstance(clips, list) and all(isinstance(song, dict) and song.get('status') == 'complete' for song in clips):
+                    return clips
+                if lease:
+                    self.rate_limiter.renew_slot(lease)
+                print(f"Canción no lista, reintentando en {SUNO_POLL_INTERVAL:g} segundos...")
+                time.sleep(SUNO_POLL_INTERVAL)
+        finally:
+            if lease:
+                self.rate_limiter.release_slot(lease)
+
+    def download_song(self, song, output_filename=None, output_dir="songs"):
         """
         Downloads a song using the direct audio_url from the song object,
-        writing it to a file as a stream.
+        writing it to a file as a stream inside 'output_dir'.
         """
-        if not self.session_id:
-            self.initialize_session()
-
         audio_url = song.get('audio_url')
         song_title = song.get('title', 'Untitled Song')
 
         if not audio_url:
             raise Exception(f"El objeto de la canción para '{song_title}' no contenía una 'audio_url'.")
 
-        audio_response = self.session.get(audio_url, stream=True)
-        audio_response.raise_for_status()
-
         if output_filename:
-            file_path = os.path.join("songs", output_filename)
+            file_path = os.path.join(output_dir, output_filename)
         else:
             safe_title = re.sub(r'[\\/*?"<>|]', "", song_title)
-            file_path = os.path.join("songs", f"{safe_title}.mp3")
-
-        os.makedirs("songs", exist_ok=True)
-        with open(file_path, 'wb') as f:
-            for chunk in audio_response.iter_content(chunk_size=8192):
-                f.write(chunk)
+            file_path = os.path.join(output_dir, f"{safe_title}.mp3")
+
+        with span("suno", "download"):
+            audio_response = self._request("GET", audio_url, stream=True)
+            audio_response.raise_for_status()
+            os.makedirs(output_dir, exist_ok=True)
+            with open(file_path, 'wb') as f:
+                for chunk in audio_response.iter_content(chunk_size=8192):
+                    f.write(chunk)
         print(f"Descarga exitosa de '{song_title}' en {file_path}")
         return file_path
 
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from src.config import SUNO_COOKIE, SUNO_TOKEN_CACHE_FILE, SUNO_TOKEN_REFRESH_MARGIN
+from src.redis_store import get_redis
+from src.utils import file_lock
+
+CLERK_CLIENT_PATH = "/client?__clerk_api_version=2025-04-10&_clerk_js_version=5.102.0"
+# Los JWT de sesión de Clerk duran ~60 s; se usa si el token no trae 'exp'
+DEFAULT_TOKEN_LIFETIME = 60
+
+# --- Sesión HTTP compartida por proceso ---
+
+_process_session = None
+_process_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_shared_session() -> requests.Session:
+    """
+    Devuelve la única sesión de requests (con pool de conexiones) de este proceso.
+    Se vuelve a crear si el proceso ha sido bifurcado (prefork de Celery).
+    """
+    global _process_session, _process_session_pid
+    with _session_lock:
+        if _process_session is None or _process_session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({
+                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0",
+            })
+            _process_session = session
+            _process_session_pid = os.getpid()
+        return _process_session
+
+
+def decode_jwt_expiry(jwt_token: str) -> float:
+    """Extrae el campo 'exp' (epoch en segundos) del payload de un JWT sin verificar la firma."""
+    try:
+        payload = jwt_token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        data = json.loads(base64.urlsafe_b64decode(payload))
+        return float(data['exp'])
+    except Exception:
+        return time.time() + DEFAULT_TOKEN_LIFETIME
+
+
+def account_key(cookie: str) -> str:
+    """Identificador estable (no reversible) de la cuenta de Suno asociada a una cookie."""
+    return hashlib.sha256((cookie or "").encode('utf-8')).hexdigest()[:16]
+
+
+class SunoTokenManager:
+    """
+    Obtiene, cachea y renueva el JWT de Clerk y el session_id de Suno.
+    Las credenciales se comparten entre procesos vía Redis (o un archivo con bloqueo
+    si Redis no está disponible) y se renuevan poco antes de expirar.
+    """
+
+    def __init__(self, session: requests.Session, clerk_base_url: str, api_base_url: str, cookie: str = SUNO_COOKIE):
+        self.session = session
+        self.clerk_base_url = clerk_base_url
+        self.api_base_url = api_base_url
+        self.account = account_key(cookie)
+        self.redis_key = f"suno:auth:{self.account}"
+        self._credentials = None
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, credentials) -> bool:
+        return bool(
+            credentials
+            and credentials.get('jwt')
+            and credentials.get('session_id')
+            and credentials.get('expires_at', 0) - SUNO_TOKEN_REFRESH_MARGIN > time.time()
+        )
+
+    # --- Almacenamiento compartido ---
+
+    def _read_shared(self):
+        redis_client = get_redis()
+        if redis_client is not None:
+            raw = redis_client.get(self.redis_key)
+            return json.loads(raw) if raw else None
+        if not os.path.exists(SUNO_TOKEN_CACHE_FILE):
+            return None
+        try:
+            with open(SUNO_TOKEN_CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f).get(self.account)
+        except (OSError, ValueError):
+            return None
+
+    def _write_shared(self, credentials):
+        redis_client = get_redis()
+        if redis_client is not None:
+            ttl = max(1, int(credentials['expires_at'] - time.time()))
+            redis_client.set(self.redis_key, json.dumps(credentials), ex=ttl)
+            return
+        data = {}
+        if os.path.exists(SUNO_TOKEN_CACHE_FILE):
+            try:
+                with open(SUNO_TOKEN_CACHE_FILE, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+        data[self.account] = credentials
+        tmp_path = f"{SUNO_TOKEN_CACHE_FILE}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, SUNO_TOKEN_CACHE_FILE)
+
+    def _shared_refresh_lock(self):
+        """Bloqueo entre procesos para que un solo worker renueve el token a la vez."""
+        redis_client = get_redis()
+        if redis_client is not None:
+            return redis_client.lock(f"{self.redis_key}:lock", timeout=30, blocking_timeout=35)
+        return file_lock(SUNO_TOKEN_CACHE_FILE)
+
+    # --- Llamadas a Clerk / Suno ---
+
+    def _fetch_jwt(self) -> str:
+        response = self.session.get(f"{self.clerk_base_url}{CLERK_CLIENT_PATH}")
+        response.raise_for_status()
+        data = response.json()
+        jwt_token = data.get("response", {}).get("sessions", [{}])[0].get("last_active_token", {}).get("jwt")
+        if not jwt_token:
+            raise Exception("No se pudo obtener el token JWT de Clerk.")
+        return jwt_token
+
+    def _fetch_session_id(self, jwt_token: str) -> str:
+        response = self.session.get(
+            f"{self.api_base_url}/user/get_user_session_id/",
+            headers={"Authorization": f"Bearer {jwt_token}"}
+        )
+        response.raise_for_status()
+        session_id = response.json().get('session_id')
+        if not session_id:
+            raise Exception("No se pudo obtener el session-id de la API de Suno.")
+        return session_id
+
+    def _refresh(self, previous):
+        print("Renovando credenciales de Suno...")
+        jwt_token = self._fetch_jwt()
+        print("Paso 1/2: Token JWT obtenido.")
+        # El session_id sobrevive a la renovación del JWT: solo se pide si no existe
+        session_id = previous.get('session_id') if previous else None
+        if not session_id:
+            session_id = self._fetch_session_id(jwt_token)
+        print(f"Paso 2/2: session-id obtenido: {session_id}")
+        return {
+            "jwt": jwt_token,
+            "session_id": session_id,
+            "expires_at": decode_jwt_expiry(jwt_token),
+        }
+
+    # --- API pública ---
+
+    def get_credentials(self, rejected_jwt: str = None) -> dict:
+        """
+        Devuelve un diccionario con 'jwt', 'session_id' y 'expires_at'.
+        Solo contacta con Clerk/Suno si ningún proceso tiene credenciales vigentes.
+        'rejected_jwt' es el token que la API acaba de rechazar (401) y no debe reutilizarse.
+        """
+        def usable(credentials):
+            return self._is_fresh(credentials) and credentials.get('jwt') != rejected_jwt
+
+        with self._lock:
+            if usable(self._credentials):
+                return self._credentials
+
+            shared = self._read_shared()
+            if usable(shared):
+                self._credentials = shared
+                return shared
+
+            with self._shared_refresh_lock():
+                # Otro proceso pudo renovar mientras esperábamos el bloqueo
+                shared = self._read_shared()
+                if usable(shared):
+                    self._credentials = shared
+                    return shared
+                credentials = self._refresh(shared or self._credentials)
+                self._write_shared(credentials)
+                self._credentials = credentials
+                return credentials
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(clerk_base_url: str, api_base_url: str) -> SunoTokenManager:
+    """Devuelve el gestor de tokens de este proceso para las URLs dadas."""
+    key = (os.getpid(), clerk_base_url, api_base_url)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = SunoTokenManager(get_shared_session(), clerk_base_url, api_base_url)
+            _managers[key] = manager
+        return manager
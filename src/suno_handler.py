@@ -2,41 +2,65 @@ import os
 import re
 from src.suno_api import SunoApiClient
 from src.config import SONGS_DIR
+from src.generation_ledger import (
+    GenerationLedger, lyrics_content_hash,
+    STATUS_SUBMITTED, STATUS_COMPLETE, STATUS_DOWNLOADED
+)
 from celery import Task
 
-def create_and_download_song(client: SunoApiClient, lyrics: str, song_style: str, song_title: str, vocal_gender: str = 'f', is_instrumental: bool = False, task_instance: Task = None, suno_model: str = "chirp-crow") -> list[str]:
+def create_and_download_song(client: SunoApiClient, lyrics: str, song_style: str, song_title: str, vocal_gender: str = 'f', is_instrumental: bool = False, task_instance: Task = None, suno_model: str = "chirp-crow", ledger: GenerationLedger = None, songs_dir: str = SONGS_DIR) -> list[str]:
     """
-    Generates two songs with the new SunoApiClient, reports progress, and downloads them.
+    Generates two songs with the new SunoApiClient, reports progress, and downloads them into 'songs_dir'.
     Returns a list with the file paths of the downloaded songs.
+    If a ledger is given, songs already downloaded are reused and clips already
+    submitted are polled again instead of paying for a new generation.
     """
-    progress_msg = f"Enviando solicitud para '{song_title}' a SunoApiClient y esperando la generación..."
-    print(progress_msg)
-    if task_instance:
-        task_instance.update_state(
-            state='PROGRESS',
-            meta={'details': progress_msg}
-        )
+    ledger_key = lyrics_content_hash(song_title, lyrics, song_style, vocal_gender, is_instrumental) if ledger else None
+    entry = ledger.reserve(ledger_key, song_title) if ledger else {}
+
+    if ledger and ledger.is_downloaded(ledger_key):
+        print(f"♻️ '{song_title}' ya fue generada y descargada. Reutilizando {entry['song_paths']}.")
+        return list(entry['song_paths'])
 
     try:
         # El cliente ahora se pasa como argumento, no se crea aquí.
+        song_ids = entry.get('clip_ids') or []
 
-        generation_response = client.generate(
-            tags=song_style,
-            title=song_title,
-            prompt=lyrics,
-            make_instrumental=is_instrumental,
-            vocal_gender=vocal_gender,
-            mv=suno_model
-        )
-
-        song_ids = [clip['id'] for clip in generation_response['clips']]
-        
-        progress_msg = f"Canciones enviadas a generar. Esperando a que finalicen (IDs: { ', '.join(song_ids) })..."
+        if song_ids:
+            progress_msg = f"Reanudando '{song_title}': los clips ya se habían solicitado a Suno (IDs: { ', '.join(song_ids) })..."
+        else:
+            progress_msg = f"Enviando solicitud para '{song_title}' a SunoApiClient y esperando la generación..."
         print(progress_msg)
         if task_instance:
-            task_instance.update_state(state='PROGRESS', meta={'details': progress_msg})
+            task_instance.update_state(
+                state='PROGRESS',
+                meta={'details': progress_msg}
+            )
+
+        if not song_ids:
+            generation_response = client.generate(
+                tags=song_style,
+                title=song_title,
+                prompt=lyrics,
+                make_instrumental=is_instrumental,
+                vocal_gender=vocal_gender,
+                mv=suno_model,
+                transaction_uuid=entry.get('transaction_uuid'),
+                create_session_token=entry.get('create_session_token')
+            )
+
+            song_ids = [clip['id'] for clip in generation_response['clips']]
+            if ledger:
+                ledger.update(ledger_key, clip_ids=song_ids, status=STATUS_SUBMITTED, suno_model=suno_model)
+
+            progress_msg = f"Canciones enviadas a generar. Esperando a que finalicen (IDs: { ', '.join(song_ids) })..."
+            print(progress_msg)
+            if task_instance:
+                task_instance.update_state(state='PROGRESS', meta={'details': progress_msg})
 
         completed_songs = client.poll_for_song(song_ids)
+        if ledger:
+            ledger.update(ledger_key, status=STATUS_COMPLETE)
 
         song_paths = []
         # Ensure we only process up to the number of songs generated (usually 2)
@@ -45,18 +69,24 @@ def create_and_download_song(client: SunoApiClient, lyrics: str, song_style: str
             safe_title = re.sub(r'[\\/*?"<>|]', "", song['title'])
             # Create the custom filename that the main orchestrator expects (e.g., "1_My_Song.mp3")
             output_filename = f"{i+1}_{safe_title.replace(' ', '_')}.mp3"
-            
+
             print(f"Descargando canción '{song['title']}' como '{output_filename}'...")
-            
+
             file_path = client.download_song(
                 song=song,
-                output_filename=output_filename
+                output_filename=output_filename,
+                output_dir=songs_dir
             )
             song_paths.append(file_path)
 
+        if ledger:
+            ledger.update(ledger_key, song_paths=song_paths, status=STATUS_DOWNLOADED)
+
         print("Canciones descargadas con éxito.")
         return song_paths
 
     except Exception as e:
+        if ledger:
+            ledger.update(ledger_key, last_error=str(e))
         print(f"Error al interactuar con la API de Suno (SunoApiClient): {e}")
-        raise
\ No newline at end of file
+        raise
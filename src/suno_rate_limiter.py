@@ -0,0 +1,219 @@
+import time
+import uuid
+import threading
+from src.config import (
+    SUNO_GENERATE_RATE_PER_MINUTE, SUNO_FEED_RATE_PER_MINUTE, SUNO_RATE_BURST,
+    SUNO_MAX_IN_FLIGHT, SUNO_LIMITER_MAX_WAIT, SUNO_SLOT_LEASE_TTL
+)
+from src.redis_store import get_redis
+
+# Intervalo entre intentos mientras se espera un hueco de generación
+_SLOT_POLL_INTERVAL = 2.0
+
+BUCKET_RATES = {
+    "generate": SUNO_GENERATE_RATE_PER_MINUTE / 60.0,
+    "feed": SUNO_FEED_RATE_PER_MINUTE / 60.0,
+}
+
+# Cubo de tokens atómico. Usa el reloj de Redis para que todos los workers
+# compartan la misma referencia temporal. Devuelve los segundos de espera (0 = concedido).
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+if tokens < 1 then
+  return tostring((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens - 1, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return '0'
+"""
+
+# Semáforo de generaciones en curso: un ZSET de concesiones con fecha de caducidad,
+# de modo que los huecos de un worker caído se liberan solos.
+_SLOT_ACQUIRE_LUA = """
+local max = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < max then
+  redis.call('ZADD', KEYS[1], now + ttl, ARGV[3])
+  redis.call('EXPIRE', KEYS[1], ttl + 60)
+  return 1
+end
+return 0
+"""
+
+_SLOT_RENEW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+return redis.call('ZADD', KEYS[1], 'XX', 'CH', now + tonumber(ARGV[1]), ARGV[2])
+"""
+
+
+class SunoRateLimitExceeded(Exception):
+    """La petición esperó más de SUNO_LIMITER_MAX_WAIT segundos en la cola del limitador."""
+
+
+class _LocalBackend:
+    """Equivalente en memoria del proceso, usado cuando Redis no está disponible."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.slots = {}
+        self.metrics = {}
+
+    def take_token(self, bucket, rate, capacity):
+        with self.lock:
+            now = time.monotonic()
+            tokens, ts = self.buckets.get(bucket, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            self.buckets[bucket] = (tokens - 1, now)
+            return 0.0
+
+    def take_slot(self, lease, max_in_flight, ttl):
+        with self.lock:
+            now = time.monotonic()
+            self.slots = {k: exp for k, exp in self.slots.items() if exp > now}
+            if len(self.slots) < max_in_flight:
+                self.slots[lease] = now + ttl
+                return True
+            return False
+
+    def renew_slot(self, lease, ttl):
+        with self.lock:
+            if lease in self.slots:
+                self.slots[lease] = time.monotonic() + ttl
+
+    def release_slot(self, lease):
+        with self.lock:
+            self.slots.pop(lease, None)
+
+    def in_flight(self):
+        with self.lock:
+            now = time.monotonic()
+            return sum(1 for exp in self.slots.values() if exp > now)
+
+    def incr(self, field, amount):
+        with self.lock:
+            self.metrics[field] = self.metrics.get(field, 0) + amount
+
+
+class SunoRateLimiter:
+    """
+    Limitador de peticiones y de generaciones simultáneas para una cuenta de Suno.
+    El estado vive en Redis para que todos los workers respeten los mismos límites.
+    """
+
+    def __init__(self, account: str):
+        self.account = account
+        self.prefix = f"suno:limiter:{account}"
+        self.local = _LocalBackend()
+
+    # --- Métricas ---
+
+    def _record(self, name: str, waited: float, rejected: bool = False):
+        fields = {
+            f"{name}_wait_seconds_total": waited,
+            f"{name}_rejected" if rejected else f"{name}_acquired": 1,
+        }
+        redis_client = get_redis()
+        for field, amount in fields.items():
+            if redis_client is not None:
+                redis_client.hincrbyfloat(f"{self.prefix}:metrics", field, amount)
+            else:
+                self.local.incr(field, amount)
+        if waited > 1:
+            print(f"⏳ Limitador de Suno: '{name}' esperó {waited:.1f}s en cola.")
+
+    def metrics(self) -> dict:
+        """Contadores de espera y rechazos, más las generaciones en curso."""
+        redis_client = get_redis()
+        if redis_client is not None:
+            raw = redis_client.hgetall(f"{self.prefix}:metrics")
+            data = {k.decode(): float(v) for k, v in raw.items()}
+            redis_client.zremrangebyscore(f"{self.prefix}:slots", '-inf', redis_client.time()[0])
+            data["in_flight"] = redis_client.zcard(f"{self.prefix}:slots")
+        else:
+            data = dict(self.local.metrics)
+            data["in_flight"] = self.local.in_flight()
+        data["max_in_flight"] = SUNO_MAX_IN_FLIGHT
+        return data
+
+    # --- Cubo de tokens ---
+
+    def acquire(self, bucket: str):
+        """Bloquea hasta que haya un token disponible en el cubo indicado ('generate' o 'feed')."""
+        rate = BUCKET_RATES[bucket]
+        started = time.monotonic()
+        while True:
+            redis_client = get_redis()
+            if redis_client is not None:
+                wait = float(redis_client.eval(_TOKEN_BUCKET_LUA, 1, f"{self.prefix}:bucket:{bucket}", rate, SUNO_RATE_BURST))
+            else:
+                wait = self.local.take_token(bucket, rate, SUNO_RATE_BURST)
+            waited = time.monotonic() - started
+            if wait <= 0:
+                self._record(bucket, waited)
+                return
+            if waited + wait > SUNO_LIMITER_MAX_WAIT:
+                self._record(bucket, waited, rejected=True)
+                raise SunoRateLimitExceeded(f"Límite de peticiones '{bucket}' de Suno superado tras esperar {waited:.0f}s.")
+            time.sleep(wait)
+
+    # --- Semáforo de generaciones en curso ---
+
+    def acquire_slot(self) -> str:
+        """Reserva un hueco de generación y devuelve su identificador de concesión."""
+        lease = str(uuid.uuid4())
+        started = time.monotonic()
+        while True:
+            redis_client = get_redis()
+            if redis_client is not None:
+                acquired = redis_client.eval(_SLOT_ACQUIRE_LUA, 1, f"{self.prefix}:slots", SUNO_MAX_IN_FLIGHT, SUNO_SLOT_LEASE_TTL, lease)
+            else:
+                acquired = self.local.take_slot(lease, SUNO_MAX_IN_FLIGHT, SUNO_SLOT_LEASE_TTL)
+            waited = time.monotonic() - started
+            if acquired:
+                self._record("slot", waited)
+                return lease
+            if waited + _SLOT_POLL_INTERVAL > SUNO_LIMITER_MAX_WAIT:
+                self._record("slot", waited, rejected=True)
+                raise SunoRateLimitExceeded(f"No hubo hueco de generación en Suno tras esperar {waited:.0f}s ({SUNO_MAX_IN_FLIGHT} en curso).")
+            time.sleep(_SLOT_POLL_INTERVAL)
+
+    def renew_slot(self, lease: str):
+        """Extiende la concesión mientras la generación sigue en curso."""
+        redis_client = get_redis()
+        if redis_client is not None:
+            redis_client.eval(_SLOT_RENEW_LUA, 1, f"{self.prefix}:slots", SUNO_SLOT_LEASE_TTL, lease)
+        else:
+            self.local.renew_slot(lease, SUNO_SLOT_LEASE_TTL)
+
+    def release_slot(self, lease: str):
+        redis_client = get_redis()
+        if redis_client is not None:
+            redis_client.zrem(f"{self.prefix}:slots", lease)
+        else:
+            self.local.release_slot(lease)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(account: str) -> SunoRateLimiter:
+    """Devuelve el limitador de este proceso para la cuenta indicada."""
+    with _limiters_lock:
+        if account not in _limiters:
+            _limiters[account] = SunoRateLimiter(account)
+        return _limiters[account]
@@ -0,0 +1,222 @@
+"""
+Spans de tiempo del pipeline y métricas de Prometheus.
+
+Cada nodo del grafo, llamada a un proveedor de LLM, petición a Suno, ejecución de ffmpeg
+y fragmento subido a YouTube se mide con 'span(tipo, nombre)'. La duración va al
+histograma 'video_pipeline_span_seconds' y el resultado al contador
+'video_pipeline_spans_total' (por tipo, nombre y estado). Las esperas en cola (Celery,
+planificador, huecos de LLM) van a 'video_pipeline_queue_wait_seconds'.
+
+Las métricas se sirven en '/metrics' de la web y en el puerto de cada worker de Celery
+(METRICS_WORKER_PORTS o METRICS_WORKER_PORT). Con PROMETHEUS_MULTIPROC_DIR, los procesos
+que comparten el directorio suman sus métricas.
+Con TELEMETRY_TRACE_PATH, cada span se anota además en un JSONL con el id del trabajo,
+para analizarlo después:
+
+    python -m src.telemetry state/trace.jsonl [--job <job_id>] [--chrome trace.json]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server
+)
+from src.config import TELEMETRY_TRACE_PATH, METRICS_WORKER_PORT, METRICS_WORKER_PORTS
+from src.llm_usage import current_scope
+from src.utils import file_lock
+
+# De milisegundos (peticiones) a una hora (nodos de Suno y render de álbumes largos)
+SPAN_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+SPAN_SECONDS = Histogram(
+    "video_pipeline_span_seconds", "Duración de los spans del pipeline.", ["kind", "name"], buckets=SPAN_BUCKETS
+)
+SPANS_TOTAL = Counter(
+    "video_pipeline_spans", "Spans del pipeline terminados, por estado.", ["kind", "name", "status"]
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "video_pipeline_queue_wait_seconds", "Espera en cola antes de empezar a ejecutarse.", ["queue"], buckets=SPAN_BUCKETS
+)
+
+# Span en curso: los spans anidados (p. ej. una llamada al LLM dentro de un nodo) lo
+# anotan como padre. Los pools de hilos del pipeline copian el contexto a cada tarea.
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class TraceExporter:
+    """Exporta cada span como una línea JSON, compartida entre procesos con un bloqueo de archivo."""
+
+    def __init__(self, path: str = TELEMETRY_TRACE_PATH):
+        self.path = path
+
+    def export(self, record: Dict):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with file_lock(self.path):
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Advertencia: no se pudo escribir la traza: {e}")
+
+
+trace_exporter = TraceExporter()
+
+
+@contextmanager
+def span(kind: str, name: str, **fields):
+    """
+    Mide el bloque como un span de tipo 'kind' ('node', 'llm', 'suno', 'ffmpeg', 'upload')
+    y nombre 'name'. El id del trabajo se toma del contexto de uso en curso; 'fields' son
+    atributos extra que solo van a la traza (los ids no se usan como etiquetas).
+    """
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    started, start = time.time(), time.monotonic()
+    status, error = "ok", None
+    try:
+        yield
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"[:200]
+        raise
+    finally:
+        seconds = time.monotonic() - start
+        _current_span.reset(token)
+        SPAN_SECONDS.labels(kind, name).observe(seconds)
+        SPANS_TOTAL.labels(kind, name, status).inc()
+        if trace_exporter.path:
+            trace_exporter.export({
+                "job_id": current_scope().get("job_id"), "span_id": span_id, "parent_id": parent_id,
+                "kind": kind, "name": name, "start": round(started, 6), "seconds": round(seconds, 6),
+                "status": status, "error": error, "pid": os.getpid(), "thread": threading.get_ident(),
+                **fields,
+            })
+
+
+def record_wait(queue: str, seconds: float):
+    """Anota la espera en cola de una tarea o llamada antes de empezar a ejecutarse."""
+    if seconds is not None and seconds >= 0:
+        QUEUE_WAIT_SECONDS.labels(queue).observe(seconds)
+
+
+# --- Exposición de las métricas ---
+
+def metrics_registry():
+    """Registro de este proceso o, con PROMETHEUS_MULTIPROC_DIR, el agregado de todos los procesos."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """Devuelve (cuerpo, content type) de la exposición de las métricas en formato de texto."""
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int) -> bool:
+    """Sirve '/metrics' en 'port' (0: desactivado). Devuelve si se pudo arrancar."""
+    if not port:
+        return False
+    try:
+        start_http_server(port, registry=metrics_registry())
+    except OSError as e:
+        print(f"Advertencia: no se pudo servir las métricas en el puerto {port}: {e}")
+        return False
+    print(f"📈 Métricas de Prometheus en http://0.0.0.0:{port}/metrics")
+    return True
+
+
+def worker_metrics_port(node_name: str) -> int:
+    """Puerto de métricas del worker 'node_name' ('render@host'): el de su nombre o el común."""
+    return METRICS_WORKER_PORTS.get((node_name or "").split("@", 1)[0], METRICS_WORKER_PORT)
+
+
+def start_worker_metrics_server(node_name: str, prefork: bool = True) -> bool:
+    """
+    Sirve las métricas de un worker de Celery. El servidor corre en el proceso principal;
+    con el pool prefork las tareas corren en los hijos, así que sin PROMETHEUS_MULTIPROC_DIR
+    solo serviría el registro vacío del principal y no se arranca.
+    """
+    port = worker_metrics_port(node_name)
+    if port and prefork and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        print(f"Advertencia: el worker '{node_name}' no sirve métricas: con el pool prefork hace falta "
+              f"PROMETHEUS_MULTIPROC_DIR (un directorio vacío propio del worker).")
+        return False
+    return start_metrics_server(port)
+
+
+def mark_process_dead(pid: int):
+    """Descarta los archivos de métricas de un proceso terminado (modo multiproceso)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+# --- Análisis de trazas ---
+
+def load_trace(path: str, job_id: str = None) -> List[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    return [s for s in spans if job_id is None or s.get("job_id") == job_id]
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+
+def summarize_trace(spans: List[Dict]) -> List[Dict]:
+    """Recuento, errores, tiempo total, p50 y p95 por tipo y nombre, de más a menos tiempo total."""
+    groups: Dict[tuple, List[Dict]] = {}
+    for s in spans:
+        groups.setdefault((s["kind"], s["name"]), []).append(s)
+    rows = []
+    for (kind, name), items in groups.items():
+        seconds = [s["seconds"] for s in items]
+        rows.append({"kind": kind, "name": name, "count": len(items),
+                     "errors": sum(s["status"] == "error" for s in items),
+                     "total": round(sum(seconds), 3), "p50": _percentile(seconds, 0.5), "p95": _percentile(seconds, 0.95)})
+    return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+
+def chrome_trace(spans: List[Dict]) -> Dict:
+    """Spans en el formato Trace Event, para abrirlos en Perfetto o chrome://tracing."""
+    return {"traceEvents": [
+        {"name": f"{s['kind']}:{s['name']}", "cat": s["kind"], "ph": "X", "ts": int(s["start"] * 1e6),
+         "dur": int(s["seconds"] * 1e6), "pid": s["pid"], "tid": s["thread"],
+         "args": {k: v for k, v in s.items() if k not in ("kind", "name", "start", "seconds", "pid", "thread")}}
+        for s in spans
+    ]}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Resumen de una traza exportada con TELEMETRY_TRACE_PATH.")
+    parser.add_argument("trace", help="Archivo JSONL de la traza.")
+    parser.add_argument("--job", help="Solo los spans de este trabajo.")
+    parser.add_argument("--chrome", help="Exportar también en formato Trace Event a este archivo JSON.")
+    args = parser.parse_args(argv)
+
+    spans = load_trace(args.trace, args.job)
+    print("\t".join(["tipo", "nombre", "spans", "errores", "total (s)", "p50 (s)", "p95 (s)"]))
+    for row in summarize_trace(spans):
+        print(f"{row['kind']}\t{row['name']}\t{row['count']}\t{row['errors']}\t{row['total']:.2f}\t{row['p50']:.3f}\t{row['p95']:.3f}")
+    if args.chrome:
+        with open(args.chrome, 'w', encoding='utf-8') as f:
+            json.dump(chrome_trace(spans), f)
+        print(f"Traza Trace Event guardada en: {args.chrome}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
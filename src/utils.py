@@ -1,4 +1,31 @@
+import os
 import re
+import json
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Bloqueo exclusivo entre procesos usando un archivo '<path>.lock'.
+    Se usa como sustituto local de Redis para estados compartidos en disco.
+    """
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 
 def parse_lyrics_file(file_content: str) -> dict:
     """
@@ -59,3 +86,177 @@ def parse_lyrics_file(file_content: str) -> dict:
         pass
 
     return parsed_data
+
+
+LYRICS_FORMAT_MARKERS = ("TITLE:", "PROMPT:", "TAGS:", "GENERO:")
+
+
+def streamed_lyrics_error(text: str, markers: tuple = LYRICS_FORMAT_MARKERS, forbidden: tuple = (),
+                          max_chars: int = 12000, title_window: int = 300):
+    """
+    Comprueba una respuesta parcial del LLM mientras llega en streaming. Devuelve el motivo
+    si ya rompió claramente el formato esperado, o None si todavía puede ser válida:
+    - los marcadores ('TITLE:', 'PROMPT:', ...) deben aparecer en orden, sin saltarse ninguno,
+    - el primero debe aparecer en los primeros 'title_window' caracteres,
+    - ninguna línea puede empezar por un marcador de 'forbidden',
+    - la respuesta no puede superar 'max_chars'.
+    Las respuestas JSON (salida estructurada) solo se comprueban por longitud.
+    """
+    if len(text) > max_chars:
+        return f"la respuesta supera {max_chars} caracteres"
+
+    stripped = text.lstrip()
+    if stripped.startswith("{") or stripped.startswith("```"):
+        # Salida estructurada (JSON): se valida entera al terminar
+        return None
+
+    upper = text.upper()
+    if markers:
+        positions = [upper.find(marker) for marker in markers]
+        if positions[0] == -1 and len(text) > title_window:
+            return f"no aparece '{markers[0]}' en los primeros {title_window} caracteres"
+        found = [(pos, marker) for pos, marker in zip(positions, markers) if pos != -1]
+        expected = list(markers[:len(found)])
+        if [marker for _, marker in found] != expected or [pos for pos, _ in found] != sorted(pos for pos, _ in found):
+            return f"los marcadores no siguen el orden {', '.join(markers)}"
+
+    for marker in forbidden:
+        if re.search(rf'^\s*{re.escape(marker)}', text, flags=re.IGNORECASE | re.MULTILINE):
+            return f"aparece el marcador '{marker}' donde no corresponde"
+    return None
+
+
+# --- Respuestas estructuradas (JSON) con respaldo en el formato de texto ---
+
+def _load_json_object(content: str):
+    """Devuelve el objeto JSON de la respuesta (admite bloques ```json), o None si no lo es."""
+    text = (content or "").strip()
+    fenced = re.match(r'^```(?:json)?\s*(.*?)\s*```$', text, flags=re.DOTALL | re.IGNORECASE)
+    if fenced:
+        text = fenced.group(1)
+    if not text.startswith("{"):
+        return None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _normalize_gender(value: str) -> str:
+    value = (value or "").strip().lower()
+    if value.startswith("fem") or value == "female":
+        return "Femenino"
+    if value.startswith("masc") or value == "male":
+        return "Masculino"
+    return ""
+
+
+def parse_lyrics_response(content: str, instrumental: bool = False):
+    """
+    Valida la respuesta del LLM para una letra. Acepta el JSON de la salida estructurada
+    ('title', 'lyrics', 'tags', 'gender') y, si no lo es, el formato TITLE/PROMPT/TAGS/GENERO.
+    Devuelve (datos, errores) con datos = {'title', 'prompt', 'tags', 'gender'}; la lista de
+    errores está vacía si la letra se puede enviar a Suno.
+    """
+    data = _load_json_object(content)
+    if data is not None:
+        parsed = {
+            'title': str(data.get('title') or '').strip(),
+            'prompt': str(data.get('lyrics') or data.get('prompt') or '').strip(),
+            'tags': str(data.get('tags') or '').strip(),
+            'gender': _normalize_gender(str(data.get('gender') or '')),
+        }
+    else:
+        text = content or ''
+        regex_parsed = parse_lyrics_file(text)
+        tags = regex_parsed['tags']
+        if not tags:
+            # Los prompts instrumentales no llevan PROMPT: buscar TAGS en cualquier parte
+            tags_match = re.search(r'^\s*TAGS:(.*?)(?=^\s*GENERO:|\Z)', text, flags=re.IGNORECASE | re.MULTILINE | re.DOTALL)
+            tags = tags_match.group(1).strip() if tags_match else ''
+        gender_match = re.search(r'^\s*GENERO:(.*)$', text, flags=re.IGNORECASE | re.MULTILINE)
+        parsed = {
+            'title': regex_parsed['title'] if re.search(r'TITLE:', text, flags=re.IGNORECASE) else '',
+            'prompt': regex_parsed['prompt'],
+            'tags': tags,
+            'gender': _normalize_gender(gender_match.group(1)) if gender_match else '',
+        }
+
+    errors = []
+    if not parsed['title']:
+        errors.append("falta el título")
+    if not parsed['tags']:
+        errors.append("faltan los tags de estilo")
+    if not instrumental:
+        if not parsed['prompt']:
+            errors.append("falta la letra")
+        elif re.search(r'^\s*(TITLE|TAGS|GENERO):', parsed['prompt'], flags=re.IGNORECASE | re.MULTILINE):
+            errors.append("la letra contiene marcadores de otras secciones")
+        if not parsed['gender']:
+            errors.append("falta el género del cantante (Masculino o Femenino)")
+    return parsed, errors
+
+
+def format_lyrics_file(parsed: dict) -> str:
+    """Formato de los archivos de letras, legible por 'parse_lyrics_file'."""
+    output = f"TITLE: {parsed.get('title') or 'Sin Título'}\n\n"
+    output += f"PROMPT:\n{parsed.get('prompt', '')}\n\n"
+    output += f"TAGS:\n{parsed.get('tags', '')}"
+    # Las instrumentales no llevan género del cantante
+    if parsed.get('gender'):
+        output += f"\n\nGENERO: {parsed['gender']}"
+    return output
+
+
+_METADATA_FIELDS = {
+    'title': r'(?:Título|Titulo|Title)',
+    'description': r'(?:Descripción|Descripcion|Description)',
+    'tags': r'(?:Etiquetas|Tags)',
+}
+
+
+def parse_metadata_file(content: str) -> dict:
+    """Lee un archivo de metadatos ('Título:', 'Descripción:', 'Etiquetas:', o en inglés)."""
+    metadata = {'title': '', 'description': '', 'tags': []}
+    for field, label in _METADATA_FIELDS.items():
+        match = re.search(rf'^\s*\**{label}\**:\**\s*(.*)$', content or '', flags=re.IGNORECASE | re.MULTILINE)
+        if match:
+            metadata[field] = match.group(1).strip()
+    metadata['tags'] = [tag.strip() for tag in metadata['tags'].split(',') if tag.strip()] if metadata['tags'] else []
+    return metadata
+
+
+def parse_metadata_response(content: str):
+    """Valida la respuesta de metadatos (JSON o texto). Devuelve (metadatos, errores)."""
+    data = _load_json_object(content)
+    if data is not None:
+        tags = data.get('tags') or []
+        if isinstance(tags, str):
+            tags = tags.split(',')
+        metadata = {
+            'title': str(data.get('title') or '').strip(),
+            'description': str(data.get('description') or '').strip(),
+            'tags': [str(tag).strip() for tag in tags if str(tag).strip()],
+        }
+    else:
+        metadata = parse_metadata_file(content)
+
+    errors = []
+    if not metadata['title']:
+        errors.append("falta el título del video")
+    if not metadata['description']:
+        errors.append("falta la descripción")
+    if not metadata['tags']:
+        errors.append("faltan las etiquetas")
+    return metadata, errors
+
+
+def format_metadata_file(metadata: dict) -> str:
+    """Formato de los archivos de metadatos: una línea por campo."""
+    one_line = lambda text: " ".join(str(text).split())
+    return (
+        f"Título: {one_line(metadata['title'])}\n"
+        f"Descripción: {one_line(metadata['description'])}\n"
+        f"Etiquetas: {', '.join(one_line(tag) for tag in metadata['tags'])}"
+    )
@@ -3,8 +3,8 @@ import subprocess
 import json
 import math
 from pathlib import Path
-from moviepy import VideoFileClip, AudioFileClip, CompositeVideoClip, TextClip, vfx, concatenate_audioclips
-from src.config import CLIPS_DIR, VIDEO_OUTPUT_PATH, OUTPUT_DIR
+from src.config import CLIPS_DIR, VIDEO_OUTPUT_PATH, OUTPUT_DIR, SIMULATION_MODE
+from src.telemetry import span
 from celery import Task
 
 # --- Configuración de Rendimiento ---
@@ -31,6 +31,7 @@ def _get_duration_ffprobe(file_path):
         result = subprocess.run(cmd, capture_output=True, text=True, check=True)
         return float(json.loads(result.stdout)['format']['duration'])
     except Exception:
+        from moviepy import VideoFileClip, AudioFileClip
         clip = AudioFileClip(file_path) if str(file_path).endswith(('.mp3', '.aac')) else VideoFileClip(file_path)
         duration = clip.duration
         clip.close()
@@ -50,8 +51,13 @@ def get_system_font_path():
 
 # --- Motor FFmpeg ---
 
-def _ffmpeg_concatenate_files(files, output_path, file_type):
-    temp_dir = Path(OUTPUT_DIR) / "temp_ffmpeg"
+def _run_ffmpeg(cmd, step):
+    """Ejecuta ffmpeg como un span de telemetría ('step' es su nombre: concat, loop, ...)."""
+    with span("ffmpeg", step):
+        return subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+def _ffmpeg_concatenate_files(files, output_path, file_type, temp_dir=None):
+    temp_dir = Path(temp_dir or Path(OUTPUT_DIR) / "temp_ffmpeg")
     temp_dir.mkdir(parents=True, exist_ok=True)
     list_path = temp_dir / f"concat_{file_type}_{os.getpid()}.txt"
     with open(list_path, 'w') as f:
@@ -61,12 +67,12 @@ def _ffmpeg_concatenate_files(files, output_path, file_type):
             f.write(f"file '{safe_path}'\n")
     cmd = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', str(list_path), '-c', 'copy', '-y', str(output_path)]
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        _run_ffmpeg(cmd, f"concat_{file_type}")
         return output_path
     finally:
         if list_path.exists(): list_path.unlink()
 
-def _ffmpeg_loop_video_smart(video_path, audio_path, output_path):
+def _ffmpeg_loop_video_smart(video_path, audio_path, output_path, temp_dir=None):
     video_duration = _get_duration_ffprobe(video_path)
     audio_duration = _get_duration_ffprobe(audio_path)
     loops_needed = math.ceil(audio_duration / video_duration)
@@ -79,14 +85,14 @@ def _ffmpeg_loop_video_smart(video_path, audio_path, output_path):
         # Removido -shortest para que el video tenga la duración COMPLETA del audio
         # Usar -t con la duración exacta del audio para cortar el video sobrante del último loop
         cmd = ['ffmpeg', '-stream_loop', str(loops_needed), '-i', video_path, '-i', audio_path, '-map', '0:v', '-map', '1:a', '-c:v', 'copy', '-c:a', 'copy', '-t', str(audio_duration), '-y', output_path]
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        _run_ffmpeg(cmd, "loop")
         return output_path
     except subprocess.CalledProcessError as e:
         print(f"ADVERTENCIA: El método de loop rápido falló, usando método de fallback más confiable. Error: {e.stderr[:200]}")
-        return _ffmpeg_loop_with_concat_demuxer(video_path, audio_path, output_path, loops_needed)
+        return _ffmpeg_loop_with_concat_demuxer(video_path, audio_path, output_path, loops_needed, temp_dir)
 
-def _ffmpeg_loop_with_concat_demuxer(video_path, audio_path, output_path, loops):
-    temp_dir = Path(OUTPUT_DIR) / "temp_ffmpeg"
+def _ffmpeg_loop_with_concat_demuxer(video_path, audio_path, output_path, loops, temp_dir=None):
+    temp_dir = Path(temp_dir or Path(OUTPUT_DIR) / "temp_ffmpeg")
     temp_dir.mkdir(parents=True, exist_ok=True)
     loop_list_path = temp_dir / f"loop_list_{os.getpid()}.txt"
     video_looped_path = temp_dir / f"video_looped_{os.getpid()}.mp4"
@@ -95,70 +101,159 @@ def _ffmpeg_loop_with_concat_demuxer(video_path, audio_path, output_path, loops)
             f.write(f"file '{os.path.abspath(video_path)}'\n")
     try:
         cmd_loop = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', str(loop_list_path), '-c', 'copy', '-y', str(video_looped_path)]
-        subprocess.run(cmd_loop, check=True, capture_output=True, text=True)
+        _run_ffmpeg(cmd_loop, "loop_concat")
         # Removido -shortest para que el video tenga la duración COMPLETA del audio
         # Usar -t con la duración exacta del audio para cortar el video sobrante
         cmd_merge = ['ffmpeg', '-i', str(video_looped_path), '-i', audio_path, '-map', '0:v', '-map', '1:a', '-c:v', 'copy', '-c:a', 'copy', '-t', str(audio_duration), '-y', output_path]
-        subprocess.run(cmd_merge, check=True, capture_output=True, text=True)
+        _run_ffmpeg(cmd_merge, "merge")
         return output_path
     finally:
         if loop_list_path.exists(): loop_list_path.unlink()
         if video_looped_path.exists(): video_looped_path.unlink()
 
+def _clip_files(clips_dir):
+    if SIMULATION_MODE and not (os.path.isdir(clips_dir) and os.listdir(clips_dir)):
+        # Simulación sin clips de fondo: un clip sintético de color liso
+        from src.simulation import synthetic_clip
+        return [synthetic_clip()]
+    video_files = sorted([os.path.join(clips_dir, f) for f in os.listdir(clips_dir) if f.lower().endswith(('.mp4', '.mov', '.m4v'))])
+    if not video_files: raise FileNotFoundError(f"No se encontraron videos en '{clips_dir}'.")
+    return video_files
+
+def _subtitle_clips(lyrics, song_duration, start_time, font_path, subtitle_cache):
+    """Subtítulos de una canción: sus líneas repartidas por igual a lo largo de su duración."""
+    from moviepy import TextClip, vfx
+
+    lines = [line.strip() for line in lyrics.split('\n') if line.strip()]
+    if not lines: return []
+    time_per_line = song_duration / len(lines)
+    subtitle_clips = []
+    for j, line in enumerate(lines):
+        if line not in subtitle_cache:
+            subtitle_cache[line] = TextClip(font=font_path, text=line, font_size=PERFORMANCE_CONFIG['subtitle_font_size'], color='white', stroke_color='black', stroke_width=PERFORMANCE_CONFIG['subtitle_stroke_width'], method=PERFORMANCE_CONFIG['subtitle_method'])
+        txt_clip = subtitle_cache[line].with_position(('center', 'bottom')).with_start(start_time + j * time_per_line).with_duration(time_per_line)
+        fade_duration = min(PERFORMANCE_CONFIG['subtitle_fade_duration'], time_per_line / 3)
+        subtitle_clips.append(txt_clip.with_effects([vfx.CrossFadeIn(fade_duration), vfx.CrossFadeOut(fade_duration)]))
+    return subtitle_clips
+
+def _write_with_subtitles(base_clip, subtitle_clips, output_path):
+    from moviepy import CompositeVideoClip
+
+    final_composition = CompositeVideoClip([base_clip] + subtitle_clips)
+    final_composition.audio = base_clip.audio
+    try:
+        # MoviePy codifica con ffmpeg: es el paso más costoso del render
+        with span("ffmpeg", "subtitles"):
+            final_composition.write_videofile(str(output_path), codec=PERFORMANCE_CONFIG['codec'], audio_codec=PERFORMANCE_CONFIG['audio_codec'], bitrate=PERFORMANCE_CONFIG['bitrate'], audio_bitrate=PERFORMANCE_CONFIG['audio_bitrate'], fps=PERFORMANCE_CONFIG['fps'], threads=PERFORMANCE_CONFIG['threads'], logger='bar')
+    finally:
+        final_composition.close()
+
+# --- Segmentos por Canción ---
+
+def render_song_segment(song_path: str, lyrics: str, output_path: str, with_subtitles: bool = True,
+                        clips_dir: str = None) -> str:
+    """
+    Renderiza el segmento de video de una sola canción: los clips de fondo en bucle durante
+    la canción y, con 'with_subtitles', su letra. Cada rama por canción del grafo renderiza
+    el suyo en cuanto tiene el audio; el video del álbum se une con 'concatenate_segments'.
+    """
+    from moviepy import VideoFileClip
+
+    clips_dir = clips_dir or CLIPS_DIR
+    # Carpeta temporal propia: varios segmentos se renderizan a la vez en el mismo proceso
+    temp_dir = Path(os.path.dirname(output_path) or ".") / "temp_ffmpeg" / Path(output_path).stem
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    reel_path, looped_path = temp_dir / "reel.mp4", temp_dir / "looped.mp4"
+    subtitle_cache, base_clip = {}, None
+    try:
+        _ffmpeg_concatenate_files(_clip_files(clips_dir), reel_path, 'video', temp_dir)
+        _ffmpeg_loop_video_smart(str(reel_path), song_path, str(looped_path), temp_dir)
+
+        if not with_subtitles:
+            import shutil
+            shutil.copy(looped_path, output_path)
+        else:
+            # Todos los segmentos con subtítulos se recodifican igual (aunque la canción no
+            # tenga letra) para poder unirlos sin volver a codificar
+            font_path = get_system_font_path()
+            if not font_path: raise RuntimeError("No se encontró una fuente de sistema para los subtítulos.")
+            base_clip = VideoFileClip(str(looped_path))
+            subtitle_clips = _subtitle_clips(lyrics or "", _get_duration_ffprobe(song_path), 0, font_path, subtitle_cache)
+            _write_with_subtitles(base_clip, subtitle_clips, output_path)
+        print(f"🎞️ Segmento de '{os.path.basename(song_path)}' renderizado en: {output_path}")
+        return output_path
+    finally:
+        for clip in ([base_clip] if base_clip else []) + list(subtitle_cache.values()):
+            try: clip.close()
+            except: pass
+        if PERFORMANCE_CONFIG['cleanup_temp_files']:
+            for temp_file in (reel_path, looped_path):
+                if temp_file.exists(): temp_file.unlink()
+            try: temp_dir.rmdir()
+            except OSError: pass
+
+def concatenate_segments(segment_paths: list[str], output_path: str) -> str:
+    """Une los segmentos por canción, en orden, en el video final sin recodificar."""
+    output_dir = os.path.dirname(output_path) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    _ffmpeg_concatenate_files(segment_paths, output_path, 'segments', Path(output_dir) / "temp_ffmpeg")
+    print(f"✅ ¡Video generado a partir de {len(segment_paths)} segmentos! Guardado en: {output_path}")
+    return output_path
+
 # --- Función Principal de Ensamblaje ---
 
-def assemble_video(song_paths: list[str], lyrics_list: list[str], with_subtitles: bool = True, task_instance: Task = None) -> str:
-    # --- Modificación para Robustez ---
-    # Se ignora la lista de 'song_paths' de entrada y se escanea el directorio directamente
-    # para asegurar que SIEMPRE se usen todos los archivos de audio existentes.
-    
-    def natural_sort_key(s):
-        import re
-        def atoi(text):
-            return int(text) if text.isdigit() else text.lower()
-        return [atoi(c) for c in re.split(r'(\d+)', s)]
-
-    from src.config import SONGS_DIR
-    all_song_files = [os.path.join(SONGS_DIR, f) for f in os.listdir(SONGS_DIR) if f.lower().endswith(('.mp3', '.wav', '.aac'))]
-    if not all_song_files:
-        raise FileNotFoundError(f"No se encontraron archivos de audio en el directorio '{SONGS_DIR}'.")
-    
-    # Usar la lista de archivos escaneada y ordenada a partir de ahora
-    final_song_paths = sorted(all_song_files, key=natural_sort_key)
-    
-    print("\n=== ARCHIVOS DE AUDIO FINALES PARA EL VIDEO (Escaneo Directo) ===")
+def assemble_video(song_paths: list[str], lyrics_list: list[str], with_subtitles: bool = True, task_instance: Task = None,
+                   clips_dir: str = None, output_path: str = None) -> str:
+    """
+    Ensambla el video final con las canciones de 'song_paths' (en ese orden) sobre los
+    clips de 'clips_dir' y lo guarda en 'output_path'. Los archivos temporales van junto
+    a la salida, de modo que cada trabajo usa su propia carpeta.
+    """
+    # moviepy es pesado de importar: solo se carga cuando realmente se ensambla un video
+    from moviepy import VideoFileClip
+
+    clips_dir = clips_dir or CLIPS_DIR
+    output_path = output_path or VIDEO_OUTPUT_PATH
+    output_dir = os.path.dirname(output_path) or "."
+
+    # Solo las canciones del trabajo: la carpeta de canciones puede contener otras
+    final_song_paths = [path for path in song_paths if os.path.exists(path)]
+    if not final_song_paths:
+        raise FileNotFoundError(f"No se encontró ninguno de los archivos de audio del trabajo: {song_paths}.")
+    if len(final_song_paths) != len(song_paths):
+        print(f"⚠️ Faltan {len(song_paths) - len(final_song_paths)} archivo(s) de audio; se ensambla con el resto.")
+
+    print("\n=== ARCHIVOS DE AUDIO FINALES PARA EL VIDEO ===")
     for idx, path in enumerate(final_song_paths, 1):
         print(f"{idx}. {os.path.basename(path)}")
-    print("===============================================================\n")
-    # --- Fin de la Modificación ---
+    print("===============================================\n")
 
     subtitle_cache, moviepy_clips, temp_files = {}, [], []
     def update_status(details: str): print(details)
     try:
         update_status("🚀 Iniciando ensamblaje híbrido...")
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        temp_dir = Path(OUTPUT_DIR) / "temp_ffmpeg"
+        os.makedirs(output_dir, exist_ok=True)
+        temp_dir = Path(output_dir) / "temp_ffmpeg"
         temp_dir.mkdir(parents=True, exist_ok=True)
 
-        video_files = sorted([os.path.join(CLIPS_DIR, f) for f in os.listdir(CLIPS_DIR) if f.lower().endswith(('.mp4', '.mov', '.m4v'))])
-        if not video_files: raise FileNotFoundError(f"No se encontraron videos en '{CLIPS_DIR}'.")
+        video_files = _clip_files(clips_dir)
 
         video_concat_path = temp_dir / f"video_concat_{os.getpid()}.mp4"
         audio_concat_path = temp_dir / f"audio_concat_{os.getpid()}.mp3"
         temp_files.extend([video_concat_path, audio_concat_path])
 
-        _ffmpeg_concatenate_files(video_files, video_concat_path, 'video')
-        _ffmpeg_concatenate_files(final_song_paths, audio_concat_path, 'audio') # Usar final_song_paths
+        _ffmpeg_concatenate_files(video_files, video_concat_path, 'video', temp_dir)
+        _ffmpeg_concatenate_files(final_song_paths, audio_concat_path, 'audio', temp_dir)
 
         video_looped_path = temp_dir / f"video_looped_{os.getpid()}.mp4"
         temp_files.append(video_looped_path)
-        _ffmpeg_loop_video_smart(video_concat_path, audio_concat_path, video_looped_path)
+        _ffmpeg_loop_video_smart(video_concat_path, audio_concat_path, video_looped_path, temp_dir)
 
         if not with_subtitles or not lyrics_list:
             # Sin subtítulos o sin letras disponibles: copiar directamente el video con audio completo
             import shutil
             update_status("📝 Generando video sin subtítulos...")
-            shutil.copy(video_looped_path, VIDEO_OUTPUT_PATH)
+            shutil.copy(video_looped_path, output_path)
         else:
             # Con subtítulos: expandir letras si es necesario y generar subtítulos
             update_status("📝 Preparando subtítulos...")
@@ -182,9 +277,9 @@ def assemble_video(song_paths: list[str], lyrics_list: list[str], with_subtitles
                 else:
                     print(f"⚠️ No hay letras disponibles, generando video sin subtítulos")
                     import shutil
-                    shutil.copy(video_looped_path, VIDEO_OUTPUT_PATH)
-                    update_status(f"✅ ¡Video generado exitosamente! Guardado en: {VIDEO_OUTPUT_PATH}")
-                    return VIDEO_OUTPUT_PATH
+                    shutil.copy(video_looped_path, output_path)
+                    update_status(f"✅ ¡Video generado exitosamente! Guardado en: {output_path}")
+                    return output_path
             
             font_path = get_system_font_path()
             if not font_path: raise RuntimeError("No se encontró una fuente de sistema para los subtítulos.")
@@ -195,26 +290,15 @@ def assemble_video(song_paths: list[str], lyrics_list: list[str], with_subtitles
             audio_start_time = 0
             subtitle_clips = []
 
-            for i, (lyrics, song_duration) in enumerate(zip(lyrics_list, audio_durations)):
-                lines = [line.strip() for line in lyrics.split('\n') if line.strip()]
-                if not lines: continue
-                time_per_line = song_duration / len(lines)
-                for j, line in enumerate(lines):
-                    if line not in subtitle_cache:
-                        subtitle_cache[line] = TextClip(font=font_path, text=line, font_size=PERFORMANCE_CONFIG['subtitle_font_size'], color='white', stroke_color='black', stroke_width=PERFORMANCE_CONFIG['subtitle_stroke_width'], method=PERFORMANCE_CONFIG['subtitle_method'])
-                    txt_clip = subtitle_cache[line].with_position(('center', 'bottom')).with_start(audio_start_time + j * time_per_line).with_duration(time_per_line)
-                    fade_duration = min(PERFORMANCE_CONFIG['subtitle_fade_duration'], time_per_line / 3)
-                    subtitle_clips.append(txt_clip.with_effects([vfx.CrossFadeIn(fade_duration), vfx.CrossFadeOut(fade_duration)]))
+            for lyrics, song_duration in zip(lyrics_list, audio_durations):
+                subtitle_clips.extend(_subtitle_clips(lyrics, song_duration, audio_start_time, font_path, subtitle_cache))
                 audio_start_time += song_duration
             
             moviepy_clips.extend(subtitle_clips)
-            final_composition = CompositeVideoClip([final_video_base] + subtitle_clips)
-            final_composition.audio = final_video_base.audio
-            moviepy_clips.append(final_composition)
-            final_composition.write_videofile(VIDEO_OUTPUT_PATH, codec=PERFORMANCE_CONFIG['codec'], audio_codec=PERFORMANCE_CONFIG['audio_codec'], bitrate=PERFORMANCE_CONFIG['bitrate'], audio_bitrate=PERFORMANCE_CONFIG['audio_bitrate'], fps=PERFORMANCE_CONFIG['fps'], threads=PERFORMANCE_CONFIG['threads'], logger='bar')
+            _write_with_subtitles(final_video_base, subtitle_clips, output_path)
         
-        update_status(f"✅ ¡Video generado exitosamente! Guardado en: {VIDEO_OUTPUT_PATH}")
-        return VIDEO_OUTPUT_PATH
+        update_status(f"✅ ¡Video generado exitosamente! Guardado en: {output_path}")
+        return output_path
     except Exception as e:
         update_status(f"❌ Error durante el ensamblaje: {e}")
         raise
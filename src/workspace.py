@@ -0,0 +1,100 @@
+"""
+Espacio de trabajo aislado de cada trabajo: letras, canciones, clips, metadatos, video
+final e informe de publicación viven bajo '<WORKSPACES_DIR>/<id_del_trabajo>/', de modo
+que varios trabajos pueden ejecutarse a la vez en el mismo worker sin pisarse archivos.
+
+La raíz '.' reproduce la disposición clásica (carpetas 'lyrics/', 'songs/', ... en el
+directorio actual), que sigue siendo la de las ejecuciones directas sin id de trabajo.
+"""
+import os
+import re
+from typing import List, Optional
+from src.config import (
+    WORKSPACES_DIR, LYRICS_DIR, SONGS_DIR, CLIPS_DIR, OUTPUT_DIR, METADATA_DIR,
+    PUBLICATION_REPORTS_DIR, STATE_DIR, VIDEO_OUTPUT_FILENAME
+)
+
+_SAFE_JOB_ID = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+class Workspace:
+    """Rutas de un trabajo a partir de su raíz."""
+
+    def __init__(self, root: str = "."):
+        self.root = root
+
+    @classmethod
+    def for_job(cls, job_id: str, base_dir: str = WORKSPACES_DIR) -> "Workspace":
+        if not job_id or not _SAFE_JOB_ID.match(job_id) or job_id in (".", ".."):
+            raise ValueError(f"Id de trabajo no válido para un espacio de trabajo: '{job_id}'.")
+        return cls(os.path.join(base_dir, job_id))
+
+    @property
+    def job_id(self) -> Optional[str]:
+        return None if self.root == "." else os.path.basename(os.path.normpath(self.root))
+
+    @property
+    def lyrics_dir(self) -> str:
+        return os.path.join(self.root, LYRICS_DIR)
+
+    @property
+    def songs_dir(self) -> str:
+        return os.path.join(self.root, SONGS_DIR)
+
+    @property
+    def metadata_dir(self) -> str:
+        return os.path.join(self.root, METADATA_DIR)
+
+    @property
+    def output_dir(self) -> str:
+        return os.path.join(self.root, OUTPUT_DIR)
+
+    @property
+    def reports_dir(self) -> str:
+        return os.path.join(self.root, PUBLICATION_REPORTS_DIR)
+
+    @property
+    def state_dir(self) -> str:
+        return os.path.join(self.root, STATE_DIR)
+
+    @property
+    def generation_ledger_path(self) -> str:
+        """Registro de generaciones de Suno del trabajo: sus canciones no se comparten con otros."""
+        return os.path.join(self.state_dir, "generation_ledger.json")
+
+    @property
+    def song_plan_path(self) -> str:
+        return os.path.join(self.metadata_dir, "song_plan.json")
+
+    @property
+    def video_output_path(self) -> str:
+        return os.path.join(self.output_dir, VIDEO_OUTPUT_FILENAME)
+
+    @property
+    def clips_dir(self) -> str:
+        """Clips propios del trabajo si los hay; si no, la carpeta común 'clips/'."""
+        own = os.path.join(self.root, CLIPS_DIR)
+        if os.path.isdir(own) and any(not f.startswith('.') for f in os.listdir(own)):
+            return own
+        return CLIPS_DIR
+
+    def create(self) -> "Workspace":
+        for directory in (self.lyrics_dir, self.songs_dir, self.metadata_dir, self.output_dir, self.reports_dir):
+            os.makedirs(directory, exist_ok=True)
+        return self
+
+    def __repr__(self):
+        return f"Workspace({self.root!r})"
+
+
+def workspace_of(state: dict) -> Workspace:
+    """Espacio de trabajo del estado del grafo ('workspace_dir'), o la disposición clásica."""
+    return Workspace(state.get("workspace_dir") or ".")
+
+
+def list_jobs(base_dir: str = WORKSPACES_DIR) -> List[str]:
+    """Ids de los trabajos con espacio de trabajo, del más reciente al más antiguo."""
+    if not os.path.isdir(base_dir):
+        return []
+    jobs = [d for d in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, d)) and not d.startswith('.')]
+    return sorted(jobs, key=lambda d: os.path.getmtime(os.path.join(base_dir, d)), reverse=True)
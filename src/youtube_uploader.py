@@ -1,14 +1,9 @@
 import os
 import time
-import httplib2
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from googleapiclient.errors import HttpError
-from oauth2client.client import flow_from_clientsecrets
-from oauth2client.file import Storage
 from celery import Task
 
-from src.config import CLIENT_SECRETS_FILE
+from src.config import CLIENT_SECRETS_FILE, SIMULATION_MODE
+from src.telemetry import span
 
 YOUTUBE_UPLOAD_SCOPE = "https://www.googleapis.com/auth/youtube.upload"
 YOUTUBE_API_SERVICE_NAME = "youtube"
@@ -17,8 +12,12 @@ CREDENTIALS_FILE = os.path.join(os.getcwd(), 'youtube-credentials.json')
 
 # --- Funciones para el Flujo de Autenticación Web (OAuth2) ---
 
+# Las librerías de Google se importan dentro de cada función para no penalizar el
+# arranque de la web y de los workers que nunca suben videos.
+
 def get_auth_flow():
     """Crea y devuelve un objeto de flujo OAuth2."""
+    from oauth2client.client import flow_from_clientsecrets
     if not os.path.exists(CLIENT_SECRETS_FILE):
         raise FileNotFoundError(
             f"El archivo de secretos de cliente '{CLIENT_SECRETS_FILE}' no se encontró. "
@@ -35,6 +34,7 @@ def exchange_code_for_credentials(code: str):
     """
     Intercambia un código de autorización por credenciales y las guarda en el archivo.
     """
+    from oauth2client.file import Storage
     flow = get_auth_flow()
     credentials = flow.step2_exchange(code)
     storage = Storage(CREDENTIALS_FILE)
@@ -48,6 +48,10 @@ def get_authenticated_service():
     Obtiene el objeto de servicio de la API de YouTube autenticado.
     Asume que 'youtube-credentials.json' ya existe y es válido.
     """
+    import httplib2
+    from googleapiclient.discovery import build
+    from oauth2client.file import Storage
+
     if not os.path.exists(CREDENTIALS_FILE):
         # Este error ahora le indica al frontend que debe iniciar el flujo de autenticación.
         raise FileNotFoundError("No se encontraron credenciales de YouTube. Por favor, autoriza la aplicación primero.")
@@ -67,6 +71,7 @@ def get_authenticated_service():
 # --- Lógica de Subida de Video (sin cambios) ---
 
 def resumable_upload(insert_request, task_instance: Task):
+    from googleapiclient.errors import HttpError
     response = None
     error = None
     retry = 0
@@ -77,7 +82,8 @@ def resumable_upload(insert_request, task_instance: Task):
             if task_instance:
                 task_instance.update_state(state='PROGRESS', meta={'details': 'Subiendo archivo a YouTube...', 'progress': '95%'})
             
-            status, response = insert_request.next_chunk()
+            with span("upload", "chunk"):
+                status, response = insert_request.next_chunk()
             if response and 'id' in response:
                 return response['id']
 
@@ -100,6 +106,10 @@ def upload_video_to_youtube(video_path: str, title: str, description: str, tags:
     """
     Sube un video a YouTube usando una subida resumible.
     """
+    if SIMULATION_MODE:
+        from src.simulation import simulated_upload
+        return simulated_upload(video_path, title, description, tags, task_instance, privacy_status)
+    from googleapiclient.http import MediaFileUpload
     try:
         youtube = get_authenticated_service()
         
@@ -1,5 +1,7 @@
 import sys
 import os
+import time
+import uuid
 import logging
 
 # --- Inyectar la librería local de Suno ---
@@ -14,14 +16,23 @@ if local_suno_path not in sys.path:
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from celery import Celery, Task
+from celery import Celery, Task, chain
+from celery.exceptions import Ignore
+from celery.signals import before_task_publish, task_prerun, worker_init, worker_process_shutdown
+from kombu import Queue
 from src.main_orchestrator import (
-    resume_video_workflow, 
-    node_generate_song_plan,
-    node_generate_lyrics_drafts, 
-    node_refine_lyrics
+    JobContext, PIPELINE_STAGES, get_app_graph, run_video_workflow, prepare_resume, run_stage, stage_of,
+    thread_config
 )
 from src.suno_api import SunoApiClient
+from src.llm_cache import llm_cache
+from src.llm_router import llm_router
+from src.llm_usage import usage_scope
+from src.progress_events import progress_publisher
+from src.job_scheduler import JobScheduler, celery_priority
+from src.config import SCHEDULER_DEFAULT_PRIORITY, CELERY_VISIBILITY_TIMEOUT
+from src import telemetry
+from src.workspace import Workspace
 
 # --- Configuración de Logging ---
 # Esto nos ayuda a ver los errores de Celery de forma más clara.
@@ -38,22 +49,105 @@ celery_app = Celery('tasks',
 # Opcional: Configuración adicional de Celery para mayor robustez
 celery_app.conf.update(
     task_track_started=True,
-    result_extended=True
+    result_extended=True,
+    # Una cola por etapa del pipeline ('llm', 'suno', 'render', 'upload'). Un worker sin
+    # '-Q' atiende todas; con '-Q render --concurrency 2' solo los renders, etc.
+    task_queues=[Queue('celery')] + [Queue(stage) for stage in PIPELINE_STAGES],
+    task_routes={
+        'tasks.create_video_task': {'queue': 'llm'},
+        'tasks.resume_video_workflow_task': {'queue': 'llm'},
+    },
+    # Las etapas son largas: cada proceso reserva una sola tarea para no acaparar la cola
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    # Prioridades de mensaje en Redis (0 = la más alta): cada cola se reparte en una
+    # sublista por prioridad ('llm', 'llm:1', ...). Ver src/job_scheduler.py. Con
+    # 'task_acks_late', Redis reentrega la tarea no confirmada pasado 'visibility_timeout'
+    # (1 h por defecto): se amplía para que una etapa larga no se ejecute dos veces
+    broker_transport_options={'priority_steps': list(range(10)), 'sep': ':',
+                              'visibility_timeout': CELERY_VISIBILITY_TIMEOUT},
+    task_default_priority=celery_priority(SCHEDULER_DEFAULT_PRIORITY)
 )
 
+
+# --- Telemetría (ver src/telemetry.py) ---
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    # Cabecera propia del mensaje: el worker calcula con ella la espera en la cola
+    if headers is not None:
+        headers['enqueued_at'] = time.time()
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    enqueued_at = task.request.get('enqueued_at') if task else None
+    if enqueued_at:
+        queue = (task.request.delivery_info or {}).get('routing_key') or 'celery'
+        telemetry.record_wait(f"celery:{queue}", time.time() - enqueued_at)
+
+
+@worker_init.connect
+def start_worker_metrics(sender=None, **kwargs):
+    # Aquí 'pool_cls' es aún el alias ('prefork', 'solo'...) o la clase que pasó la línea de comandos
+    pool = getattr(sender, 'pool_cls', None) or 'prefork'
+    pool_name = pool if isinstance(pool, str) else pool.__module__
+    prefork = 'prefork' in pool_name or pool_name == 'processes'
+    telemetry.start_worker_metrics_server(getattr(sender, 'hostname', ''), prefork=prefork)
+
+
+@worker_process_shutdown.connect
+def discard_worker_process_metrics(pid=None, **kwargs):
+    telemetry.mark_process_dead(pid or os.getpid())
+
+
+class ProgressTask(Task):
+    """
+    Tarea que, además de guardar su estado en el backend de resultados, lo publica en el
+    canal de eventos de progreso (ver src/progress_events.py) para la página de estado.
+    """
+
+    def update_state(self, task_id=None, state=None, meta=None, **kwargs):
+        super().update_state(task_id=task_id, state=state, meta=meta, **kwargs)
+        progress_publisher.publish(task_id or self.request.id, state, meta)
+
+    def on_success(self, retval, task_id, args, kwargs):
+        # Las tareas sin resultado (reanudación y etapas) publican su final por su cuenta
+        if not self.ignore_result and isinstance(retval, dict):
+            progress_publisher.publish(task_id, retval.get('state', 'SUCCESS'), retval)
+
+
+class TrackedProgress:
+    """
+    Publica el progreso de una etapa en la tarea que consulta la página de estado, para
+    que las etapas de un mismo trabajo (en colas distintas) se vean como una sola tarea.
+    """
+
+    def __init__(self, task: Task, tracking_id: str):
+        self.task = task
+        self.tracking_id = tracking_id
+
+    def update_state(self, state=None, meta=None):
+        self.task.update_state(task_id=self.tracking_id, state=state, meta=meta)
+
 # --- Definición de la Tarea de Celery ---
 
-@celery_app.task(bind=True)
-def create_video_task(self, user_prompt, song_style, is_instrumental, language, with_subtitles, refine_lyrics, num_female_songs, num_male_songs, num_instrumental_songs, llm_model, suno_model):
+@celery_app.task(bind=True, base=ProgressTask)
+def create_video_task(self, user_prompt, song_style, is_instrumental, language, with_subtitles, refine_lyrics, num_female_songs, num_male_songs, num_instrumental_songs, llm_model, suno_model, auto_resume=False, priority=None):
     """
     Tarea de Celery que genera los borradores de letras y se detiene,
-    permitiendo la revisión manual del usuario.
+    permitiendo la revisión manual del usuario. El id de la tarea es el id del
+    trabajo: sus archivos quedan en su propio espacio de trabajo y su estado en el
+    checkpoint del grafo, en pausa antes de crear las canciones.
+
+    Con 'auto_resume' (envíos masivos sin revisión) encadena directamente las etapas
+    siguientes con la prioridad del trabajo, que publican su progreso en esta tarea. Si
+    no, el trabajo queda en pausa en el planificador hasta que se reanude.
     """
     try:
         self.update_state(state='STARTED', meta={'details': 'Iniciando la generación de letras...'})
         
-        client = SunoApiClient()
-        client.initialize_session()
+        workspace = Workspace.for_job(self.request.id).create()
 
         initial_state = {
             "user_prompt": user_prompt, "song_style": song_style,
@@ -62,71 +156,185 @@ def create_video_task(self, user_prompt, song_style, is_instrumental, language,
             "num_female_songs": num_female_songs, "num_male_songs": num_male_songs,
             "num_instrumental_songs": num_instrumental_songs,
             "llm_model": llm_model, "suno_model": suno_model,
-            "task_instance": self, "suno_client": client
+            "workspace_dir": workspace.root,
+            # Las etapas de una reanudación fuera del planificador usan la del checkpoint
+            "priority": priority
         }
 
-        # 1. Generar el PLAN de canciones
-        plan_state = node_generate_song_plan(initial_state)
-        current_state = {**initial_state, **plan_state}
+        # Las llamadas a LLM se contabilizan bajo el id del trabajo; la reanudación
+        # posterior recibe el mismo id y se suma a él
+        with usage_scope(job_id=self.request.id):
+            # Etapa 'llm': plan, borradores y refinamiento (si se pidió); el grafo se
+            # detiene antes de Suno. Los segmentos de video se renderizarán en la etapa 'render'
+            initial_state["defer_segment_render"] = True
+            run_video_workflow(initial_state, JobContext(self), pause_before=["create_songs"])
+        
+        logger.info(f"Caché de LLM: {llm_cache.stats()}")
+        logger.info(f"Router de LLM: {llm_router.summary()}")
 
-        # 2. Generar los BORRADORES de letras usando el plan
-        draft_state = node_generate_lyrics_drafts(current_state)
-        current_state.update(draft_state)
+        if auto_resume:
+            self.update_state(state='PROGRESS', meta={'details': 'Letras generadas. Etapas del proceso en cola...', 'progress': '0%'})
+            stage_pipeline(self.request.id, self.request.id, self.request.id, priority).apply_async()
+            # Sin resultado propio: el estado final lo guarda la última etapa
+            raise Ignore()
 
-        # 3. Refinar las letras si el usuario lo solicitó
-        if refine_lyrics and not is_instrumental:
-            refine_state = node_refine_lyrics(current_state)
-            current_state.update(refine_state)
-        
         self.update_state(state='PROGRESS', meta={'details': 'Letras generadas. Proceso en pausa para revisión manual.', 'progress': '100%'})
+        # Libera el hueco mientras dura la revisión; al reanudarse vuelve a la cola
+        job_scheduler.pause(self.request.id)
 
         return {
             'state': 'SUCCESS',
             'details': 'Letras generadas y listas para su revisión. Por favor, ve a la página de "Reanudar Proceso" para editar y continuar.',
-            'result': 'LYRICS_GENERATED'
+            'result': 'LYRICS_GENERATED',
+            'job_id': self.request.id
         }
 
+    except Ignore:
+        raise
     except Exception as e:
         logger.error(f"La tarea de generación de letras ha fallado: {e}", exc_info=True)
         self.update_state(state='FAILURE', meta={'details': str(e)})
+        job_scheduler.pause(self.request.id)
         return {'state': 'FAILURE', 'details': str(e)}
 
 
-@celery_app.task(bind=True)
-def resume_video_workflow_task(self, is_instrumental, with_subtitles, suno_model, llm_model):
+def enqueue_resume(job_id=None, **options):
     """
-    Tarea de Celery para reanudar el proceso de creación de video.
+    Reanuda un trabajo y devuelve el id de la tarea de reanudación, la que consulta la
+    página de estado. Los trabajos en pausa del planificador vuelven a su cola y se lanzan
+    cuando les toca turno, con su prioridad; el resto se reanuda directamente.
+    """
+    task_id = str(uuid.uuid4())
+    if not (job_id and job_scheduler.resume(job_id, {**options, 'task_id': task_id})):
+        resume_video_workflow_task.apply_async(kwargs={**options, 'job_id': job_id}, task_id=task_id)
+    return task_id
+
+
+@celery_app.task(bind=True, base=ProgressTask, ignore_result=True)
+def resume_video_workflow_task(self, is_instrumental, with_subtitles, suno_model, llm_model, job_id=None, priority=None):
+    """
+    Tarea de Celery para reanudar el proceso de creación de video del trabajo 'job_id'
+    (sin id, el de las carpetas clásicas del directorio actual). Prepara el checkpoint y
+    encadena las etapas pendientes, cada una en su cola y con la prioridad del trabajo.
+    Las etapas publican su progreso y el resultado final en esta tarea, que es la que
+    consulta la página de estado. Se lanza con 'enqueue_resume'.
     """
     try:
         self.update_state(state='STARTED', meta={'details': 'Reanudando el proceso...'})
-        
-        client = SunoApiClient()
-        client.initialize_session() # Pre-autenticar al inicio de la tarea
 
         initial_state = {
             "is_instrumental": is_instrumental,
             "with_subtitles": with_subtitles,
             "suno_model": suno_model,
             "llm_model": llm_model,
-            "task_instance": self,
-            "suno_client": client # Pasamos el cliente instanciado
+            "defer_segment_render": True,
+            "workspace_dir": Workspace.for_job(job_id).root if job_id else "."
         }
+        thread_id = prepare_resume(initial_state)
+        pipeline = stage_pipeline(thread_id, job_id or self.request.id, self.request.id, priority)
+        self.update_state(state='PROGRESS', meta={'details': 'Etapas del proceso en cola...', 'progress': '0%'})
+        pipeline.apply_async()
 
-        final_result = resume_video_workflow(initial_state)
+    except Exception as e:
+        logger.error(f"La tarea de reanudación ha fallado: {e}", exc_info=True)
+        self.update_state(state='FAILURE', meta={'details': str(e)})
+        if job_id:
+            job_scheduler.finish(job_id)
+
+
+def stage_pipeline(thread_id, usage_job_id, tracking_id, priority=None):
+    """
+    Cadena de Celery con las etapas pendientes del trabajo, cada una en su cola y con la
+    prioridad del trabajo (0-9, mayor = antes): la indicada o, si no, la del checkpoint.
+    """
+    graph_state = get_app_graph().get_state(thread_config(thread_id))
+    if priority is None:
+        priority = graph_state.values.get("priority")
+    stages = list(PIPELINE_STAGES)
+    first = stages.index(stage_of(graph_state.next[0]))
+    options = {} if priority is None else {'priority': celery_priority(priority)}
+    return chain(*[
+        run_pipeline_stage.si(thread_id, stage, usage_job_id, tracking_id).set(queue=stage, **options)
+        for stage in stages[first:]
+    ])
+
+
+@celery_app.task(bind=True, base=ProgressTask, ignore_result=True)
+def run_pipeline_stage(self, thread_id, stage, usage_job_id, tracking_id):
+    """
+    Ejecuta una etapa del pipeline ('suno', 'render', 'upload') desde el checkpoint del
+    trabajo 'usage_job_id'. Si el grafo termina, guarda el resultado final en la tarea de
+    seguimiento; si falla, marca el fallo y la cadena se detiene (se puede reanudar desde
+    la web). En ambos casos libera el hueco del trabajo en el planificador.
+    """
+    progress = TrackedProgress(self, tracking_id)
+    try:
+        client = None
+        if stage == "suno":
+            client = SunoApiClient()
+            client.initialize_session() # Pre-autenticar al inicio de la etapa
+
+        with usage_scope(job_id=usage_job_id):
+            result = run_stage(thread_id, stage, JobContext(progress, client))
+        logger.info(f"Etapa '{stage}' completada. Caché de LLM: {llm_cache.stats()}")
+        logger.info(f"Router de LLM: {llm_router.summary()}")
+
+        if not result['paused_at']:
+            final = {
+                'state': 'SUCCESS',
+                'details': '¡Proceso de reanudación completado!',
+                'result': result
+            }
+            self.backend.store_result(tracking_id, final, 'SUCCESS')
+            progress_publisher.publish(tracking_id, 'SUCCESS', final)
+            job_scheduler.finish(usage_job_id)
+        return result
 
+    except Exception as e:
+        logger.error(f"La etapa '{stage}' ha fallado: {e}", exc_info=True)
+        progress.update_state(state='FAILURE', meta={'details': f"Etapa '{stage}': {e}"})
+        job_scheduler.pause(usage_job_id)
+        raise
+
+
+# --- Planificador de trabajos ---
+
+def dispatch_scheduled_job(job):
+    """
+    Lanza un trabajo admitido por el planificador; su id es el id de la tarea. Un trabajo
+    en pausa que vuelve a la cola se reanuda en la tarea que sigue la página de estado.
+    """
+    if job.get('resume'):
+        options = dict(job['resume'])
+        task_id = options.pop('task_id')
+        resume_video_workflow_task.apply_async(
+            kwargs={**options, 'job_id': job['job_id'], 'priority': job['priority']},
+            task_id=task_id,
+            priority=celery_priority(job['priority'])
+        )
+        return
+    create_video_task.apply_async(
+        kwargs={**job['spec'], 'auto_resume': not job['review'], 'priority': job['priority']},
+        task_id=job['job_id'],
+        priority=celery_priority(job['priority'])
+    )
+
+
+def broker_queue_depths():
+    """Mensajes en espera en cada cola de Celery, sumando sus sublistas de prioridad."""
+    sep = celery_app.conf.broker_transport_options['sep']
+    with celery_app.connection_for_read() as connection:
+        client = connection.default_channel.client
         return {
-            'state': 'SUCCESS',
-            'details': '¡Proceso de reanudación completado!',
-            'result': final_result
+            queue.name: sum(client.llen(queue.name if step == 0 else f"{queue.name}{sep}{step}") for step in range(10))
+            for queue in celery_app.conf.task_queues
         }
 
-    except Exception as e:
-        logger.error(f"La tarea de reanudación ha fallado: {e}", exc_info=True)
-        self.update_state(state='FAILURE', meta={'details': str(e)})
-        return {'state': 'FAILURE', 'details': str(e)}
+
+job_scheduler = JobScheduler(dispatch_scheduled_job, queue_depths=broker_queue_depths)
 
 
-@celery_app.task(bind=True)
+@celery_app.task(bind=True, base=ProgressTask)
 def test_sunoai_generate(self, prompt: str):
     """Una tarea de prueba para verificar la generación con la nueva librería SunoAI."""
     try:
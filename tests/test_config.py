@@ -0,0 +1,48 @@
+import os
+import sys
+import subprocess
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import config
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_require_config_raises_only_for_missing_keys(monkeypatch):
+    monkeypatch.setattr(config, "GROQ_API_KEY", "clave")
+    monkeypatch.setattr(config, "SUNO_COOKIE", None)
+
+    config.require_config("GROQ_API_KEY")
+    with pytest.raises(ValueError, match="Suno"):
+        config.require_config("GROQ_API_KEY", "SUNO_COOKIE")
+
+
+def test_entry_points_import_without_keys_or_heavy_sdks():
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("OPENAI_API_KEY", "GROQ_API_KEY", "GEMINI_API_KEY", "SUNO_COOKIE")}
+    code = (
+        "import sys, tasks, app\n"
+        "heavy = [m for m in ('moviepy', 'langgraph', 'openai', 'groq', 'google.generativeai', 'googleapiclient') if m in sys.modules]\n"
+        "print('cargados:' + ','.join(heavy))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "cargados:"
+
+
+def test_simulation_keeps_its_state_and_cache_apart():
+    env = {**os.environ, "SIMULATION_MODE": "1"}
+    for name in ("CACHE_DIR", "WORKSPACES_DIR", "CHECKPOINT_DB_PATH"):
+        env.pop(name, None)
+    code = (
+        "from src import config\n"
+        "print(config.LLM_CACHE_DIR, config.LLM_USAGE_LOG_PATH, config.CHECKPOINT_DB_PATH, config.WORKSPACES_DIR)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    cache_dir, usage_log, checkpoints, workspaces = result.stdout.split()
+    assert cache_dir == os.path.join(".cache", "simulation", "llm")
+    assert usage_log == os.path.join("state", "simulation", "llm_usage.jsonl")
+    assert checkpoints == os.path.join("state", "simulation", "checkpoints.sqlite")
+    assert workspaces == "simulation_workspaces"
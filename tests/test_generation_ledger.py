@@ -0,0 +1,67 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from unittest.mock import MagicMock
+
+from src.generation_ledger import GenerationLedger, STATUS_DOWNLOADED
+from src.suno_handler import create_and_download_song
+
+
+@pytest.fixture
+def fake_client(tmp_path):
+    client = MagicMock()
+    client.generate.return_value = {"clips": [{"id": "a"}, {"id": "b"}]}
+    client.poll_for_song.return_value = [
+        {"id": "a", "title": "Song", "audio_url": "http://x/a.mp3"},
+        {"id": "b", "title": "Song", "audio_url": "http://x/b.mp3"},
+    ]
+
+    def download(song, output_filename, output_dir=None):
+        path = tmp_path / output_filename
+        path.write_bytes(b"mp3")
+        return str(path)
+
+    client.download_song.side_effect = download
+    return client
+
+
+def generate(client, ledger):
+    return create_and_download_song(client, lyrics="la la", song_style="pop", song_title="Song", ledger=ledger)
+
+
+def test_retry_after_crash_reattaches_to_submitted_clips(fake_client, tmp_path):
+    ledger = GenerationLedger(str(tmp_path / "ledger.json"))
+    fake_client.poll_for_song.side_effect = [RuntimeError("worker crash"), fake_client.poll_for_song.return_value]
+
+    with pytest.raises(RuntimeError):
+        generate(fake_client, ledger)
+    paths = generate(fake_client, ledger)
+
+    assert fake_client.generate.call_count == 1
+    assert fake_client.poll_for_song.call_args_list[-1].args == (["a", "b"],)
+    assert len(paths) == 2
+
+
+def test_downloaded_songs_are_not_regenerated(fake_client, tmp_path):
+    ledger = GenerationLedger(str(tmp_path / "ledger.json"))
+
+    first = generate(fake_client, ledger)
+    second = generate(fake_client, ledger)
+
+    assert first == second
+    assert fake_client.generate.call_count == 1
+    assert fake_client.poll_for_song.call_count == 1
+    assert list(ledger.entries().values())[0]["status"] == STATUS_DOWNLOADED
+
+
+def test_transaction_ids_are_persisted_across_failed_submissions(fake_client, tmp_path):
+    ledger = GenerationLedger(str(tmp_path / "ledger.json"))
+    fake_client.generate.side_effect = [RuntimeError("Suno 500"), fake_client.generate.return_value]
+
+    with pytest.raises(RuntimeError):
+        generate(fake_client, ledger)
+    generate(fake_client, ledger)
+
+    first_call, second_call = fake_client.generate.call_args_list
+    assert first_call.kwargs["transaction_uuid"] == second_call.kwargs["transaction_uuid"]
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import main_orchestrator
+from src import headless_runner
+
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    monkeypatch.setattr(main_orchestrator, "CHECKPOINT_DB_PATH", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(main_orchestrator, "_app_graph", None)
+
+    def fake_plan(user_prompt, total_songs, language, llm_model):
+        if user_prompt == "roto":
+            raise RuntimeError("proveedor caído")
+        return json.dumps({"song_plan": [{"title": f"Canción {i}", "description": user_prompt} for i in range(total_songs)]})
+
+    def fake_draft(prompt, song_style, language, gender, song_index, total_songs, llm_model, on_token=None):
+        return f"TITLE: x\n\nPROMPT:\nVerse 1:\n{prompt}\n\nTAGS:\n{song_style}\n\nGENERO: {gender}"
+
+    monkeypatch.setattr(main_orchestrator, "generate_song_plan", fake_plan)
+    monkeypatch.setattr(main_orchestrator, "generate_draft_lyrics", fake_draft)
+    monkeypatch.setattr(main_orchestrator, "dedupe_lyrics_files", lambda paths, *args: paths)
+    return main_orchestrator.get_app_graph()
+
+
+def write_catalog(tmp_path, jobs):
+    path = tmp_path / "catalogo.json"
+    path.write_text(json.dumps(jobs), encoding='utf-8')
+    return str(path)
+
+
+def test_catalog_runs_in_parallel_and_reports_stage_timings(graph, tmp_path, capsys):
+    catalog = write_catalog(tmp_path, [
+        {"user_prompt": "mar", "song_style": "pop", "refine_lyrics": False, "job_id": "mar"},
+        {"user_prompt": "rio", "song_style": "rock", "refine_lyrics": False, "num_male_songs": 1, "priority": 9},
+    ])
+    report = tmp_path / "report.json"
+
+    code = headless_runner.main([catalog, "--workers", "2", "--stop-before", "create_songs",
+                                 "--workspaces-dir", str(tmp_path / "workspaces"), "--report", str(report)])
+
+    assert code == 0
+    results = json.loads(report.read_text(encoding='utf-8'))
+    assert [r["status"] for r in results] == ["paused", "paused"]
+    assert results[0]["job_id"] == "mar" and results[0]["paused_at"] == "create_songs"
+    assert set(results[1]["timing"]["stages"]) == {"llm"}
+    assert "[mar]" in capsys.readouterr().out
+
+    # Un trabajo con checkpoint no se vuelve a lanzar desde el catálogo
+    assert headless_runner.main([catalog, "--workspaces-dir", str(tmp_path / "workspaces")]) == 2
+
+
+def test_failures_give_a_nonzero_exit_code(graph, tmp_path):
+    catalog = write_catalog(tmp_path, [{"user_prompt": "roto"}, {"user_prompt": "bien", "refine_lyrics": False}])
+
+    code = headless_runner.main([catalog, "--stop-before", "create_songs", "--workspaces-dir", str(tmp_path / "w")])
+    assert code == 1
+
+    assert headless_runner.main([write_catalog(tmp_path, [{"song_style": "pop"}])]) == 2
@@ -0,0 +1,134 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src.job_scheduler import JobScheduler, album_spec, celery_priority
+
+
+def make_scheduler(max_active=2):
+    dispatched = []
+    scheduler = JobScheduler(lambda job: dispatched.append(job["job_id"]), max_active=max_active,
+                             redis_factory=lambda: None)
+    return scheduler, dispatched
+
+
+def test_album_specs_use_the_form_defaults_and_are_validated():
+    album = album_spec({"user_prompt": "mar", "is_instrumental": True, "num_instrumental_songs": 3})
+    assert album["num_female_songs"] == album["num_male_songs"] == 0
+    assert album["refine_lyrics"] and album["with_subtitles"] and album["suno_model"] == "chirp-crow"
+    assert celery_priority(9) == 0
+
+    for spec, message in [({"song_style": "pop"}, "user_prompt"),
+                          ({"user_prompt": "x", "num_male_songs": "2"}, "num_male_songs"),
+                          ({"user_prompt": "x", "num_female_songs": 0}, "no tiene canciones"),
+                          ({"user_prompt": "x", "tempo": 120}, "tempo")]:
+        with pytest.raises(ValueError, match=message):
+            album_spec(spec)
+
+
+def test_priorities_and_users_take_turns():
+    scheduler, dispatched = make_scheduler()
+    scheduler.submit([{"user_prompt": f"a{i}", "job_id": f"a{i}"} for i in range(4)], user="ana")
+    scheduler.submit([{"user_prompt": f"b{i}", "job_id": f"b{i}"} for i in range(2)], user="beto")
+    scheduler.submit([{"user_prompt": "urgente", "job_id": "c0", "priority": 8}], user="carla")
+    assert dispatched == ["a0", "a1"]
+
+    # El trabajo urgente pasa primero; después, el usuario con menos trabajos en curso
+    overview = scheduler.overview()
+    assert [j["job_id"] for j in overview["jobs"] if j["status"] == "pending"] == ["c0", "b0", "b1", "a2", "a3"]
+    assert overview["users"]["ana"] == {"pending": 2, "active": 2, "paused": 0}
+
+    for job_id in ("a0", "a1", "c0"):
+        scheduler.finish(job_id)
+    assert dispatched == ["a0", "a1", "c0", "b0", "a2"]
+    scheduler.finish("desconocido")  # los trabajos que no son del planificador se ignoran
+    assert scheduler.overview()["active"] == 2
+
+
+def test_estimated_starts_follow_the_queue(monkeypatch):
+    scheduler, dispatched = make_scheduler(max_active=1)
+    with pytest.raises(ValueError, match="priority"):
+        scheduler.submit([{"user_prompt": "x"}], priority=12)
+    jobs = scheduler.submit([{"user_prompt": f"p{i}"} for i in range(3)], user="ana")
+
+    assert jobs[0]["status"] == "active" and len(dispatched) == 1
+    assert [(j["position"], j["estimated_wait_seconds"]) for j in jobs[1:]] == [(1, 1800), (2, 3600)]
+    with pytest.raises(ValueError, match="Ya hay trabajos"):
+        scheduler.submit([{"user_prompt": "x", "job_id": jobs[1]["job_id"]}])
+
+
+def test_failed_dispatch_returns_the_job_to_the_queue():
+    def broken(job):
+        raise ConnectionError("broker caído")
+
+    scheduler = JobScheduler(broken, max_active=2, redis_factory=lambda: None)
+    with pytest.raises(ConnectionError):
+        scheduler.submit([{"user_prompt": "x"}, {"user_prompt": "y"}])
+    assert scheduler.overview()["pending"] == 2
+
+
+def test_bulk_submission_api(monkeypatch):
+    import app as app_module
+
+    scheduler, dispatched = make_scheduler(max_active=1)
+    monkeypatch.setattr(app_module, "job_scheduler", scheduler)
+    client = app_module.app.test_client()
+
+    response = client.post("/api/jobs", json={"user": "ana", "priority": 7, "jobs": [
+        {"user_prompt": "mar", "song_style": "pop"}, {"user_prompt": "rio", "review": False}
+    ]})
+    assert response.status_code == 202
+    data = response.get_json()
+    assert [j["status"] for j in data["jobs"]] == ["active", "pending"]
+    assert data["jobs"][1]["status_url"] == f"/status/{data['jobs'][1]['job_id']}"
+    assert data["queue"]["pending"] == 1 and "jobs" not in data["queue"]
+
+    assert client.post("/api/jobs", json=[{"song_style": "pop"}]).status_code == 400
+    assert client.get("/api/queue").get_json()["jobs"][1]["priority"] == 7
+
+
+def test_web_and_workers_share_the_queue_through_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    dispatched = []
+    web = JobScheduler(lambda job: dispatched.append(job["job_id"]), max_active=1, redis_factory=lambda: client)
+    worker = JobScheduler(lambda job: dispatched.append(job["job_id"]), max_active=1, redis_factory=lambda: client)
+
+    web.submit([{"user_prompt": "x", "job_id": "j1"}, {"user_prompt": "y", "job_id": "j2"}])
+    worker.finish("j1")
+    assert dispatched == ["j1", "j2"] and web.overview()["active"] == 1
+
+
+def test_paused_jobs_free_their_slot_and_resume_through_the_queue():
+    dispatched = []
+    scheduler = JobScheduler(lambda job: dispatched.append((job["job_id"], job.get("resume"))), max_active=1,
+                             redis_factory=lambda: None)
+    scheduler.submit([{"user_prompt": "a", "job_id": "a", "priority": 8}, {"user_prompt": "b", "job_id": "b"}], user="ana")
+    assert dispatched == [("a", None)]
+
+    # Revisión de las letras: el hueco pasa al siguiente, pero el trabajo conserva su prioridad
+    scheduler.pause("a")
+    assert dispatched == [("a", None), ("b", None)]
+    assert scheduler.overview()["paused"] == 1 and scheduler.overview()["users"]["ana"]["paused"] == 1
+
+    assert scheduler.resume("a", {"suno_model": "v5"})
+    assert len(dispatched) == 2, "espera a que se libere un hueco"
+    with pytest.raises(ValueError, match="en cola"):
+        scheduler.resume("a", {})
+    assert not scheduler.resume("desconocido", {})
+
+    scheduler.finish("b")
+    assert dispatched[-1] == ("a", {"suno_model": "v5"})
+    assert scheduler.overview()["jobs"][0]["priority"] == 8
+
+
+def test_resumed_jobs_keep_their_priority_in_the_stage_queues(monkeypatch):
+    import tasks
+
+    calls = []
+    monkeypatch.setattr(tasks.resume_video_workflow_task, "apply_async", lambda **kwargs: calls.append(kwargs))
+    tasks.dispatch_scheduled_job({"job_id": "a", "priority": 8, "resume": {"suno_model": "v5", "task_id": "t1"}})
+
+    assert calls == [{"kwargs": {"suno_model": "v5", "job_id": "a", "priority": 8},
+                      "task_id": "t1", "priority": celery_priority(8)}]
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import llm_batch
+from src.llm_batch import BatchRunner, LocalBatchBackend
+from src.llm_cache import LLMResponseCache
+from src.llm_usage import LLMUsageLedger
+
+CATALOG = [
+    {"job_id": "amor", "user_prompt": "Amor perdido", "song_style": "balada", "num_female_songs": 1, "num_male_songs": 1},
+    {"job_id": "mar", "user_prompt": "El mar", "song_style": "ambient", "is_instrumental": True, "num_instrumental_songs": 2},
+]
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_batch, "llm_cache", LLMResponseCache(str(tmp_path / "cache"), mode="on"))
+    monkeypatch.setattr(llm_batch, "llm_usage", LLMUsageLedger(str(tmp_path / "usage.jsonl")))
+    return BatchRunner("catalogo", backend_name="local", output_dir=str(tmp_path / "jobs"),
+                       state_dir=str(tmp_path / "state"), poll_interval=0)
+
+
+def test_catalog_runs_offline_and_fans_out_files(runner, tmp_path):
+    submitted = []
+    original_submit = LocalBatchBackend.submit
+    runner.local_backend.submit = lambda path: submitted.append(path) or original_submit(runner.local_backend, path)
+
+    job_dirs = runner.run(CATALOG)
+
+    lyrics = sorted(os.listdir(os.path.join(job_dirs["amor"], "lyrics")))
+    assert lyrics == ["1_Canción simulada 1.txt", "2_Canción simulada 2.txt"]
+    with open(os.path.join(job_dirs["amor"], "lyrics", lyrics[0]), encoding='utf-8') as f:
+        content = f.read()
+    assert "TITLE: Canción simulada 1" in content and "Línea refinada 0" in content
+
+    assert sorted(os.listdir(os.path.join(job_dirs["mar"], "lyrics"))) == ["1_Instrumental Song 1.txt", "2_Instrumental Song 2.txt"]
+    for job_dir in job_dirs.values():
+        assert any(f.startswith("metadata_") for f in os.listdir(os.path.join(job_dir, "metadata")))
+
+    # Un lote por etapa con peticiones (plan, borradores de ambos trabajos, refinamiento, metadatos)
+    assert len(submitted) == 4
+    with open(submitted[1], encoding='utf-8') as f:
+        assert len([line for line in f if line.strip()]) == 4
+
+    # Cada respuesta del lote queda en el registro de uso, atribuida a su trabajo
+    usage = llm_batch.llm_usage.summarize("amor", group_by=("stage",))
+    assert set(usage["by_stage"]) == {"plan", "draft", "refine", "metadata"}
+    assert usage["totals"]["retries"] == 0
+
+
+def test_rerun_skips_completed_stages(runner):
+    runner.run(CATALOG)
+    runner.local_backend.submit = lambda path: pytest.fail("no debería volver a enviar lotes")
+
+    runner.run(CATALOG)
+
+    with open(runner.manifest_path, encoding='utf-8') as f:
+        assert all(stage["status"] == "done" for stage in json.load(f)["stages"].values())
+
+
+def test_failed_batch_items_fall_back_to_placeholders(runner, monkeypatch):
+    def responder(custom_id, body):
+        if "|refine|" in custom_id:
+            raise RuntimeError("lote caído")
+        return llm_batch.offline_responder(custom_id, body)
+
+    runner.local_backend.responder = responder
+    monkeypatch.setattr(runner, "_realtime_retry", lambda request, messages=None: None)
+
+    job_dirs = runner.run(CATALOG[:1])
+
+    lyrics_dir = os.path.join(job_dirs["amor"], "lyrics")
+    with open(os.path.join(lyrics_dir, sorted(os.listdir(lyrics_dir))[0]), encoding='utf-8') as f:
+        content = f.read()
+    # Sin respuesta del refinamiento se conserva el borrador
+    assert "Línea simulada 0" in content
+
+
+def test_invalid_batch_responses_are_repaired_in_realtime(runner, monkeypatch):
+    def responder(custom_id, body):
+        if "|refine|" in custom_id:
+            return "TITLE: Cabecera de más\nVerse 1:\nLínea rota"
+        return llm_batch.offline_responder(custom_id, body)
+
+    repairs = []
+
+    def fake_complete_validated(stage, messages, validate, **kwargs):
+        repairs.append((stage, messages))
+        return validate("Verse 1:\nLínea reparada")[0]
+
+    runner.local_backend.responder = responder
+    monkeypatch.setattr(llm_batch.llm_router, "complete_validated", fake_complete_validated)
+
+    job_dirs = runner.run(CATALOG[:1])
+
+    # Una reparación por canción, con la respuesta rota y sus errores en la conversación
+    assert [stage for stage, _ in repairs] == ["refine", "refine"]
+    messages = repairs[0][1]
+    assert messages[-2] == {"role": "assistant", "content": "TITLE: Cabecera de más\nVerse 1:\nLínea rota"}
+    assert "TITLE/TAGS/GENERO" in messages[-1]["content"]
+    lyrics_dir = os.path.join(job_dirs["amor"], "lyrics")
+    with open(os.path.join(lyrics_dir, sorted(os.listdir(lyrics_dir))[0]), encoding='utf-8') as f:
+        assert "Línea reparada" in f.read()
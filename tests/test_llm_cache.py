@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src.llm_cache import LLMResponseCache, LLMCacheMiss
+
+MESSAGES = [{"role": "user", "content": "Escribe una canción"}]
+
+
+def test_key_depends_on_sampling_params():
+    base = LLMResponseCache.make_key("openai", "gpt-4o-mini", MESSAGES, {"temperature": 0.7})
+    assert base == LLMResponseCache.make_key("openai", "gpt-4o-mini", MESSAGES, {"temperature": 0.7})
+    assert base != LLMResponseCache.make_key("openai", "gpt-4o-mini", MESSAGES, {"temperature": 0.8})
+    assert base != LLMResponseCache.make_key("groq", "gpt-4o-mini", MESSAGES, {"temperature": 0.7})
+
+
+def test_hit_miss_and_ttl(tmp_path):
+    cache = LLMResponseCache(str(tmp_path), mode="on", ttl=60)
+    key = cache.make_key("openai", "m", MESSAGES, {})
+
+    assert cache.get(key) is None
+    cache.put(key, "TITLE: Hola", "openai", "m")
+    assert cache.get(key) == "TITLE: Hola"
+
+    cache.ttl = -1
+    assert cache.get(key) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expired"]) == (1, 2, 1)
+
+
+def test_replay_ignores_ttl_and_fails_on_miss(tmp_path):
+    LLMResponseCache(str(tmp_path), mode="on").put("k" * 64, "respuesta", "openai", "m")
+    replay = LLMResponseCache(str(tmp_path), mode="replay", ttl=-1)
+
+    assert replay.get("k" * 64) == "respuesta"
+    with pytest.raises(LLMCacheMiss):
+        replay.get("z" * 64)
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = LLMResponseCache(str(tmp_path), mode="on", ttl=3600, max_bytes=10**9)
+    keys = [f"{i:064d}" for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, "x" * 1000, "openai", "m")
+        os.utime(cache._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+
+    cache.max_bytes = 2500
+    cache.evict()
+
+    assert not os.path.exists(cache._path(keys[0]))
+    assert os.path.exists(cache._path(keys[2]))
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import random
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import llm_pool
+from src.llm_pool import map_concurrently, provider_of, provider_slot
+
+
+def test_provider_of_uses_model_prefix():
+    assert provider_of("groq/llama-3.3-70b-versatile") == "groq"
+    assert provider_of("gemini/gemini-1.5-flash") == "gemini"
+    assert provider_of("openai/gpt-4o-mini") == "openai"
+    assert provider_of("gpt-4o-mini") == "openai"
+
+
+def test_results_keep_input_order():
+    def slow_square(n):
+        time.sleep(random.random() * 0.02)
+        return n * n
+
+    assert map_concurrently(slow_square, range(20), "openai/gpt-4o-mini") == [n * n for n in range(20)]
+
+
+def test_provider_slot_caps_concurrency(monkeypatch):
+    monkeypatch.setitem(llm_pool.LLM_CONCURRENCY_LIMITS, "groq", 2)
+    monkeypatch.setattr(llm_pool, "_semaphores", {})
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def call(_):
+        nonlocal active, peak
+        with provider_slot("groq/model"):
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.01)
+            with lock:
+                active -= 1
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak == 2
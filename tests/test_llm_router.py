@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import llm_router as router_module
+from src.llm_router import LLMRouter
+from src.llm_stats import LLMLatencyStats
+
+MESSAGES = [{"role": "user", "content": "Escribe una canción"}]
+ROUTE = ["openai/gpt-4o-mini", "groq/openai/gpt-oss-120b"]
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    monkeypatch.setattr(router_module.config, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(router_module.config, "GROQ_API_KEY", "test")
+    monkeypatch.setitem(router_module.LLM_ROUTES, "draft", list(ROUTE))
+    monkeypatch.setattr(router_module, "LLM_HEDGE_STAGES", {"draft"})
+    monkeypatch.setattr(router_module, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+    return LLMRouter(stats=LLMLatencyStats(window=20), log_path=str(tmp_path / "router.jsonl"))
+
+
+def fake_provider(monkeypatch, behaviour):
+    calls = []
+
+    def chat_completion(llm_model, messages, on_token=None, **params):
+        calls.append((llm_model, params))
+        delay, result = behaviour[llm_model]
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(router_module, "chat_completion", chat_completion)
+    return calls
+
+
+def test_slow_primary_is_hedged_and_fastest_answer_wins(router, monkeypatch):
+    fake_provider(monkeypatch, {ROUTE[0]: (0.5, "lenta"), ROUTE[1]: (0.01, "rápida")})
+
+    assert router.complete("draft", MESSAGES) == "rápida"
+    summary = router.summary()
+    assert (summary["hedges"], summary["hedge_wins"]) == (1, 1)
+
+
+def test_failure_falls_back_with_provider_params(router, monkeypatch):
+    calls = fake_provider(monkeypatch, {ROUTE[0]: (0, RuntimeError("503")), ROUTE[1]: (0, "respaldo")})
+    monkeypatch.setattr(router_module, "LLM_HEDGE_STAGES", set())
+
+    result = router.complete("draft", MESSAGES, provider_params={"groq": {"top_p": 1}}, temperature=0.7)
+
+    assert result == "respaldo"
+    assert calls == [(ROUTE[0], {"temperature": 0.7}), (ROUTE[1], {"top_p": 1})]
+    assert router.summary()["fallbacks"] == 1
+
+
+def test_unhealthy_model_is_demoted(router, monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_ROUTER_MIN_SAMPLES", 3)
+    for _ in range(3):
+        router.stats.record(ROUTE[0], 1.0, ok=False)
+
+    assert router.candidates("draft") == [ROUTE[1], ROUTE[0]]
+
+
+def test_hedge_delay_uses_rolling_percentile(router, monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_ROUTER_MIN_SAMPLES", 3)
+    monkeypatch.setattr(router_module, "LLM_HEDGE_PERCENTILE", 0.9)
+    for latency in (1.0, 2.0, 3.0, 4.0, 10.0):
+        router.stats.record(ROUTE[0], latency, ok=True)
+
+    assert router.hedge_delay(ROUTE[0]) == 10.0
+    assert router.hedge_delay(ROUTE[1]) == 0.05
+
+
+def test_invalid_response_gets_a_targeted_repair(router, monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_HEDGE_STAGES", set())
+    replies = iter(["sin formato", '{"title": "Mar"}'])
+    repair_requests = []
+
+    def chat_completion(llm_model, messages, on_token=None, **params):
+        repair_requests.append(messages[-1]["content"])
+        return next(replies)
+
+    monkeypatch.setattr(router_module, "chat_completion", chat_completion)
+    validate = lambda content: (content, [] if content.startswith("{") else ["no es JSON"])
+
+    assert router.complete_validated("draft", MESSAGES, validate) == '{"title": "Mar"}'
+    assert "no es JSON" in repair_requests[1]
+    assert router.summary()["repairs"] == 1
+
+
+def test_response_still_invalid_after_repair_raises(router, monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_HEDGE_STAGES", set())
+    fake_provider(monkeypatch, {ROUTE[0]: (0, "sin formato")})
+
+    with pytest.raises(router_module.InvalidLLMResponse):
+        router.complete_validated("draft", MESSAGES, lambda content: (content, ["no es JSON"]))
@@ -0,0 +1,95 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import llm_client, llm_router as router_module, llm_usage as usage_module
+from src.llm_cache import LLMResponseCache
+from src.llm_pool import map_concurrently
+from src.llm_router import LLMRouter
+from src.llm_stats import LLMLatencyStats
+from src.llm_usage import LLMUsageLedger, TokenUsage, call_cost, current_scope, usage_scope
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    ledger = LLMUsageLedger(str(tmp_path / "usage.jsonl"))
+    monkeypatch.setattr(llm_client, "llm_usage", ledger)
+    monkeypatch.setattr(llm_client, "llm_stats", LLMLatencyStats())
+    monkeypatch.setattr(llm_client, "llm_cache", LLMResponseCache(str(tmp_path / "cache"), mode="off"))
+    monkeypatch.setitem(usage_module.LLM_PRICES, "openai/m", (1.0, 2.0))
+    return ledger
+
+
+def test_chat_completion_records_tokens_cost_and_scope(ledger, monkeypatch):
+    monkeypatch.setattr(llm_client, "_call_provider", lambda *args: ("hola", TokenUsage(1000, 500)))
+
+    with usage_scope(job_id="job-1", stage="draft"):
+        llm_client.chat_completion("openai/m", [{"role": "user", "content": "x"}])
+
+    entry, = ledger.entries("job-1")
+    assert entry["stage"] == "draft" and entry["attempt"] == "primary"
+    assert (entry["prompt_tokens"], entry["completion_tokens"]) == (1000, 500)
+    assert entry["cost_usd"] == call_cost("openai/m", TokenUsage(1000, 500)) == 0.002
+    assert current_scope() == {}
+
+
+def test_router_labels_fallbacks_and_repairs(ledger, tmp_path, monkeypatch):
+    monkeypatch.setitem(router_module.LLM_ROUTES, "draft", ["openai/m", "groq/m"])
+    monkeypatch.setattr(router_module, "LLM_HEDGE_STAGES", [])
+
+    def fake_call(provider, model_name, messages, params):
+        if provider == "openai":
+            raise RuntimeError("caído")
+        return ("ok" if len(messages) > 1 else "roto"), TokenUsage(10, 5)
+
+    monkeypatch.setattr(llm_client, "_call_provider", fake_call)
+    router = LLMRouter(stats=LLMLatencyStats(), log_path=str(tmp_path / "router.jsonl"))
+
+    with usage_scope(job_id="job-2"):
+        result = router.complete_validated(
+            "draft", [{"role": "user", "content": "x"}],
+            lambda text: (text, [] if text == "ok" else ["formato"]),
+        )
+
+    assert result == "ok"
+    attempts = [(e["model"], e["status"], e["attempt"], e["repair"]) for e in ledger.entries("job-2")]
+    assert attempts == [
+        ("openai/m", "error", "primary", 0), ("groq/m", "ok", "fallback", 0),
+        ("openai/m", "error", "primary", 1), ("groq/m", "ok", "fallback", 1),
+    ]
+    summary = ledger.summarize("job-2")
+    assert summary["totals"]["errors"] == 2 and summary["totals"]["retries"] == 3
+    assert summary["by_stage"]["draft"]["prompt_tokens"] == 20
+    assert summary["by_model"]["groq/m"]["calls"] == 2
+
+
+def test_scope_follows_calls_into_the_pool(ledger, monkeypatch):
+    monkeypatch.setattr(llm_client, "_call_provider", lambda *args: ("hola", None))
+
+    with usage_scope(job_id="job-3", stage="metadata"):
+        map_concurrently(lambda i: llm_client.chat_completion("openai/m", [{"role": "user", "content": str(i)}]),
+                         range(4), "openai/m")
+
+    entries = ledger.entries("job-3")
+    assert len(entries) == 4 and {e["stage"] for e in entries} == {"metadata"}
+    assert ledger.summarize("job-3")["totals"]["cost_usd"] is None
+
+
+def test_cached_prompt_tokens_are_reported_and_priced(ledger, monkeypatch):
+    from types import SimpleNamespace
+
+    response = SimpleNamespace(usage=SimpleNamespace(
+        prompt_tokens=2000, completion_tokens=100, prompt_tokens_details=SimpleNamespace(cached_tokens=1536)
+    ))
+    usage = llm_client._token_usage(response)
+    assert usage == TokenUsage(2000, 100, 1536)
+
+    monkeypatch.setitem(usage_module.LLM_PRICES, "openai/m", (1.0, 2.0, 0.5))
+    assert call_cost("openai/m", usage) == round((464 * 1.0 + 1536 * 0.5 + 100 * 2.0) / 1_000_000, 6)
+
+    monkeypatch.setattr(llm_client, "_call_provider", lambda *args: ("hola", usage))
+    with usage_scope(job_id="job-5", stage="draft"):
+        llm_client.chat_completion("openai/m", [{"role": "user", "content": "x"}])
+    totals = ledger.summarize("job-5")["totals"]
+    assert totals["cached_tokens"] == 1536 and totals["cache_hit_ratio"] == 0.768
@@ -0,0 +1,102 @@
+import os
+import sys
+import re
+import json
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import lyric_generator
+from src.lyric_generator import generate_song_plan, plan_chunks, title_hash
+from src.main_orchestrator import parse_song_plan
+
+
+class FakePlanRouter:
+    """Responde a las peticiones del plan; 'titles(inicio, n)' decide los títulos de cada tramo."""
+
+    def __init__(self, titles):
+        self.titles = titles
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def candidates(self, stage, primary=None):
+        return ["openai/gpt-4o-mini"]
+
+    def complete(self, stage, messages, **params):
+        user_message = messages[-1]["content"]
+        with self._lock:
+            self.requests.append(user_message)
+        if "'summary'" in user_message:
+            sections = int(re.search(r"lista de (\d+) frases", user_message).group(1))
+            return json.dumps({"summary": "Un viaje por el mar.", "sections": [f"Tramo {i}" for i in range(sections)]})
+        count = int(re.search(r"plan para (\d+) canciones", user_message).group(1))
+        chunk = re.search(r"planificando las canciones (\d+) a", user_message)
+        titles = self.titles(int(chunk.group(1)) if chunk else 1, count, user_message)
+        return json.dumps({"song_plan": [{"title": t, "description": f"Sobre {t}"} for t in titles]}, ensure_ascii=False)
+
+
+@pytest.fixture
+def fake_router(monkeypatch):
+    def install(titles):
+        router = FakePlanRouter(titles)
+        monkeypatch.setattr(lyric_generator, "llm_router", router)
+        monkeypatch.setattr(lyric_generator, "LLM_PLAN_CHUNK_SIZE", 10)
+        return router
+    return install
+
+
+def test_plan_chunks_cover_the_album():
+    assert plan_chunks(25, 10) == [(1, 10), (11, 10), (21, 5)]
+    assert plan_chunks(3, 10) == [(1, 3)]
+
+
+def test_title_hash_ignores_accents_case_and_punctuation():
+    assert title_hash("Canción del Mar!") == title_hash("cancion  del mar")
+    assert title_hash("Canción del Mar") != title_hash("Canción del Río")
+
+
+def test_large_album_is_planned_in_parallel_chunks_with_shared_summary(fake_router):
+    router = fake_router(lambda start, count, _: [f"Ola {i}" for i in range(start, start + count)])
+
+    song_plan = json.loads(generate_song_plan("El mar", 25, "spanish"))["song_plan"]
+
+    assert [entry["title"] for entry in song_plan] == [f"Ola {i}" for i in range(1, 26)]
+    chunk_requests = [r for r in router.requests if "plan para" in r]
+    assert len(chunk_requests) == 3
+    assert all("Un viaje por el mar." in r for r in chunk_requests)
+
+
+def test_only_duplicate_and_missing_entries_are_regenerated(fake_router):
+    def titles(start, count, message):
+        if "Títulos ya usados" in message:
+            return [f"Nueva {i}" for i in range(count)]
+        # El segundo tramo repite dos títulos del primero y se queda corto
+        return ["Ola 1", "Ola 2", "Ola 13"] if start == 11 else [f"Ola {i}" for i in range(start, start + count)]
+
+    router = fake_router(titles)
+
+    song_plan = json.loads(generate_song_plan("El mar", 20, "spanish"))["song_plan"]
+
+    assert len(song_plan) == 20
+    assert len({title_hash(entry["title"]) for entry in song_plan}) == 20
+    repair = [r for r in router.requests if "Títulos ya usados" in r]
+    assert len(repair) == 1 and "plan para 9 canciones" in repair[0]
+
+
+def test_short_plan_only_pads_the_missing_entries():
+    plan = parse_song_plan(json.dumps({"song_plan": [{"title": "Ola", "description": "a"}, {"title": "OLA", "description": "b"}]}), 3, "El mar")
+    assert [entry["title"] for entry in plan] == ["Ola", "Song 2", "Song 3"]
+
+
+def test_song_requests_share_the_job_prefix():
+    from src.lyric_generator import build_draft_messages, build_instrumental_messages, build_refine_messages
+
+    first = build_draft_messages("Olas", "synthwave", "spanish", "Masculino", 1, 12)
+    second = build_draft_messages("Faros", "synthwave", "spanish", "Femenino", 2, 12)
+    assert first[0] == second[0]
+    assert "synthwave" in first[0]["content"] and "Femenino" in second[1]["content"]
+    assert "Olas" not in first[0]["content"] and "Masculino" not in first[0]["content"].split("Contexto del trabajo")[1]
+
+    assert build_instrumental_messages("Olas", "ambient", song_index=1, total_songs=3)[0] == \
+        build_instrumental_messages("Faros", "ambient", song_index=3, total_songs=3)[0]
+    assert build_refine_messages("El mar", "Verse 1:\nA", "pop")[0] == build_refine_messages("El mar", "Verse 1:\nB", "pop")[0]
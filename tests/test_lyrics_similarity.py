@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import time
+import random
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.lyrics_similarity import find_similar_pairs, dedupe_lyrics_files, split_sections
+from src.utils import format_lyrics_file
+
+VOCABULARY = [f"palabra{i}" for i in range(3000)]
+
+
+def random_lyrics(rng, chorus=None):
+    verses = "\n".join(" ".join(rng.choices(VOCABULARY, k=7)) for _ in range(16))
+    chorus = chorus or "\n".join(" ".join(rng.choices(VOCABULARY, k=6)) for _ in range(4))
+    return f"Verse 1:\n{verses}\n\nChorus:\n{chorus}"
+
+
+def write_song(directory, index, lyrics):
+    path = os.path.join(directory, f"{index}_Cancion {index}.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(format_lyrics_file({"title": f"Cancion {index}", "prompt": lyrics, "tags": "pop", "gender": "Masculino"}))
+    return path
+
+
+def test_sections_are_normalized_and_choruses_tracked():
+    sections = split_sections("Verse 1:\n¡Hola, Mundo!\n[Chorus]\nOh, mar\nBridge:\nAdiós")
+    assert sections == {"all": ["hola mundo", "oh mar", "adios"], "chorus": ["oh mar"]}
+
+
+def test_near_duplicates_and_shared_choruses_are_flagged():
+    rng = random.Random(7)
+    base = random_lyrics(rng)
+    lyrics = {
+        "a": base,
+        "b": random_lyrics(rng),
+        "a_copia": base.replace("palabra1 ", "palabra2 ", 2),
+        "mismo_estribillo": random_lyrics(rng, chorus=base.split("Chorus:\n")[1]),
+    }
+
+    pairs = {(p["a"], p["b"]) for p in find_similar_pairs(lyrics)}
+
+    assert pairs == {("a", "a_copia"), ("a", "mismo_estribillo"), ("a_copia", "mismo_estribillo")}
+
+
+def test_hundreds_of_songs_are_compared_quickly():
+    rng = random.Random(3)
+    lyrics = {f"cancion_{i}": random_lyrics(rng) for i in range(300)}
+
+    start = time.monotonic()
+    assert find_similar_pairs(lyrics) == []
+    assert time.monotonic() - start < 5
+
+
+def test_only_offending_songs_are_regenerated(tmp_path):
+    rng = random.Random(11)
+    base = random_lyrics(rng)
+    paths = [write_song(str(tmp_path), 1, base), write_song(str(tmp_path), 2, random_lyrics(rng)), write_song(str(tmp_path), 3, base)]
+    regenerated = []
+
+    def regenerate(filepath, reference_lyrics):
+        regenerated.append(filepath)
+        write_song(str(tmp_path), 3, random_lyrics(rng))
+
+    kept = dedupe_lyrics_files(paths, regenerate, action="regenerate", log_path=str(tmp_path / "review.jsonl"))
+
+    assert regenerated == [paths[2]] and kept == paths
+
+
+def test_songs_still_duplicated_are_queued_for_review(tmp_path):
+    rng = random.Random(5)
+    base = random_lyrics(rng)
+    paths = [write_song(str(tmp_path), 1, base), write_song(str(tmp_path), 2, base)]
+    log_path = str(tmp_path / "review.jsonl")
+
+    kept = dedupe_lyrics_files(paths, regenerate=lambda filepath, reference: None, action="regenerate", log_path=log_path)
+
+    assert kept == paths[:1]
+    assert os.path.exists(paths[1] + ".review") and not os.path.exists(paths[1])
+    with open(log_path, encoding='utf-8') as f:
+        assert json.loads(f.readline())["similar_to"] == paths[0]
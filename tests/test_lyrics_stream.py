@@ -0,0 +1,104 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import llm_client
+from src.llm_client import StreamAborted
+from src.llm_cache import LLMResponseCache
+from src.llm_stats import LLMLatencyStats
+from src.llm_usage import LLMUsageLedger
+from src.lyrics_stream import LyricsStreamWriter, StreamProgress
+
+DRAFT_CHUNKS = ["TITLE: Mar", "\n\nPROMPT:\n", "Verse 1:\nOlas", "\n\nTAGS:\npop", "\n\nGENERO: Femenino"]
+
+
+def test_writer_streams_into_partial_file(tmp_path):
+    published = []
+    progress = StreamProgress(lambda details, streams: published.append(streams), "Borradores", interval=0)
+    writer = LyricsStreamWriter(str(tmp_path / "1_Mar.txt"), progress, key="Canción 1")
+
+    for chunk in DRAFT_CHUNKS:
+        writer(chunk, "openai/m")
+
+    with open(writer.partial_path, encoding='utf-8') as f:
+        assert f.read() == "".join(DRAFT_CHUNKS)
+    assert published[-1]["Canción 1"]["chars"] == len("".join(DRAFT_CHUNKS))
+    writer.discard()
+    assert not os.path.exists(writer.partial_path)
+
+
+def test_writer_aborts_broken_format_and_hands_file_to_hedge(tmp_path):
+    writer = LyricsStreamWriter(str(tmp_path / "1_Mar.txt"))
+    writer("TITLE: Mar\n", "openai/m")
+    writer("TITLE: Mar\nPROMPT:\n", "groq/m")
+
+    with pytest.raises(StreamAborted):
+        writer("TAGS: antes de la letra", "openai/m")
+
+    with open(writer.partial_path, encoding='utf-8') as f:
+        assert f.read() == "TITLE: Mar\nPROMPT:\n"
+
+
+def test_losing_hedge_stops_after_discard(tmp_path, monkeypatch):
+    final_path = tmp_path / "1_a.txt"
+    writer = LyricsStreamWriter(str(final_path))
+    writer("TITLE: Mar\n", "openai/m")
+
+    # Gana el otro modelo: se escribe la letra definitiva y se descarta el temporal
+    final_path.write_text("TITLE: Mar\nPROMPT:\nVerse 1:\nOlas", encoding='utf-8')
+    writer.discard()
+
+    # El intento perdedor sigue en segundo plano: se corta sin recrear el temporal
+    with pytest.raises(StreamAborted):
+        writer("PROMPT:\nVerse 1:\n", "openai/m")
+    assert os.listdir(tmp_path) == ["1_a.txt"]
+
+    # Por chat_completion, el stream perdedor se cierra y no cuenta como fallo del modelo
+    stats, closed = LLMLatencyStats(), []
+
+    def fake_stream(provider, model_name, messages, params):
+        try:
+            yield from ["PROMPT:\n", "nunca llega"]
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(llm_client, "_stream_provider", fake_stream)
+    monkeypatch.setattr(llm_client, "llm_stats", stats)
+    monkeypatch.setattr(llm_client, "llm_cache", LLMResponseCache(str(tmp_path / "cache"), mode="off"))
+    monkeypatch.setattr(llm_client, "llm_usage", LLMUsageLedger(str(tmp_path / "usage.jsonl")))
+    with pytest.raises(StreamAborted):
+        llm_client.chat_completion("openai/m", [{"role": "user", "content": "x"}],
+                                   on_token=lambda text: writer(text, "openai/m"))
+    assert closed == [True] and stats.error_rate("openai/m") == 0
+    assert not os.path.exists(writer.partial_path)
+
+
+def test_stream_completion_records_ttft_and_stops_on_abort(tmp_path, monkeypatch):
+    stats = LLMLatencyStats()
+    closed = []
+
+    def fake_stream(provider, model_name, messages, params):
+        try:
+            yield from ["TITLE: Mar\n", "Hola " * 100, "nunca llega"]
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(llm_client, "_stream_provider", fake_stream)
+    monkeypatch.setattr(llm_client, "llm_stats", stats)
+    monkeypatch.setattr(llm_client, "llm_cache", LLMResponseCache(str(tmp_path), mode="off"))
+    monkeypatch.setattr(llm_client, "llm_usage", LLMUsageLedger(str(tmp_path / "usage.jsonl")))
+    received = []
+
+    def on_token(text):
+        received.append(text)
+        if len(received) == 2:
+            raise StreamAborted("formato roto")
+
+    with pytest.raises(StreamAborted):
+        llm_client.chat_completion("openai/m", [{"role": "user", "content": "x"}], on_token=on_token)
+
+    assert closed == [True]
+    assert received[-1] != "nunca llega"
+    assert stats.ttft_percentile("openai/m", 0.5) is not None
+    assert stats.error_rate("openai/m") == 1.0
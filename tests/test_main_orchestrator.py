@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import main_orchestrator
+from src.main_orchestrator import JobContext, run_video_workflow, resume_video_workflow, thread_config
+from src.workspace import Workspace
+
+
+class FakeTask:
+    def __init__(self):
+        self.updates = []
+
+    def update_state(self, state, meta):
+        self.updates.append(meta)
+
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    monkeypatch.setattr(main_orchestrator, "CHECKPOINT_DB_PATH", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(main_orchestrator, "_app_graph", None)
+
+    def fake_plan(user_prompt, total_songs, language, llm_model):
+        return json.dumps({"song_plan": [{"title": f"Canción {i}", "description": user_prompt} for i in range(total_songs)]})
+
+    def fake_draft(prompt, song_style, language, gender, song_index, total_songs, llm_model, on_token=None):
+        return f"TITLE: x\n\nPROMPT:\nVerse 1:\n{prompt}\n\nTAGS:\n{song_style}\n\nGENERO: {gender}"
+
+    monkeypatch.setattr(main_orchestrator, "generate_song_plan", fake_plan)
+    monkeypatch.setattr(main_orchestrator, "generate_draft_lyrics", fake_draft)
+    monkeypatch.setattr(main_orchestrator, "dedupe_lyrics_files", lambda paths, *args: paths)
+    return main_orchestrator.get_app_graph()
+
+
+def test_paused_job_resumes_from_its_checkpoint(graph, tmp_path, monkeypatch):
+    workspace = Workspace.for_job("job-1", base_dir=str(tmp_path / "workspaces")).create()
+    state = {"user_prompt": "mar", "song_style": "pop", "num_female_songs": 1, "num_male_songs": 1,
+             "refine_lyrics": False, "workspace_dir": workspace.root}
+    task = FakeTask()
+
+    result = run_video_workflow(state, JobContext(task, "cliente"), pause_before=["create_songs"])
+
+    assert result["job_id"] == "job-1" and result["paused_at"] == "create_songs"
+    assert task.updates, "la tarea del contexto recibe el progreso"
+    checkpoint = graph.get_state(thread_config("job-1"))
+    assert len(checkpoint.values["draft_filepaths"]) == 2
+    assert "task_instance" not in checkpoint.values and "suno_client" not in checkpoint.values
+
+    # Edición manual durante la revisión
+    edited = checkpoint.values["draft_filepaths"][0]
+    with open(edited, 'w', encoding='utf-8') as f:
+        f.write("TITLE: Editada\n\nPROMPT:\nVerse 1:\nnueva letra\n\nTAGS:\nrock\n\nGENERO: female")
+
+    created = []
+
+    def fake_create(client, lyrics, song_title, **kwargs):
+        created.append((client, lyrics, kwargs["suno_model"], song_title))
+        # Cada trabajo tiene su propio registro de generaciones: no reutiliza canciones de otro
+        assert kwargs["ledger"].path == workspace.generation_ledger_path
+        return [os.path.join(kwargs["songs_dir"], f"{len(created)}_{song_title}.mp3")]
+
+    def failing_assemble(**kwargs):
+        raise RuntimeError("ffmpeg no disponible")
+
+    monkeypatch.setattr(main_orchestrator, "create_and_download_song", fake_create)
+    monkeypatch.setattr(main_orchestrator, "assemble_video", failing_assemble)
+    metadata = []
+    metadata_path = tmp_path / "metadata.txt"
+    metadata_path.write_text("metadatos", encoding='utf-8')
+    monkeypatch.setattr(main_orchestrator, "generate_youtube_metadata", lambda **kwargs: metadata.append(kwargs) or str(metadata_path))
+    monkeypatch.setattr(main_orchestrator, "parse_metadata_file", lambda text: {"title": "t", "description": "d", "tags": []})
+    monkeypatch.setattr(main_orchestrator, "upload_video_to_youtube", lambda **kwargs: "https://youtu.be/x")
+
+    with pytest.raises(RuntimeError):
+        resume_video_workflow({"workspace_dir": workspace.root, "suno_model": "v5"}, JobContext(FakeTask(), "nuevo"))
+
+    assert [c[0] for c in created] == ["nuevo", "nuevo"]
+    # Las ramas por canción corren en paralelo: la canción editada se busca por su título
+    lyrics_by_title = {c[3]: c[1] for c in created}
+    assert "nueva letra" in lyrics_by_title["Editada"] and {c[2] for c in created} == {"v5"}
+    # Los metadatos se generan en paralelo con el ensamblaje y no se pierden con su fallo:
+    # al reanudar se reintenta solo el ensamblaje
+    assert len(metadata) == 1
+    assert graph.get_state(thread_config("job-1")).next == ("assemble_video",)
+
+    monkeypatch.setattr(main_orchestrator, "assemble_video", lambda **kwargs: kwargs["output_path"])
+    result = resume_video_workflow({"workspace_dir": workspace.root})
+
+    assert len(created) == 2 and len(metadata) == 1
+    assert result["youtube_url"] == "https://youtu.be/x" and result["paused_at"] is None
+    with pytest.raises(ValueError, match="completado"):
+        resume_video_workflow({"workspace_dir": workspace.root})
+
+
+def test_job_without_checkpoint_falls_back_to_the_files(graph, tmp_path):
+    workspace = Workspace.for_job("antiguo", base_dir=str(tmp_path / "workspaces")).create()
+
+    with pytest.raises(ValueError, match="No hay suficiente progreso"):
+        resume_video_workflow({"workspace_dir": workspace.root})
+
+
+def test_songs_run_in_their_own_branches_and_only_failed_ones_rerun(graph, tmp_path, monkeypatch):
+    workspace = Workspace.for_job("job-2", base_dir=str(tmp_path / "workspaces")).create()
+    state = {"user_prompt": "mar", "song_style": "pop", "num_female_songs": 2, "num_male_songs": 1,
+             "refine_lyrics": False, "with_subtitles": True, "workspace_dir": workspace.root}
+    run_video_workflow(state, pause_before=["create_songs"])
+
+    created, failed_once = [], []
+
+    def flaky_create(client, lyrics, song_title, **kwargs):
+        if song_title == "Canción 1" and not failed_once:
+            failed_once.append(song_title)
+            raise RuntimeError("Suno no responde")
+        created.append(song_title)
+        return [os.path.join(kwargs["songs_dir"], f"{n}_{song_title}.mp3") for n in (1, 2)]
+
+    def fake_segment(song_path, lyrics, output_path, with_subtitles=True, clips_dir=None):
+        return output_path
+
+    concatenated = []
+    monkeypatch.setattr(main_orchestrator, "create_and_download_song", flaky_create)
+    monkeypatch.setattr(main_orchestrator, "render_song_segment", fake_segment)
+    monkeypatch.setattr(main_orchestrator, "concatenate_segments", lambda paths, output: concatenated.append(paths) or output)
+    monkeypatch.setattr(main_orchestrator, "generate_youtube_metadata", lambda **kwargs: None)
+
+    with pytest.raises(RuntimeError):
+        resume_video_workflow({"workspace_dir": workspace.root, "suno_model": "v5"})
+    assert sorted(created) == ["Canción 0", "Canción 2"]
+    assert graph.get_state(thread_config("job-2")).next == ("produce_song",)
+
+    with pytest.raises(TypeError):
+        # La subida falla sin metadatos: el video ya está ensamblado
+        resume_video_workflow({"workspace_dir": workspace.root, "suno_model": "v6", "with_subtitles": True})
+
+    # Solo se repite la rama que falló (las opciones nuevas no cambian las ramas en curso)
+    assert sorted(created) == ["Canción 0", "Canción 1", "Canción 2"]
+    values = graph.get_state(thread_config("job-2")).values
+    assert [os.path.basename(p) for p in values["song_paths"]] == [
+        "1_Canción 0.mp3", "1_Canción 1.mp3", "1_Canción 2.mp3", "2_Canción 0.mp3", "2_Canción 1.mp3", "2_Canción 2.mp3"
+    ]
+    assert concatenated == [values["segment_paths"]] and len(values["segment_paths"]) == 6
+    assert values["final_video_path"] == workspace.video_output_path
+
+
+def test_metadata_runs_alongside_assembly(graph, tmp_path, monkeypatch):
+    import threading
+    workspace = Workspace.for_job("job-3", base_dir=str(tmp_path / "workspaces")).create()
+    both_running = threading.Barrier(2, timeout=5)
+
+    def slow_assemble(**kwargs):
+        both_running.wait()
+        return kwargs["output_path"]
+
+    def slow_metadata(**kwargs):
+        # Si las ramas fueran secuenciales, la barrera no se alcanzaría
+        both_running.wait()
+        path = os.path.join(kwargs["metadata_dir"], "metadata.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("metadatos")
+        return path
+
+    monkeypatch.setattr(main_orchestrator, "create_and_download_song",
+                        lambda client, lyrics, song_title, **kwargs: [os.path.join(kwargs["songs_dir"], f"1_{song_title}.mp3")])
+    monkeypatch.setattr(main_orchestrator, "render_song_segment", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main_orchestrator, "assemble_video", slow_assemble)
+    monkeypatch.setattr(main_orchestrator, "generate_youtube_metadata", slow_metadata)
+    monkeypatch.setattr(main_orchestrator, "parse_metadata_file", lambda text: {"title": "t", "description": "d", "tags": []})
+    monkeypatch.setattr(main_orchestrator, "upload_video_to_youtube", lambda **kwargs: "https://youtu.be/y")
+
+    result = run_video_workflow({"user_prompt": "mar", "song_style": "pop", "num_female_songs": 1, "num_male_songs": 0,
+                                 "refine_lyrics": False, "workspace_dir": workspace.root})
+
+    assert result["youtube_url"] == "https://youtu.be/y"
+    timings = graph.get_state(thread_config("job-3")).values["node_timings"]
+    nodes = [t["node"] for t in timings]
+    assert nodes.index("upload_to_youtube") > max(nodes.index("assemble_video"), nodes.index("generate_metadata"))
+    assert "produce_song:1" in nodes
+    with open(os.path.join(workspace.reports_dir, "report_final_video.json"), encoding='utf-8') as f:
+        timing = json.load(f)["graph_timing"]
+    assert [n["node"] for n in timing["nodes"]][:2] == ["generate_song_plan", "generate_lyrics_drafts"]
+
+
+def test_stages_stop_at_their_boundaries(graph, tmp_path, monkeypatch):
+    workspace = Workspace.for_job("job-4", base_dir=str(tmp_path / "workspaces")).create()
+    run_video_workflow({"user_prompt": "mar", "song_style": "pop", "num_female_songs": 1, "num_male_songs": 1,
+                        "refine_lyrics": False, "defer_segment_render": True, "workspace_dir": workspace.root},
+                       pause_before=["create_songs"])
+
+    rendered = []
+    monkeypatch.setattr(main_orchestrator, "create_and_download_song",
+                        lambda client, lyrics, song_title, **kwargs: [os.path.join(kwargs["songs_dir"], f"1_{song_title}.mp3")])
+    monkeypatch.setattr(main_orchestrator, "render_song_segment",
+                        lambda song_path, lyrics, output_path, **kwargs: rendered.append(song_path) or output_path)
+    monkeypatch.setattr(main_orchestrator, "concatenate_segments", lambda paths, output: output)
+    monkeypatch.setattr(main_orchestrator, "generate_youtube_metadata", lambda **kwargs: None)
+
+    thread_id = main_orchestrator.prepare_resume({"workspace_dir": workspace.root})
+    assert main_orchestrator.run_stage(thread_id, "render")["paused_at"] == "create_songs"
+
+    result = main_orchestrator.run_stage(thread_id, "suno")
+    # Los segmentos se dejan para la etapa 'render'
+    assert result["paused_at"] == "collect_songs" and rendered == []
+
+    result = main_orchestrator.run_stage(thread_id, "render")
+    assert result["paused_at"] == "upload_to_youtube" and len(rendered) == 2
+    assert result["video_path"] == workspace.video_output_path
@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src.progress_events import ProgressPublisher, event_stream, status_payload
+
+
+class RecordingRedis:
+    def __init__(self):
+        self.published = []
+        self.values = {}
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def publish(self, channel, data):
+        self.published.append((channel, json.loads(data)))
+
+
+def test_bursts_are_coalesced_into_the_latest_update():
+    redis = RecordingRedis()
+    publisher = ProgressPublisher(interval=0.2, redis_factory=lambda: redis)
+
+    for n in range(10):
+        publisher.publish("t1", "PROGRESS", {"details": f"paso {n}", "progress": f"{n}%"})
+    assert [e["details"] for _, e in redis.published] == ["paso 0"]
+
+    time.sleep(0.35)
+    assert [e["details"] for _, e in redis.published] == ["paso 0", "paso 9"]
+    assert redis.published[-1][0] == "progress:t1"
+    assert json.loads(redis.values["progress:last:t1"])["progress"] == "9%"
+
+
+def test_final_state_is_sent_at_once_and_drops_pending_updates():
+    redis = RecordingRedis()
+    publisher = ProgressPublisher(interval=0.2, redis_factory=lambda: redis)
+
+    publisher.publish("t2", "PROGRESS", {"details": "uno"})
+    publisher.publish("t2", "PROGRESS", {"details": "dos"})
+    publisher.publish("t2", "SUCCESS", {"details": "hecho", "result": "LYRICS_GENERATED", "job_id": "t2"})
+    time.sleep(0.3)
+
+    assert [e["state"] for _, e in redis.published] == ["PROGRESS", "SUCCESS"]
+    assert redis.published[-1][1]["result"] == "LYRICS_GENERATED"
+    # Sin Redis no se publica nada
+    ProgressPublisher(redis_factory=lambda: None).publish("t3", "SUCCESS", {})
+
+
+def test_status_payload_matches_the_polling_api():
+    assert status_payload("PENDING", None)["progress"] == "0%"
+    assert status_payload("FAILURE", ValueError("roto"))["details"] == "roto"
+    assert status_payload("PROGRESS", {"details": "x", "streams": {"a": 1}})["streams"] == {"a": 1}
+
+
+def test_event_stream_replays_the_last_event_and_stops_at_the_end():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    publisher = ProgressPublisher(interval=0, redis_factory=lambda: client)
+    publisher.publish("t4", "PROGRESS", {"details": "Fase 2", "progress": "25%"})
+
+    stream = event_stream("t4", lambda: pytest.fail("no debe consultar el backend"), client, timeout=5, heartbeat=0.05)
+    assert json.loads(next(stream)[len("data: "):])["details"] == "Fase 2"
+
+    publisher.publish("t4", "SUCCESS", {"details": "Completado"})
+    events = [chunk for chunk in stream if chunk.startswith("data: ")]
+    assert json.loads(events[-1][len("data: "):])["state"] == "SUCCESS"
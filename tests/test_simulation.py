@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import config, simulation, suno_api, youtube_uploader, main_orchestrator, headless_runner
+from src.lyric_generator import (
+    build_draft_messages, build_instrumental_messages, build_refine_messages, build_song_plan_messages,
+    parse_plan_entries, validate_refined_lyrics
+)
+from src.metadata_generator import build_metadata_messages
+from src.utils import parse_lyrics_response, parse_metadata_response
+
+
+def test_simulated_llm_answers_in_the_format_of_each_stage():
+    draft_messages = build_draft_messages("mar", "pop", gender="Femenino", song_index=2, total_songs=4)
+    draft = simulation.simulated_response(draft_messages)
+    parsed, errors = parse_lyrics_response(draft)
+    assert errors == [] and parsed["gender"] == "Femenino" and "Chorus:" in parsed["prompt"]
+    # Deterministas: la misma petición da la misma respuesta; otra canción, otra letra
+    assert simulation.simulated_response(draft_messages) == draft
+    assert simulation.simulated_response(build_draft_messages("mar", "pop", song_index=3, total_songs=4)) != draft
+
+    assert parse_lyrics_response(simulation.simulated_response(draft_messages, structured=True))[1] == []
+    instrumental = simulation.simulated_response(build_instrumental_messages("mar", "pop"), structured=True)
+    assert parse_lyrics_response(instrumental, instrumental=True)[1] == []
+
+    refined = simulation.simulated_response(build_refine_messages("mar", parsed["prompt"], "pop"))
+    assert validate_refined_lyrics(refined)[1] == []
+    assert refined != parsed["prompt"] and refined.count("Chorus:") == parsed["prompt"].count("Chorus:")
+
+    plan = simulation.simulated_response(build_song_plan_messages("mar", 3, "spanish", start_index=4, album_size=9))
+    assert len(parse_plan_entries(plan)) == 3
+    metadata, errors = parse_metadata_response(simulation.simulated_response(build_metadata_messages(refined, "mar", "pop")))
+    assert errors == [] and "pop" in metadata["tags"]
+
+
+def test_failures_are_injected_and_uploads_retry(tmp_path, monkeypatch):
+    monkeypatch.setattr(simulation, "SIM_LLM_LATENCY", 0)
+    monkeypatch.setattr(simulation, "SIM_LLM_FAILURE_RATE", 1.0)
+    with pytest.raises(simulation.SimulatedServiceError, match="groq/x"):
+        simulation.simulated_completion("groq", "x", build_instrumental_messages("mar", "pop"), {})
+
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"0" * 100)
+    log_path = tmp_path / "uploads.jsonl"
+    monkeypatch.setattr(simulation, "SIM_UPLOADS_LOG_PATH", str(log_path))
+    monkeypatch.setattr(simulation, "SIM_YOUTUBE_LATENCY", 0)
+    failures = iter([True, True, False, False])
+    monkeypatch.setattr(simulation, "_should_fail", lambda rate: next(failures, False))
+
+    url = simulation.simulated_upload(str(video), "t", "d", ["a"], chunk_size=40)
+    entry = json.loads(log_path.read_text(encoding='utf-8'))
+    assert url.endswith(entry["video_id"]) and entry["retries"] == 2 and entry["bytes"] == 100
+
+    monkeypatch.setattr(simulation, "_should_fail", lambda rate: True)
+    with pytest.raises(RuntimeError, match="máximo de reintentos"):
+        simulation.simulated_upload(str(video), "t", "d", [])
+
+
+def test_album_runs_end_to_end_without_credentials(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main_orchestrator, "CHECKPOINT_DB_PATH", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(main_orchestrator, "_app_graph", None)
+    for module in (config, suno_api, youtube_uploader):
+        monkeypatch.setattr(module, "SIMULATION_MODE", True)
+    # Como al importar la configuración en simulación sin credenciales
+    monkeypatch.setattr(config, "SUNO_COOKIE", "simulated")
+    monkeypatch.setattr(suno_api, "SUNO_COOKIE", "simulated")
+    monkeypatch.setattr(suno_api, "SUNO_POLL_INTERVAL", 0.05)
+    for name, value in [("SIM_LLM_LATENCY", 0), ("SIM_SUNO_LATENCY", 0.1), ("SIM_YOUTUBE_LATENCY", 0),
+                        ("SIM_SONG_DURATION", 1), ("SIM_UPLOADS_LOG_PATH", str(tmp_path / "uploads.jsonl"))]:
+        monkeypatch.setattr(simulation, name, value)
+    monkeypatch.setattr(simulation, "_suno_server", {})
+
+    # El render (ffmpeg) no es un servicio externo: aquí solo se sustituye por archivos vacíos
+    def fake_concatenate(paths, output):
+        with open(output, 'wb') as f:
+            f.write(b"video")
+        return output
+
+    monkeypatch.setattr(main_orchestrator, "render_song_segment", lambda song_path, lyrics, output_path, **kwargs: output_path)
+    monkeypatch.setattr(main_orchestrator, "concatenate_segments", fake_concatenate)
+
+    catalog = tmp_path / "catalogo.json"
+    catalog.write_text(json.dumps([{"user_prompt": "mar", "song_style": "pop", "num_female_songs": 1,
+                                    "num_male_songs": 1, "num_instrumental_songs": 0, "job_id": "sim"}]), encoding='utf-8')
+    report = tmp_path / "report.json"
+    assert headless_runner.main([str(catalog), "--workspaces-dir", "workspaces", "--report", str(report)]) == 0
+
+    result = json.loads(report.read_text(encoding='utf-8'))[0]
+    assert result["status"] == "completed" and set(result["timing"]["stages"]) == {"llm", "suno", "render", "upload"}
+    upload = json.loads((tmp_path / "uploads.jsonl").read_text(encoding='utf-8'))
+    assert result["youtube_url"].endswith(upload["video_id"]) and upload["title"]
+    # Dos canciones, dos clips de Suno por canción, cada uno con su MP3 sintético
+    songs = os.listdir(tmp_path / "workspaces" / "sim" / "songs")
+    assert len([name for name in songs if name.endswith(".mp3")]) == 4
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import time
+import base64
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from unittest.mock import MagicMock
+
+from src import suno_auth
+
+
+def make_jwt(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip('=')
+    return f"header.{payload}.signature"
+
+
+class FakeSession:
+    """Simula Clerk y Suno contando las llamadas de red."""
+
+    def __init__(self, lifetime=3600):
+        self.lifetime = lifetime
+        self.clerk_calls = 0
+        self.session_id_calls = 0
+
+    def get(self, url, headers=None):
+        response = MagicMock()
+        if "/client" in url:
+            self.clerk_calls += 1
+            jwt = make_jwt(time.time() + self.lifetime + self.clerk_calls)
+            response.json.return_value = {"response": {"sessions": [{"last_active_token": {"jwt": jwt}}]}}
+        else:
+            self.session_id_calls += 1
+            response.json.return_value = {"session_id": "sess-1"}
+        return response
+
+
+@pytest.fixture
+def file_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(suno_auth, "get_redis", lambda: None)
+    monkeypatch.setattr(suno_auth, "SUNO_TOKEN_CACHE_FILE", str(tmp_path / "suno_token.json"))
+
+
+def test_decode_jwt_expiry():
+    assert suno_auth.decode_jwt_expiry(make_jwt(1234567890)) == 1234567890
+    assert suno_auth.decode_jwt_expiry("no-es-un-jwt") > time.time()
+
+
+def test_credentials_are_shared_between_managers(file_backend):
+    session = FakeSession()
+    first = suno_auth.SunoTokenManager(session, "https://clerk", "https://api", cookie="c")
+    second = suno_auth.SunoTokenManager(session, "https://clerk", "https://api", cookie="c")
+
+    creds = first.get_credentials()
+    assert second.get_credentials() == creds
+    assert session.clerk_calls == 1
+    assert session.session_id_calls == 1
+
+
+def test_refresh_before_expiry_keeps_session_id(file_backend):
+    session = FakeSession(lifetime=1)  # por debajo del margen de renovación
+    manager = suno_auth.SunoTokenManager(session, "https://clerk", "https://api", cookie="c")
+
+    manager.get_credentials()
+    manager.get_credentials()
+    assert session.clerk_calls == 2
+    assert session.session_id_calls == 1
+
+
+def test_rejected_token_forces_refresh(file_backend):
+    session = FakeSession()
+    manager = suno_auth.SunoTokenManager(session, "https://clerk", "https://api", cookie="c")
+
+    creds = manager.get_credentials()
+    renewed = manager.get_credentials(rejected_jwt=creds["jwt"])
+    assert renewed["jwt"] != creds["jwt"]
+    assert session.clerk_calls == 2
@@ -0,0 +1,39 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+from src import suno_rate_limiter
+from src.suno_rate_limiter import SunoRateLimiter, SunoRateLimitExceeded
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(suno_rate_limiter, "get_redis", lambda: None)
+    monkeypatch.setattr(suno_rate_limiter, "SUNO_LIMITER_MAX_WAIT", 0)
+    monkeypatch.setattr(suno_rate_limiter, "SUNO_RATE_BURST", 2)
+    monkeypatch.setattr(suno_rate_limiter, "SUNO_MAX_IN_FLIGHT", 2)
+    return SunoRateLimiter("test-account")
+
+
+def test_token_bucket_allows_burst_then_rejects(limiter):
+    limiter.acquire("generate")
+    limiter.acquire("generate")
+    with pytest.raises(SunoRateLimitExceeded):
+        limiter.acquire("generate")
+
+    metrics = limiter.metrics()
+    assert metrics["generate_acquired"] == 2
+    assert metrics["generate_rejected"] == 1
+
+
+def test_slots_limit_in_flight_generations(limiter):
+    first = limiter.acquire_slot()
+    limiter.acquire_slot()
+    assert limiter.metrics()["in_flight"] == 2
+    with pytest.raises(SunoRateLimitExceeded):
+        limiter.acquire_slot()
+
+    limiter.release_slot(first)
+    limiter.acquire_slot()
+    assert limiter.metrics()["slot_rejected"] == 1
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from prometheus_client import REGISTRY
+
+from src import telemetry
+from src.llm_usage import usage_scope
+from src.main_orchestrator import timed_node
+
+
+def sample(metric, **labels):
+    return REGISTRY.get_sample_value(metric, labels) or 0
+
+
+@pytest.fixture
+def trace_path(tmp_path, monkeypatch):
+    path = tmp_path / "trace.jsonl"
+    monkeypatch.setattr(telemetry.trace_exporter, "path", str(path))
+    return path
+
+
+def test_spans_feed_the_metrics_and_the_trace(trace_path, capsys):
+    before = sample("video_pipeline_spans_total", kind="llm", name="groq/x", status="error")
+    node = timed_node("generate_song_plan", lambda state, runtime: {"song_plan": "[]"})
+
+    with usage_scope(job_id="job-1"):
+        update = node({}, None)
+        with pytest.raises(RuntimeError):
+            with telemetry.span("node", "refine_lyrics"):
+                with telemetry.span("llm", "groq/x", stage="refine"):
+                    raise RuntimeError("proveedor caído")
+
+    assert update["song_plan"] == "[]" and update["node_timings"][0]["node"] == "generate_song_plan"
+    assert sample("video_pipeline_spans_total", kind="llm", name="groq/x", status="error") == before + 1
+    assert sample("video_pipeline_span_seconds_count", kind="node", name="generate_song_plan") >= 1
+
+    spans = telemetry.load_trace(str(trace_path), job_id="job-1")
+    plan, llm, refine = spans
+    assert plan["kind"] == "node" and plan["status"] == "ok" and plan["parent_id"] is None
+    assert llm["parent_id"] == refine["span_id"] and llm["stage"] == "refine" and "proveedor caído" in llm["error"]
+
+    rows = {(row["kind"], row["name"]): row for row in telemetry.summarize_trace(spans)}
+    assert rows[("llm", "groq/x")]["errors"] == 1
+    chrome = telemetry.chrome_trace(spans)["traceEvents"]
+    assert [event["name"] for event in chrome] == ["node:generate_song_plan", "llm:groq/x", "node:refine_lyrics"]
+
+    chrome_path = trace_path.parent / "chrome.json"
+    assert telemetry.main([str(trace_path), "--job", "job-1", "--chrome", str(chrome_path)]) == 0
+    assert "groq/x" in capsys.readouterr().out and chrome_path.exists()
+
+
+def test_metrics_endpoint_and_celery_queue_wait(monkeypatch):
+    import tasks
+    import app as app_module
+
+    headers = {}
+    tasks.stamp_enqueue_time(headers=headers)
+
+    class FakeTask:
+        class request:
+            delivery_info = {"routing_key": "render"}
+
+            @staticmethod
+            def get(key, default=None):
+                return headers["enqueued_at"] - 2 if key == "enqueued_at" else default
+
+    tasks.record_queue_wait(task=FakeTask())
+    assert sample("video_pipeline_queue_wait_seconds_sum", queue="celery:render") >= 2
+
+    response = app_module.app.test_client().get("/metrics")
+    assert response.status_code == 200 and response.content_type.startswith("text/plain")
+    text = response.get_data(as_text=True)
+    assert 'video_pipeline_queue_wait_seconds_count{queue="celery:render"}' in text
+    assert "# TYPE video_pipeline_span_seconds histogram" in text
+
+
+def test_worker_metrics_need_their_own_port_and_multiprocess_dir(monkeypatch):
+    import tasks
+
+    started = []
+    monkeypatch.setattr(telemetry, "start_metrics_server", lambda port: started.append(port) or True)
+    monkeypatch.setattr(telemetry, "METRICS_WORKER_PORTS", {"render": 9810})
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+
+    class Worker:
+        hostname = "render@maquina"
+        pool_cls = "prefork"
+
+    # Prefork sin directorio multiproceso: el principal no ve las métricas de las tareas
+    tasks.start_worker_metrics(sender=Worker())
+    assert started == []
+
+    Worker.pool_cls = "solo"
+    tasks.start_worker_metrics(sender=Worker())
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", "/tmp/metricas")
+    Worker.hostname, Worker.pool_cls = "io@maquina", "prefork"
+    tasks.start_worker_metrics(sender=Worker())
+    assert started == [9810, telemetry.METRICS_WORKER_PORT]
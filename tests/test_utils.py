@@ -0,0 +1,52 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils import (
+    parse_lyrics_file, parse_lyrics_response, format_lyrics_file,
+    parse_metadata_file, parse_metadata_response, format_metadata_file
+)
+from src.main_orchestrator import instrumental_content, is_generable
+from src.lyric_generator import error_draft
+
+
+def test_structured_lyrics_round_trip_to_the_file_format():
+    content = '```json\n{"title": "Mar", "lyrics": "Verse 1:\\nOlas", "tags": "ambient pop", "gender": "femenino"}\n```'
+
+    parsed, errors = parse_lyrics_response(content)
+
+    assert errors == []
+    assert parse_lyrics_file(format_lyrics_file(parsed)) == {
+        'title': 'Mar', 'prompt': 'Verse 1:\nOlas', 'tags': 'ambient pop', 'gender': 'female'
+    }
+
+
+def test_text_lyrics_fall_back_to_regex_and_report_missing_fields():
+    parsed, errors = parse_lyrics_response("TITLE: Mar\n\nPROMPT:\nVerse 1:\nOlas\n\nTAGS:\nambient")
+
+    assert parsed['prompt'] == "Verse 1:\nOlas"
+    assert errors == ["falta el género del cantante (Masculino o Femenino)"]
+    assert parse_lyrics_response("Lo siento, no puedo ayudarte.")[1][:2] == ["falta el título", "faltan los tags de estilo"]
+
+
+def test_instrumental_content_keeps_tags_and_plan_title():
+    content = instrumental_content({"title": "Marea"}, '{"title": "Otro", "tags": "slow ambient"}')
+
+    parsed = parse_lyrics_file(content)
+    assert (parsed['title'], parsed['tags']) == ("Marea", "slow ambient")
+    assert is_generable(parsed, is_instrumental=True)
+
+
+def test_error_drafts_are_not_sent_to_suno():
+    assert not is_generable(parse_lyrics_file(error_draft(1, "timeout")), is_instrumental=False)
+    assert not is_generable(parse_lyrics_file("TITLE: Error\nTAGS: error"), is_instrumental=True)
+
+
+def test_metadata_reader_accepts_spanish_and_english_labels():
+    metadata, errors = parse_metadata_response('{"title": "Mar", "description": "Olas\\nde noche", "tags": ["ambient", "mar"]}')
+    assert errors == []
+
+    text = format_metadata_file(metadata)
+    assert text.splitlines()[1] == "Descripción: Olas de noche"
+    assert parse_metadata_file(text) == {**metadata, 'description': "Olas de noche"}
+    assert parse_metadata_file("Title: Mar\nDescription: Olas\nTags: a, b")['tags'] == ["a", "b"]
@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from src import main_orchestrator
+from src.workspace import Workspace, list_jobs, workspace_of
+
+
+def test_job_workspace_layout_and_validation(tmp_path):
+    workspace = Workspace.for_job("job-1", base_dir=str(tmp_path)).create()
+
+    assert workspace.job_id == "job-1"
+    assert workspace.lyrics_dir == os.path.join(str(tmp_path), "job-1", "lyrics")
+    assert workspace.video_output_path == os.path.join(str(tmp_path), "job-1", "output", "final_video.mp4")
+    assert workspace.generation_ledger_path == os.path.join(str(tmp_path), "job-1", "state", "generation_ledger.json")
+    assert os.path.isdir(workspace.songs_dir)
+    assert list_jobs(str(tmp_path)) == ["job-1"]
+    assert workspace_of({}).root == "." and workspace_of({}).job_id is None
+
+    for job_id in ("", "..", "a/b"):
+        with pytest.raises(ValueError):
+            Workspace.for_job(job_id, base_dir=str(tmp_path))
+
+
+def test_clips_fall_back_to_the_shared_folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    workspace = Workspace.for_job("job-1", base_dir="workspaces")
+    assert workspace.clips_dir == "clips"
+
+    os.makedirs(os.path.join(workspace.root, "clips"))
+    (tmp_path / "workspaces" / "job-1" / "clips" / "fondo.mp4").write_bytes(b"mp4")
+    assert workspace.clips_dir == os.path.join(workspace.root, "clips")
+
+
+def test_concurrent_jobs_write_to_their_own_workspace(tmp_path, monkeypatch):
+    def fake_plan(user_prompt, total_songs, language, llm_model):
+        return json.dumps({"song_plan": [{"title": f"{user_prompt} {i}", "description": user_prompt} for i in range(total_songs)]})
+
+    def fake_draft(prompt, song_style, language, gender, song_index, total_songs, llm_model, on_token=None):
+        return f"TITLE: x\n\nPROMPT:\nVerse 1:\n{prompt}\n\nTAGS:\n{song_style}\n\nGENERO: {gender}"
+
+    monkeypatch.setattr(main_orchestrator, "generate_song_plan", fake_plan)
+    monkeypatch.setattr(main_orchestrator, "generate_draft_lyrics", fake_draft)
+    monkeypatch.setattr(main_orchestrator, "dedupe_lyrics_files", lambda paths, *args: paths)
+
+    def run_job(job):
+        state = {"user_prompt": job, "song_style": "pop", "num_female_songs": 1, "num_male_songs": 2,
+                 "task_instance": None, "workspace_dir": Workspace.for_job(job, base_dir=str(tmp_path)).root}
+        state.update(main_orchestrator.node_generate_song_plan(state))
+        return main_orchestrator.node_generate_lyrics_drafts(state)["draft_filepaths"]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = dict(zip(("Mar", "Rio"), pool.map(run_job, ("Mar", "Rio"))))
+
+    for job, paths in results.items():
+        workspace = Workspace.for_job(job, base_dir=str(tmp_path))
+        assert [os.path.basename(p) for p in paths] == [f"1_{job} 0.txt", f"2_{job} 1.txt", f"3_{job} 2.txt"]
+        assert all(os.path.dirname(p) == workspace.lyrics_dir for p in paths)
+        with open(workspace.song_plan_path, encoding='utf-8') as f:
+            assert all(entry["description"] == job for entry in json.load(f))
+        assert main_orchestrator.load_song_plan({"workspace_dir": workspace.root})[0]["title"] == f"{job} 0"